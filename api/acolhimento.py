@@ -0,0 +1,173 @@
+"""
+Acolhimento local da queixa do paciente (cadastrando_queixa, triagem_neuro_queixa,
+cadastrando_queixa_veterano).
+
+chamar_ia_custom pedia ao gpt-4o-mini uma frase de acolhimento a cada queixa —
+até 15s num passo do funil em que demora perde lead. A maioria das queixas cai
+em poucas categorias (pós-cirúrgico, fratura, coluna, joelho, ombro...), então:
+
+  - classificar_queixa: palavras-chave por categoria num único autômato
+    (casamento_padroes), em ordem de prioridade — pós-cirúrgico e fratura antes
+    da região do corpo, região antes de "dor" genérica;
+  - acolhimento_local: escolhe uma frase do conjunto curado da categoria (a
+    escolha é estável para o mesmo texto);
+  - sem categoria → None, e o chamador segue para o LLM.
+
+As frases seguem as regras do prompt do LLM: uma frase curta, sem perguntas,
+sem falar de convênio, valores ou procedimentos.
+"""
+import os
+import re
+import zlib
+import threading
+
+from casamento_padroes import CasadorPadroes, normalizar_texto
+
+ACOLHIMENTO_LOCAL = os.environ.get("ACOLHIMENTO_LOCAL", "1") == "1"
+
+# Ordem = prioridade. Padrões com espaço nas pontas casam palavra inteira / início de palavra
+# (o texto é analisado só com letras e números, separados por espaço).
+CATEGORIAS = [
+    ("pos_cirurgico", [" cirurgia", " cirurgic", " operei", " operad", " operacao", " pos operatori", " pos op ", " protese",
+                       " artroscopia", " reconstrucao", " artrodese", " tirei os pontos", " retirei os pontos"]),
+    ("fratura", [" fratur", " quebrei", " quebrou", " quebrad", " gesso", " trincou", " trinca", " luxacao", " luxei"]),
+    ("neurologico", [" avc ", " derrame", " parkinson", " esclerose", " neuropatia", " paralisia", " alzheimer",
+                     " lesao medular", " sequela", " neurologic", " hemiplegia", " paraplegia"]),
+    ("pelvico", [" incontinencia", " assoalho pelvico", " pelvic", " pos parto", " gestante", " gravida",
+                 " gravidez", " perda de urina", " escape de urina", " prolapso", " endometriose", " dispareunia"]),
+    ("coluna", [" coluna", " lombar", " lombalgia", " hernia", " costas", " cervical", " ciatic", " escoliose",
+                " bico de papagaio", " torcicolo", " pescoco", " protusao", " protrusao", " discopatia"]),
+    ("joelho", [" joelho", " menisco", " ligamento cruzado", " lca ", " patela", " condromalacia"]),
+    ("ombro", [" ombro", " manguito", " bursite", " capsulite", " clavicula", " supraespinhal"]),
+    ("quadril", [" quadril", " virilha", " coxa ", " coxas ", " gluteo", " artrose no quadril"]),
+    ("tornozelo_pe", [" tornozelo", " torci o pe", " entorse", " pe ", " pes ", " fascite", " calcanhar",
+                      " esporao", " aquiles"]),
+    ("mao_punho", [" punho", " mao ", " maos ", " tunel do carpo", " dedo", " cotovelo", " epicondilite",
+                   " tendinite", " dedos "]),
+    ("esporte", [" corrida", " correr", " academia", " futebol", " treino", " musculacao", " lesao esportiva",
+                 " crossfit", " estiramento", " distensao", " atleta", " maratona"]),
+    ("dor", [" dor ", " dores ", " doi ", " doendo", " dolorid", " inflama", " inchad", " travad", " travou",
+             " contratura", " incomodo", " incomoda", " machuquei", " fibromialgia", " artrose", " artrite",
+             " lesao "]),
+    ("prevencao", [" postura", " prevenc", " prevenir", " fortalec", " condicionamento", " alongamento",
+                   " bem estar", " qualidade de vida", " check up"]),
+]
+_NEGACAO_DOR = [" sem dor ", " sem dores ", " nao tenho dor", " nao sinto dor", " nao tenho dores", " nao sinto dores"]
+
+FRASES = {
+    "pos_cirurgico": [
+        "A recuperação depois de uma cirurgia pede cuidado e acompanhamento de perto, e nós vamos estar com você em cada etapa. 💙",
+        "Entendo, o pós-operatório é um momento importante e a fisioterapia faz toda a diferença para você voltar à rotina com segurança.",
+        "Fico feliz que você tenha nos procurado nessa fase de recuperação; vamos cuidar de você com toda a atenção que esse momento merece.",
+    ],
+    "fratura": [
+        "Sinto muito pela fratura, sei que é um período difícil, e vamos te ajudar a recuperar os movimentos com segurança. 💙",
+        "Uma fratura mexe com toda a rotina, mas com o acompanhamento certo a recuperação fica bem mais tranquila, conte com a gente.",
+        "Imagino o quanto isso tem sido desafiador; estamos aqui para te acompanhar de perto até você voltar a se movimentar bem.",
+    ],
+    "neurologico": [
+        "Obrigado por compartilhar; sabemos o quanto cada pequena conquista importa e vamos caminhar junto com você nesse processo. 💙",
+        "Entendo a sua situação e saiba que nossa equipe vai te acolher com todo o cuidado e paciência que você merece.",
+        "Agradeço a confiança em nos contar; vamos cuidar de você com carinho e atenção em cada etapa do tratamento.",
+    ],
+    "pelvico": [
+        "Obrigado pela confiança em compartilhar algo tão pessoal; aqui vamos te atender com todo o respeito e cuidado. 💙",
+        "Sei que não é fácil falar sobre isso, e fico feliz que você tenha nos procurado; vamos cuidar de você com toda a atenção.",
+        "Agradeço por nos contar; esse cuidado faz muita diferença na qualidade de vida e estamos aqui para te acompanhar.",
+    ],
+    "coluna": [
+        "Sinto muito pelo incômodo na coluna, sei o quanto isso atrapalha o dia a dia, e vamos cuidar de você com toda a atenção. 💙",
+        "Problemas na coluna tiram o conforto de qualquer rotina; fico feliz que você tenha nos procurado para cuidar disso.",
+        "Entendo perfeitamente, dor nas costas e na coluna é muito desgastante, e nossa equipe vai te ajudar a se sentir melhor.",
+    ],
+    "joelho": [
+        "Sinto muito pelo problema no joelho, sei o quanto ele limita os movimentos, e vamos te ajudar a recuperar a confiança para se movimentar. 💙",
+        "Entendo, o joelho participa de quase tudo que fazemos, e nossa equipe vai cuidar de você com toda a atenção.",
+        "Fico feliz que você tenha nos procurado; vamos cuidar do seu joelho para você voltar às suas atividades com mais conforto.",
+    ],
+    "ombro": [
+        "Sinto muito pelo incômodo no ombro, sei como isso atrapalha até as tarefas mais simples, e vamos cuidar de você. 💙",
+        "Entendo perfeitamente, dor no ombro limita muito a rotina, e nossa equipe vai te ajudar a recuperar os movimentos.",
+        "Fico feliz que você tenha nos procurado; vamos cuidar do seu ombro com toda a atenção que ele precisa.",
+    ],
+    "quadril": [
+        "Sinto muito pelo incômodo no quadril, sei o quanto isso afeta o caminhar e o dia a dia, e vamos cuidar de você. 💙",
+        "Entendo perfeitamente, e saiba que nossa equipe vai te ajudar a se movimentar com mais conforto e segurança.",
+        "Fico feliz que você tenha nos procurado; vamos cuidar de você com atenção para aliviar esse desconforto.",
+    ],
+    "tornozelo_pe": [
+        "Sinto muito pelo problema no pé e tornozelo, sei como isso atrapalha cada passo, e vamos cuidar de você. 💙",
+        "Entendo perfeitamente, e nossa equipe vai te ajudar a voltar a caminhar com firmeza e conforto.",
+        "Fico feliz que você tenha nos procurado; vamos cuidar de você para que cada passo volte a ser tranquilo.",
+    ],
+    "mao_punho": [
+        "Sinto muito pelo incômodo, sei que mãos, punhos e cotovelos participam de tudo no dia a dia, e vamos cuidar de você. 💙",
+        "Entendo perfeitamente como isso atrapalha a rotina, e nossa equipe vai te ajudar a recuperar o conforto nos movimentos.",
+        "Fico feliz que você tenha nos procurado; vamos cuidar de você com toda a atenção para aliviar esse desconforto.",
+    ],
+    "esporte": [
+        "Sei o quanto é frustrante ficar longe dos treinos, e vamos te ajudar a voltar à atividade com segurança. 💙",
+        "Entendo perfeitamente; lesões no esporte pedem um cuidado específico e nossa equipe está pronta para te acompanhar.",
+        "Fico feliz que você tenha nos procurado; vamos cuidar de você para que volte a praticar o que gosta com tranquilidade.",
+    ],
+    "dor": [
+        "Sinto muito que você esteja passando por isso, conviver com dor é muito desgastante, e estamos aqui para cuidar de você. 💙",
+        "Entendo perfeitamente, e saiba que nossa equipe vai fazer de tudo para você se sentir melhor o quanto antes.",
+        "Compreendo como isso tira o conforto do dia a dia; fico feliz que tenha nos procurado e vamos cuidar de você com atenção.",
+    ],
+    "prevencao": [
+        "Que ótimo que você está cuidando da saúde de forma preventiva; vamos te acompanhar com todo o cuidado nessa jornada. 💙",
+        "Adoro ver esse cuidado com o corpo e a qualidade de vida, e nossa equipe vai te ajudar a alcançar seus objetivos.",
+        "Fico feliz com a sua iniciativa de cuidar do corpo; estamos aqui para te acompanhar de perto.",
+    ],
+}
+
+_lock_metricas = threading.Lock()
+METRICAS = {"locais": 0, "sem_categoria": 0, "por_categoria": {}}
+
+
+def _montar_casador():
+    return CasadorPadroes({**{nome: padroes for nome, padroes in CATEGORIAS}, "negacao_dor": _NEGACAO_DOR})
+
+
+_casador = _montar_casador()
+_PRIORIDADE = [nome for nome, _ in CATEGORIAS]
+
+
+def _preparar(texto):
+    # Só letras/números separados por espaço: os padrões com espaço viram limite de palavra
+    return " " + re.sub(r"[^a-z0-9]+", " ", normalizar_texto(texto)) + " "
+
+
+def classificar_queixa(texto):
+    """Categoria da queixa (ver CATEGORIAS) ou None se nada bater."""
+    analise = _casador.analisar(_preparar(texto))
+    for nome in _PRIORIDADE:
+        if nome == "dor" and analise.contem("negacao_dor"):
+            continue
+        if analise.contem(nome):
+            return nome
+    return None
+
+
+def acolhimento_local(texto):
+    """Frase de acolhimento curada para a queixa, ou None (o chamador usa o LLM)."""
+    categoria = classificar_queixa(texto)
+    with _lock_metricas:
+        if categoria is None:
+            METRICAS["sem_categoria"] += 1
+        else:
+            METRICAS["locais"] += 1
+            METRICAS["por_categoria"][categoria] = METRICAS["por_categoria"].get(categoria, 0) + 1
+    if categoria is None:
+        return None
+    frases = FRASES[categoria]
+    return frases[zlib.crc32(normalizar_texto(texto).encode("utf-8")) % len(frases)]
+
+
+def metricas_acolhimento():
+    with _lock_metricas:
+        m = {**METRICAS, "por_categoria": dict(METRICAS["por_categoria"])}
+    total = m["locais"] + m["sem_categoria"]
+    m["taxa_local"] = round(m["locais"] / total, 3) if total else 0.0
+    return m
@@ -0,0 +1,356 @@
+"""
+Camada de cache com backend plugável (substitui os dicts de módulo _patients_cache,
+_faq_cache e _porto_cache, que só valiam para um único worker/instância).
+
+Backends (CACHE_BACKEND):
+  - "memoria": LRU em processo (padrão)
+  - "disco":   SQLite local — compartilhado entre workers da mesma máquina
+  - "redis":   qualquer servidor Redis (REDIS_URL) — compartilhado entre instâncias;
+               FakeRedis implementa o mesmo subconjunto de comandos para testes
+
+Recursos:
+  - TTL por entrada, com "validade estendida": o valor vencido continua guardado
+    por mais um período e é devolvido se a recarga falhar (ex.: cota do Firestore)
+  - single-flight: no vencimento só UM chamador recalcula (trava local + trava no
+    backend); os demais aguardam o valor novo. A trava dura espera_single_flight
+    segundos (por Cache — o login Playwright da Porto leva bem mais que o padrão)
+    e só é solta depois que o valor novo está gravado
+  - métricas de hit/miss/recarga por namespace
+"""
+import os
+import sys
+import time
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import redis as _redis
+    REDIS_DISPONIVEL = True
+except ImportError:
+    _redis = None
+    REDIS_DISPONIVEL = False
+
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "memoria")  # memoria | disco | redis
+CACHE_DISCO_PATH = os.environ.get("CACHE_DISCO_PATH", "/tmp/cache_conectifisio.db")
+REDIS_URL = os.environ.get("REDIS_URL", "")
+CACHE_MAX_ITENS = int(os.environ.get("CACHE_MAX_ITENS", "2000"))
+
+_FATOR_OBSOLETO = 10  # valor vencido fica disponível como fallback por 10x o TTL
+_ESPERA_SINGLE_FLIGHT = 15  # padrão: validade da trava e espera máxima por outro processo
+_LIMPEZA_DISCO_S = 600  # intervalo entre as remoções de linhas vencidas do BackendDisco
+
+
+# ==========================================
+# BACKENDS
+# ==========================================
+class BackendMemoria:
+    """LRU em processo. Valores guardados como objetos (sem serialização)."""
+
+    def __init__(self, max_itens=CACHE_MAX_ITENS):
+        self._dados = OrderedDict()
+        self._travas = {}
+        self._max = max_itens
+        self._lock = threading.Lock()
+
+    def get(self, chave):
+        with self._lock:
+            item = self._dados.get(chave)
+            if item is None:
+                return None
+            valor, expira_fisico = item
+            if expira_fisico < time.time():
+                del self._dados[chave]
+                return None
+            self._dados.move_to_end(chave)
+            return valor
+
+    def set(self, chave, valor, ttl):
+        with self._lock:
+            self._dados[chave] = (valor, time.time() + ttl)
+            self._dados.move_to_end(chave)
+            while len(self._dados) > self._max:
+                self._dados.popitem(last=False)
+
+    def delete(self, chave):
+        with self._lock:
+            self._dados.pop(chave, None)
+
+    def adquirir_trava(self, chave, ttl):
+        with self._lock:
+            agora = time.time()
+            if self._travas.get(chave, 0) > agora:
+                return False
+            self._travas[chave] = agora + ttl
+            return True
+
+    def liberar_trava(self, chave):
+        with self._lock:
+            self._travas.pop(chave, None)
+
+
+class BackendDisco:
+    """SQLite local (WAL) — vários workers gunicorn na mesma máquina enxergam o mesmo cache."""
+
+    def __init__(self, caminho=CACHE_DISCO_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(caminho, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS cache (chave TEXT PRIMARY KEY, valor BLOB, expira_em REAL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS travas (chave TEXT PRIMARY KEY, expira_em REAL)")
+        self._ultima_limpeza = 0
+
+    def _limpar_vencidos(self, agora):
+        """Chamado com self._lock — entradas vencidas (inclusive a validade estendida) saem do arquivo."""
+        if agora - self._ultima_limpeza < _LIMPEZA_DISCO_S:
+            return
+        self._ultima_limpeza = agora
+        self._conn.execute("DELETE FROM cache WHERE expira_em < ?", (agora,))
+        self._conn.execute("DELETE FROM travas WHERE expira_em < ?", (agora,))
+
+    def get(self, chave):
+        with self._lock:
+            row = self._conn.execute("SELECT valor, expira_em FROM cache WHERE chave = ?", (chave,)).fetchone()
+        if not row or row[1] < time.time():
+            return None
+        return pickle.loads(row[0])
+
+    def set(self, chave, valor, ttl):
+        blob = pickle.dumps(valor)
+        agora = time.time()
+        with self._lock:
+            self._limpar_vencidos(agora)
+            self._conn.execute("INSERT OR REPLACE INTO cache (chave, valor, expira_em) VALUES (?, ?, ?)",
+                               (chave, blob, agora + ttl))
+
+    def delete(self, chave):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE chave = ?", (chave,))
+
+    def adquirir_trava(self, chave, ttl):
+        agora = time.time()
+        with self._lock:
+            self._conn.execute("DELETE FROM travas WHERE chave = ? AND expira_em < ?", (chave, agora))
+            cur = self._conn.execute("INSERT OR IGNORE INTO travas (chave, expira_em) VALUES (?, ?)",
+                                     (chave, agora + ttl))
+            return cur.rowcount == 1
+
+    def liberar_trava(self, chave):
+        with self._lock:
+            self._conn.execute("DELETE FROM travas WHERE chave = ?", (chave,))
+
+
+class FakeRedis:
+    """Subconjunto do cliente redis-py usado aqui (get/set com px e nx/delete), em memória."""
+
+    def __init__(self):
+        self._dados = {}
+        self._lock = threading.Lock()
+
+    def get(self, nome):
+        with self._lock:
+            item = self._dados.get(nome)
+            if item is None:
+                return None
+            valor, expira = item
+            if expira is not None and expira < time.time():
+                del self._dados[nome]
+                return None
+            return valor
+
+    def set(self, nome, valor, ex=None, px=None, nx=False):
+        with self._lock:
+            agora = time.time()
+            atual = self._dados.get(nome)
+            if nx and atual is not None and (atual[1] is None or atual[1] >= agora):
+                return None
+            expira = agora + ex if ex else (agora + px / 1000.0 if px else None)
+            self._dados[nome] = (valor if isinstance(valor, bytes) else str(valor).encode(), expira)
+            return True
+
+    def delete(self, *nomes):
+        with self._lock:
+            return sum(1 for n in nomes if self._dados.pop(n, None) is not None)
+
+
+class BackendRedis:
+    def __init__(self, cliente):
+        self._r = cliente
+
+    def get(self, chave):
+        blob = self._r.get(chave)
+        return pickle.loads(blob) if blob is not None else None
+
+    def set(self, chave, valor, ttl):
+        self._r.set(chave, pickle.dumps(valor), px=max(1, int(ttl * 1000)))
+
+    def delete(self, chave):
+        self._r.delete(chave)
+
+    def adquirir_trava(self, chave, ttl):
+        return bool(self._r.set("trava:" + chave, b"1", px=max(1, int(ttl * 1000)), nx=True))
+
+    def liberar_trava(self, chave):
+        self._r.delete("trava:" + chave)
+
+
+def criar_backend(tipo=None):
+    tipo = tipo or CACHE_BACKEND
+    if tipo == "redis":
+        if REDIS_DISPONIVEL and REDIS_URL:
+            return BackendRedis(_redis.Redis.from_url(REDIS_URL, socket_timeout=2))
+        print("[CACHE] Redis indisponível (pacote ou REDIS_URL) — usando memória", file=sys.stderr)
+    elif tipo == "fake_redis":
+        return BackendRedis(FakeRedis())
+    elif tipo == "disco":
+        try:
+            return BackendDisco()
+        except Exception as e:
+            print(f"[CACHE] Falha ao abrir cache em disco: {e} — usando memória", file=sys.stderr)
+    return BackendMemoria()
+
+
+_backend_padrao = None
+_backend_lock = threading.Lock()
+
+
+def backend_padrao():
+    """Backend único do processo (todos os namespaces compartilham)."""
+    global _backend_padrao
+    with _backend_lock:
+        if _backend_padrao is None:
+            _backend_padrao = criar_backend()
+        return _backend_padrao
+
+
+# ==========================================
+# CACHE COM TTL + SINGLE-FLIGHT + MÉTRICAS
+# ==========================================
+_caches = {}
+
+
+class Cache:
+    def __init__(self, namespace, ttl, backend=None, espera_single_flight=_ESPERA_SINGLE_FLIGHT):
+        self.namespace = namespace
+        self.ttl = ttl
+        self._backend = backend
+        self.espera_single_flight = espera_single_flight  # > duração máxima de `carregar`
+        self._travas_locais = {}  # chave → [Lock, usuários]; sai da tabela quando ninguém mais usa
+        self._lock = threading.Lock()
+        self.metricas = {"hits": 0, "misses": 0, "recargas": 0, "esperas": 0, "obsoletos_servidos": 0, "erros": 0}
+        _caches[namespace] = self
+
+    @property
+    def backend(self):
+        return self._backend or backend_padrao()
+
+    def _chave(self, chave):
+        return f"{self.namespace}:{chave}"
+
+    @contextmanager
+    def _trava_local(self, chave):
+        with self._lock:
+            item = self._travas_locais.get(chave)
+            if item is None:
+                item = self._travas_locais[chave] = [threading.Lock(), 0]
+            item[1] += 1
+        try:
+            with item[0]:
+                yield
+        finally:
+            with self._lock:
+                item[1] -= 1
+                if item[1] == 0:
+                    del self._travas_locais[chave]
+
+    def _ler(self, chave):
+        """(valor, fresco) ou (None, False)."""
+        try:
+            item = self.backend.get(self._chave(chave))
+        except Exception as e:
+            self.metricas["erros"] += 1
+            print(f"[CACHE] Erro lendo {self.namespace}:{chave}: {e}", file=sys.stderr)
+            return None, False
+        if item is None:
+            return None, False
+        valor, expira_logico = item
+        return valor, expira_logico >= time.time()
+
+    def definir(self, chave, valor, ttl=None):
+        ttl = ttl or self.ttl
+        try:
+            self.backend.set(self._chave(chave), (valor, time.time() + ttl), ttl * _FATOR_OBSOLETO)
+        except Exception as e:
+            self.metricas["erros"] += 1
+            print(f"[CACHE] Erro gravando {self.namespace}:{chave}: {e}", file=sys.stderr)
+
+    def invalidar(self, chave):
+        try:
+            self.backend.delete(self._chave(chave))
+        except Exception:
+            pass
+
+    def obter(self, chave, carregar=None, ttl=None):
+        return self.obter_com_origem(chave, carregar, ttl)[0]
+
+    def obter_com_origem(self, chave, carregar=None, ttl=None, fallback_em=None):
+        """Retorna (valor, origem) — origem: "cache" | "carregado" | "obsoleto" | "fallback" | None.
+        Sem `carregar`, só consulta. "obsoleto" = valor vencido servido enquanto outro
+        processo recalcula. "fallback" = `carregar` falhou e havia valor vencido
+        (fallback_em(exc) decide quais erros permitem isso; padrão: todos).
+        Resultado None de `carregar` não é guardado."""
+        valor, fresco = self._ler(chave)
+        if fresco:
+            self.metricas["hits"] += 1
+            return valor, "cache"
+        self.metricas["misses"] += 1
+        if carregar is None:
+            return None, None
+
+        with self._trava_local(chave):
+            # Outro thread pode ter recarregado enquanto esperávamos a trava
+            valor, fresco = self._ler(chave)
+            if fresco:
+                self.metricas["hits"] += 1
+                return valor, "cache"
+            chave_trava = self._chave(chave)
+            tem_trava = self.backend.adquirir_trava(chave_trava, self.espera_single_flight)
+            if not tem_trava:
+                # Outro processo está recalculando: serve o vencido se houver, senão espera
+                if valor is not None:
+                    self.metricas["obsoletos_servidos"] += 1
+                    return valor, "obsoleto"
+                self.metricas["esperas"] += 1
+                limite = time.time() + self.espera_single_flight
+                while time.time() < limite:
+                    time.sleep(0.1)
+                    novo, fresco = self._ler(chave)
+                    if fresco:
+                        return novo, "cache"
+            try:
+                self.metricas["recargas"] += 1
+                novo = carregar()
+                # Grava antes de soltar a trava: quem chegar depois já encontra o valor novo
+                if novo is not None:
+                    self.definir(chave, novo, ttl)
+            except Exception as e:
+                if valor is not None and (fallback_em is None or fallback_em(e)):
+                    self.metricas["obsoletos_servidos"] += 1
+                    return valor, "fallback"
+                raise
+            finally:
+                if tem_trava:
+                    self.backend.liberar_trava(chave_trava)
+            return novo, "carregado"
+
+
+def metricas_caches():
+    resultado = {}
+    for nome, cache in _caches.items():
+        total = cache.metricas["hits"] + cache.metricas["misses"]
+        resultado[nome] = {**cache.metricas,
+                           "hit_rate": round(cache.metricas["hits"] / total, 4) if total else 0.0}
+    resultado["_backend"] = type(backend_padrao()).__name__
+    return resultado
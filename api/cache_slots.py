@@ -0,0 +1,173 @@
+"""
+Cache de horários disponíveis do Feegow (appoints/available-schedule).
+
+Todo reagendamento (reagendando_preferencia, reagendando_tipo) consultava o
+Feegow ao vivo enquanto o paciente esperava "Buscando horários disponíveis... ⏳".
+Agora:
+
+  - os slots ficam em memória por (local_id, procedimento_id, unidade_id, data),
+    com validade SLOTS_TTL; uma consulta de intervalo é só a varredura dos dias
+    em memória. Dias que faltam (ou vencidos) viram UMA chamada cobrindo do
+    primeiro ao último dia faltante;
+  - um thread de prefetch renova, a cada SLOTS_PREFETCH_INTERVALO, a janela de
+    hoje até 14 dias úteis para os equipamentos do _LOCAL_ID_MAP e para as
+    chaves consultadas nas últimas SLOTS_PREFETCH_USO_H horas;
+  - cancelamento/remarcação/escolha de horário invalida o dia afetado (ou tudo,
+    sem data) — equipamentos da mesma unidade dividem a agenda, então a
+    invalidação é por data em todas as chaves;
+  - falha do Feegow não é guardada: serve o que houver em memória (mesmo
+    vencido) e, sem nada, devolve lista vazia como antes.
+
+O resultado é sempre restrito ao intervalo pedido, em ordem de (data, hora).
+"""
+import os
+import sys
+import time
+import threading
+from datetime import datetime, timedelta
+
+SLOTS_TTL = int(os.environ.get("SLOTS_TTL", "600"))  # segundos
+SLOTS_PREFETCH = os.environ.get("SLOTS_PREFETCH", "1") == "1"
+SLOTS_PREFETCH_INTERVALO = int(os.environ.get("SLOTS_PREFETCH_INTERVALO", "300"))  # segundos
+SLOTS_PREFETCH_USO_H = int(os.environ.get("SLOTS_PREFETCH_USO_H", "24"))
+
+
+def _datas(inicio_iso, fim_iso):
+    atual = datetime.strptime(inicio_iso, "%Y-%m-%d")
+    fim = datetime.strptime(fim_iso, "%Y-%m-%d")
+    datas = []
+    while atual <= fim:
+        datas.append(atual.strftime("%Y-%m-%d"))
+        atual += timedelta(days=1)
+    return datas
+
+
+class CacheSlots:
+    def __init__(self, consultar_api, chaves_semente=(), janela_prefetch=None, ttl=SLOTS_TTL):
+        self._consultar_api = consultar_api  # (local_id, proc_id, ini_iso, fim_iso) → [slots] | None em falha
+        self._chaves_semente = list(chaves_semente)  # [(local_id, proc_id, unidade_id)]
+        self._janela_prefetch = janela_prefetch      # () → (ini_iso, fim_iso)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._dias = {}      # chave → {data_iso: (expira_em, [slots])}
+        self._uso = {}       # chave → última consulta (monotonic)
+        self._geracao = 0    # invalidação durante uma carga → a carga não é guardada
+        self._thread = None
+        self.metricas = {"consultas": 0, "hits": 0, "misses": 0, "chamadas_api": 0, "falhas_api": 0,
+                         "obsoletos_servidos": 0, "invalidacoes": 0, "prefetch_rodadas": 0}
+
+    # ------------------------------------------
+    # Consulta
+    # ------------------------------------------
+    def obter(self, local_id, proc_id, unidade_id, inicio_iso, fim_iso):
+        chave = (local_id, proc_id, unidade_id)
+        datas = _datas(inicio_iso, fim_iso)
+        agora = time.monotonic()
+        with self._lock:
+            self.metricas["consultas"] += 1
+            self._uso[chave] = agora
+            dias = self._dias.get(chave, {})
+            faltando = [d for d in datas if d not in dias or dias[d][0] <= agora]
+            if not faltando:
+                self.metricas["hits"] += 1
+                return self._varrer(dias, datas)
+            self.metricas["misses"] += 1
+        carregados = self._carregar(chave, faltando[0], faltando[-1])
+        with self._lock:
+            dias = dict(self._dias.get(chave, {}))
+            if carregados is None:
+                if any(d in dias for d in datas):
+                    self.metricas["obsoletos_servidos"] += 1
+                    print(f"[SLOTS] Feegow falhou — servindo horários em memória de {chave}", file=sys.stderr)
+            else:
+                dias.update({d: (0, lista) for d, lista in carregados.items()})
+            return self._varrer(dias, datas)
+
+    @staticmethod
+    def _varrer(dias, datas):
+        return [dict(s) for d in datas if d in dias for s in dias[d][1]]
+
+    def _carregar(self, chave, inicio_iso, fim_iso):
+        """Uma chamada ao Feegow para o intervalo; guarda dia a dia. None em falha."""
+        local_id, proc_id, _ = chave
+        with self._lock:
+            geracao = self._geracao
+            self.metricas["chamadas_api"] += 1
+        slots = self._consultar_api(local_id, proc_id, inicio_iso, fim_iso)
+        if slots is None:
+            with self._lock:
+                self.metricas["falhas_api"] += 1
+            return None
+        por_dia = {d: [] for d in _datas(inicio_iso, fim_iso)}
+        for s in sorted(slots, key=lambda x: (x.get("data", ""), x.get("hora", ""))):
+            if s.get("data") in por_dia:
+                por_dia[s["data"]].append(s)
+        with self._lock:
+            if geracao == self._geracao:
+                expira = time.monotonic() + self.ttl
+                dias = self._dias.setdefault(chave, {})
+                for d, lista in por_dia.items():
+                    dias[d] = (expira, lista)
+        return por_dia
+
+    # ------------------------------------------
+    # Invalidação
+    # ------------------------------------------
+    def invalidar(self, data_iso=None):
+        """Remove o dia (em todas as chaves) ou, sem data, tudo."""
+        with self._lock:
+            self._geracao += 1
+            self.metricas["invalidacoes"] += 1
+            if data_iso is None:
+                self._dias.clear()
+            for dias in self._dias.values():
+                dias.pop(data_iso, None)
+        print(f"[SLOTS] Invalidado: {data_iso or 'tudo'}", file=sys.stderr)
+
+    # ------------------------------------------
+    # Prefetch
+    # ------------------------------------------
+    def iniciar_prefetch(self):
+        with self._lock:
+            if self._thread is not None or not SLOTS_PREFETCH or self._janela_prefetch is None:
+                return
+            self._thread = threading.Thread(target=self._loop_prefetch, daemon=True, name="slots-prefetch")
+        self._thread.start()
+
+    def _chaves_prefetch(self):
+        limite = time.monotonic() - SLOTS_PREFETCH_USO_H * 3600
+        with self._lock:
+            recentes = [c for c, t in self._uso.items() if t >= limite]
+        return list(dict.fromkeys(self._chaves_semente + recentes))
+
+    def renovar(self):
+        """Uma rodada de prefetch: a janela inteira de cada chave, uma chamada por chave."""
+        inicio_iso, fim_iso = self._janela_prefetch()
+        for chave in self._chaves_prefetch():
+            try:
+                self._carregar(chave, inicio_iso, fim_iso)
+            except Exception as e:
+                print(f"[SLOTS] Prefetch {chave} falhou: {e}", file=sys.stderr)
+        with self._lock:
+            self.metricas["prefetch_rodadas"] += 1
+            # Dias que já passaram não voltam a ser consultados
+            for dias in self._dias.values():
+                for d in [d for d in dias if d < inicio_iso]:
+                    del dias[d]
+
+    def _loop_prefetch(self):
+        while True:
+            inicio = time.monotonic()
+            try:
+                self.renovar()
+            except Exception as e:
+                print(f"[SLOTS] Erro no prefetch: {e}", file=sys.stderr)
+            time.sleep(max(SLOTS_PREFETCH_INTERVALO - (time.monotonic() - inicio), 1))
+
+    def status(self):
+        with self._lock:
+            m = dict(self.metricas)
+            m.update({"chaves": len(self._dias), "dias_em_cache": sum(len(d) for d in self._dias.values()),
+                      "prefetch_ativo": self._thread is not None, "ttl": self.ttl})
+        m["taxa_acerto"] = round(m["hits"] / m["consultas"], 3) if m["consultas"] else 0.0
+        return m
@@ -0,0 +1,111 @@
+"""
+Casamento de várias listas de palavras-chave numa única passada (Aho-Corasick).
+
+O webhook testava a mesma mensagem contra várias listas com laços de `in`
+(pré-filtros do FAQ, pedido de recepção, socorro, cortesias, saudações, lead do
+Instagram). Aqui cada conjunto de listas vira um autômato compilado uma vez; analisar()
+percorre o texto uma vez e devolve todos os acertos, por intenção.
+
+Normalização: minúsculas e sem acentos (NFKD sem marcas combinantes), no texto e
+nos padrões — "recepção" casa com "recepcao" e vice-versa. O texto é analisado
+com um espaço de cada lado, então padrões como " rpg " também casam no início/fim.
+"""
+import unicodedata
+from collections import deque
+
+
+def normalizar_texto(texto):
+    decomposto = unicodedata.normalize("NFKD", (texto or "").lower())
+    return "".join(c for c in decomposto if not unicodedata.combining(c))
+
+
+class Analise:
+    """Acertos de uma mensagem: {intencao: [(ordem, padrao_original, inicio, fim)]}.
+    Posições no texto normalizado com o espaço inicial (o texto começa em 1)."""
+
+    __slots__ = ("texto", "acertos")
+
+    def __init__(self, texto, acertos):
+        self.texto = texto
+        self.acertos = acertos
+
+    def contem(self, intencao):
+        return intencao in self.acertos
+
+    def primeiro(self, intencao):
+        """(ordem, padrao) do acerto cujo padrão vem antes na lista, ou None."""
+        acertos = self.acertos.get(intencao)
+        if not acertos:
+            return None
+        ordem, padrao, _, _ = min(acertos)
+        return ordem, padrao
+
+    def inicia(self, intencao):
+        """Como texto.startswith(padrao) para algum padrão da intenção."""
+        return any(inicio == 1 for _, _, inicio, _ in self.acertos.get(intencao, ()))
+
+    def exato(self, intencao, descartar_fim=".!?,"):
+        """Algum padrão é a mensagem inteira (sem espaços nas pontas e sem a pontuação final)."""
+        nucleo = self.texto[1:-1].strip().rstrip(descartar_fim)
+        if not nucleo:
+            return False
+        inicio = 1 + self.texto[1:-1].index(nucleo)
+        fim = inicio + len(nucleo)
+        return any(i == inicio and f == fim for _, _, i, f in self.acertos.get(intencao, ()))
+
+    def distintos(self, intencao):
+        """Quantos padrões diferentes (após normalização) da intenção aparecem."""
+        return len({normalizar_texto(p) for _, p, _, _ in self.acertos.get(intencao, ())})
+
+
+class CasadorPadroes:
+    def __init__(self, intencoes):
+        """intencoes: {intencao: [padrao, ...]} — a posição na lista é a `ordem`."""
+        self._goto = [{}]
+        self._falha = [0]
+        self._saida = [[]]  # estado → [(intencao, ordem, padrao_original, tamanho)]
+        for intencao, padroes in intencoes.items():
+            for ordem, padrao in enumerate(padroes):
+                normalizado = normalizar_texto(padrao)
+                if normalizado:
+                    self._inserir(normalizado, (intencao, ordem, padrao, len(normalizado)))
+        self._construir_falhas()
+
+    def _inserir(self, padrao, saida):
+        estado = 0
+        for c in padrao:
+            proximo = self._goto[estado].get(c)
+            if proximo is None:
+                proximo = len(self._goto)
+                self._goto[estado][c] = proximo
+                self._goto.append({})
+                self._falha.append(0)
+                self._saida.append([])
+            estado = proximo
+        self._saida[estado].append(saida)
+
+    def _construir_falhas(self):
+        # BFS: filhos da raiz falham para a raiz; os demais herdam as saídas do estado de falha
+        fila = deque(self._goto[0].values())
+        while fila:
+            estado = fila.popleft()
+            for c, proximo in self._goto[estado].items():
+                fila.append(proximo)
+                f = self._falha[estado]
+                while f and c not in self._goto[f]:
+                    f = self._falha[f]
+                self._falha[proximo] = self._goto[f].get(c, 0)
+                self._saida[proximo] = self._saida[proximo] + self._saida[self._falha[proximo]]
+
+    def analisar(self, texto):
+        texto = " " + normalizar_texto(texto) + " "
+        goto, falha, saida = self._goto, self._falha, self._saida
+        acertos = {}
+        estado = 0
+        for pos, c in enumerate(texto):
+            while estado and c not in goto[estado]:
+                estado = falha[estado]
+            estado = goto[estado].get(c, 0)
+            for intencao, ordem, padrao, tamanho in saida[estado]:
+                acertos.setdefault(intencao, []).append((ordem, padrao, pos + 1 - tamanho, pos + 1))
+        return Analise(texto, acertos)
@@ -0,0 +1,277 @@
+"""
+Cliente compartilhado para as chamadas à OpenAI (FAQ, acolhimento, extração de
+data, interpretação de serviço, embeddings).
+
+Antes cada função fazia seu POST bloqueante com timeout próprio: com a OpenAI
+lenta, todos os workers do webhook ficavam parados 10–15s. Aqui:
+
+  - Orçamento por mensagem: iniciar_orcamento() no começo do processamento de uma
+    mensagem fixa um prazo total (LLM_ORCAMENTO_MENSAGEM). Cada chamada usa como
+    timeout o menor entre o seu e o que resta; sem orçamento, nem tenta.
+  - Disjuntor: LLM_FALHAS_PARA_ABRIR falhas seguidas (timeout, conexão, 429/5xx)
+    abrem o circuito por LLM_DISJUNTOR_ABERTO_S — as chamadas devolvem None na hora
+    e os chamadores usam o texto estático. Depois disso, uma chamada de teste
+    decide se fecha ou reabre.
+  - Hedging (chamadas determinísticas, hedge=True): se a resposta passar do p95
+    da finalidade, dispara uma segunda requisição igual e fica com a primeira que
+    voltar.
+  - completar_async(): roda a chamada num pool e devolve um Future — o webhook
+    dispara o acolhimento assim que sabe o status e segue com o resto do
+    processamento (leituras/escritas no Firestore) enquanto a OpenAI responde.
+  - Métricas por finalidade: chamadas, falhas, tokens de entrada/saída, latência.
+
+Todas as funções devolvem None em vez de levantar exceção (exceto embeddings,
+que levanta — o índice do FAQ trata).
+"""
+import os
+import sys
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from http_cliente import http_post
+
+LLM_ORCAMENTO_MENSAGEM = float(os.environ.get("LLM_ORCAMENTO_MENSAGEM", "12"))  # segundos por mensagem recebida
+LLM_FALHAS_PARA_ABRIR = int(os.environ.get("LLM_FALHAS_PARA_ABRIR", "5"))
+LLM_DISJUNTOR_ABERTO_S = float(os.environ.get("LLM_DISJUNTOR_ABERTO_S", "30"))
+LLM_WORKERS = int(os.environ.get("LLM_WORKERS", "8"))
+LLM_HEDGE_MIN_S = float(os.environ.get("LLM_HEDGE_MIN_S", "3"))  # nunca duplica antes disso
+
+_URL_BASE = "https://api.openai.com/v1"
+_ORCAMENTO_MINIMO = 0.5  # abaixo disso nem vale abrir a requisição
+_AMOSTRAS_HEDGE = 20     # amostras mínimas para usar o p95 como gatilho
+AMOSTRAS_LATENCIA = 500
+
+_thread_local = threading.local()
+
+
+# ==========================================
+# ORÇAMENTO POR MENSAGEM
+# ==========================================
+def iniciar_orcamento(segundos=LLM_ORCAMENTO_MENSAGEM):
+    _thread_local.prazo = time.monotonic() + segundos
+
+
+def encerrar_orcamento():
+    _thread_local.prazo = None
+
+
+def restante():
+    """Segundos que restam do orçamento da mensagem atual (None = sem orçamento)."""
+    prazo = getattr(_thread_local, "prazo", None)
+    return None if prazo is None else prazo - time.monotonic()
+
+
+# ==========================================
+# DISJUNTOR
+# ==========================================
+class Disjuntor:
+    def __init__(self, limite_falhas=LLM_FALHAS_PARA_ABRIR, tempo_aberto=LLM_DISJUNTOR_ABERTO_S):
+        self.limite_falhas = limite_falhas
+        self.tempo_aberto = tempo_aberto
+        self._lock = threading.Lock()
+        self._falhas = 0
+        self._aberto_ate = 0.0
+        self._em_teste = False
+        self.aberturas = 0
+
+    def permitir(self):
+        with self._lock:
+            if self._falhas < self.limite_falhas:
+                return True
+            if time.monotonic() < self._aberto_ate or self._em_teste:
+                return False
+            self._em_teste = True  # meio-aberto: só esta chamada passa
+            return True
+
+    def sucesso(self):
+        with self._lock:
+            self._falhas = 0
+            self._em_teste = False
+
+    def falha(self):
+        with self._lock:
+            self._falhas += 1
+            self._em_teste = False
+            if self._falhas >= self.limite_falhas:
+                if self._aberto_ate < time.monotonic():
+                    self.aberturas += 1
+                    print(f"[LLM] Disjuntor ABERTO por {self.tempo_aberto:.0f}s após {self._falhas} falhas", file=sys.stderr)
+                self._aberto_ate = time.monotonic() + self.tempo_aberto
+
+    def estado(self):
+        with self._lock:
+            if self._falhas < self.limite_falhas:
+                return "fechado"
+            return "aberto" if time.monotonic() < self._aberto_ate else "meio_aberto"
+
+
+# ==========================================
+# CLIENTE
+# ==========================================
+class ClienteLLM:
+    def __init__(self, chave_api, workers=LLM_WORKERS):
+        self._chave_api = chave_api  # callable → chave atual (lida a cada chamada)
+        self.disjuntor = Disjuntor()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llm")
+        self._pool_hedge = ThreadPoolExecutor(max_workers=workers * 2, thread_name_prefix="llm-hedge")
+        self._lock = threading.Lock()
+        self._metricas = {}
+
+    # ------------------------------------------
+    # API
+    # ------------------------------------------
+    def completar(self, finalidade, mensagens, modelo="gpt-4o-mini", max_tokens=80, temperature=0.0,
+                  timeout=15, hedge=False):
+        """Texto da resposta do chat completions, ou None (sem chave, disjuntor aberto,
+        orçamento esgotado, erro)."""
+        payload = {"model": modelo, "messages": mensagens, "max_tokens": max_tokens, "temperature": temperature}
+        dados = self._executar(finalidade, "/chat/completions", payload, timeout, hedge)
+        if not dados:
+            return None
+        return (dados.get("choices") or [{}])[0].get("message", {}).get("content", "").strip()
+
+    def completar_async(self, finalidade, mensagens, **kwargs):
+        """Como completar(), num thread do pool. O orçamento da mensagem atual vai junto."""
+        prazo = getattr(_thread_local, "prazo", None)
+
+        def tarefa():
+            _thread_local.prazo = prazo
+            try:
+                return self.completar(finalidade, mensagens, **kwargs)
+            finally:
+                _thread_local.prazo = None
+        return self._pool.submit(tarefa)
+
+    def embeddings(self, finalidade, textos, modelo, timeout=10):
+        dados = self._executar(finalidade, "/embeddings", {"model": modelo, "input": textos}, timeout, False)
+        if not dados:
+            raise RuntimeError("embeddings indisponíveis")
+        return [d["embedding"] for d in sorted(dados.get("data", []), key=lambda d: d.get("index", 0))]
+
+    # ------------------------------------------
+    # Internos
+    # ------------------------------------------
+    def _m(self, finalidade):
+        m = self._metricas.get(finalidade)
+        if m is None:
+            m = self._metricas[finalidade] = {
+                "chamadas": 0, "ok": 0, "falhas": 0, "disjuntor_aberto": 0, "sem_orcamento": 0,
+                "hedges": 0, "hedge_venceu": 0, "tokens_entrada": 0, "tokens_saida": 0,
+                "latencias": deque(maxlen=AMOSTRAS_LATENCIA)}
+        return m
+
+    def _contar(self, finalidade, **valores):
+        with self._lock:
+            m = self._m(finalidade)
+            for chave, valor in valores.items():
+                m[chave] += valor
+
+    def _p95(self, finalidade):
+        with self._lock:
+            amostras = sorted(self._m(finalidade)["latencias"])
+        if len(amostras) < _AMOSTRAS_HEDGE:
+            return None
+        return amostras[min(len(amostras) - 1, int(len(amostras) * 0.95))]
+
+    def _executar(self, finalidade, caminho, payload, timeout, hedge):
+        chave = self._chave_api()
+        if not chave:
+            return None
+        self._contar(finalidade, chamadas=1)
+        resta = restante()
+        if resta is not None:
+            if resta < _ORCAMENTO_MINIMO:
+                self._contar(finalidade, sem_orcamento=1)
+                print(f"[LLM] {finalidade}: orçamento da mensagem esgotado — usando fallback", file=sys.stderr)
+                return None
+            timeout = min(timeout, resta)
+        if not self.disjuntor.permitir():
+            self._contar(finalidade, disjuntor_aberto=1)
+            return None
+
+        inicio = time.perf_counter()
+        p95 = self._p95(finalidade) if hedge else None
+        if p95 is None:
+            dados, indisponivel = self._requisitar(caminho, payload, chave, timeout)
+        else:
+            dados, indisponivel = self._requisitar_com_hedge(finalidade, caminho, payload, chave, timeout,
+                                                             max(LLM_HEDGE_MIN_S, p95))
+        segundos = time.perf_counter() - inicio
+
+        if dados is None:
+            # Só indisponibilidade conta para o disjuntor (400 de payload ruim, não)
+            if indisponivel:
+                self.disjuntor.falha()
+            else:
+                self.disjuntor.sucesso()
+            self._contar(finalidade, falhas=1)
+            return None
+        self.disjuntor.sucesso()
+        uso = dados.get("usage") or {}
+        with self._lock:
+            m = self._m(finalidade)
+            m["ok"] += 1
+            m["tokens_entrada"] += uso.get("prompt_tokens", 0)
+            m["tokens_saida"] += uso.get("completion_tokens", 0)
+            m["latencias"].append(segundos)
+        return dados
+
+    def _requisitar(self, caminho, payload, chave, timeout):
+        """(json, None) em sucesso; (None, indisponivel) em erro — indisponivel=True para
+        timeout/conexão/429/5xx."""
+        headers = {"Authorization": f"Bearer {chave}", "Content-Type": "application/json"}
+        try:
+            res = http_post(_URL_BASE + caminho, json=payload, headers=headers, timeout=timeout)
+        except Exception as e:
+            print(f"[LLM] Erro OpenAI: {e}", file=sys.stderr)
+            return None, True
+        if res.status_code != 200:
+            print(f"[LLM] OpenAI HTTP {res.status_code}: {res.text[:200]}", file=sys.stderr)
+            return None, res.status_code == 429 or res.status_code >= 500
+        try:
+            return res.json(), False
+        except ValueError as e:
+            print(f"[LLM] Resposta inválida da OpenAI: {e}", file=sys.stderr)
+            return None, True
+
+    def _requisitar_com_hedge(self, finalidade, caminho, payload, chave, timeout, atraso):
+        limite = time.monotonic() + timeout
+        primeira = self._pool_hedge.submit(self._requisitar, caminho, payload, chave, timeout)
+        feitas, _ = wait([primeira], timeout=min(atraso, timeout))
+        if feitas:
+            return primeira.result()
+        resta = limite - time.monotonic()
+        if resta < _ORCAMENTO_MINIMO:
+            feitas, _ = wait([primeira], timeout=max(resta, 0))
+            return primeira.result() if feitas else (None, True)
+        self._contar(finalidade, hedges=1)
+        segunda = self._pool_hedge.submit(self._requisitar, caminho, payload, chave, resta)
+        pendentes = {primeira, segunda}
+        resultado = (None, True)
+        while pendentes:
+            feitas, pendentes = wait(pendentes, timeout=max(limite - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+            if not feitas:
+                return None, True
+            for f in feitas:
+                resultado = f.result()
+                if resultado[0] is not None:
+                    if f is segunda:
+                        self._contar(finalidade, hedge_venceu=1)
+                    return resultado
+        return resultado
+
+    def status(self):
+        with self._lock:
+            resultado = {"disjuntor": self.disjuntor.estado(), "aberturas_disjuntor": self.disjuntor.aberturas}
+            for finalidade, m in self._metricas.items():
+                amostras = sorted(m["latencias"])
+                item = {k: v for k, v in m.items() if k != "latencias"}
+                if amostras:
+                    n = len(amostras)
+                    item.update({"media_ms": round(1000 * sum(amostras) / n, 1),
+                                 "p50_ms": round(1000 * amostras[n // 2], 1),
+                                 "p95_ms": round(1000 * amostras[min(n - 1, int(n * 0.95))], 1)})
+                resultado[finalidade] = item
+            return resultado
@@ -0,0 +1,137 @@
+"""
+Idempotência do webhook — deduplicação por id da mensagem WhatsApp (wamid).
+
+A Meta reentrega o mesmo messages[].id quando o webhook demora; sem isso a
+mensagem era reprocessada (histórico duplicado, resposta enviada duas vezes).
+
+Duas camadas, ambas O(1):
+  1. LRU em memória limitado (OrderedDict) — reentregas no mesmo processo não
+     tocam em nada externo;
+  2. conjunto persistente com TTL — coleção Firestore "MensagensProcessadas"
+     (doc.create falha se o id já existe; configurar política de TTL no campo
+     "expira_em" no console) ou SQLite local como substituto.
+
+O id é marcado antes do processamento (duas entregas simultâneas não rodam em
+paralelo) e continua marcado mesmo se o processamento falhar — o paciente pode já
+ter recebido respostas. liberar() é só para ids que nem chegaram a ser processados.
+"""
+import os
+import sys
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from google.api_core.exceptions import AlreadyExists
+
+DEDUPE_LRU_MAX = int(os.environ.get("DEDUPE_LRU_MAX", "5000"))
+DEDUPE_TTL = int(os.environ.get("DEDUPE_TTL", "86400"))  # 24h — a Meta reentrega por até ~1 dia
+DEDUPE_SQLITE = os.environ.get("DEDUPE_SQLITE", "/tmp/dedupe_mensagens.db")
+
+
+class PersistenciaFirestore:
+    """Conjunto persistente na coleção MensagensProcessadas (doc id = wamid)."""
+
+    def __init__(self, obter_db, colecao="MensagensProcessadas", ttl=DEDUPE_TTL):
+        self._obter_db = obter_db
+        self._colecao = colecao
+        self._ttl = ttl
+
+    def marcar_se_nova(self, msg_id):
+        """True se o id ainda não existia (e agora foi gravado); False se é duplicata."""
+        db = self._obter_db()
+        if not db:
+            return True
+        agora = datetime.now(timezone.utc)
+        try:
+            db.collection(self._colecao).document(msg_id).create({
+                "criado_em": agora,
+                "expira_em": agora + timedelta(seconds=self._ttl)
+            })
+            return True
+        except AlreadyExists:
+            return False
+        except Exception as e:
+            # Falha de rede/cota: melhor processar do que perder a mensagem
+            print(f"[DEDUPE] Falha ao gravar {msg_id}: {e}", file=sys.stderr)
+            return True
+
+    def desmarcar(self, msg_id):
+        db = self._obter_db()
+        if not db:
+            return
+        try:
+            db.collection(self._colecao).document(msg_id).delete()
+        except Exception as e:
+            print(f"[DEDUPE] Falha ao liberar {msg_id}: {e}", file=sys.stderr)
+
+
+class PersistenciaSQLite:
+    """Substituto local (testes / execução sem Firebase)."""
+
+    def __init__(self, caminho=DEDUPE_SQLITE, ttl=DEDUPE_TTL):
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._ultima_limpeza = 0
+        self._conn = sqlite3.connect(caminho, check_same_thread=False, isolation_level=None)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS mensagens_processadas (id TEXT PRIMARY KEY, expira_em REAL)")
+
+    def marcar_se_nova(self, msg_id):
+        agora = time.time()
+        with self._lock:
+            if agora - self._ultima_limpeza > 600:
+                self._conn.execute("DELETE FROM mensagens_processadas WHERE expira_em < ?", (agora,))
+                self._ultima_limpeza = agora
+            row = self._conn.execute("SELECT expira_em FROM mensagens_processadas WHERE id = ?", (msg_id,)).fetchone()
+            if row and row[0] >= agora:
+                return False
+            self._conn.execute("INSERT OR REPLACE INTO mensagens_processadas (id, expira_em) VALUES (?, ?)",
+                               (msg_id, agora + self._ttl))
+            return True
+
+    def desmarcar(self, msg_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM mensagens_processadas WHERE id = ?", (msg_id,))
+
+
+class DedupeMensagens:
+    def __init__(self, persistencia, max_lru=DEDUPE_LRU_MAX):
+        self._persistencia = persistencia
+        self._max_lru = max_lru
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self.metricas = {"hits_memoria": 0, "hits_persistente": 0, "misses": 0, "liberadas": 0}
+
+    def ja_processada(self, msg_id):
+        """True se a mensagem já foi vista (descartar); False se é nova (já fica marcada)."""
+        if not msg_id:
+            return False
+        with self._lock:
+            if msg_id in self._lru:
+                self._lru.move_to_end(msg_id)
+                self.metricas["hits_memoria"] += 1
+                return True
+        nova = self._persistencia.marcar_se_nova(msg_id)
+        with self._lock:
+            self._lru[msg_id] = True
+            if len(self._lru) > self._max_lru:
+                self._lru.popitem(last=False)
+            self.metricas["hits_persistente" if not nova else "misses"] += 1
+        return not nova
+
+    def liberar(self, msg_id):
+        """Desfaz a marcação de uma mensagem que não chegou a ser processada — a reentrega volta a valer."""
+        if not msg_id:
+            return
+        with self._lock:
+            self._lru.pop(msg_id, None)
+            self.metricas["liberadas"] += 1
+        self._persistencia.desmarcar(msg_id)
+        print(f"[DEDUPE] {msg_id} liberada (não processada)", file=sys.stderr)
+
+    def status(self):
+        total = self.metricas["hits_memoria"] + self.metricas["hits_persistente"] + self.metricas["misses"]
+        hits = self.metricas["hits_memoria"] + self.metricas["hits_persistente"]
+        return {**self.metricas, "tamanho_lru": len(self._lru),
+                "taxa_duplicatas": round(hits / total, 4) if total else 0.0,
+                "persistencia": type(self._persistencia).__name__}
@@ -0,0 +1,7 @@
+"""
+Handlers da máquina de estados da conversa (ver maquina_estados.py).
+
+  - cadastro.py: primeiro atendimento, do "Olá" até o período preferido
+  - veterano.py: menu e agenda do paciente já cadastrado no Feegow
+  - pilates.py:  Instagram, Particular, Wellhub/TotalPass e Saúde Caixa
+"""
@@ -0,0 +1,876 @@
+"""
+Estados do primeiro atendimento: triagem, unidade, nome, especialidade,
+queixa, modalidade/convênio, dados cadastrais, documentos e período.
+
+Cada handler recebe o Contexto da mensagem (ver maquina_estados.py) e devolve
+a resposta do webhook — ou None para a resposta padrão {"status": "success"}.
+"""
+import re
+import sys
+from datetime import datetime
+from flask import jsonify
+
+from maquina_estados import registro
+from whatsapp import (  # carregado sob demanda, depois do whatsapp.py (ver maquina_estados.py)
+    PORTO_SEGURO_SENHA, UNIDADES, buscar_feegow_por_cpf, chamar_ia_custom,
+    enviar_botoes, enviar_lista, iniciar_verificacao_porto_background,
+    integrar_feegow, llm, marcar_precisa_recepcao, responder_texto, salvar_midia_imediata,
+    update_paciente, validar_cpf, validar_data_nascimento, verificar_cobertura,
+)
+
+
+@registro.estado("triagem", transicoes=["cadastrando_nome", "menu_veterano"])
+def estado_triagem(ctx):
+    phone, info, is_veteran = ctx.phone, ctx.info, ctx.is_veteran
+    if info.get("faq_encaminhou"):
+        # Veterano volta direto ao menu, sem pedir unidade
+        if is_veteran:
+            nome_salvo = info.get("title", "Paciente").split()[0]
+            update_paciente(phone, {"status": "menu_veterano", "faq_encaminhou": False})
+            secoes = [{"title": "Como posso ajudar?", "rows": [{"id": "v1", "title": "🗓️ Meus Agendamentos"}, {"id": "v2", "title": "🔄 Nova Guia/Tratamento"}, {"id": "v3", "title": "➕ Novo Serviço"}, {"id": "v5", "title": "🔑 Enviar Token"}, {"id": "v4", "title": "📁 Secretaria"}]}]
+            enviar_lista(phone, f"Olá, {nome_salvo}! 😊 Como posso te ajudar?", "Ver Opções", secoes)
+            return jsonify({"status": "veterano_faq_para_menu"}), 200
+        # Novo paciente: pede NOME (não pede unidade ainda)
+        update_paciente(phone, {"status": "cadastrando_nome", "faq_encaminhou": False})
+        responder_texto(phone,
+            "Olá! ✨ Seja muito bem-vindo(a) à Conectifisio.\n\n"
+            "Para iniciarmos seu atendimento, como você gostaria de ser chamado(a)? 😊"
+        )
+        return jsonify({"status": "faq_para_fluxo_nome"}), 200
+
+    # Veterano: pula direto pro menu
+    if is_veteran:
+        import sys as _sys_vet
+        nome_salvo = info.get("title", "Paciente").split()[0]
+        unidade_salva = info.get("unit", "")
+        try:
+            res_ag_vet = ctx.agenda_feegow()
+            if res_ag_vet and res_ag_vet.get("agendamentos"):
+                unidade_real_vet = res_ag_vet["agendamentos"][0].get("unidade", "")
+                if unidade_real_vet and unidade_real_vet != unidade_salva:
+                    unidade_salva = unidade_real_vet
+                    print(f"[VETERAN-UNIT] Unidade atualizada para {unidade_salva}", file=_sys_vet.stderr)
+        except Exception as e_vet:
+            print(f"[VETERAN-UNIT] Erro: {e_vet}", file=_sys_vet.stderr)
+        update_paciente(phone, {"status": "menu_veterano", "unit": unidade_salva})
+        secoes = [{"title": "Como posso ajudar?", "rows": [{"id": "v1", "title": "🗓️ Meus Agendamentos"}, {"id": "v2", "title": "🔄 Nova Guia/Tratamento"}, {"id": "v3", "title": "➕ Novo Serviço"}, {"id": "v5", "title": "🔑 Enviar Token"}, {"id": "v4", "title": "📁 Secretaria"}]}]
+        unid_txt = f" (unidade {unidade_salva})" if unidade_salva else ""
+        enviar_lista(phone, f"Olá, {nome_salvo}! ✨ Que bom ter você de volta{unid_txt}. Como posso te ajudar hoje?", "Ver Opções", secoes)
+        return jsonify({"status": "veterano_menu_direto"}), 200
+
+    # NOVO PACIENTE: pede o NOME ANTES de qualquer outra coisa
+    update_paciente(phone, {"status": "cadastrando_nome"})
+    if info.get("is_historico"):
+        responder_texto(phone,
+            "Olá! ✨ Que bom ter você de volta à Conectifisio.\n\n"
+            "Para iniciarmos seu atendimento, como você gostaria de ser chamado(a)? 😊"
+        )
+    else:
+        responder_texto(phone,
+            "Olá! ✨ Seja muito bem-vindo(a) à Conectifisio.\n\n"
+            "Para iniciarmos seu atendimento, como você gostaria de ser chamado(a)? 😊"
+        )
+
+
+@registro.estado(
+    "escolhendo_unidade",
+    transicoes=["cadastrando_nome", "escolhendo_especialidade", "menu_veterano"],
+    botoes=["São Caetano", "Ipiranga"],
+)
+def estado_escolhendo_unidade(ctx):
+    phone, info, msg_recebida, is_veteran = ctx.phone, ctx.info, ctx.msg_recebida, ctx.is_veteran
+    # Mantido para retrocompatibilidade quando volta ao Menu pelo retomar_fluxo
+    if msg_recebida not in ["São Caetano", "Ipiranga"]:
+         enviar_botoes(phone, "Por favor, utilize os botões abaixo para escolher a unidade:", [{"id": "u1", "title": "São Caetano"}, {"id": "u2", "title": "Ipiranga"}])
+    else:
+        unidade_info = UNIDADES.get(msg_recebida, {})
+        update_paciente(phone, {
+            "unit": msg_recebida,
+            "address": unidade_info.get("endereco"),
+            "maps_link": unidade_info.get("maps"),
+            "recommendation": unidade_info.get("recomendacao")
+        })
+        if is_veteran:
+            nome_salvo = info.get("title", "Paciente").split()[0]
+            update_paciente(phone, {"status": "menu_veterano"})
+            secoes = [{"title": "Como posso ajudar?", "rows": [{"id": "v1", "title": "🗓️ Meus Agendamentos"}, {"id": "v2", "title": "🔄 Nova Guia/Tratamento"}, {"id": "v3", "title": "➕ Novo Serviço"}, {"id": "v5", "title": "🔑 Enviar Token"}, {"id": "v4", "title": "📁 Secretaria"}]}]
+            enviar_lista(phone, f"Unidade {msg_recebida} selecionada! ✅\n\nOlá, {nome_salvo}! ✨ Que bom ter você de volta. Como posso te ajudar hoje?", "Ver Opções", secoes)
+        else:
+            # Caso novo paciente caia aqui (retomada): vai pra serviço
+            if info.get("title") and not info.get("title", "").startswith("Paciente"):
+                update_paciente(phone, {"status": "escolhendo_especialidade"})
+                secoes = [{"title": "Nossos Serviços", "rows": [{"id": "e1", "title": "Fisio Ortopédica"}, {"id": "e2", "title": "Fisio Neurológica"}, {"id": "e3", "title": "Fisio Pélvica"}, {"id": "e4", "title": "Acupuntura"}, {"id": "e5", "title": "Pilates Studio"}, {"id": "e6", "title": "Recovery"}, {"id": "e7", "title": "Liberação Miofascial"}, {"id": "e9", "title": "🔍 Não encontrei"}]}]
+                enviar_lista(phone, f"Unidade {msg_recebida} confirmada! ✅\n\nQual serviço você procura hoje?", "Ver Serviços", secoes)
+            else:
+                update_paciente(phone, {"status": "cadastrando_nome"})
+                responder_texto(phone, f"Unidade {msg_recebida} selecionada! ✅\n\nPara garantirmos um atendimento personalizado, como você gostaria de ser chamado(a)?")
+
+
+@registro.estado("cadastrando_nome", transicoes=["confirmando_paciente_real", "perguntando_para_quem"])
+def estado_cadastrando_nome(ctx):
+    phone, msg_recebida, tem_anexo = ctx.phone, ctx.msg_recebida, ctx.tem_anexo
+    # VALIDAÇÃO RIGOROSA: rejeita qualquer coisa que não seja nome
+    # (anexo, pergunta, URL, número, saudação, frase com verbos de pergunta)
+
+    # 1. Rejeita anexos
+    if tem_anexo:
+        responder_texto(phone,
+            "Antes de seguir, preciso saber como você gostaria de ser chamado(a). 😊\n\n"
+            "Pode me dizer seu nome?"
+        )
+        return jsonify({"status": "nome_anexo_rejeitado"}), 200
+
+    msg_stripped = msg_recebida.strip()
+    msg_lower_strip = msg_stripped.lower()
+
+    # 2. Rejeita perguntas (tem "?", "!")
+    tem_pontuacao_pergunta = "?" in msg_stripped or msg_stripped.endswith("!")
+
+    # 3. Rejeita URLs
+    tem_url = "http" in msg_lower_strip or "www." in msg_lower_strip
+
+    # 4. Rejeita só números
+    so_numeros = msg_stripped.replace(" ", "").replace("-", "").replace(".", "").isdigit()
+
+    # 5. Rejeita saudação isolada
+    saudacoes_puras = ["oi", "olá", "ola", "bom dia", "boa tarde", "boa noite",
+                       "oi!", "olá!", "ola!", "bom dia!", "boa tarde!", "boa noite!",
+                       "oii", "oiii", "ei", "alô", "alo"]
+    eh_saudacao = msg_lower_strip in saudacoes_puras
+
+    # 6. Rejeita início com verbos/pronomes de pergunta (formas variadas de "você")
+    verbos_pergunta = ["vocês", "voces", "voce", "vc", "vcs", "vces",
+                      "qual", "quanto", "como", "onde",
+                      "quando", "atendem", "atende", "atender", "fazem", "faz", "tem ",
+                      "preciso", "queria", "gostaria de saber", "gostaria saber",
+                      "podem", "pode me", "pode", "vou", "estou com dor", "estou querendo",
+                      "aceita", "aceitam", "realizam", "cobre", "cobrem"]
+    comeca_com_pergunta = any(msg_lower_strip.startswith(v) for v in verbos_pergunta)
+
+    # 6b. Rejeita palavras de pergunta/agendamento em QUALQUER posição (frases com 3+ palavras)
+    palavras_msg = msg_lower_strip.split()
+    palavras_pergunta_meio = [
+        "atende", "atendem", "atendimento", "atender",
+        "fazem", "faz", "realizam", "realiza",
+        "aceita", "aceitam", "cobrem", "cobre", "cobertura",
+        "convênio", "convenio", "plano", "seguro saúde",
+        "marcar", "agendar", "agendamento", "agenda",
+        "preço", "preco", "valor", "valores", "custa", "custo",
+        "disponível", "disponivel", "horário", "horario", "horarios",
+        "vaga", "vagas", "atendimento",
+        "particular", "consulta", "sessão", "sessao"
+    ]
+    tem_palavra_pergunta_no_meio = (
+        len(palavras_msg) >= 3 and
+        any(p in msg_lower_strip for p in palavras_pergunta_meio)
+    )
+
+    # 6c. Rejeita se mencionar nome de convênio (claramente não é nome de pessoa)
+    convenios_mencionados = [
+        "amil", "bradesco", "porto seguro", "porto", "prevent",
+        "saúde caixa", "saude caixa", "saúde petrobras", "saude petrobras",
+        "mediservice", "cassi", "geap", "unimed", "sulamerica", "sulamérica",
+        "hapvida", "notredame", "notre dame", "wellhub", "totalpass", "gympass"
+    ]
+    tem_convenio = any(c in msg_lower_strip for c in convenios_mencionados)
+
+    # 7. Rejeita mensagem muito longa (> 80 chars sugere frase, não nome)
+    muito_longo = len(msg_stripped) > 80
+
+    # 8. Rejeita texto sem letras
+    tem_letra = any(c.isalpha() for c in msg_stripped)
+
+    # 9. Tamanho mínimo
+    muito_curto = len(msg_stripped) < 2
+
+    nome_invalido = (tem_pontuacao_pergunta or tem_url or so_numeros or eh_saudacao
+                    or comeca_com_pergunta or tem_palavra_pergunta_no_meio
+                    or tem_convenio or muito_longo or not tem_letra or muito_curto)
+
+    if nome_invalido:
+        motivo = []
+        if tem_pontuacao_pergunta: motivo.append("pontuacao_pergunta")
+        if comeca_com_pergunta: motivo.append("inicio_pergunta")
+        if tem_palavra_pergunta_no_meio: motivo.append("palavra_pergunta_meio")
+        if tem_convenio: motivo.append("convenio_mencionado")
+        if eh_saudacao: motivo.append("saudacao")
+        if muito_longo: motivo.append("muito_longo")
+        if so_numeros: motivo.append("so_numeros")
+        if tem_url: motivo.append("url")
+        print(f"[NOME-BLOQUEIO] '{msg_recebida[:60]}' motivos={motivo}", file=sys.stderr)
+        responder_texto(phone,
+            "Para prosseguirmos com seu atendimento, preciso primeiro saber como você gostaria de ser chamado(a). 😊\n\n"
+            "Pode me dizer seu nome?"
+        )
+        return jsonify({"status": "nome_invalido"}), 200
+
+    # Detecta frase de terceiro ("estou agendando para minha mãe", etc)
+    frases_terceiro = [
+        "estou agendando para", "estou marcando para", "estou ligando para",
+        "sou a mãe de", "sou o pai de", "sou a esposa de", "sou o marido de",
+        "sou a filha de", "sou o filho de", "agendando para meu", "agendando para minha",
+        "marcando para meu", "marcando para minha", "para o meu marido", "para a minha esposa",
+        "para o meu pai", "para a minha mãe", "para meu filho", "para minha filha",
+        "para meu irmão", "para minha irmã", "mas estou vendo atendimento para"
+    ]
+    eh_terceiro = any(frase in msg_lower_strip for frase in frases_terceiro)
+
+    if eh_terceiro:
+        update_paciente(phone, {"title": msg_recebida, "agendado_por_terceiro": True, "status": "confirmando_paciente_real"})
+        responder_texto(phone, f"Entendido! 😊 Fico feliz em ajudar.\n\nPara garantirmos que o cadastro fique correto no sistema, por favor me informe o *NOME COMPLETO do paciente* que será atendido (conforme documento):")
+    else:
+        primeiro_nome = msg_stripped.split()[0].capitalize()
+        # Salva o nome e pergunta para quem é o atendimento
+        update_paciente(phone, {
+            "title": msg_recebida,
+            "primeiro_nome": primeiro_nome,
+            "status": "perguntando_para_quem"
+        })
+        enviar_botoes(phone,
+            f"Prazer em conhecer você, {primeiro_nome}! 😊\n\n"
+            f"Para te oferecermos a melhor experiência, vou te conduzir por algumas perguntas rápidas.\n\n"
+            f"O atendimento é para você ou para outra pessoa?",
+            [{"id": "pq_eu", "title": "Para mim"}, {"id": "pq_outro", "title": "Para outra pessoa"}]
+        )
+
+
+@registro.estado(
+    "perguntando_para_quem",
+    transicoes=["confirmando_paciente_real", "escolhendo_especialidade"],
+    botoes=["Para outra pessoa", "Para mim"],
+)
+def estado_perguntando_para_quem(ctx):
+    phone, info, msg_recebida, msg_limpa = ctx.phone, ctx.info, ctx.msg_recebida, ctx.msg_limpa
+    if "outra pessoa" in msg_limpa or msg_recebida == "Para outra pessoa":
+        update_paciente(phone, {"agendado_por_terceiro": True, "status": "confirmando_paciente_real"})
+        responder_texto(phone,
+            "Entendido! 😊\n\n"
+            "Por favor, me informe o *NOME COMPLETO* do paciente que será atendido (conforme documento):"
+        )
+    elif "mim" in msg_limpa or "para mim" in msg_limpa or msg_recebida == "Para mim":
+        # Pula para escolha de serviço
+        primeiro_nome = info.get("primeiro_nome") or info.get("title", "Paciente").split()[0]
+        update_paciente(phone, {"status": "escolhendo_especialidade"})
+        secoes = [{"title": "Nossos Serviços", "rows": [
+            {"id": "e1", "title": "Fisio Ortopédica"},
+            {"id": "e2", "title": "Fisio Neurológica"},
+            {"id": "e3", "title": "Fisio Pélvica"},
+            {"id": "e4", "title": "Acupuntura"},
+            {"id": "e5", "title": "Pilates Studio"},
+            {"id": "e6", "title": "Recovery"},
+            {"id": "e7", "title": "Liberação Miofascial"},
+            {"id": "e9", "title": "🔍 Não encontrei"}
+        ]}]
+        enviar_lista(phone,
+            f"Perfeito, {primeiro_nome}! 😊\n\nQual serviço você procura hoje?",
+            "Ver Serviços",
+            secoes
+        )
+    else:
+        enviar_botoes(phone,
+            "Por favor, escolha uma das opções abaixo:",
+            [{"id": "pq_eu", "title": "Para mim"}, {"id": "pq_outro", "title": "Para outra pessoa"}]
+        )
+
+
+@registro.estado("confirmando_paciente_real", transicoes=["escolhendo_especialidade"])
+def estado_confirmando_paciente_real(ctx):
+    phone, info, msg_recebida, msg_limpa = ctx.phone, ctx.info, ctx.msg_recebida, ctx.msg_limpa
+    if len(msg_limpa) < 2 or msg_recebida.isdigit():
+        responder_texto(phone, "❌ Por favor, digite o nome completo do paciente.")
+    else:
+        nome_responsavel = info.get("title", "")
+        update_paciente(phone, {"title": msg_recebida, "nome_responsavel": nome_responsavel, "status": "escolhendo_especialidade"})
+        secoes = [{"title": "Nossos Serviços", "rows": [
+            {"id": "e1", "title": "Fisio Ortopédica"},
+            {"id": "e2", "title": "Fisio Neurológica"},
+            {"id": "e3", "title": "Fisio Pélvica"},
+            {"id": "e4", "title": "Acupuntura"},
+            {"id": "e5", "title": "Pilates Studio"},
+            {"id": "e6", "title": "Recovery"},
+            {"id": "e7", "title": "Liberação Miofascial"},
+            {"id": "e9", "title": "🔍 Não encontrei"}
+        ]}]
+        enviar_lista(phone, f"Perfeito! Cadastro em nome de *{msg_recebida}*. ✅\n\nQual serviço o paciente procura hoje?", "Ver Serviços", secoes)
+
+
+@registro.estado(
+    "escolhendo_especialidade",
+    transicoes=["cadastrando_queixa", "interpretando_servico_livre", "menu_veterano", "pilates_modalidade", "transferencia_pilates", "triagem_neuro"],
+    botoes=["🔍 Não encontrei", "Recovery", "Liberação Miofascial", "Fisio Neurológica", "Pilates Studio"],
+)
+def estado_escolhendo_especialidade(ctx):
+    phone, info, msg_recebida = ctx.phone, ctx.info, ctx.msg_recebida
+    if "Voltar" in msg_recebida:
+        update_paciente(phone, {"status": "menu_veterano"})
+        secoes = [{"title": "Como posso ajudar?", "rows": [{"id": "v1", "title": "🗓️ Meus Agendamentos"}, {"id": "v2", "title": "🔄 Nova Guia/Tratamento"}, {"id": "v3", "title": "➕ Novo Serviço"}, {"id": "v5", "title": "🔑 Enviar Token"}, {"id": "v4", "title": "📁 Secretaria"}]}]
+        enviar_lista(phone, "Voltando ao menu principal. Como posso ajudar?", "Ver Opções", secoes)
+
+    # OPÇÃO "Não encontrei" — paciente descreve em texto livre
+    elif "Não encontrei" in msg_recebida or "Nao encontrei" in msg_recebida or msg_recebida == "🔍 Não encontrei":
+        update_paciente(phone, {"status": "interpretando_servico_livre"})
+        responder_texto(phone,
+            "Sem problemas! 😊\n\n"
+            "Me conte com suas palavras: qual tratamento você está procurando?\n\n"
+            "_Pode descrever o que está sentindo ou o nome do procedimento que você conhece._"
+        )
+
+    elif msg_recebida in ["Recovery", "Liberação Miofascial"]:
+        # Exceção 2: sempre Particular — vai direto pra queixa (sem perguntar modalidade)
+        update_paciente(phone, {"servico": msg_recebida, "modalidade": "Particular", "status": "cadastrando_queixa"})
+        responder_texto(phone, f"Ótima escolha! {msg_recebida} é um serviço particular. ✨\n\nPara prepararmos o atendimento, me conte brevemente: o que te trouxe aqui hoje?")
+
+    elif msg_recebida == "Fisio Neurológica":
+        # Etapa extra de mobilidade ANTES da queixa
+        update_paciente(phone, {"servico": msg_recebida, "status": "triagem_neuro"})
+        texto_neuro = "Queremos garantir que sua experiência na Conectifisio seja a mais confortável e segura possível. 😊\n\nPoderia nos contar em qual dessas opções de suporte você se enquadra hoje?\n\n1️⃣ Preciso de auxílio integral (ajuda de outra pessoa para me movimentar).\n2️⃣ Preciso de auxílio parcial (utilizo bengala, andador).\n3️⃣ Tenho autonomia total."
+        enviar_botoes(phone, texto_neuro, [{"id": "n1", "title": "1️⃣ Auxílio integral"}, {"id": "n2", "title": "2️⃣ Auxílio parcial"}, {"id": "n3", "title": "3️⃣ Autonomia total"}])
+
+    elif msg_recebida == "Pilates Studio":
+        # Exceção 1: Pilates só em São Caetano — fluxo próprio
+        if info.get("unit") == "Ipiranga":
+            update_paciente(phone, {"servico": msg_recebida, "status": "transferencia_pilates"})
+            enviar_botoes(phone, "O Pilates Studio é uma modalidade exclusiva da nossa unidade de *São Caetano*. 🧘‍♀️\n\nDeseja transferir o seu atendimento para lá para realizar o Pilates?", [{"id": "tp_sim", "title": "Sim, mudar p/ São Caetano"}, {"id": "tp_nao", "title": "Não, escolher outro"}])
+        else:
+            update_paciente(phone, {"servico": msg_recebida, "unit": "São Caetano", "status": "pilates_modalidade"})
+            secoes = [{"title": "Modalidade Pilates", "rows": [{"id": "p_part", "title": "💎 Plano Particular"}, {"id": "p_caixa", "title": "🏦 Saúde Caixa"}, {"id": "p_app", "title": "💪 Wellhub/Totalpass"}, {"id": "p_vol", "title": "⬅️ Voltar"}]}]
+            enviar_lista(phone, "Excelente escolha! 🧘‍♀️ O Pilates é fundamental para a correção postural e fortalecimento.\n\n📍 Atendemos Pilates exclusivamente em *São Caetano*.\n\nComo você pretende realizar as aulas?", "Ver Opções", secoes)
+
+    else:
+        # Fisio Ortopédica, Pélvica, Acupuntura → vai DIRETO pra queixa (unidade vem depois da modalidade)
+        update_paciente(phone, {"servico": msg_recebida, "status": "cadastrando_queixa"})
+        responder_texto(phone, f"Entendido! {msg_recebida} selecionada. ✅\n\nPara garantirmos o conforto e segurança no seu atendimento, me conte brevemente: o que te trouxe à clínica hoje?")
+
+
+@registro.estado(
+    "escolhendo_unidade_apos_servico",
+    transicoes=["agendando", "cadastrando_nome_completo", "num_carteirinha"],
+    botoes=["São Caetano", "Ipiranga"],
+)
+def estado_escolhendo_unidade_apos_servico(ctx):
+    phone, info, msg_recebida, is_veteran = ctx.phone, ctx.info, ctx.msg_recebida, ctx.is_veteran
+    if msg_recebida not in ["São Caetano", "Ipiranga"]:
+        enviar_botoes(phone,
+            "Por favor, escolha uma das unidades abaixo:",
+            [{"id": "u1", "title": "São Caetano"}, {"id": "u2", "title": "Ipiranga"}]
+        )
+        return jsonify({"status": "unidade_invalida"}), 200
+    unidade_info = UNIDADES.get(msg_recebida, {})
+    update_paciente(phone, {
+        "unit": msg_recebida,
+        "address": unidade_info.get("endereco"),
+        "maps_link": unidade_info.get("maps"),
+        "recommendation": unidade_info.get("recomendacao")
+    })
+    # Unidade escolhida DEPOIS da modalidade → agora vai pro cadastro
+    # (veterano pula cadastro e vai pro fluxo de convênio/agendamento conforme modalidade)
+    modalidade_atual = info.get("modalidade", "")
+    convenio_atual = info.get("convenio", "")
+    primeiro_nome = info.get("primeiro_nome", "")
+
+    if is_veteran:
+        # Veterano: já tem cadastro — vai direto conforme modalidade
+        if convenio_atual and convenio_atual.lower() != "particular":
+            update_paciente(phone, {"status": "num_carteirinha"})
+            responder_texto(phone, f"Unidade {msg_recebida} confirmada! ✅\n\nComo você já é nosso paciente, qual o NÚMERO DA SUA CARTEIRINHA? (Apenas números)")
+        else:
+            update_paciente(phone, {"status": "agendando"})
+            enviar_botoes(phone, f"Unidade {msg_recebida} confirmada! ✅\n\nQual o melhor período para você? ☀️⛅", [{"id": "t1", "title": "Manhã"}, {"id": "t2", "title": "Tarde"}])
+        return jsonify({"status": "unidade_veterano"}), 200
+
+    # Novo paciente: vai pro cadastro de nome completo
+    update_paciente(phone, {"status": "cadastrando_nome_completo"})
+    if primeiro_nome:
+        msg_nome = f"Unidade {msg_recebida} confirmada! ✅\n\nAgora, {primeiro_nome}, para o seu prontuário preciso do seu *nome completo conforme documento* (exigência do registro clínico):"
+    else:
+        msg_nome = f"Unidade {msg_recebida} confirmada! ✅\n\nPara o seu prontuário, preciso do seu *nome completo conforme documento*:"
+    responder_texto(phone, msg_nome)
+
+
+@registro.estado("interpretando_servico_livre", transicoes=["confirmando_servico_livre"])
+def estado_interpretando_servico_livre(ctx):
+    phone, msg_recebida = ctx.phone, ctx.msg_recebida
+    # Paciente descreveu em texto livre — usa o modelo v8 para interpretar
+    print(f"[SERVICO-LIVRE] Texto recebido: {msg_recebida[:80]}", file=sys.stderr)
+
+    # Primeiro: filtros locais antes da IA
+    msg_lower_serv = msg_recebida.lower()
+
+    # Detecta massagem → Liberação Miofascial
+    if any(w in msg_lower_serv for w in ["massagem", "massoterapia", "massotera"]):
+        if "miofascial" not in msg_lower_serv and "liberação" not in msg_lower_serv:
+            update_paciente(phone, {"status": "confirmando_servico_livre", "servico_sugerido": "Liberação Miofascial"})
+            enviar_botoes(phone,
+                "Não realizamos massagem terapêutica tradicional, mas oferecemos a *Liberação Miofascial*! 💆\n\n"
+                "É uma técnica manual eficaz para tensão muscular e dores, realizada por fisioterapeutas especializados.\n\n"
+                "É um serviço *particular*. É isso que você está procurando?",
+                [{"id": "sl_sim", "title": "✅ Sim, é isso"}, {"id": "sl_nao", "title": "❌ Não é isso"}]
+            )
+            return jsonify({"status": "sugerido_liberacao"}), 200
+
+    # Detecta serviços não atendidos
+    SERVICOS_NAO_ATENDIDOS_KEYWORDS = {
+        "ATM / disfunção temporomandibular": ["atm", "articulação temporomandibular", "temporomandibular", "disfunção tm"],
+        "fisioterapia facial / estética facial": ["fisioterapia facial", "fisio facial", "estética facial", "estetica facial"],
+        "fisioterapia pediátrica": ["pediátrica", "pediatrica", "infantil"],
+        "fisioterapia neuropediátrica": ["neuropediátrica", "neuropediatrica"],
+        "drenagem linfática": ["drenagem linfática", "drenagem linfatica", "drenagem"],
+        "RPG": [" rpg", "reeducação postural global"],
+        "quiropraxia": ["quiropraxia", "quiroprática"],
+        "fisioterapia respiratória": ["respiratória", "respiratoria"]
+    }
+    msg_pad_serv = " " + msg_lower_serv + " "
+    servico_nao_atendido = None
+    for nome_s, kws in SERVICOS_NAO_ATENDIDOS_KEYWORDS.items():
+        if any(kw in msg_pad_serv for kw in kws):
+            servico_nao_atendido = nome_s
+            break
+
+    if servico_nao_atendido:
+        responder_texto(phone,
+            f"Infelizmente ainda não atendemos *{servico_nao_atendido}*. 💙\n\n"
+            "Outros serviços que oferecemos:\n"
+            "• Fisioterapia Ortopédica\n"
+            "• Fisioterapia Neurológica\n"
+            "• Fisioterapia Pélvica\n"
+            "• Acupuntura\n"
+            "• Pilates Studio\n"
+            "• Recovery\n"
+            "• Liberação Miofascial\n\n"
+            "Nossa recepção vai te orientar sobre as melhores opções para o seu caso. 😊"
+        )
+        marcar_precisa_recepcao(phone, f"Solicitou serviço não atendido: {servico_nao_atendido}. Msg: {msg_recebida[:80]}")
+        return jsonify({"status": "servico_livre_nao_atendido"}), 200
+
+    # Tenta interpretar com o modelo
+    prompt_interpretacao = (
+        f"Paciente descreveu: \"{msg_recebida[:200]}\"\n\n"
+        "Qual dos serviços abaixo melhor corresponde ao que ele procura?\n"
+        "- Fisio Ortopédica\n"
+        "- Fisio Neurológica\n"
+        "- Fisio Pélvica\n"
+        "- Acupuntura\n"
+        "- Pilates Studio\n"
+        "- Recovery\n"
+        "- Liberação Miofascial\n\n"
+        "Responda APENAS com o nome exato do serviço da lista (sem explicações). "
+        "Se nenhum bater, responda NENHUM."
+    )
+    try:
+        resp_interp = llm.completar("servico_livre", [{"role": "user", "content": prompt_interpretacao}],
+                                    max_tokens=30, temperature=0.0, timeout=10, hedge=True)
+        if resp_interp is None:
+            raise RuntimeError("LLM indisponível")
+        print(f"[SERVICO-LIVRE] Modelo sugeriu: {resp_interp}", file=sys.stderr)
+
+        SERVICOS_VALIDOS = ["Fisio Ortopédica", "Fisio Neurológica", "Fisio Pélvica", "Acupuntura", "Pilates Studio", "Recovery", "Liberação Miofascial"]
+        servico_match = None
+        for sv in SERVICOS_VALIDOS:
+            if sv.lower() in resp_interp.lower() or resp_interp.lower() in sv.lower():
+                servico_match = sv
+                break
+
+        if servico_match:
+            update_paciente(phone, {"status": "confirmando_servico_livre", "servico_sugerido": servico_match})
+            enviar_botoes(phone,
+                f"Pelo que você descreveu, *{servico_match}* parece a melhor opção. 😊\n\nÉ isso que você procura?",
+                [{"id": "sl_sim", "title": "✅ Sim, é isso"}, {"id": "sl_nao", "title": "❌ Não é isso"}]
+            )
+        else:
+            # Modelo não conseguiu identificar → recepção
+            marcar_precisa_recepcao(phone, f"Serviço não identificado. Descrição livre: {msg_recebida[:120]}")
+            responder_texto(phone,
+                "Obrigado por compartilhar! 💙\n\n"
+                "Para te oferecermos a melhor orientação, vou conectar você com nossa recepção. "
+                "Em instantes alguém da equipe vai te atender pessoalmente. 😊"
+            )
+    except Exception as e_int:
+        print(f"[SERVICO-LIVRE] Erro IA: {e_int}", file=sys.stderr)
+        marcar_precisa_recepcao(phone, f"Erro ao interpretar serviço. Descrição: {msg_recebida[:120]}")
+        responder_texto(phone,
+            "Obrigado por compartilhar! 💙\n\n"
+            "Vou conectar você com nossa recepção para te orientar melhor. 😊"
+        )
+
+
+@registro.estado(
+    "confirmando_servico_livre",
+    transicoes=["cadastrando_queixa", "pilates_modalidade", "triagem_neuro"],
+    botoes=["✅ Sim, é isso", "sl_sim", "❌ Não é isso", "sl_nao"],
+)
+def estado_confirmando_servico_livre(ctx):
+    phone, info, msg_recebida, msg_limpa = ctx.phone, ctx.info, ctx.msg_recebida, ctx.msg_limpa
+    servico_sug = info.get("servico_sugerido", "")
+    if msg_recebida in ["✅ Sim, é isso", "sl_sim"] or "sim" in msg_limpa[:5]:
+        # Confirmado: entra no fluxo normal do serviço (queixa primeiro, igual escolhendo_especialidade)
+        update_paciente(phone, {"servico": servico_sug, "servico_sugerido": ""})
+        if servico_sug in ["Recovery", "Liberação Miofascial"]:
+            # Exceção 2: sempre particular → queixa direto
+            update_paciente(phone, {"modalidade": "Particular", "status": "cadastrando_queixa"})
+            responder_texto(phone, f"Perfeito! {servico_sug} é um serviço particular. ✨\n\nPara prepararmos o atendimento, me conte brevemente: o que te trouxe aqui hoje?")
+        elif servico_sug == "Pilates Studio":
+            # Exceção 1: Pilates fluxo próprio
+            update_paciente(phone, {"unit": "São Caetano", "status": "pilates_modalidade"})
+            secoes = [{"title": "Modalidade Pilates", "rows": [{"id": "p_part", "title": "💎 Plano Particular"}, {"id": "p_caixa", "title": "🏦 Saúde Caixa"}, {"id": "p_app", "title": "💪 Wellhub/Totalpass"}, {"id": "p_vol", "title": "⬅️ Voltar"}]}]
+            enviar_lista(phone, "Excelente! 🧘‍♀️\n\n📍 Atendemos Pilates exclusivamente em *São Caetano*.\n\nComo você pretende realizar as aulas?", "Ver Opções", secoes)
+        elif servico_sug == "Fisio Neurológica":
+            # Etapa extra de mobilidade
+            update_paciente(phone, {"status": "triagem_neuro"})
+            texto_neuro = "Queremos garantir que sua experiência seja a mais confortável e segura possível. 😊\n\nPoderia nos contar em qual dessas opções de suporte você se enquadra hoje?\n\n1️⃣ Preciso de auxílio integral (ajuda de outra pessoa para me movimentar).\n2️⃣ Preciso de auxílio parcial (utilizo bengala, andador).\n3️⃣ Tenho autonomia total."
+            enviar_botoes(phone, texto_neuro, [{"id": "n1", "title": "1️⃣ Auxílio integral"}, {"id": "n2", "title": "2️⃣ Auxílio parcial"}, {"id": "n3", "title": "3️⃣ Autonomia total"}])
+        else:
+            # Ortopédica, Pélvica, Acupuntura → queixa direto
+            update_paciente(phone, {"status": "cadastrando_queixa"})
+            responder_texto(phone, f"Perfeito! {servico_sug} confirmado. ✅\n\nPara prepararmos o atendimento, me conte brevemente: o que te trouxe à clínica hoje?")
+    elif msg_recebida in ["❌ Não é isso", "sl_nao"] or "não" in msg_limpa[:5] or "nao" in msg_limpa[:5]:
+        # Não é o serviço sugerido → marca recepção
+        marcar_precisa_recepcao(phone, f"Não confirmou serviço sugerido ({servico_sug}). Recepção avalia.")
+        responder_texto(phone,
+            "Entendido! Vou conectar você com nossa recepção para te orientar melhor sobre as opções disponíveis. 💙"
+        )
+    else:
+        enviar_botoes(phone,
+            f"O serviço *{servico_sug}* é o que você procura?",
+            [{"id": "sl_sim", "title": "✅ Sim, é isso"}, {"id": "sl_nao", "title": "❌ Não é isso"}]
+        )
+
+
+@registro.estado("triagem_neuro", transicoes=["triagem_neuro_queixa"])
+def estado_triagem_neuro(ctx):
+    phone, msg_limpa = ctx.phone, ctx.msg_limpa
+    if "integral" in msg_limpa or "1" in msg_limpa:
+        update_paciente(phone, {"mobilidade": "Necessidade de auxílio integral", "status": "triagem_neuro_queixa"})
+        responder_texto(phone, "Agradeço por compartilhar. ❤️ Para prepararmos o consultório com a estrutura correta para você, me conte brevemente: o que te trouxe à clínica hoje?")
+    else:
+        mobilidade = "Preciso de auxílio parcial" if "parcial" in msg_limpa or "2" in msg_limpa else "Autonomia total"
+        update_paciente(phone, {"mobilidade": mobilidade, "status": "triagem_neuro_queixa"})
+        responder_texto(phone, "Anotado! ✅\n\nPara prepararmos o consultório com a estrutura correta para você, me conte brevemente: o que te trouxe à clínica hoje?")
+
+
+@registro.estado("triagem_neuro_queixa", transicoes=["confirmando_convenio_salvo", "modalidade"], acolhimento=True)
+def estado_triagem_neuro_queixa(ctx):
+    phone, info, msg_recebida, is_veteran = ctx.phone, ctx.info, ctx.msg_recebida, ctx.is_veteran
+    acolhimento = chamar_ia_custom(msg_recebida) or "Compreendo perfeitamente, e saiba que estamos aqui para cuidar de você da melhor forma."
+    conv_salvo = info.get("convenio", "")
+    update_paciente(phone, {"queixa": msg_recebida, "queixa_ia": acolhimento, "lastPatientInteraction": datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S+00:00'), "status": "modalidade"})
+    if is_veteran and conv_salvo and conv_salvo.lower() != "particular":
+        update_paciente(phone, {"status": "confirmando_convenio_salvo"})
+        enviar_botoes(phone, f"{acolhimento}\n\nVi aqui que você já utilizou o convênio *{conv_salvo}*. Vamos seguir com ele para este serviço?", [{"id": "c_manter", "title": "Sim, manter plano"}, {"id": "c_trocar", "title": "Troquei de plano"}, {"id": "c_part", "title": "Mudar p/ Particular"}])
+    else:
+        enviar_botoes(phone, f"{acolhimento}\n\nDeseja atendimento pelo seu CONVÊNIO ou de forma PARTICULAR?", [{"id": "m1", "title": "Convênio"}, {"id": "m2", "title": "Particular"}])
+
+
+@registro.estado(
+    "cadastrando_queixa",
+    transicoes=["agendando", "confirmando_convenio_salvo", "escolhendo_unidade_apos_servico", "modalidade"],
+    acolhimento=True,
+)
+def estado_cadastrando_queixa(ctx):
+    phone, info, msg_recebida, servico, is_veteran = ctx.phone, ctx.info, ctx.msg_recebida, ctx.servico, ctx.is_veteran
+    # VALIDAÇÃO: rejeita respostas que não são queixa (paciente clicou achando que era avanço)
+    msg_strip_queixa = msg_recebida.strip().lower()
+    palavras_avanco = ["próximo", "proximo", "next", "avançar", "avancar", "ok",
+                      "sim", "tá", "ta", "blz", "beleza", "continuar", "vai",
+                      "manda", "pode mandar", "?", "."]
+    eh_resposta_curta_invalida = (
+        len(msg_strip_queixa) <= 12 and
+        (msg_strip_queixa in palavras_avanco or msg_strip_queixa.replace("!", "").replace(".", "").replace("?", "") in palavras_avanco)
+    )
+    if eh_resposta_curta_invalida:
+        responder_texto(phone,
+            "Por favor, me conte um pouquinho mais sobre o que está sentindo ou o motivo da consulta. 😊\n\n"
+            "_Pode descrever em poucas palavras: dor, lesão, recuperação, etc._"
+        )
+        return jsonify({"status": "queixa_invalida"}), 200
+
+    acolhimento = chamar_ia_custom(msg_recebida) or "Compreendo perfeitamente, e saiba que estamos aqui para cuidar de você da melhor forma."
+    if servico in ["Recovery", "Liberação Miofascial"]:
+        # Exceção 2: sempre particular, sem perguntar modalidade → vai pra unidade
+        if is_veteran:
+            update_paciente(phone, {"queixa": msg_recebida, "queixa_ia": acolhimento, "status": "agendando"})
+            enviar_botoes(phone, f"{acolhimento}\n\nComo você já é nosso paciente, vamos direto para a agenda. Qual o melhor período para você? ☀️⛅", [{"id": "t1", "title": "Manhã"}, {"id": "t2", "title": "Tarde"}])
+        else:
+            update_paciente(phone, {"queixa": msg_recebida, "queixa_ia": acolhimento, "status": "escolhendo_unidade_apos_servico"})
+            enviar_botoes(phone,
+                f"{acolhimento}\n\nEm qual unidade você prefere ser atendido?",
+                [{"id": "u1", "title": "São Caetano"}, {"id": "u2", "title": "Ipiranga"}]
+            )
+    else:
+        update_paciente(phone, {"queixa": msg_recebida, "queixa_ia": acolhimento, "status": "modalidade"})
+        conv_salvo = info.get("convenio", "")
+        if is_veteran and conv_salvo and conv_salvo.lower() != "particular":
+            update_paciente(phone, {"status": "confirmando_convenio_salvo"})
+            enviar_botoes(phone, f"{acolhimento}\n\nVi aqui que você já utilizou o convênio *{conv_salvo}*. Vamos seguir com ele para este serviço?", [{"id": "c_manter", "title": "Sim, manter plano"}, {"id": "c_trocar", "title": "Troquei de plano"}, {"id": "c_part", "title": "Mudar p/ Particular"}])
+        else:
+            enviar_botoes(phone, f"{acolhimento}\n\nDeseja atendimento pelo seu CONVÊNIO ou de forma PARTICULAR?", [{"id": "m1", "title": "Convênio"}, {"id": "m2", "title": "Particular"}])
+
+
+@registro.estado("modalidade", transicoes=["agendando", "escolhendo_unidade_apos_servico", "nome_convenio"])
+def estado_modalidade(ctx):
+    phone, msg_recebida, is_veteran = ctx.phone, ctx.msg_recebida, ctx.is_veteran
+    if "Convênio" in msg_recebida:
+        update_paciente(phone, {"modalidade": "Convênio", "status": "nome_convenio"})
+        secoes = [{"title": "Convênios Aceitos", "rows": [{"id": "c1", "title": "Saúde Petrobras"}, {"id": "c2", "title": "Mediservice"}, {"id": "c3", "title": "Cassi"}, {"id": "c4", "title": "Geap Saúde"}, {"id": "c5", "title": "Amil"}, {"id": "c6", "title": "Bradesco Saúde"}, {"id": "c7", "title": "Porto Seguro Saúde"}, {"id": "c8", "title": "Prevent Senior"}, {"id": "c9", "title": "Saúde Caixa"}]}]
+        enviar_lista(phone, "Selecione o seu plano de saúde para validarmos a cobertura:", "Ver Convênios", secoes)
+    else:
+        if is_veteran:
+            update_paciente(phone, {"modalidade": "Particular", "status": "agendando"})
+            enviar_botoes(phone, "Perfeito! Como você já é nosso paciente, vamos direto para a agenda. Qual o melhor período para você? ☀️⛅", [{"id": "t1", "title": "Manhã"}, {"id": "t2", "title": "Tarde"}])
+        else:
+            # Novo + Particular: pergunta UNIDADE antes do cadastro
+            update_paciente(phone, {"modalidade": "Particular", "status": "escolhendo_unidade_apos_servico"})
+            enviar_botoes(phone,
+                "Perfeito, atendimento Particular! ✨\n\nEm qual unidade você prefere ser atendido?",
+                [{"id": "u1", "title": "São Caetano"}, {"id": "u2", "title": "Ipiranga"}]
+            )
+
+
+@registro.estado(
+    "nome_convenio",
+    transicoes=["cobertura_recusada", "escolhendo_unidade_apos_servico", "num_carteirinha"],
+)
+def estado_nome_convenio(ctx):
+    phone, msg_recebida, servico, is_veteran = ctx.phone, ctx.msg_recebida, ctx.servico, ctx.is_veteran
+    convenio_selecionado = msg_recebida
+    CONVENIOS_VALIDOS = ["Saúde Petrobras", "Mediservice", "Cassi", "Geap Saúde", "Amil",
+                          "Bradesco Saúde", "Porto Seguro Saúde", "Prevent Senior", "Saúde Caixa"]
+    CONVENIOS_NAO_ATENDIDOS = ["Unimed", "Sulamerica", "SulAmérica", "Hapvida", "NotreDame", "Notre Dame", "Golden Cross", "Apivida"]
+    if any(c.lower() in convenio_selecionado.lower() for c in CONVENIOS_NAO_ATENDIDOS):
+        responder_texto(phone, f"Infelizmente não atendemos o convênio {convenio_selecionado}. 😊 Os convênios que aceitamos são: Amil, Bradesco Saúde, Porto Seguro, Prevent Senior, Saúde Caixa, Saúde Petrobras, Mediservice, Cassi e Geap Saúde. Gostaria de verificar outra opção ou realizar o atendimento particular?")
+    elif convenio_selecionado not in CONVENIOS_VALIDOS:
+        secoes = [{"title": "Convênios Aceitos", "rows": [{"id": "c1", "title": "Saúde Petrobras"}, {"id": "c2", "title": "Mediservice"}, {"id": "c3", "title": "Cassi"}, {"id": "c4", "title": "Geap Saúde"}, {"id": "c5", "title": "Amil"}, {"id": "c6", "title": "Bradesco Saúde"}, {"id": "c7", "title": "Porto Seguro Saúde"}, {"id": "c8", "title": "Prevent Senior"}, {"id": "c9", "title": "Saúde Caixa"}]}]
+        enviar_lista(phone, "❌ Por favor, selecione um dos convênios disponíveis na lista abaixo:", "Ver Convênios", secoes)
+    elif not verificar_cobertura(convenio_selecionado, servico):
+        update_paciente(phone, {"convenio": convenio_selecionado, "status": "cobertura_recusada"})
+        enviar_botoes(phone, f"⚠️ O seu plano *{convenio_selecionado}* não possui cobertura direta para *{servico}* na nossa clínica.\n\nNo entanto, você pode realizar o atendimento Particular para solicitar reembolso. Deseja seguir no particular?", [{"id": "part", "title": "Seguir Particular"}, {"id": "out", "title": "Escolher outro"}])
+    else:
+        if is_veteran:
+            update_paciente(phone, {"convenio": convenio_selecionado, "status": "num_carteirinha"})
+            responder_texto(phone, f"Anotado: {convenio_selecionado}! ✅\n\nComo você já é nosso paciente, pulei o preenchimento de CPF e E-mail! Para atualizarmos o seu cadastro, qual o NÚMERO DA SUA NOVA CARTEIRINHA? (Apenas números)")
+        else:
+            # Novo + Convênio: pergunta UNIDADE antes do cadastro
+            update_paciente(phone, {"convenio": convenio_selecionado, "status": "escolhendo_unidade_apos_servico"})
+            enviar_botoes(phone,
+                f"Anotado: {convenio_selecionado}! ✅\n\nEm qual unidade você prefere ser atendido?",
+                [{"id": "u1", "title": "São Caetano"}, {"id": "u2", "title": "Ipiranga"}]
+            )
+
+
+@registro.estado(
+    "cobertura_recusada",
+    transicoes=["agendando", "escolhendo_especialidade", "escolhendo_unidade_apos_servico"],
+)
+def estado_cobertura_recusada(ctx):
+    phone, msg_recebida, is_veteran = ctx.phone, ctx.msg_recebida, ctx.is_veteran
+    if "Particular" in msg_recebida:
+        if is_veteran:
+            update_paciente(phone, {"modalidade": "Particular", "status": "agendando"})
+            enviar_botoes(phone, "Perfeito! Mudamos para Particular. Qual o melhor período para você? ☀️ ⛅", [{"id": "t1", "title": "Manhã"}, {"id": "t2", "title": "Tarde"}])
+        else:
+            # Novo: ainda não escolheu unidade (recusa veio antes) → pergunta unidade
+            update_paciente(phone, {"modalidade": "Particular", "convenio": "", "status": "escolhendo_unidade_apos_servico"})
+            enviar_botoes(phone,
+                "Perfeito! Mudamos para Particular. ✨\n\nEm qual unidade você prefere ser atendido?",
+                [{"id": "u1", "title": "São Caetano"}, {"id": "u2", "title": "Ipiranga"}]
+            )
+    else:
+        update_paciente(phone, {"status": "escolhendo_especialidade"})
+        secoes = [{"title": "Nossos Serviços", "rows": [{"id": "e1", "title": "Fisio Ortopédica"}, {"id": "e2", "title": "Fisio Neurológica"}, {"id": "e3", "title": "Fisio Pélvica"}, {"id": "e4", "title": "Acupuntura"}]}]
+        enviar_lista(phone, "Sem problemas! Qual outro serviço você gostaria de buscar?", "Ver Serviços", secoes)
+
+
+@registro.estado("cadastrando_nome_completo", transicoes=["cpf"])
+def estado_cadastrando_nome_completo(ctx):
+    phone, msg_recebida, msg_limpa = ctx.phone, ctx.msg_recebida, ctx.msg_limpa
+    partes_nc = [p for p in msg_limpa.split() if len(p) >= 2]
+    if len(partes_nc) < 2 or msg_recebida.isdigit(): responder_texto(phone, "❌ Por favor, digite seu NOME E SOBRENOME completos:")
+    else:
+        update_paciente(phone, {"title": msg_recebida, "status": "cpf"})
+        responder_texto(phone, "Nome registrado! ✅ Agora, para validarmos o seu registro com segurança junto ao sistema, digite o seu CPF (apenas os 11 números):")
+
+
+@registro.estado("cpf", transicoes=["agendando", "data_nascimento", "num_carteirinha"])
+def estado_cpf(ctx):
+    phone, info, msg_recebida, modalidade, numero_id = ctx.phone, ctx.info, ctx.msg_recebida, ctx.modalidade, ctx.numero_id
+    cpf_limpo = re.sub(r'\D', '', msg_recebida)
+    if not validar_cpf(cpf_limpo):
+        responder_texto(phone, "❌ CPF inválido. Por favor, verifique os números e digite novamente:")
+    else:
+        conv_atual = info.get("convenio", "")
+
+        # ==========================================
+        # PORTO SEGURO — ELEGIBILIDADE SILENCIOSA
+        #
+        # MUDANÇA ARQUITETURAL (30/04/2026):
+        # 1. Salva o CPF e avança IMEDIATAMENTE para data de nascimento
+        # 2. Thread de elegibilidade roda em paralelo (silenciosa)
+        # 3. Resultado vai APENAS para o card no Kanban (badge verde/vermelho/amarelo)
+        # 4. Paciente nunca sabe se conseguimos ou não verificar a elegibilidade
+        # ==========================================
+        if any(x in conv_atual for x in ["Porto Seguro", "Itaú"]) and PORTO_SEGURO_SENHA:
+            # Salva CPF e avança o estado ANTES de disparar a thread
+            update_paciente(phone, {
+                "cpf": cpf_limpo,
+                "status": "data_nascimento",
+                "porto_elegibilidade_badge": "amarelo",  # Badge inicial: aguardando verificação
+                "porto_verificando": True
+            })
+            # Resposta natural — sem mencionar elegibilidade
+            responder_texto(phone, "CPF recebido! ✅ Para completarmos sua ficha clínica, qual sua data de nascimento? (Ex: 15/05/1980)")
+            # Thread dispara em background — não bloqueia o fluxo
+            iniciar_verificacao_porto_background(phone, cpf_limpo, numero_id)
+            return jsonify({"status": "cpf_recebido_porto_verificando"}), 200
+
+        # Outros convênios / Particular — fluxo padrão
+        busca = buscar_feegow_por_cpf(cpf_limpo)
+        if busca:
+            if modalidade == "Particular":
+                update_paciente(phone, {"cpf": cpf_limpo, "title": busca['nome'], "feegow_id": busca['id'], "status": "agendando"})
+                enviar_botoes(phone, f"Reconheci seu cadastro, {busca['nome']}! ✨\n\nPulei as etapas de e-mail e nascimento. Qual o melhor período para você?", [{"id": "t1", "title": "Manhã"}, {"id": "t2", "title": "Tarde"}])
+            else:
+                update_paciente(phone, {"cpf": cpf_limpo, "title": busca['nome'], "feegow_id": busca['id'], "status": "num_carteirinha"})
+                responder_texto(phone, f"Reconheci seu cadastro, {busca['nome']}! ✨\n\nPulei as etapas de e-mail e nascimento. Para atualizarmos o seu cadastro, qual o NÚMERO DA SUA CARTEIRINHA? (Apenas números)")
+        else:
+            update_paciente(phone, {"cpf": cpf_limpo, "status": "data_nascimento"})
+            responder_texto(phone, "Recebido! ✅ Para completarmos sua ficha clínica, qual sua data de nascimento? (Ex: 15/05/1980)")
+
+
+@registro.estado("data_nascimento", transicoes=["coletando_email", "confirmando_menor_12"])
+def estado_data_nascimento(ctx):
+    phone, msg_recebida = ctx.phone, ctx.msg_recebida
+    validacao = validar_data_nascimento(msg_recebida)
+    if not validacao["valida"]:
+        responder_texto(phone, "❌ Data de nascimento inválida. Digite uma data real no formato DD/MM/AAAA (ex: 15/05/1980).")
+    elif validacao["menor_12"]:
+        # Permite ao paciente confirmar se foi engano antes de bloquear
+        # Salva a data NORMALIZADA (4 dígitos) — ver mapa_fluxos.md bug Cleusa
+        update_paciente(phone, {"birthDate": validacao["data"], "status": "confirmando_menor_12"})
+        enviar_botoes(phone,
+            f"⚠️ A data *{validacao['data']}* indica que o paciente tem menos de 12 anos.\n\n"
+            "Foi um engano de digitação?",
+            [{"id": "menor_engano", "title": "Sim, foi engano"}, {"id": "menor_correto", "title": "Não, é correta"}]
+        )
+    else:
+        # Salva a data NORMALIZADA (4 dígitos) — ver mapa_fluxos.md bug Cleusa
+        update_paciente(phone, {"birthDate": validacao["data"], "status": "coletando_email"})
+        responder_texto(phone, "Ótimo! Para finalizar seu cadastro, qual seu melhor E-MAIL?")
+
+
+@registro.estado(
+    "confirmando_menor_12",
+    transicoes=["data_nascimento", "finalizado"],
+    botoes=["Sim, foi engano", "Não, é correta"],
+)
+def estado_confirmando_menor_12(ctx):
+    phone, msg_recebida, msg_limpa = ctx.phone, ctx.msg_recebida, ctx.msg_limpa
+    if "engano" in msg_limpa or msg_recebida == "Sim, foi engano":
+        update_paciente(phone, {"status": "data_nascimento", "birthDate": ""})
+        responder_texto(phone, "Sem problemas! 😊 Pode me informar a data de nascimento correta? (Ex: 15/05/1980)")
+    elif "correta" in msg_limpa or msg_recebida == "Não, é correta":
+        update_paciente(phone, {"status": "finalizado", "robo_ligado": False})
+        responder_texto(phone,
+            "⚠️ Infelizmente não possuímos especialidade pediátrica em nossas unidades. "
+            "Não poderemos realizar este agendamento.\n\n"
+            "Recomendamos a busca por profissionais especializados na área infantil. "
+            "Obrigado pela compreensão! 🙏"
+        )
+    else:
+        enviar_botoes(phone,
+            "Por favor, confirme:",
+            [{"id": "menor_engano", "title": "Sim, foi engano"}, {"id": "menor_correto", "title": "Não, é correta"}]
+        )
+
+
+@registro.estado("coletando_email", transicoes=["agendando", "num_carteirinha"])
+def estado_coletando_email(ctx):
+    phone, msg_recebida, modalidade = ctx.phone, ctx.msg_recebida, ctx.modalidade
+    if "@" not in msg_recebida or "." not in msg_recebida: responder_texto(phone, "❌ E-mail inválido. Por favor, digite um e-mail válido.")
+    else:
+        if modalidade == "Particular":
+            update_paciente(phone, {"email": msg_recebida, "status": "agendando"})
+            enviar_botoes(phone, "Cadastro concluído! 🎉\n\nQual o melhor período para verificarmos a agenda particular?", [{"id": "t1", "title": "Manhã"}, {"id": "t2", "title": "Tarde"}])
+        else:
+            update_paciente(phone, {"email": msg_recebida, "status": "num_carteirinha"})
+            responder_texto(phone, "Certo! E qual o NÚMERO DA CARTEIRINHA do seu plano? (apenas números)")
+
+
+@registro.estado("num_carteirinha", transicoes=["foto_carteirinha", "pausado"])
+def estado_num_carteirinha(ctx):
+    phone, msg_recebida, msg_limpa = ctx.phone, ctx.msg_recebida, ctx.msg_limpa
+    num_limpo = re.sub(r'\D', '', msg_recebida)
+    _espera = ["momento", "aguarda", "agora não", "depois", "vou pegar", "não tenho", "nao tenho", "vou ver", "preciso ver"]
+    if any(e in msg_limpa for e in _espera) and len(num_limpo) < 4:
+        update_paciente(phone, {"status": "pausado", "unread": True, "ultima_mensagem_paciente": msg_recebida})
+        responder_texto(phone, "Sem problema! 😊 Quando tiver o número da carteirinha em mãos, é só me enviar aqui que continuamos.")
+    elif len(num_limpo) < 4:
+        responder_texto(phone, "❌ Número de carteirinha inválido. Por favor, digite apenas os números da sua carteirinha (mínimo 4 dígitos):")
+    else:
+        update_paciente(phone, {"numCarteirinha": num_limpo, "status": "foto_carteirinha"})
+        responder_texto(phone, "Anotado! ✅ Agora a parte documental:\n\nEnvie uma FOTO NÍTIDA da sua carteirinha (use o ícone de clipe ou câmera do WhatsApp).")
+
+
+@registro.estado("foto_carteirinha", transicoes=["foto_pedido_medico"], aceita_anexo=True)
+def estado_foto_carteirinha(ctx):
+    phone, tem_anexo, media_id = ctx.phone, ctx.tem_anexo, ctx.media_id
+    if not tem_anexo: responder_texto(phone, "❌ Não recebi a imagem. Por favor, envie a foto da sua carteirinha.")
+    else:
+        media_data = salvar_midia_imediata(phone, "carteirinha", media_id) if media_id else {}
+        update_fields = {
+            "status": "foto_pedido_medico",
+            "tem_foto_carteirinha": True,
+        }
+        update_fields.update(media_data)
+        update_paciente(phone, update_fields)
+        responder_texto(phone, "Foto recebida! ✅\n\nAgora, envie a FOTO DO SEU PEDIDO MÉDICO.")
+
+
+@registro.estado("foto_pedido_medico", transicoes=["agendando"], aceita_anexo=True)
+def estado_foto_pedido_medico(ctx):
+    phone, msg_recebida, msg_limpa, tem_anexo, media_id = ctx.phone, ctx.msg_recebida, ctx.msg_limpa, ctx.tem_anexo, ctx.media_id
+    _links_pedido = ["memed.com.br", "drconnect", "bula.fiocruz", "receita", "http", "https"]
+    _tem_link_pedido = any(lp in msg_limpa for lp in _links_pedido) and not tem_anexo
+    if _tem_link_pedido:
+        update_paciente(phone, {"status": "agendando", "tem_foto_pedido": True, "pedido_link": msg_recebida})
+        enviar_botoes(phone, "Pedido médico digital recebido! 🎉\n\nQual o melhor período para verificarmos a sua vaga?", [{"id": "t1", "title": "Manhã"}, {"id": "t2", "title": "Tarde"}])
+    elif not tem_anexo: responder_texto(phone, "❌ Por favor, envie a foto do seu Pedido Médico.")
+    else:
+        media_data = salvar_midia_imediata(phone, "pedido", media_id) if media_id else {}
+        update_fields = {
+            "status": "agendando",
+            "tem_foto_pedido": True,
+        }
+        update_fields.update(media_data)
+        update_paciente(phone, update_fields)
+        enviar_botoes(phone, "Documentação completa! 🎉\n\nQual o melhor período para verificarmos a sua vaga?", [{"id": "t1", "title": "Manhã"}, {"id": "t2", "title": "Tarde"}])
+
+
+@registro.estado(
+    "agendando",
+    transicoes=["finalizado", "pendente_feegow"],
+    botoes=["Manhã", "Tarde", "Noite"],
+)
+def estado_agendando(ctx):
+    phone, info, msg_recebida, servico, modalidade = ctx.phone, ctx.info, ctx.msg_recebida, ctx.servico, ctx.modalidade
+    if msg_recebida in ["Manhã", "Tarde", "Noite"]:
+        info["periodo"] = msg_recebida
+        if not modalidade and (info.get("convenio") or info.get("carteirinha_media_id")):
+            modalidade = "Convênio"
+        novo_status = "pendente_feegow" if modalidade == "Convênio" else "finalizado"
+        update_data = {"periodo": msg_recebida, "status": novo_status, "modalidade": modalidade}
+
+        if servico and "Pilates" not in servico:
+            resultado_feegow = integrar_feegow(phone, info)
+            if resultado_feegow: update_data.update(resultado_feegow)
+
+        update_paciente(phone, update_data)
+
+        if modalidade == "Convênio":
+            texto_final = (f"Período selecionado com sucesso! ✅ Nossa recepção já recebeu as suas fotos e está realizando a validação de cobertura junto ao seu plano de saúde.\n\n"
+                           f"Assim que a elegibilidade for confirmada, enviaremos as opções de horários disponíveis. Fique de olho por aqui! 😊")
+        else:
+            texto_final = (f"Período selecionado com sucesso! ✅ Tudo pronto! A nossa equipe já está verificando a disponibilidade dos nossos especialistas para o período da {msg_recebida}.\n\n"
+                           f"Em instantes voltaremos com as opções exatas para confirmarmos o seu horário. Fique de olho por aqui! ✨")
+
+        responder_texto(phone, texto_final)
+    else:
+        enviar_botoes(phone, "Por favor, escolha o período:", [{"id": "t1", "title": "Manhã"}, {"id": "t2", "title": "Tarde"}])
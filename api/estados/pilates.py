@@ -0,0 +1,427 @@
+"""
+Estados do fluxo de Pilates: lead do Instagram, transferência de unidade,
+Particular, Wellhub/TotalPass e Saúde Caixa.
+
+Cada handler recebe o Contexto da mensagem (ver maquina_estados.py) e devolve
+a resposta do webhook — ou None para a resposta padrão {"status": "success"}.
+"""
+import re
+from flask import jsonify
+
+from maquina_estados import registro
+from whatsapp import (  # carregado sob demanda, depois do whatsapp.py (ver maquina_estados.py)
+    enviar_botoes, enviar_lista, get_paciente, integrar_feegow, marcar_precisa_recepcao,
+    responder_texto, salvar_midia_imediata, update_paciente, validar_cpf, validar_data_nascimento,
+)
+
+
+@registro.estado("instagram_pilates_q1", transicoes=["instagram_pilates_q2"])
+def estado_instagram_pilates_q1(ctx):
+    phone, msg_recebida = ctx.phone, ctx.msg_recebida
+    update_paciente(phone, {
+        "status": "instagram_pilates_q2",
+        "instagram_resp_q1": msg_recebida,
+        "followup_toque": 0
+    })
+    responder_texto(phone, "Que ótimo! E qual o seu principal objetivo com o Pilates?")
+    return jsonify({"status": "instagram_q1_respondida"}), 200
+
+
+@registro.estado("instagram_pilates_q2", transicoes=["atendimento_humano"])
+def estado_instagram_pilates_q2(ctx):
+    phone, info, msg_recebida = ctx.phone, ctx.info, ctx.msg_recebida
+    nome_lead = info.get("title", "").split()[0] if info.get("title") else ""
+    saudacao = f"Perfeito{', ' + nome_lead if nome_lead else ''}! 💙 " if nome_lead else "Perfeito! 💙 "
+    update_paciente(phone, {
+        "status": "atendimento_humano",
+        "instagram_resp_q2": msg_recebida,
+        "followup_toque": 0
+    })
+    responder_texto(phone, (
+        f"{saudacao}Registrei suas informações. "
+        f"Nossa equipe especializada vai entrar em contato em breve "
+        f"para te apresentar as melhores opções de Pilates Estúdio. 😊"
+    ))
+    return jsonify({"status": "instagram_lead_qualificado"}), 200
+
+
+@registro.estado("transferencia_pilates", transicoes=["escolhendo_especialidade", "pilates_modalidade"])
+def estado_transferencia_pilates(ctx):
+    phone, msg_recebida = ctx.phone, ctx.msg_recebida
+    if "Sim" in msg_recebida or "mudar" in msg_recebida.lower():
+        update_paciente(phone, {"unit": "São Caetano", "status": "pilates_modalidade"})
+        secoes = [{"title": "Modalidade Pilates", "rows": [{"id": "p_part", "title": "💎 Plano Particular"}, {"id": "p_caixa", "title": "🏦 Saúde Caixa"}, {"id": "p_app", "title": "💪 Wellhub/Totalpass"}, {"id": "p_vol", "title": "⬅️ Voltar"}]}]
+        enviar_lista(phone, "Perfeito! A sua unidade foi alterada para **São Caetano** com sucesso. ✅\n\nAgora, como você pretende realizar as aulas de Pilates?", "Ver Opções", secoes)
+    else:
+        update_paciente(phone, {"servico": "", "status": "escolhendo_especialidade"})
+        secoes = [{"title": "Nossos Serviços", "rows": [{"id": "e1", "title": "Fisio Ortopédica"}, {"id": "e2", "title": "Fisio Neurológica"}, {"id": "e3", "title": "Fisio Pélvica"}, {"id": "e4", "title": "Acupuntura"}, {"id": "e6", "title": "Recovery"}, {"id": "e7", "title": "Liberação Miofascial"}]}]
+        enviar_lista(phone, "Sem problemas! Mantemos o seu atendimento na unidade **Ipiranga**. Qual outro serviço você procura hoje?", "Ver Serviços", secoes)
+
+
+@registro.estado(
+    "pilates_modalidade",
+    transicoes=["escolhendo_especialidade", "pilates_app", "pilates_caixa_queixa", "pilates_part_experiencia"],
+)
+def estado_pilates_modalidade(ctx):
+    phone, msg_recebida = ctx.phone, ctx.msg_recebida
+    if "Voltar" in msg_recebida:
+        update_paciente(phone, {"status": "escolhendo_especialidade"})
+        secoes = [{"title": "Nossos Serviços", "rows": [{"id": "e1", "title": "Fisio Ortopédica"}, {"id": "e2", "title": "Fisio Neurológica"}, {"id": "e3", "title": "Fisio Pélvica"}, {"id": "e4", "title": "Acupuntura"}, {"id": "e5", "title": "Pilates Studio"}, {"id": "e6", "title": "Recovery"}, {"id": "e7", "title": "Liberação Miofascial"}]}]
+        enviar_lista(phone, "Voltando ao menu de especialidades. Qual serviço você procura hoje?", "Ver Serviços", secoes)
+    elif "Wellhub" in msg_recebida or "Totalpass" in msg_recebida:
+        # 🛡️ Wellhub/TotalPass: informar planos aceitos antes da escolha
+        # Ver mapa_fluxos.md → Fluxo Wellhub / TotalPass
+        update_paciente(phone, {"modalidade": "Parceria App", "status": "pilates_app"})
+        enviar_botoes(phone, "Atendemos *Wellhub (Golden)* e *TotalPass (TP5)*. Qual o seu?", [{"id": "w1", "title": "Wellhub"}, {"id": "t1", "title": "Totalpass"}])
+    elif "Saúde Caixa" in msg_recebida:
+        # 🛡️ Saúde Caixa Pilates: comporta-se como convênio Fisio padrão
+        # Ver mapa_fluxos.md → Fluxo Pilates Saúde Caixa
+        update_paciente(phone, {"modalidade": "Convênio", "convenio": "Saúde Caixa", "status": "pilates_caixa_queixa"})
+        responder_texto(phone, "Entendido! 🏦 Para o plano Saúde Caixa, me conte brevemente: o que te trouxe à clínica hoje?")
+    elif "Particular" in msg_recebida:
+        # 🛡️ Pilates Particular: pergunta experiência ANTES da aula experimental
+        # Ver mapa_fluxos.md → Experiência com Pilates
+        update_paciente(phone, {"modalidade": "Particular", "status": "pilates_part_experiencia"})
+        enviar_botoes(phone, "Para personalizarmos sua experiência, você já praticou Pilates? 🧘",
+            [{"id": "exp_atual", "title": "☑️ Já pratico"}, {"id": "exp_pass", "title": "🌱 Já pratiquei"}, {"id": "exp_nao", "title": "❌ Nunca pratiquei"}])
+
+
+@registro.estado("pilates_part_experiencia", transicoes=["pilates_part_exp"])
+def estado_pilates_part_experiencia(ctx):
+    phone, msg_recebida = ctx.phone, ctx.msg_recebida
+    # 🛡️ Captura nível de experiência do lead Pilates Particular
+    # Ver mapa_fluxos.md → Experiência com Pilates
+    update_paciente(phone, {"experiencia_pilates": msg_recebida, "status": "pilates_part_exp"})
+    enviar_botoes(phone, "Ótima escolha! ✨ O Pilates vai ajudar a fortalecer o corpo. Gostaria de agendar uma aula experimental gratuita para conhecer o nosso estúdio?", [{"id": "pe_sim", "title": "Sim, gostaria"}, {"id": "pe_nao", "title": "Não, já quero começar"}])
+
+
+@registro.estado("pilates_part_exp", transicoes=["pilates_part_periodo"])
+def estado_pilates_part_exp(ctx):
+    phone, msg_recebida = ctx.phone, ctx.msg_recebida
+    update_paciente(phone, {"interesse_experimental": msg_recebida, "status": "pilates_part_periodo"})
+    enviar_botoes(phone, "Agradecemos a escolha! Para o agendamento, qual o melhor período para você?", [{"id": "pe_m", "title": "☀️ Manhã"}, {"id": "pe_t", "title": "⛅ Tarde"}, {"id": "pe_n", "title": "🌙 Noite"}])
+
+
+@registro.estado("pilates_part_periodo", transicoes=["atendimento_humano", "pilates_part_nome"])
+def estado_pilates_part_periodo(ctx):
+    phone, msg_recebida, is_veteran = ctx.phone, ctx.msg_recebida, ctx.is_veteran
+    update_paciente(phone, {"periodo": msg_recebida})
+    if is_veteran:
+        update_paciente(phone, {"status": "atendimento_humano"})
+        responder_texto(phone, "Tudo pronto! Nossa equipe vai assumir o atendimento agora mesmo para alinhar seu horário. Aguarde um instante! 👩‍⚕️")
+    else:
+        update_paciente(phone, {"status": "pilates_part_nome"})
+        responder_texto(phone, "Para agilizarmos seu atendimento de Pilates, por favor, digite seu NOME E SOBRENOME:")
+
+
+@registro.estado("pilates_part_nome", transicoes=["pilates_part_cpf"])
+def estado_pilates_part_nome(ctx):
+    phone, msg_recebida = ctx.phone, ctx.msg_recebida
+    update_paciente(phone, {"title": msg_recebida, "status": "pilates_part_cpf"})
+    responder_texto(phone, "Nome registrado! ✅ Agora, para validarmos o seu registro com segurança, digite o seu CPF (apenas os 11 números):")
+
+
+@registro.estado("pilates_part_cpf", transicoes=["pilates_part_nasc"])
+def estado_pilates_part_cpf(ctx):
+    phone, msg_recebida = ctx.phone, ctx.msg_recebida
+    cpf_limpo = re.sub(r'\D', '', msg_recebida)
+    if not validar_cpf(cpf_limpo): responder_texto(phone, "❌ CPF inválido. Por favor, verifique os números e digite novamente:")
+    else:
+        update_paciente(phone, {"cpf": cpf_limpo, "status": "pilates_part_nasc"})
+        responder_texto(phone, "Recebido! ✅ Qual sua data de nascimento? (Ex: 15/05/1980)")
+
+
+@registro.estado("pilates_part_nasc", transicoes=["pilates_part_email"])
+def estado_pilates_part_nasc(ctx):
+    phone, msg_recebida = ctx.phone, ctx.msg_recebida
+    validacao = validar_data_nascimento(msg_recebida)
+    if not validacao["valida"]: responder_texto(phone, "❌ Data inválida. Digite uma data real no formato DD/MM/AAAA (ex: 15/05/1980).")
+    else:
+        # Salva data NORMALIZADA (4 dígitos) — ver mapa_fluxos.md bug Cleusa
+        update_paciente(phone, {"birthDate": validacao["data"], "status": "pilates_part_email"})
+        responder_texto(phone, "Para completarmos, qual seu melhor E-MAIL?")
+
+
+@registro.estado("pilates_part_email", transicoes=["pilates_pendente_recepcao"])
+def estado_pilates_part_email(ctx):
+    phone, msg_recebida = ctx.phone, ctx.msg_recebida
+    if "@" not in msg_recebida or "." not in msg_recebida: responder_texto(phone, "❌ E-mail inválido. Por favor, digite um e-mail válido.")
+    else:
+        # 🛡️ Pilates: cadastra aluno no Feegow + marca precisa_recepcao
+        # Card permanece na coluna Lead Pilates (ver index.html filtros)
+        # Ver mapa_fluxos.md → Fluxo Pilates
+        update_paciente(phone, {"email": msg_recebida})
+        info_atualizado = get_paciente(phone)
+        resultado_feegow = integrar_feegow(phone, info_atualizado)
+        update_data = {"status": "pilates_pendente_recepcao"}
+        if resultado_feegow:
+            update_data.update(resultado_feegow)
+        update_paciente(phone, update_data)
+        marcar_precisa_recepcao(phone, "Atenção lead Pilates")
+        responder_texto(phone, "Tudo pronto! Nossa equipe vai assumir o atendimento agora mesmo para confirmar o seu horário. Aguarde um instante! 👩‍⚕️")
+
+
+@registro.estado("pilates_app", transicoes=["pilates_app_confirma_plano"], botoes=["Wellhub"])
+def estado_pilates_app(ctx):
+    phone, msg_recebida = ctx.phone, ctx.msg_recebida
+    # 🛡️ Wellhub/TotalPass: após escolher app, confirma se tem plano elegível
+    # Ver mapa_fluxos.md → Fluxo Wellhub / TotalPass
+    plano = "Golden" if msg_recebida == "Wellhub" else "TP5"
+    update_paciente(phone, {"convenio": msg_recebida, "status": "pilates_app_confirma_plano"})
+    enviar_botoes(phone, f"⚠️ Atendemos apenas o plano *{plano}* do {msg_recebida}. Você está com este plano?",
+        [{"id": "pl_sim", "title": f"✅ Tenho {plano}"}, {"id": "pl_nsei", "title": "❓ Não sei"}, {"id": "pl_outro", "title": "❌ Tenho outro"}])
+
+
+@registro.estado(
+    "pilates_app_confirma_plano",
+    transicoes=["pilates_app_cross_sell", "pilates_app_orientar", "pilates_app_periodo", "pilates_wellhub_id"],
+)
+def estado_pilates_app_confirma_plano(ctx):
+    phone, info, msg_recebida = ctx.phone, ctx.info, ctx.msg_recebida
+    # 🛡️ Roteia para A (segue Golden/TP5), B (cross-sell), C (orientar verificação)
+    info_app = info.get("convenio", "Wellhub")
+    if "✅" in msg_recebida or "Tenho Golden" in msg_recebida or "Tenho TP5" in msg_recebida:
+        # CAMINHO A — segue fluxo Wellhub/TotalPass normal
+        if info_app == "Wellhub":
+            update_paciente(phone, {"status": "pilates_wellhub_id"})
+            responder_texto(phone, "Perfeito! Por favor, informe o seu Wellhub ID.")
+        else:
+            update_paciente(phone, {"status": "pilates_app_periodo"})
+            enviar_botoes(phone, "Perfeito! ✅ Para agilizarmos o agendamento, qual o melhor período para você?",
+                [{"id": "pe_m", "title": "☀️ Manhã"}, {"id": "pe_t", "title": "⛅ Tarde"}, {"id": "pe_n", "title": "🌙 Noite"}])
+    elif "❌" in msg_recebida or "outro" in msg_recebida.lower():
+        # CAMINHO B — cross-sell
+        update_paciente(phone, {"status": "pilates_app_cross_sell"})
+        enviar_botoes(phone,
+            f"Que pena! Atualmente atendemos apenas o plano de cobertura completa pelo {info_app}.\n\n"
+            "Mas temos o nosso *Plano Particular* que pode te interessar. Gostaria de conhecer?",
+            [{"id": "cs_sim", "title": "Sim, quero conhecer"}, {"id": "cs_nao", "title": "Agora não"}])
+    elif "❓" in msg_recebida or "não sei" in msg_recebida.lower() or "nao sei" in msg_recebida.lower():
+        # CAMINHO C — orientar verificação
+        update_paciente(phone, {"status": "pilates_app_orientar"})
+        enviar_botoes(phone,
+            f"Sem problemas! 😊\n\nPara verificar, abra o app do {info_app} em *'Minha conta'* — o plano aparece logo abaixo do seu nome.\n\n"
+            "Enquanto verifica, posso te orientar sobre nosso *Plano Particular*, caso seu plano não cubra. Deseja conhecer?",
+            [{"id": "or_sim", "title": "Sim, quero conhecer"}, {"id": "or_nao", "title": "Vou verificar e volto"}])
+    else:
+        enviar_botoes(phone, "Por favor, escolha uma das opções:",
+            [{"id": "pl_sim", "title": "✅ Tenho o plano"}, {"id": "pl_nsei", "title": "❓ Não sei"}, {"id": "pl_outro", "title": "❌ Tenho outro"}])
+
+
+@registro.estado("pilates_app_cross_sell", transicoes=["pilates_lead_morno", "pilates_part_experiencia"])
+def estado_pilates_app_cross_sell(ctx):
+    phone, info, msg_recebida = ctx.phone, ctx.info, ctx.msg_recebida
+    # 🛡️ Caminho B: paciente tinha plano fora de cobertura
+    info_app = info.get("convenio", "Wellhub")
+    if "Sim" in msg_recebida:
+        # Migra para fluxo Particular
+        update_paciente(phone, {"modalidade": "Particular", "convenio": "", "status": "pilates_part_experiencia"})
+        enviar_botoes(phone, "Ótima decisão! ✨\n\nPara personalizarmos sua experiência, você já praticou Pilates? 🧘",
+            [{"id": "exp_atual", "title": "☑️ Já pratico"}, {"id": "exp_pass", "title": "🌱 Já pratiquei"}, {"id": "exp_nao", "title": "❌ Nunca pratiquei"}])
+    else:
+        # Lead morno
+        update_paciente(phone, {"status": "pilates_lead_morno",
+                                "motivo_lead_morno": f"Plano {info_app} fora da cobertura"})
+        marcar_precisa_recepcao(phone, "Recuperar lead")
+        responder_texto(phone, "Tudo certo! Volte quando quiser, será um prazer atender. 😊")
+
+
+@registro.estado("pilates_app_orientar", transicoes=["pilates_lead_morno", "pilates_part_experiencia"])
+def estado_pilates_app_orientar(ctx):
+    phone, info, msg_recebida = ctx.phone, ctx.info, ctx.msg_recebida
+    # 🛡️ Caminho C: paciente não sabia o plano
+    info_app = info.get("convenio", "Wellhub")
+    if "Sim" in msg_recebida:
+        update_paciente(phone, {"modalidade": "Particular", "convenio": "", "status": "pilates_part_experiencia"})
+        enviar_botoes(phone, "Ótima decisão! ✨\n\nPara personalizarmos sua experiência, você já praticou Pilates? 🧘",
+            [{"id": "exp_atual", "title": "☑️ Já pratico"}, {"id": "exp_pass", "title": "🌱 Já pratiquei"}, {"id": "exp_nao", "title": "❌ Nunca pratiquei"}])
+    else:
+        update_paciente(phone, {"status": "pilates_lead_morno",
+                                "motivo_lead_morno": f"Não sabia o plano {info_app}"})
+        marcar_precisa_recepcao(phone, "Recuperar lead")
+        responder_texto(phone, "Tudo certo! Volte quando quiser, será um prazer atender. 😊")
+
+
+@registro.estado("pilates_wellhub_id", transicoes=["pilates_app_periodo"])
+def estado_pilates_wellhub_id(ctx):
+    phone, msg_recebida = ctx.phone, ctx.msg_recebida
+    update_paciente(phone, {"numCarteirinha": msg_recebida, "status": "pilates_app_periodo"})
+    enviar_botoes(phone, "ID recebido com sucesso! ✅ Para agilizarmos, qual o melhor período para você?", [{"id": "pe_m", "title": "☀️ Manhã"}, {"id": "pe_t", "title": "⛅ Tarde"}, {"id": "pe_n", "title": "🌙 Noite"}])
+
+
+@registro.estado("pilates_app_periodo", transicoes=["atendimento_humano", "pilates_app_nome_completo"])
+def estado_pilates_app_periodo(ctx):
+    phone, msg_recebida, is_veteran = ctx.phone, ctx.msg_recebida, ctx.is_veteran
+    periodo_limpo = msg_recebida.replace("☀️ ", "").replace("⛅ ", "").replace("🌙 ", "")
+    update_paciente(phone, {"periodo": msg_recebida})
+    if is_veteran:
+        update_paciente(phone, {"status": "atendimento_humano"})
+        responder_texto(phone, f"Tudo pronto! Nossa equipe vai confirmar o horário para a {periodo_limpo} em instantes. 👩‍⚕️")
+    else:
+        update_paciente(phone, {"status": "pilates_app_nome_completo"})
+        responder_texto(phone, "Para finalizarmos, digite o seu NOME E SOBRENOME:")
+
+
+@registro.estado("pilates_app_nome_completo", transicoes=["pilates_app_cpf"])
+def estado_pilates_app_nome_completo(ctx):
+    phone, msg_recebida = ctx.phone, ctx.msg_recebida
+    update_paciente(phone, {"title": msg_recebida, "status": "pilates_app_cpf"})
+    responder_texto(phone, "Nome registrado! ✅ Agora, digite o seu CPF (apenas os 11 números):")
+
+
+@registro.estado("pilates_app_cpf", transicoes=["pilates_app_nasc"])
+def estado_pilates_app_cpf(ctx):
+    phone, msg_recebida = ctx.phone, ctx.msg_recebida
+    cpf_limpo = re.sub(r'\D', '', msg_recebida)
+    if not validar_cpf(cpf_limpo): responder_texto(phone, "❌ CPF inválido. Por favor, verifique os números e digite novamente:")
+    else:
+        update_paciente(phone, {"cpf": cpf_limpo, "status": "pilates_app_nasc"})
+        responder_texto(phone, "Recebido! ✅ Qual sua data de nascimento? (Ex: 15/05/1980)")
+
+
+@registro.estado("pilates_app_nasc", transicoes=["pilates_app_email"])
+def estado_pilates_app_nasc(ctx):
+    phone, msg_recebida = ctx.phone, ctx.msg_recebida
+    validacao = validar_data_nascimento(msg_recebida)
+    if not validacao["valida"]: responder_texto(phone, "❌ Data inválida. Digite uma data real no formato DD/MM/AAAA (ex: 15/05/1980).")
+    else:
+        # Salva data NORMALIZADA (4 dígitos) — ver mapa_fluxos.md bug Cleusa
+        update_paciente(phone, {"birthDate": validacao["data"], "status": "pilates_app_email"})
+        responder_texto(phone, "Para completarmos o registro, qual seu melhor E-MAIL?")
+
+
+@registro.estado("pilates_app_email", transicoes=["pilates_pendente_recepcao"])
+def estado_pilates_app_email(ctx):
+    phone, msg_recebida = ctx.phone, ctx.msg_recebida
+    if "@" not in msg_recebida or "." not in msg_recebida: responder_texto(phone, "❌ E-mail inválido. Por favor, digite um e-mail válido.")
+    else:
+        # 🛡️ Wellhub/TotalPass (Golden/TP5): cadastra no Feegow + recepção transfere pro NextFit
+        # Ver mapa_fluxos.md → Fluxo Wellhub / TotalPass
+        update_paciente(phone, {"email": msg_recebida})
+        info_atualizado = get_paciente(phone)
+        resultado_feegow = integrar_feegow(phone, info_atualizado)
+        update_data = {"status": "pilates_pendente_recepcao"}
+        if resultado_feegow:
+            update_data.update(resultado_feegow)
+        update_paciente(phone, update_data)
+        marcar_precisa_recepcao(phone, "Transferir NextFit")
+
+        nome_app = info_atualizado.get("convenio", "do seu aplicativo")
+        responder_texto(phone,
+            "Cadastro concluído! 🎉\n\n"
+            f"📲 *O agendamento das aulas é feito direto pelo app do {nome_app}*. "
+            "Nossa unidade aparece como *Conectifisio São Caetano* — "
+            "escolha o horário disponível direto por lá.\n\n"
+            "Qualquer dúvida, nossa equipe está à disposição. 😊"
+        )
+
+
+@registro.estado("pilates_caixa_queixa", transicoes=["pilates_caixa_num_carteirinha"])
+def estado_pilates_caixa_queixa(ctx):
+    phone, msg_recebida = ctx.phone, ctx.msg_recebida
+    # 🛡️ Saúde Caixa Pilates: captura queixa (igual convênio Fisio)
+    update_paciente(phone, {"queixa": msg_recebida, "status": "pilates_caixa_num_carteirinha"})
+    responder_texto(phone, "Anotado! ✅ Pode me informar o *número da sua carteirinha* do Saúde Caixa?")
+
+
+@registro.estado("pilates_caixa_num_carteirinha", transicoes=["pausado", "pilates_caixa_foto_cart"])
+def estado_pilates_caixa_num_carteirinha(ctx):
+    phone, msg_recebida, msg_limpa = ctx.phone, ctx.msg_recebida, ctx.msg_limpa
+    num_limpo = re.sub(r'\D', '', msg_recebida)
+    _espera = ["momento", "aguarda", "agora não", "depois", "vou pegar", "não tenho", "nao tenho", "vou ver", "preciso ver"]
+    if any(e in msg_limpa for e in _espera) and len(num_limpo) < 4:
+        update_paciente(phone, {"status": "pausado", "unread": True, "ultima_mensagem_paciente": msg_recebida})
+        responder_texto(phone, "Sem problema! 😊 Quando tiver o número da carteirinha em mãos, é só me enviar aqui que continuamos.")
+    elif len(num_limpo) < 4:
+        responder_texto(phone, "❌ Número de carteirinha inválido. Por favor, digite apenas os números da sua carteirinha (mínimo 4 dígitos):")
+    else:
+        update_paciente(phone, {"numCarteirinha": num_limpo, "status": "pilates_caixa_foto_cart"})
+        responder_texto(phone, "Anotado! ✅ Agora a parte documental:\n\nEnvie uma *FOTO NÍTIDA da sua carteirinha* do Saúde Caixa (use o ícone de clipe ou câmera do WhatsApp).")
+
+
+@registro.estado("pilates_caixa_foto_cart", transicoes=["pilates_caixa_foto_pedido"], aceita_anexo=True)
+def estado_pilates_caixa_foto_cart(ctx):
+    phone, tem_anexo, media_id = ctx.phone, ctx.tem_anexo, ctx.media_id
+    if not tem_anexo: responder_texto(phone, "❌ Não recebi a imagem. Por favor, envie a foto da sua carteirinha.")
+    else:
+        media_data = salvar_midia_imediata(phone, "carteirinha", media_id) if media_id else {}
+        update_fields = {
+            "status": "pilates_caixa_foto_pedido",
+            "tem_foto_carteirinha": True,
+        }
+        update_fields.update(media_data)
+        update_paciente(phone, update_fields)
+        responder_texto(phone, "Foto recebida! ✅\n\nAgora, envie a *FOTO ou PDF do seu PEDIDO MÉDICO* atualizado.")
+
+
+@registro.estado("pilates_caixa_foto_pedido", transicoes=["pilates_caixa_periodo"], aceita_anexo=True)
+def estado_pilates_caixa_foto_pedido(ctx):
+    phone, tem_anexo, media_id = ctx.phone, ctx.tem_anexo, ctx.media_id
+    if not tem_anexo: responder_texto(phone, "❌ Por favor, envie o Pedido Médico.")
+    else:
+        media_data = salvar_midia_imediata(phone, "pedido", media_id) if media_id else {}
+        update_fields = {
+            "status": "pilates_caixa_periodo",
+            "tem_foto_pedido": True,
+        }
+        update_fields.update(media_data)
+        update_paciente(phone, update_fields)
+        enviar_botoes(phone, "Documentação completa! 🎉 ✅ Para agilizarmos o agendamento, qual o melhor período para você?", [{"id": "pe_m", "title": "☀️ Manhã"}, {"id": "pe_t", "title": "⛅ Tarde"}, {"id": "pe_n", "title": "🌙 Noite"}])
+
+
+@registro.estado("pilates_caixa_periodo", transicoes=["atendimento_humano", "pilates_caixa_nome"])
+def estado_pilates_caixa_periodo(ctx):
+    phone, msg_recebida, is_veteran = ctx.phone, ctx.msg_recebida, ctx.is_veteran
+    update_paciente(phone, {"periodo": msg_recebida})
+    if is_veteran:
+        update_paciente(phone, {"status": "atendimento_humano"})
+        responder_texto(phone, "Tudo pronto! Nossa equipe vai assumir o atendimento agora mesmo para alinhar seu horário. 👩‍⚕️")
+    else:
+        update_paciente(phone, {"status": "pilates_caixa_nome"})
+        responder_texto(phone, "Para finalizarmos, por favor digite o seu NOME E SOBRENOME:")
+
+
+@registro.estado("pilates_caixa_nome", transicoes=["pilates_caixa_cpf"])
+def estado_pilates_caixa_nome(ctx):
+    phone, msg_recebida = ctx.phone, ctx.msg_recebida
+    update_paciente(phone, {"title": msg_recebida, "status": "pilates_caixa_cpf"})
+    responder_texto(phone, "Nome registrado! ✅ Agora, digite seu CPF (apenas os 11 números):")
+
+
+@registro.estado("pilates_caixa_cpf", transicoes=["pilates_caixa_nasc"])
+def estado_pilates_caixa_cpf(ctx):
+    phone, msg_recebida = ctx.phone, ctx.msg_recebida
+    cpf_limpo = re.sub(r'\D', '', msg_recebida)
+    if not validar_cpf(cpf_limpo): responder_texto(phone, "❌ CPF inválido. Digite apenas os 11 números.")
+    else:
+        update_paciente(phone, {"cpf": cpf_limpo, "status": "pilates_caixa_nasc"})
+        responder_texto(phone, "Recebido! ✅ Qual sua data de nascimento? (Ex: 15/05/1980)")
+
+
+@registro.estado("pilates_caixa_nasc", transicoes=["pilates_caixa_email"])
+def estado_pilates_caixa_nasc(ctx):
+    phone, msg_recebida = ctx.phone, ctx.msg_recebida
+    validacao = validar_data_nascimento(msg_recebida)
+    if not validacao["valida"]: responder_texto(phone, "❌ Data inválida. Digite no formato DD/MM/AAAA (ex: 15/05/1980).")
+    else:
+        # Salva data NORMALIZADA (4 dígitos) — ver mapa_fluxos.md bug Cleusa
+        update_paciente(phone, {"birthDate": validacao["data"], "status": "pilates_caixa_email"})
+        responder_texto(phone, "Ótimo! Qual seu melhor E-MAIL?")
+
+
+@registro.estado("pilates_caixa_email", transicoes=["pilates_pendente_recepcao"])
+def estado_pilates_caixa_email(ctx):
+    phone, msg_recebida = ctx.phone, ctx.msg_recebida
+    if "@" not in msg_recebida or "." not in msg_recebida: responder_texto(phone, "❌ E-mail inválido. Por favor, digite um e-mail válido.")
+    else:
+        # 🛡️ Pilates: cadastra aluno no Feegow + marca precisa_recepcao
+        # Ver mapa_fluxos.md → Fluxo Pilates
+        update_paciente(phone, {"email": msg_recebida})
+        info_atualizado = get_paciente(phone)
+        resultado_feegow = integrar_feegow(phone, info_atualizado)
+        update_data = {"status": "pilates_pendente_recepcao"}
+        if resultado_feegow:
+            update_data.update(resultado_feegow)
+        update_paciente(phone, update_data)
+        marcar_precisa_recepcao(phone, "Atenção lead Pilates")
+        responder_texto(phone, "Recebido! ✅ Tudo pronto! Nossa equipe vai confirmar o seu horário e logo retorna. 👩‍⚕️")
@@ -0,0 +1,820 @@
+"""
+Estados do paciente já cadastrado no Feegow (veterano): menu, agenda
+(consultar/confirmar/reagendar/cancelar), token de convênio, nova guia e secretaria.
+
+Cada handler recebe o Contexto da mensagem (ver maquina_estados.py) e devolve
+a resposta do webhook — ou None para a resposta padrão {"status": "success"}.
+"""
+import base64
+import sys
+from datetime import datetime, timedelta
+from flask import jsonify
+from http_cliente import http_get, http_post
+
+from indice_slots import filtrar_conflitos
+from maquina_estados import registro
+from whatsapp import (  # carregado sob demanda, depois do whatsapp.py (ver maquina_estados.py)
+    FEEGOW_TOKEN, _LOCAL_ID_UNIDADE, _buscar_servico_atual_feegow, baixar_midia_whatsapp_raw,
+    cancelar_agendamento_feegow, chamar_ia_custom, confirmar_presenca_feegow,
+    consultar_disponibilidade_feegow, dias_uteis_a_partir,
+    encontrar_horarios_proximos, enviar_botoes, enviar_lista, extrair_preferencia_data,
+    invalidar_slots, responder_texto, salvar_midia_imediata, update_paciente, verificar_cobertura,
+)
+
+
+@registro.estado(
+    "menu_veterano",
+    transicoes=["aguardando_token_convenio", "confirmando_servico_nova_guia", "escolhendo_especialidade", "gestao_agenda", "menu_secretaria"],
+    botoes=["v1", "v5"],
+)
+def estado_menu_veterano(ctx):
+    phone, info, msg_recebida = ctx.phone, ctx.info, ctx.msg_recebida
+    if "Novo Serviço" in msg_recebida:
+        # Limpa dados antigos — paciente pode escolher modalidade/convênio diferente
+        update_paciente(phone, {
+            "status": "escolhendo_especialidade",
+            "queixa": "", "queixa_ia": "",
+            "modalidade": "", "convenio": "",
+            "numCarteirinha": "", "carteirinha_media_id": "",
+            "pedido_media_id": ""
+        })
+        secoes = [{"title": "Nossos Serviços", "rows": [{"id": "e1", "title": "Fisio Ortopédica"}, {"id": "e2", "title": "Fisio Neurológica"}, {"id": "e3", "title": "Fisio Pélvica"}, {"id": "e4", "title": "Acupuntura"}, {"id": "e5", "title": "Pilates Studio"}, {"id": "e6", "title": "Recovery"}, {"id": "e7", "title": "Liberação Miofascial"}, {"id": "e8", "title": "⬅️ Voltar ao Menu"}]}]
+        enviar_lista(phone, "Perfeito! Qual novo serviço você deseja agendar?", "Ver Serviços", secoes)
+
+    elif "Nova Guia" in msg_recebida or "Tratamento" in msg_recebida:
+        # Limpa dados antigos — paciente pode mudar modalidade/convênio
+        update_paciente(phone, {
+            "queixa": "", "queixa_ia": "",
+            "modalidade": "",
+            "numCarteirinha": "", "carteirinha_media_id": "",
+            "pedido_media_id": ""
+        })
+        feegow_id = info.get("feegow_id")
+        servico_atual = _buscar_servico_atual_feegow(feegow_id) if feegow_id else None
+        if servico_atual and servico_atual.get("servico"):
+            sv = servico_atual["servico"]
+            un = servico_atual.get("unidade", "")
+            un_txt = f" — unidade *{un}*" if un else ""
+            update_paciente(phone, {
+                "status": "confirmando_servico_nova_guia",
+                "nova_guia_servico": sv,
+                "nova_guia_unidade": un,
+                "nova_guia_local_id": servico_atual.get("local_id"),
+                "nova_guia_proc_id": servico_atual.get("procedimento_id")
+            })
+            enviar_botoes(phone,
+                f"Vou te ajudar a renovar a autorização do seu tratamento. ✅\n\n"
+                f"Vi que você realiza *{sv}*{un_txt}.\n\n"
+                f"Vamos organizar a nova guia para esse tratamento?",
+                [{"id": "ng_sim", "title": f"✅ Sim, {sv}"}, {"id": "ng_outro", "title": "↔️ Outro serviço"}, {"id": "ng_voltar", "title": "⬅️ Voltar"}])
+        else:
+            update_paciente(phone, {"status": "escolhendo_especialidade", "nova_guia": True})
+            secoes_ng = [{"title": "Nossos Serviços", "rows": [{"id": "e1", "title": "Fisio Ortopédica"}, {"id": "e2", "title": "Fisio Neurológica"}, {"id": "e3", "title": "Fisio Pélvica"}, {"id": "e4", "title": "Acupuntura"}, {"id": "e5", "title": "Pilates Studio"}, {"id": "e6", "title": "Recovery"}, {"id": "e7", "title": "Liberação Miofascial"}, {"id": "e8", "title": "⬅️ Voltar ao Menu"}]}]
+            enviar_lista(phone, "Não identifiquei seu tratamento automaticamente. Qual serviço deseja renovar a guia?", "Ver Serviços", secoes_ng)
+
+    elif "Reagendar" in msg_recebida or "Meus Agendamentos" in msg_recebida or msg_recebida == "v1":
+        resultado_raw = ctx.agenda_feegow()
+        sessoes_labels = resultado_raw["sessoes"] if resultado_raw else []
+        agendamentos_raw = resultado_raw["agendamentos"] if resultado_raw else []
+        # Salva dados do primeiro agendamento para uso no reagendamento
+        local_id_ag = agendamentos_raw[0]["local_id"] if agendamentos_raw else None
+        proc_id_ag = agendamentos_raw[0]["procedimento_id"] if agendamentos_raw else None
+        # Atualiza unidade com base no agendamento real (não na seleção do menu)
+        unidade_real = agendamentos_raw[0].get("unidade", "") if agendamentos_raw else ""
+        update_fields = {"status": "gestao_agenda", "agenda_local_id": local_id_ag, "agenda_procedimento_id": proc_id_ag, "agenda_agendamentos": agendamentos_raw[:10]}
+        if unidade_real:
+            update_fields["unit"] = unidade_real
+        update_paciente(phone, update_fields)
+        if sessoes_labels:
+            secoes_gestao = [{"title": "O que deseja fazer?", "rows": [
+                {"id": "ga_consultar", "title": "📋 Ver minha agenda"},
+                {"id": "ga_confirmar", "title": "✅ Confirmar presença"},
+                {"id": "ga_reagendar", "title": "🔄 Reagendar sessão"},
+                {"id": "ga_cancelar",  "title": "❌ Cancelar sessão"}
+            ]}]
+            enviar_lista(phone, f"Localizei suas próximas sessões:\n\n{chr(10).join(sessoes_labels[:5])}\n\nO que deseja fazer?", "Ver Opções", secoes_gestao)
+        else:
+            enviar_botoes(phone, "Não encontrei sessões futuras agendadas. 😊\n\nDeseja falar com nossa equipe?", [{"id": "ga_secretaria", "title": "📁 Falar com equipe"}, {"id": "menu_ini", "title": "⬅️ Voltar ao Menu"}])
+
+    elif "Token" in msg_recebida or msg_recebida == "v5":
+        update_paciente(phone, {"status": "aguardando_token_convenio"})
+        responder_texto(phone, "Claro! 😊 Por favor, informe o código de autorização que você recebeu do seu convênio (Amil, Prevent, Bradesco...).\n\n_Normalmente é um número com 6 dígitos enviado por SMS ou pelo app do plano._")
+
+    elif "Secretaria" in msg_recebida or "📁" in msg_recebida:
+        update_paciente(phone, {"status": "menu_secretaria"})
+        secoes = [{"title": "Serviços de Secretaria", "rows": [{"id": "s1", "title": "Declaração de Horas"}, {"id": "s2", "title": "Relatório Fisio"}, {"id": "s3", "title": "Atualização Cadastral"}, {"id": "s5", "title": "📁 Enviar Exames/Resultados"}, {"id": "s6", "title": "❌ Cancelar Tratamento"}, {"id": "s4", "title": "⬅️ Voltar ao Menu"}]}]
+        enviar_lista(phone, "Acesso à Secretaria. O que você precisa solicitar?", "Ver Serviços", secoes)
+
+    else:
+        # Catch-all: mensagem não reconhecida → reapresenta o menu
+        nome_mv = info.get("title", "Paciente").split()[0]
+        secoes_mv = [{"title": "Como posso ajudar?", "rows": [{"id": "v1", "title": "🗓️ Meus Agendamentos"}, {"id": "v2", "title": "🔄 Nova Guia/Tratamento"}, {"id": "v3", "title": "➕ Novo Serviço"}, {"id": "v5", "title": "🔑 Enviar Token"}, {"id": "v4", "title": "📁 Secretaria"}]}]
+        enviar_lista(phone, f"Como posso te ajudar, {nome_mv}? 😊", "Ver Opções", secoes_mv)
+
+
+@registro.estado(
+    "gestao_agenda",
+    transicoes=["atendimento_humano", "cancelando_sessao", "escolhendo_sessao_cancelamento", "escolhendo_sessao_reagendamento", "menu_veterano", "reagendando_tipo"],
+    botoes=["ga_consultar", "📋 Ver minha agenda", "Ver minha agenda", "ga_confirmar", "✅ Confirmar presença", "Confirmar presença", "ga_reagendar", "🔄 Reagendar sessão", "Reagendar sessão", "ga_cancelar", "❌ Cancelar sessão", "Cancelar sessão", "ga_voltar", "⬅️ Voltar ao Menu", "Voltar ao Menu"],
+)
+def estado_gestao_agenda(ctx):
+    phone, info, msg_recebida = ctx.phone, ctx.info, ctx.msg_recebida
+    _secoes_ga = [{"title": "O que deseja fazer?", "rows": [{"id": "ga_consultar", "title": "📋 Ver minha agenda"}, {"id": "ga_confirmar", "title": "✅ Confirmar presença"}, {"id": "ga_reagendar", "title": "🔄 Reagendar sessão"}, {"id": "ga_cancelar", "title": "❌ Cancelar sessão"}, {"id": "ga_voltar", "title": "⬅️ Voltar ao Menu"}]}]
+
+    if msg_recebida in ["ga_consultar", "📋 Ver minha agenda", "Ver minha agenda"]:
+        res_raw = ctx.agenda_feegow()
+        sessoes_v = res_raw["sessoes"] if res_raw else []
+        if sessoes_v:
+            responder_texto(phone, f"📋 Sua agenda:\n\n{chr(10).join(sessoes_v[:10])}")
+        else:
+            responder_texto(phone, "Não encontrei sessões futuras agendadas no momento.")
+        # Reapresenta menu veterano em vez de apenas "qualquer dúvida é só chamar"
+        update_paciente(phone, {"status": "menu_veterano"})
+        nome_va = info.get("title", "Paciente").split()[0]
+        secoes_va = [{"title": "Como posso ajudar?", "rows": [
+            {"id": "v1", "title": "🗓️ Meus Agendamentos"},
+            {"id": "v2", "title": "🔄 Nova Guia/Tratamento"},
+            {"id": "v3", "title": "➕ Novo Serviço"},
+            {"id": "v5", "title": "🔑 Enviar Token"},
+            {"id": "v4", "title": "📁 Secretaria"}
+        ]}]
+        enviar_lista(phone, f"Posso te ajudar com mais alguma coisa, {nome_va}? 😊", "Ver Opções", secoes_va)
+        return jsonify({"status": "agenda_consultada"}), 200
+
+    elif msg_recebida in ["ga_confirmar", "✅ Confirmar presença", "Confirmar presença"]:
+        agendamentos_raw = info.get("agenda_agendamentos", [])
+        agendamento_id = agendamentos_raw[0]["agendamento_id"] if agendamentos_raw else None
+        data_proxima = agendamentos_raw[0]["data_br"] if agendamentos_raw else "--"
+        hora_proxima = agendamentos_raw[0]["hora"] if agendamentos_raw else "--"
+        if agendamento_id:
+            ok = confirmar_presenca_feegow(agendamento_id, paciente_id=info.get("feegow_id"))
+            if ok:
+                update_paciente(phone, {"status": "menu_veterano", "confirmou_presenca": True})
+                responder_texto(phone, f"✅ Presença confirmada para *{data_proxima} às {hora_proxima}*!\n\nTe esperamos! Lembre-se de chegar 10 minutinhos antes. 😊")
+            else:
+                update_paciente(phone, {"status": "atendimento_humano", "unread": True, "queixa": f"[CONFIRMAÇÃO]: Paciente tentou confirmar presença em {data_proxima} às {hora_proxima}"})
+                responder_texto(phone, "Não consegui confirmar automaticamente. Nossa equipe já foi notificada e confirma em instantes! 😊")
+        else:
+            responder_texto(phone, "Não encontrei agendamento para confirmar. Nossa equipe pode te ajudar! 😊")
+            update_paciente(phone, {"status": "menu_veterano"})
+        return jsonify({"status": "confirmacao_processada"}), 200
+
+    elif msg_recebida in ["ga_reagendar", "🔄 Reagendar sessão", "Reagendar sessão"]:
+        agendamentos_raw = info.get("agenda_agendamentos", [])
+        if not agendamentos_raw:
+            responder_texto(phone, "Não encontrei sessões próximas para reagendar. Nossa equipe pode te ajudar! 😊")
+            update_paciente(phone, {"status": "menu_veterano"})
+            return jsonify({"status": "reagendar_sem_sessoes"}), 200
+
+        # Agrupa por local_id — pega as 2 mais próximas de cada agenda
+        local_id_visto = {}
+        sessoes_exibir = []
+        for ag in agendamentos_raw:
+            lid = ag.get("local_id")
+            if lid not in local_id_visto:
+                local_id_visto[lid] = 0
+            if local_id_visto[lid] < 2:
+                sessoes_exibir.append(ag)
+                local_id_visto[lid] += 1
+
+        tem_mais = len(agendamentos_raw) > len(sessoes_exibir)
+
+        if len(sessoes_exibir) == 1:
+            # Só uma sessão — vai direto para tipo
+            ag = sessoes_exibir[0]
+            update_paciente(phone, {"status": "reagendando_tipo", "agenda_sessao_selecionada": ag, "agenda_local_id": ag["local_id"], "agenda_procedimento_id": ag["procedimento_id"]})
+            enviar_botoes(phone,
+                f"Vamos reagendar sua sessão de *{ag['servico']}* em *{ag['data_br']} às {ag['hora']}*.\n\nO que você precisa?",
+                [{"id": "rt_horario", "title": "🕐 Mudar horário"}, {"id": "rt_dia", "title": "📅 Mudar o dia"}, {"id": "rt_voltar", "title": "⬅️ Voltar"}])
+        else:
+            # Múltiplas sessões — deixa paciente escolher
+            rows = [{"id": f"rag_{i}", "title": f"{ag['servico']} {ag['data_br']} {ag['hora']}"[:24]} for i, ag in enumerate(sessoes_exibir)]
+            if tem_mais:
+                rows.append({"id": "rag_mais", "title": "📅 Ver mais sessões"})
+            rows.append({"id": "rag_voltar", "title": "⬅️ Voltar"})
+            update_paciente(phone, {"status": "escolhendo_sessao_reagendamento", "agenda_agendamentos": agendamentos_raw})
+            lista_txt = "\n".join([f"• 🗓️ *{ag['data_br']} às {ag['hora']}* - {ag['servico']}" for ag in sessoes_exibir])
+            enviar_lista(phone, f"Qual sessão deseja reagendar?\n\n{lista_txt}", "Selecionar", [{"title": "Sessões", "rows": rows}])
+        return jsonify({"status": "reagendar_iniciado"}), 200
+
+    elif msg_recebida in ["ga_cancelar", "❌ Cancelar sessão", "Cancelar sessão"]:
+        agendamentos_raw = info.get("agenda_agendamentos", [])
+        ag_cancel = agendamentos_raw[0] if agendamentos_raw else None
+        ag_mesmo_dia_c = []
+        if ag_cancel:
+            data_c = ag_cancel.get("data", "")
+            ag_mesmo_dia_c = [a for a in agendamentos_raw if a.get("data") == data_c]
+        if len(ag_mesmo_dia_c) > 1:
+            opcoes_c = [{"id": f"ac_{i}", "title": f"{ag['servico']} {ag['hora']}"[:24]} for i, ag in enumerate(ag_mesmo_dia_c[:2])]
+            opcoes_c.append({"id": "ac_ambos", "title": "Cancelar ambos"})
+            opcoes_c.append({"id": "ac_voltar", "title": "⬅️ Voltar"})
+            update_paciente(phone, {"status": "escolhendo_sessao_cancelamento"})
+            enviar_lista(phone, f"Você tem dois atendimentos em *{ag_cancel.get('data_br','')}*. Qual deseja cancelar?", "Ver Sessões", [{"title": "Selecione", "rows": opcoes_c}])
+        elif ag_cancel:
+            update_paciente(phone, {"status": "cancelando_sessao", "agenda_sessao_selecionada": ag_cancel})
+            data_br_c = ag_cancel.get("data_br", "")
+            hora_c = ag_cancel.get("hora", "")
+            servico_c = ag_cancel.get("servico", "Sessão")
+            enviar_botoes(phone,
+                f"Atenção: vou cancelar sua sessão de *{servico_c}* em *{data_br_c} às {hora_c}*.\n\nDeseja informar o motivo?",
+                [{"id": "cs_motivo", "title": "Sim, informar motivo"}, {"id": "cs_direto", "title": "Não, só cancelar"}, {"id": "cs_voltar", "title": "⬅️ Voltar"}])
+        else:
+            responder_texto(phone, "Não encontrei sessões próximas para cancelar.")
+            update_paciente(phone, {"status": "menu_veterano"})
+        return jsonify({"status": "cancelamento_iniciado"}), 200
+
+    elif msg_recebida in ["ga_voltar", "⬅️ Voltar ao Menu", "Voltar ao Menu"]:
+        nome_s = info.get("title", "Paciente").split()[0]
+        update_paciente(phone, {"status": "menu_veterano"})
+        secoes_vet_v = [{"title": "Como posso ajudar?", "rows": [{"id": "v1", "title": "🗓️ Meus Agendamentos"}, {"id": "v2", "title": "🔄 Nova Guia/Tratamento"}, {"id": "v3", "title": "➕ Novo Serviço"}, {"id": "v5", "title": "🔑 Enviar Token"}, {"id": "v4", "title": "📁 Secretaria"}]}]
+        enviar_lista(phone, f"Voltando ao menu principal. Como posso te ajudar, {nome_s}?", "Ver Opções", secoes_vet_v)
+
+    else:
+        enviar_lista(phone, "Por favor, escolha uma das opções:", "Ver Opções", _secoes_ga)
+
+
+@registro.estado(
+    "escolhendo_sessao_reagendamento",
+    transicoes=["atendimento_humano", "gestao_agenda", "reagendando_tipo"],
+    botoes=["rag_voltar", "ag_voltar", "⬅️ Voltar", "rag_mais"],
+)
+def estado_escolhendo_sessao_reagendamento(ctx):
+    phone, info, msg_recebida, msg_limpa = ctx.phone, ctx.info, ctx.msg_recebida, ctx.msg_limpa
+    agendamentos_raw = info.get("agenda_agendamentos", [])
+    if msg_recebida in ["rag_voltar", "ag_voltar", "⬅️ Voltar"]:
+        update_paciente(phone, {"status": "gestao_agenda"})
+        _secoes_ga2 = [{"title": "O que deseja fazer?", "rows": [{"id": "ga_consultar", "title": "📋 Ver minha agenda"}, {"id": "ga_confirmar", "title": "✅ Confirmar presença"}, {"id": "ga_reagendar", "title": "🔄 Reagendar sessão"}, {"id": "ga_cancelar", "title": "❌ Cancelar sessão"}]}]
+        enviar_lista(phone, "Voltando ao menu de gestão:", "Ver Opções", _secoes_ga2)
+    elif msg_recebida == "rag_mais":
+        nome_rm = info.get("title", "Paciente").split()[0]
+        update_paciente(phone, {"status": "atendimento_humano", "unread": True, "queixa": "[REAGENDAMENTO]: paciente quer reagendar sessões além das próximas."})
+        responder_texto(phone, f"Claro, {nome_rm}! Vou conectar você com nossa recepção para organizar as demais sessões. 💙")
+    else:
+        # Tenta casar por ID (rag_N ou ag_N) ou por título
+        ag_sel = None
+        for prefix in ["rag_", "ag_"]:
+            if msg_recebida.startswith(prefix) and msg_recebida.replace(prefix, "").isdigit():
+                idx = int(msg_recebida.replace(prefix, ""))
+                if idx < len(agendamentos_raw):
+                    ag_sel = agendamentos_raw[idx]
+                break
+        if not ag_sel:
+            # Casa por título — inclui serviço para evitar ambiguidade
+            msg_lower = msg_limpa
+            for ag in agendamentos_raw:
+                servico_ag = ag.get('servico','').lower()
+                data_ag = ag.get('data_br','')
+                hora_ag = ag.get('hora','')
+                # Verifica se o serviço e a data batem
+                servico_ok = servico_ag and servico_ag in msg_lower
+                data_ok = data_ag and data_ag.replace("/","") in msg_lower.replace("/","").replace("-","")
+                hora_ok = hora_ag and hora_ag[:5] in msg_lower
+                if servico_ok and (data_ok or hora_ok):
+                    ag_sel = ag
+                    break
+            # Fallback: casa só por data+hora se serviço não identificado
+            if not ag_sel:
+                for ag in agendamentos_raw:
+                    data_ag = ag.get('data_br','')
+                    hora_ag = ag.get('hora','')
+                    if data_ag in msg_recebida and hora_ag[:5] in msg_recebida:
+                        ag_sel = ag
+                        break
+        if ag_sel:
+            update_paciente(phone, {"status": "reagendando_tipo", "agenda_sessao_selecionada": ag_sel, "agenda_local_id": ag_sel["local_id"], "agenda_procedimento_id": ag_sel["procedimento_id"]})
+            enviar_botoes(phone,
+                f"Vamos reagendar sua sessão de *{ag_sel['servico']}* em *{ag_sel['data_br']} às {ag_sel['hora']}*.\n\nO que você precisa?",
+                [{"id": "rt_horario", "title": "🕐 Mudar horário"}, {"id": "rt_dia", "title": "📅 Mudar o dia"}, {"id": "rt_voltar", "title": "⬅️ Voltar"}])
+        else:
+            enviar_lista(phone, "Qual sessão deseja reagendar?", "Selecionar", [{"title": "Sessões", "rows": [{"id": f"rag_{i}", "title": f"{ag['servico']} {ag['data_br']}"[:24]} for i, ag in enumerate(agendamentos_raw[:4])]}])
+
+
+@registro.estado(
+    "escolhendo_sessao_cancelamento",
+    transicoes=["cancelando_sessao", "gestao_agenda"],
+    botoes=["ac_voltar", "⬅️ Voltar", "Voltar"],
+)
+def estado_escolhendo_sessao_cancelamento(ctx):
+    phone, info, msg_recebida, msg_limpa = ctx.phone, ctx.info, ctx.msg_recebida, ctx.msg_limpa
+    agendamentos_raw = info.get("agenda_agendamentos", [])
+    if msg_recebida in ["ac_voltar", "⬅️ Voltar", "Voltar"]:
+        update_paciente(phone, {"status": "gestao_agenda"})
+        _secoes_ga3 = [{"title": "O que deseja fazer?", "rows": [{"id": "ga_consultar", "title": "📋 Ver minha agenda"}, {"id": "ga_confirmar", "title": "✅ Confirmar presença"}, {"id": "ga_reagendar", "title": "🔄 Reagendar sessão"}, {"id": "ga_cancelar", "title": "❌ Cancelar sessão"}]}]
+        enviar_lista(phone, "Voltando ao menu de gestão:", "Ver Opções", _secoes_ga3)
+    else:
+        # Tenta achar a sessão: primeiro por ID (ac_N), depois por título
+        ag_sel = None
+        if msg_recebida.startswith("ac_") and msg_recebida.replace("ac_", "").isdigit():
+            idx = int(msg_recebida.replace("ac_", ""))
+            if idx < len(agendamentos_raw):
+                ag_sel = agendamentos_raw[idx]
+        else:
+            # Busca por título — ex: "Fisioterapia 11:00"
+            for ag in agendamentos_raw:
+                titulo_ag = f"{ag.get('servico','')} {ag.get('hora','')}".strip()
+                if msg_limpa in titulo_ag.lower() or titulo_ag.lower() in msg_limpa:
+                    ag_sel = ag
+                    break
+        if ag_sel:
+            update_paciente(phone, {"status": "cancelando_sessao", "agenda_sessao_selecionada": ag_sel})
+            data_br_c = ag_sel.get("data_br", "")
+            hora_c = ag_sel.get("hora", "")
+            servico_c = ag_sel.get("servico", "Sessão")
+            enviar_botoes(phone,
+                f"Atenção: vou cancelar sua sessão de *{servico_c}* em *{data_br_c} às {hora_c}*.\n\nDeseja informar o motivo?",
+                [{"id": "cs_motivo", "title": "Sim, informar motivo"}, {"id": "cs_direto", "title": "Não, só cancelar"}, {"id": "cs_voltar", "title": "⬅️ Voltar"}])
+        else:
+            # Sessão não identificada — mostra a lista novamente
+            ag_mesmo_dia = agendamentos_raw[:2]
+            opcoes_c = [{"id": f"ac_{i}", "title": f"{ag['servico']} {ag['hora']}"[:24]} for i, ag in enumerate(ag_mesmo_dia)]
+            opcoes_c.append({"id": "ac_voltar", "title": "⬅️ Voltar"})
+            enviar_lista(phone, "Qual sessão deseja cancelar?", "Selecionar", [{"title": "Sessões", "rows": opcoes_c}])
+
+
+@registro.estado(
+    "reagendando_preferencia",
+    transicoes=["atendimento_humano", "escolhendo_horario_reagendamento", "gestao_agenda"],
+    botoes=["rp_voltar", "⬅️ Voltar", "Voltar"],
+)
+def estado_reagendando_preferencia(ctx):
+    phone, info, msg_recebida = ctx.phone, ctx.info, ctx.msg_recebida
+    if msg_recebida in ["rp_voltar", "⬅️ Voltar", "Voltar"]:
+        update_paciente(phone, {"status": "gestao_agenda"})
+        _secoes_gav = [{"title": "O que deseja fazer?", "rows": [{"id": "ga_consultar", "title": "📋 Ver minha agenda"}, {"id": "ga_confirmar", "title": "✅ Confirmar presença"}, {"id": "ga_reagendar", "title": "🔄 Reagendar sessão"}, {"id": "ga_cancelar", "title": "❌ Cancelar sessão"}, {"id": "ga_voltar", "title": "⬅️ Voltar ao Menu"}]}]
+        enviar_lista(phone, "Voltando às opções:", "Ver Opções", _secoes_gav)
+        return jsonify({"status": "reagendamento_cancelado"}), 200
+    # Usa IA para extrair preferência de data do texto livre
+    pref = extrair_preferencia_data(msg_recebida)
+    print(f"[REAGEND-PREF] Extraído: {pref}", file=sys.stderr)
+    local_id = info.get("agenda_local_id") or 2
+    proc_id = info.get("agenda_procedimento_id") or 9
+    hoje = datetime.now()
+    agendamentos_serie = info.get("agenda_agendamentos", [])
+
+    # Determina horário preferido
+    hora_preferida = pref.get("hora") or {"tarde": "14:00", "noite": "18:00"}.get(pref.get("periodo"), "08:00")
+
+    # Data alvo — já em YYYY-MM-DD, sem parsing frágil
+    data_ini = hoje + timedelta(days=1)  # mínimo amanhã
+    if pref.get("data"):
+        try:
+            data_cand = datetime.strptime(pref["data"], "%Y-%m-%d")
+            if data_cand.date() >= hoje.date():
+                data_ini = data_cand
+        except Exception as e_dp:
+            print(f"[REAGEND-DATA] Erro parse '{pref.get('data')}': {e_dp}", file=sys.stderr)
+    elif pref.get("periodo") and not pref.get("data"):
+        pass  # sem data específica → usa amanhã
+    print(f"[REAGEND-DATA] data_ini={data_ini.strftime('%d/%m/%Y')} hora_pref={hora_preferida}", file=sys.stderr)
+
+    data_fim = dias_uteis_a_partir(data_ini, 14)  # janela de 14 dias úteis
+
+    update_paciente(phone, {"status": "escolhendo_horario_reagendamento", "reagendamento_hora_preferida": hora_preferida,
+                            "reagendamento_periodo": pref.get("periodo")})
+    responder_texto(phone, "Buscando horários disponíveis... ⏳")
+    slots_all = consultar_disponibilidade_feegow(local_id, proc_id, data_ini.strftime('%Y-%m-%d'), data_fim.strftime('%Y-%m-%d'))
+
+    # Filtra por data >= solicitada (Feegow ignora data_start)
+    data_ini_str = data_ini.strftime('%Y-%m-%d')
+    slots_all = [s for s in slots_all if s.get("data","") >= data_ini_str]
+
+    # Filtro por unidade_id já feito na consulta — não precisa filtrar aqui
+    print(f"[REAGEND-SLOTS] {len(slots_all)} slots unidade_id={_LOCAL_ID_UNIDADE.get(local_id, 0)}", file=sys.stderr)
+
+    # Filtra conflitos com agenda existente
+    # Conflito: mesmo dia com diferença < 30min de um agendamento existente
+    slots_ok = filtrar_conflitos(slots_all, agendamentos_serie)
+    proximos = encontrar_horarios_proximos(slots_ok, hora_preferida, qtd=2, periodo=pref.get("periodo"))
+    if proximos:
+        opcoes_txt = "\n".join([f"• {s['label']}" for s in proximos])
+        update_paciente(phone, {
+            "reagendamento_opcoes": [{"data": s["data"], "hora": s["hora"], "label": s["label"]} for s in proximos],
+            "reagendamento_slots_cache": slots_ok,
+            "reagendamento_slots_vistos": [s["label"] for s in proximos]
+        })
+        rows_sl = [{"id": f"slot_{i}", "title": f"{s['data_br']} às {s['hora']}"} for i, s in enumerate(proximos[:8])]
+        rows_sl.append({"id": "slot_outro", "title": "🔄 Ver outros horários"})
+        rows_sl.append({"id": "eh_voltar", "title": "⬅️ Voltar"})
+        opcoes_txt = "\n".join([f"• {s['label']}" for s in proximos])
+        enviar_lista(phone, f"Horários disponíveis mais próximos:\n\n{opcoes_txt}\n\nQual prefere?", "Ver Horários", [{"title": "Selecione", "rows": rows_sl}])
+    else:
+        ag_sel = info.get("agenda_sessao_selecionada", {})
+        nome_rp = info.get("title", "Paciente").split()[0]
+        # Verifica se o problema é conflito (tem slots mas todos filtrados)
+        tem_slots_brutos = len(slots_all) > 0
+        if tem_slots_brutos:
+            # Conflito detectado — tem slots mas todos conflitam com agenda
+            conflitos = []
+            for ag in agendamentos_serie:
+                conflitos.append(f"{ag.get('data_br','')} às {ag.get('hora','')} ({ag.get('servico','')})")
+            conflitos_txt = "\n".join([f"• {c}" for c in conflitos[:3]])
+            queixa_conf = f"[REAGENDAMENTO CONFLITO]: {nome_rp} solicitou horário que conflita com agenda existente. Sessão original: {ag_sel.get('data_br','')} às {ag_sel.get('hora','')}. Preferência: {msg_recebida}."
+            update_paciente(phone, {"status": "atendimento_humano", "unread": True, "queixa": queixa_conf})
+            responder_texto(phone,
+                f"Atenção, {nome_rp}! ⚠️ O horário solicitado conflita com sessões já agendadas:\n\n{conflitos_txt}\n\n"
+                f"Vou encaminhar para nossa recepção encontrar o melhor horário sem conflito. 💙"
+            )
+        else:
+            queixa_rp = f"[REAGENDAMENTO]: sem disponibilidade. Preferência: {msg_recebida}. Sessão original: {ag_sel.get('data_br','')}"
+            update_paciente(phone, {"status": "atendimento_humano", "unread": True, "queixa": queixa_rp})
+            responder_texto(phone, f"Não encontrei horários disponíveis no período solicitado, {nome_rp}. Nossa equipe vai entrar em contato para encontrar o melhor horário! 💙")
+
+
+@registro.estado(
+    "escolhendo_horario_reagendamento",
+    transicoes=["atendimento_humano", "gestao_agenda"],
+    botoes=["slot_outro", "Outros horários", "Ver outros horários", "Outro horário", "🔄 Ver outros horários", "slot_recepcao", "👩 Falar com recepção", "eh_voltar", "⬅️ Voltar", "Voltar"],
+)
+def estado_escolhendo_horario_reagendamento(ctx):
+    phone, info, msg_recebida = ctx.phone, ctx.info, ctx.msg_recebida
+    opcoes = info.get("reagendamento_opcoes", [])
+    if msg_recebida in ["slot_outro", "Outros horários", "Ver outros horários", "Outro horário", "🔄 Ver outros horários"]:
+        hora_pref = info.get("reagendamento_hora_preferida", "08:00")
+        ag_sel_r = info.get("agenda_sessao_selecionada", {})
+        # Usa slots já em cache — não refaz chamada à API
+        slots_cache = info.get("reagendamento_slots_cache", [])
+        slots_ja_vistos = info.get("reagendamento_slots_vistos", [])
+        # Filtra os que ainda não foram mostrados
+        proximos_outros = [s for s in slots_cache if s.get("label") not in slots_ja_vistos]
+        proximos_outros = encontrar_horarios_proximos(proximos_outros, hora_pref, qtd=5, periodo=info.get("reagendamento_periodo"))
+        if proximos_outros:
+            vistos_novos = slots_ja_vistos + [s["label"] for s in proximos_outros]
+            update_paciente(phone, {
+                "reagendamento_opcoes": proximos_outros,
+                "reagendamento_slots_vistos": vistos_novos
+            })
+            opcoes_txt2 = "\n".join([f"• {s['label']}" for s in proximos_outros])
+            rows_sl2 = [{"id": f"slot_{i}", "title": f"{s['data_br']} às {s['hora']}"} for i, s in enumerate(proximos_outros[:8])]
+            rows_sl2.append({"id": "slot_recepcao", "title": "👩 Falar com recepção"})
+            rows_sl2.append({"id": "eh_voltar", "title": "⬅️ Voltar"})
+            enviar_lista(phone, f"Outras opções disponíveis:\n\n{opcoes_txt2}\n\nQual prefere?", "Ver Horários", [{"title": "Selecione", "rows": rows_sl2}])
+        else:
+            # Sem mais slots — transfere para recepção
+            nome_r = info.get("title", "Paciente").split()[0]
+            queixa_sem = f"[REAGENDAMENTO]: {nome_r} não aceitou nenhuma sugestão. Sessão original: {ag_sel_r.get('data_br','')} às {ag_sel_r.get('hora','')}. Preferência: {hora_pref}."
+            update_paciente(phone, {"status": "atendimento_humano", "unread": True, "queixa": queixa_sem})
+            responder_texto(phone, f"Entendido, {nome_r}! Vou passar para nossa equipe encontrar o melhor horário para você. Em breve entraremos em contato! 💙")
+
+    elif msg_recebida in ["slot_recepcao", "👩 Falar com recepção"]:
+        nome_r2 = info.get("title", "Paciente").split()[0]
+        ag_sel_r2 = info.get("agenda_sessao_selecionada", {})
+        queixa_r2 = f"[REAGENDAMENTO]: {nome_r2} pediu para falar com a recepção. Sessão original: {ag_sel_r2.get('data_br','')} às {ag_sel_r2.get('hora','')}."
+        update_paciente(phone, {"status": "atendimento_humano", "unread": True, "queixa": queixa_r2})
+        responder_texto(phone, f"Claro, {nome_r2}! Nossa equipe vai entrar em contato para encontrar o melhor horário. 💙")
+    elif msg_recebida in ["eh_voltar", "⬅️ Voltar", "Voltar"]:
+        update_paciente(phone, {"status": "gestao_agenda"})
+        _secoes_ehv = [{"title": "O que deseja fazer?", "rows": [{"id": "ga_consultar", "title": "📋 Ver minha agenda"}, {"id": "ga_confirmar", "title": "✅ Confirmar presença"}, {"id": "ga_reagendar", "title": "🔄 Reagendar sessão"}, {"id": "ga_cancelar", "title": "❌ Cancelar sessão"}, {"id": "ga_voltar", "title": "⬅️ Voltar ao Menu"}]}]
+        enviar_lista(phone, "Voltando às opções:", "Ver Opções", _secoes_ehv)
+    else:
+        # Tenta casar por ID (slot_N) ou por título ("15/05/2026 às 08:00")
+        slot = None
+        if msg_recebida.startswith("slot_") and msg_recebida.replace("slot_", "").isdigit():
+            idx = int(msg_recebida.replace("slot_", ""))
+            slot = opcoes[idx] if idx < len(opcoes) else None
+        else:
+            # Lista retorna título — casa por data/hora
+            for o in opcoes:
+                titulo = f"{o.get('data_br','')} às {o.get('hora','')}"
+                if msg_recebida == titulo or o.get("hora","") in msg_recebida and o.get("data_br","") in msg_recebida:
+                    slot = o
+                    break
+
+        if slot:
+            # Nada é reservado aqui (a recepção confirma no Feegow); o dia sai do cache para a
+            # próxima oferta reconsultar a agenda e não repetir um horário que pode já ter sido marcado
+            invalidar_slots(slot.get("data"))
+            ag_orig = info.get("agenda_sessao_selecionada", {})
+            nome_pac = info.get("title", "Paciente").split()[0]
+            queixa_r = (
+                f"[REAGENDAMENTO]: {nome_pac} escolheu *{slot['label']}*. "
+                f"Sessão original: {ag_orig.get('data_br','')} às {ag_orig.get('hora','')} "
+                f"({ag_orig.get('servico','')}) — aguarda confirmação da recepção."
+            )
+            update_paciente(phone, {
+                "status": "atendimento_humano",
+                "unread": True,
+                "queixa": queixa_r,
+                "reagendamento_solicitado": slot
+            })
+            responder_texto(phone,
+                f"Ótimo, {nome_pac}! ✅\n\n"
+                f"Sua preferência de horário *{slot['label']}* foi registrada.\n\n"
+                f"Vou informar nossa recepção agora e em breve você receberá a confirmação do reagendamento. 😊"
+            )
+        elif opcoes:
+            rows_back = [{"id": f"slot_{i}", "title": f"{o['data_br']} às {o['hora']}"} for i, o in enumerate(opcoes[:8])]
+            rows_back.append({"id": "slot_outro", "title": "🔄 Ver outros horários"})
+            rows_back.append({"id": "eh_voltar", "title": "⬅️ Voltar"})
+            enviar_lista(phone, "Por favor, escolha uma das opções:", "Ver Horários", [{"title": "Selecione", "rows": rows_back}])
+
+
+@registro.estado(
+    "cancelando_sessao",
+    transicoes=["gestao_agenda", "informando_motivo_cancelamento_sessao", "menu_veterano", "pos_cancelamento_sessao", "reagendando_preferencia"],
+    botoes=["cs_voltar", "⬅️ Voltar", "Voltar", "cs_motivo", "Sim, informar motivo", "cs_direto", "Não, só cancelar", "cs_rea", "Sim, reagendar", "cs_nao", "Não, obrigado"],
+)
+def estado_cancelando_sessao(ctx):
+    phone, info, msg_recebida = ctx.phone, ctx.info, ctx.msg_recebida
+    ag_sel = info.get("agenda_sessao_selecionada", {})
+    ag_id_cs = ag_sel.get("agendamento_id")
+    ref_sessao = f" *{ag_sel.get('data_br','')} às {ag_sel.get('hora','')}*" if ag_sel else ""
+    if msg_recebida in ["cs_voltar", "⬅️ Voltar", "Voltar"]:
+        update_paciente(phone, {"status": "gestao_agenda"})
+        _secoes_csv = [{"title": "O que deseja fazer?", "rows": [{"id": "ga_consultar", "title": "📋 Ver minha agenda"}, {"id": "ga_confirmar", "title": "✅ Confirmar presença"}, {"id": "ga_reagendar", "title": "🔄 Reagendar sessão"}, {"id": "ga_cancelar", "title": "❌ Cancelar sessão"}, {"id": "ga_voltar", "title": "⬅️ Voltar ao Menu"}]}]
+        enviar_lista(phone, "Voltando às opções:", "Ver Opções", _secoes_csv)
+    elif msg_recebida in ["cs_motivo", "Sim, informar motivo"]:
+        update_paciente(phone, {"status": "informando_motivo_cancelamento_sessao"})
+        responder_texto(phone, f"Entendido. Por favor, me informe o motivo do cancelamento da sessão de{ref_sessao}:")
+    elif msg_recebida in ["cs_direto", "Não, só cancelar"] or "apenas" in msg_recebida.lower():
+        obs_cs = f"Desmarcado pelo paciente via robô. Sessão:{ref_sessao}"
+        ok_cs = cancelar_agendamento_feegow(ag_id_cs, obs=obs_cs, data=ag_sel.get("data"), paciente_id=info.get("feegow_id")) if ag_id_cs else False
+        print(f"[CANCEL-SESSAO] id={ag_id_cs} ok={ok_cs}", file=sys.stderr)
+        tag_cs = "[CANCELAMENTO]" if ok_cs else "[CANCELAMENTO — confirmar no Feegow]"
+        update_paciente(phone, {"status": "menu_veterano", "unread": True, "queixa": f"{tag_cs}: sessão{ref_sessao} cancelada."})
+        enviar_botoes(phone, f"Cancelamento registrado! ✅\n\nGostaria de reagendar para outro horário?",
+            [{"id": "cs_rea", "title": "Sim, reagendar"}, {"id": "cs_nao", "title": "Não, obrigado"}])
+        update_paciente(phone, {"status": "pos_cancelamento_sessao"})
+    elif msg_recebida in ["cs_rea", "Sim, reagendar"] or "cancel_reagendar" in msg_recebida or "reagendar" in msg_recebida.lower():
+        update_paciente(phone, {"status": "reagendando_preferencia"})
+        responder_texto(phone, "Vamos encontrar um novo horário! 😊\n\nQual dia e período você prefere?\n\n_Exemplo: quinta de manhã, semana que vem_")
+    elif msg_recebida in ["cs_nao", "Não, obrigado"]:
+        nome_cs = info.get("title", "Paciente").split()[0]
+        update_paciente(phone, {"status": "menu_veterano"})
+        responder_texto(phone, f"Tudo certo, {nome_cs}! ✅ Sua solicitação foi enviada para nossa recepção. Se precisar de algo mais, é só chamar. 😊")
+    else:
+        enviar_botoes(phone, f"Como deseja prosseguir com a sessão de{ref_sessao}?",
+            [{"id": "cs_motivo", "title": "Informar motivo"}, {"id": "cs_direto", "title": "Cancelar direto"}, {"id": "cs_rea", "title": "Cancelar e reagendar"}, {"id": "cs_voltar", "title": "⬅️ Voltar"}])
+
+
+@registro.estado("informando_motivo_cancelamento_sessao", transicoes=["pos_cancelamento_sessao"])
+def estado_informando_motivo_cancelamento_sessao(ctx):
+    phone, info, msg_recebida = ctx.phone, ctx.info, ctx.msg_recebida
+    motivo_cs = msg_recebida
+    ag_sel_cs = info.get("agenda_sessao_selecionada", {})
+    ag_id_mcs = ag_sel_cs.get("agendamento_id")
+    ref_cs = f" *{ag_sel_cs.get('data_br','')} às {ag_sel_cs.get('hora','')}*" if ag_sel_cs else ""
+    obs_mcs = f"Desmarcado pelo paciente. Motivo: {motivo_cs}"
+    ok_mcs = cancelar_agendamento_feegow(ag_id_mcs, obs=obs_mcs, data=ag_sel_cs.get("data"), paciente_id=info.get("feegow_id")) if ag_id_mcs else False
+    print(f"[CANCEL-MOTIVO] id={ag_id_mcs} ok={ok_mcs}", file=sys.stderr)
+    tag_mcs = "[CANCELAMENTO]" if ok_mcs else "[CANCELAMENTO — confirmar no Feegow]"
+    update_paciente(phone, {"status": "pos_cancelamento_sessao", "unread": True, "queixa": f"{tag_mcs}: sessão{ref_cs}. Motivo: {motivo_cs}"})
+    enviar_botoes(phone, f"Cancelamento registrado! ✅\n\nGostaria de reagendar para outro horário?",
+        [{"id": "cs_rea", "title": "Sim, reagendar"}, {"id": "cs_nao", "title": "Não, obrigado"}])
+
+
+@registro.estado(
+    "pos_cancelamento_sessao",
+    transicoes=["menu_veterano", "reagendando_preferencia"],
+    botoes=["cs_rea", "Sim, reagendar", "cs_nao", "Não, obrigado"],
+)
+def estado_pos_cancelamento_sessao(ctx):
+    phone, info, msg_recebida = ctx.phone, ctx.info, ctx.msg_recebida
+    nome_pcs = info.get("title", "Paciente").split()[0]
+    if msg_recebida in ["cs_rea", "Sim, reagendar"] or "reagendar" in msg_recebida.lower():
+        update_paciente(phone, {"status": "reagendando_preferencia"})
+        responder_texto(phone, f"Vamos encontrar um novo horário para você, {nome_pcs}! 😊\n\nQual dia e período você prefere?\n\n_Exemplo: quinta de manhã, semana que vem_")
+    elif msg_recebida in ["cs_nao", "Não, obrigado"] or "obrigad" in msg_recebida.lower() or "nao" in msg_recebida.lower() or "não" in msg_recebida.lower():
+        update_paciente(phone, {"status": "menu_veterano"})
+        responder_texto(phone, f"Tudo certo, {nome_pcs}! ✅ Sua solicitação foi enviada para nossa recepção. Qualquer dúvida, é só chamar. 😊")
+
+
+@registro.estado("aguardando_token_convenio", transicoes=["menu_veterano"])
+def estado_aguardando_token_convenio(ctx):
+    phone, info, msg_recebida, msg_limpa, agora_iso = ctx.phone, ctx.info, ctx.msg_recebida, ctx.msg_limpa, ctx.agora_iso
+    import re as _re_tk
+    nums = _re_tk.findall(r'[0-9]{4,10}', msg_recebida)
+    palavras_saida = ["ok", "obrigado", "obrigada", "valeu", "voltar", "menu", "cancelar", "tchau", "nao", "não"]
+    eh_saida = any(w in msg_limpa for w in palavras_saida) and not nums
+    if nums:
+        token_val = nums[0]
+        from firebase_admin import firestore as _fs_tk
+        conv_tk = info.get("convenio", "")
+        update_paciente(phone, {
+            "historico_tokens": _fs_tk.ArrayUnion([{"token": token_val, "convenio": conv_tk, "ts": agora_iso}]),
+            "token_convenio": token_val,
+            "status": "menu_veterano",
+            "unread": True
+        })
+        nome_tk = info.get("title", "Paciente").split()[0]
+        responder_texto(phone, f"Token *{token_val}* registrado! ✅\nNossa recepção já recebeu a autorização. 😊")
+        secoes_tk = [{"title": "Como posso ajudar?", "rows": [{"id": "v1", "title": "🗓️ Meus Agendamentos"}, {"id": "v2", "title": "🔄 Nova Guia/Tratamento"}, {"id": "v3", "title": "➕ Novo Serviço"}, {"id": "v5", "title": "🔑 Enviar Token"}, {"id": "v4", "title": "📁 Secretaria"}]}]
+        enviar_lista(phone, f"Mais alguma coisa, {nome_tk}?", "Ver Opções", secoes_tk, atraso=1)
+    elif eh_saida:
+        nome_tk2 = info.get("title", "Paciente").split()[0]
+        update_paciente(phone, {"status": "menu_veterano"})
+        secoes_tk2 = [{"title": "Como posso ajudar?", "rows": [{"id": "v1", "title": "🗓️ Meus Agendamentos"}, {"id": "v2", "title": "🔄 Nova Guia/Tratamento"}, {"id": "v3", "title": "➕ Novo Serviço"}, {"id": "v5", "title": "🔑 Enviar Token"}, {"id": "v4", "title": "📁 Secretaria"}]}]
+        enviar_lista(phone, f"Como posso te ajudar, {nome_tk2}? 😊", "Ver Opções", secoes_tk2)
+    else:
+        responder_texto(phone, "❌ Não reconheci esse código. O token de autorização tem entre 4 e 10 dígitos numéricos.\n\nPode tentar novamente?")
+
+
+@registro.estado(
+    "confirmando_servico_nova_guia",
+    transicoes=["cadastrando_queixa_veterano", "escolhendo_especialidade", "menu_veterano"],
+    botoes=["ng_sim", "ng_outro", "ng_voltar"],
+)
+def estado_confirmando_servico_nova_guia(ctx):
+    phone, info, msg_recebida = ctx.phone, ctx.info, ctx.msg_recebida
+    if msg_recebida in ["ng_sim"] or "Sim" in msg_recebida:
+        sv_ng = info.get("nova_guia_servico", "")
+        update_paciente(phone, {"status": "cadastrando_queixa_veterano", "servico": sv_ng})
+        responder_texto(phone, f"Ótimo! ✅ Vamos renovar a guia para *{sv_ng}*.\n\nPara registrarmos corretamente, me conte brevemente sua situação atual — como está se sentindo e o que motivou a renovação?")
+    elif msg_recebida in ["ng_outro"] or "Outro" in msg_recebida:
+        update_paciente(phone, {"status": "escolhendo_especialidade", "nova_guia": True})
+        secoes_ng2 = [{"title": "Nossos Serviços", "rows": [{"id": "e1", "title": "Fisio Ortopédica"}, {"id": "e2", "title": "Fisio Neurológica"}, {"id": "e3", "title": "Fisio Pélvica"}, {"id": "e4", "title": "Acupuntura"}, {"id": "e5", "title": "Pilates Studio"}, {"id": "e6", "title": "Recovery"}, {"id": "e7", "title": "Liberação Miofascial"}, {"id": "e8", "title": "⬅️ Voltar ao Menu"}]}]
+        enviar_lista(phone, "Qual serviço você deseja renovar a guia?", "Ver Serviços", secoes_ng2)
+    elif msg_recebida in ["ng_voltar"] or "Voltar" in msg_recebida:
+        update_paciente(phone, {"status": "menu_veterano"})
+        nome_ng = info.get("title", "Paciente").split()[0]
+        secoes_ng_v = [{"title": "Como posso ajudar?", "rows": [{"id": "v1", "title": "🗓️ Meus Agendamentos"}, {"id": "v2", "title": "🔄 Nova Guia/Tratamento"}, {"id": "v3", "title": "➕ Novo Serviço"}, {"id": "v5", "title": "🔑 Enviar Token"}, {"id": "v4", "title": "📁 Secretaria"}]}]
+        enviar_lista(phone, f"Voltando ao menu. Como posso ajudar, {nome_ng}?", "Ver Opções", secoes_ng_v)
+    else:
+        sv_ng = info.get("nova_guia_servico", "")
+        un_ng = info.get("nova_guia_unidade", "")
+        un_ng_txt = f" — unidade *{un_ng}*" if un_ng else ""
+        enviar_botoes(phone, f"Você realiza *{sv_ng}*{un_ng_txt}. Vamos renovar a guia para esse tratamento?",
+            [{"id": "ng_sim", "title": f"✅ Sim, {sv_ng}"}, {"id": "ng_outro", "title": "↔️ Outro serviço"}, {"id": "ng_voltar", "title": "⬅️ Voltar"}])
+
+
+@registro.estado(
+    "reagendando_tipo",
+    transicoes=["escolhendo_horario_reagendamento", "gestao_agenda", "reagendando_preferencia"],
+    botoes=["rt_horario", "rt_dia", "rt_voltar"],
+)
+def estado_reagendando_tipo(ctx):
+    phone, info, msg_recebida = ctx.phone, ctx.info, ctx.msg_recebida
+    ag_orig = info.get("agenda_sessao_selecionada", info.get("agenda_agendamentos", [{}])[0] if info.get("agenda_agendamentos") else {})
+    if msg_recebida in ["rt_horario"] or "horário" in msg_recebida.lower() or "horario" in msg_recebida.lower():
+        data_orig = ag_orig.get("data", "")
+        local_id_rt = info.get("agenda_local_id") or 2
+        proc_id_rt = info.get("agenda_procedimento_id") or 9
+        hora_orig = ag_orig.get("hora", "08:00")
+        update_paciente(phone, {"status": "escolhendo_horario_reagendamento", "reagendamento_mesmo_dia": True, "reagendamento_hora_preferida": hora_orig, "reagendamento_periodo": None})
+        responder_texto(phone, "Buscando horários disponíveis no mesmo dia... ⏳")
+        if data_orig:
+            slots_dia = consultar_disponibilidade_feegow(local_id_rt, proc_id_rt, data_orig, data_orig)
+            proximos_dia = encontrar_horarios_proximos(slots_dia, hora_orig, qtd=3)
+            if proximos_dia:
+                update_paciente(phone, {"reagendamento_opcoes": [{"data": s["data"], "hora": s["hora"], "label": s["label"]} for s in proximos_dia]})
+                botoes_dia = [{"id": f"slot_{i}", "title": f"{s['hora']}"[:20]} for i, s in enumerate(proximos_dia)]
+                botoes_dia.append({"id": "slot_outro", "title": "Outro horário"})
+                botoes_dia.append({"id": "eh_voltar", "title": "⬅️ Voltar"})
+                data_br_orig = ag_orig.get("data_br", "")
+                enviar_botoes(phone, f"Horários disponíveis em *{data_br_orig}* mais próximos das {hora_orig}:", botoes_dia)
+            else:
+                responder_texto(phone, "Não há outros horários disponíveis nesse dia. Quer tentar outro dia?")
+                update_paciente(phone, {"status": "reagendando_preferencia"})
+                responder_texto(phone, "Qual dia e período você prefere?\n\n_Exemplo: quinta de manhã, semana que vem_")
+        else:
+            update_paciente(phone, {"status": "reagendando_preferencia"})
+            responder_texto(phone, "Qual dia e período você prefere?\n\n_Exemplo: quinta de manhã_")
+    elif msg_recebida in ["rt_dia"] or "dia" in msg_recebida.lower():
+        update_paciente(phone, {"status": "reagendando_preferencia", "reagendamento_mesmo_dia": False})
+        responder_texto(phone, "Qual dia e período você prefere?\n\n_Exemplo: quinta de manhã, semana que vem, dia 20..._")
+    elif msg_recebida in ["rt_voltar"] or "Voltar" in msg_recebida:
+        update_paciente(phone, {"status": "gestao_agenda"})
+        _secoes_rtv = [{"title": "O que deseja fazer?", "rows": [{"id": "ga_consultar", "title": "📋 Ver minha agenda"}, {"id": "ga_confirmar", "title": "✅ Confirmar presença"}, {"id": "ga_reagendar", "title": "🔄 Reagendar sessão"}, {"id": "ga_cancelar", "title": "❌ Cancelar sessão"}, {"id": "ga_voltar", "title": "⬅️ Voltar ao Menu"}]}]
+        enviar_lista(phone, "Voltando às opções:", "Ver Opções", _secoes_rtv)
+    else:
+        data_br_rt = ag_orig.get("data_br", "")
+        hora_rt = ag_orig.get("hora", "")
+        enviar_botoes(phone, f"O que deseja fazer com a sessão de *{data_br_rt} às {hora_rt}*?",
+            [{"id": "rt_horario", "title": "🕐 Mudar horário (mesmo dia)"}, {"id": "rt_dia", "title": "📅 Mudar o dia"}, {"id": "rt_voltar", "title": "⬅️ Voltar"}])
+
+
+@registro.estado(
+    "cancelando_tratamento",
+    transicoes=["atendimento_humano", "informando_motivo_cancelamento_trat"],
+    botoes=["ct_motivo", "Sim, informar motivo", "ct_direto", "Não, só cancelar"],
+)
+def estado_cancelando_tratamento(ctx):
+    phone, info, msg_recebida = ctx.phone, ctx.info, ctx.msg_recebida
+    if msg_recebida in ["ct_motivo", "Sim, informar motivo"] or "motivo" in msg_recebida.lower():
+        update_paciente(phone, {"status": "informando_motivo_cancelamento_trat"})
+        responder_texto(phone, "Entendido. Por favor, me conte o motivo do cancelamento do tratamento:")
+    elif msg_recebida in ["ct_direto", "Não, só cancelar"] or "não" in msg_recebida.lower() or "nao" in msg_recebida.lower():
+        ag_prox = (info.get("agenda_agendamentos") or [{}])[0]
+        ag_id_ct = ag_prox.get("agendamento_id")
+        if ag_id_ct:
+            cancelar_agendamento_feegow(ag_id_ct, obs="Cancelamento de tratamento solicitado pelo paciente via robô.", data=ag_prox.get("data"), paciente_id=info.get("feegow_id"))
+        update_paciente(phone, {"status": "atendimento_humano", "unread": True, "queixa": "[CANCELAR TRATAMENTO]: Paciente solicitou encerramento do tratamento."})
+        responder_texto(phone, "Cancelamento registrado. 💙\n\nNossa equipe responsável entrará em contato para entender melhor sua situação e garantir o melhor cuidado para você.")
+    else:
+        enviar_botoes(phone, "Deseja informar o motivo do cancelamento?",
+            [{"id": "ct_motivo", "title": "Sim, informar motivo"}, {"id": "ct_direto", "title": "Não, só cancelar"}])
+
+
+@registro.estado("informando_motivo_cancelamento_trat", transicoes=["atendimento_humano"])
+def estado_informando_motivo_cancelamento_trat(ctx):
+    phone, info, msg_recebida = ctx.phone, ctx.info, ctx.msg_recebida
+    motivo_ct = msg_recebida
+    ag_prox_ct = (info.get("agenda_agendamentos") or [{}])[0]
+    ag_id_ct2 = ag_prox_ct.get("agendamento_id")
+    if ag_id_ct2:
+        cancelar_agendamento_feegow(ag_id_ct2, obs=f"Cancelamento de tratamento — motivo: {motivo_ct}", data=ag_prox_ct.get("data"), paciente_id=info.get("feegow_id"))
+    update_paciente(phone, {"status": "atendimento_humano", "unread": True, "queixa": f"[CANCELAR TRATAMENTO]: {motivo_ct}"})
+    responder_texto(phone, "Obrigado por nos explicar. 💙\n\nNossa equipe responsável entrará em contato para entender melhor sua situação e garantir o melhor cuidado para você.")
+
+
+@registro.estado("cadastrando_queixa_veterano", transicoes=["confirmando_convenio_salvo", "modalidade"],
+                 acolhimento=True)
+def estado_cadastrando_queixa_veterano(ctx):
+    phone, info, msg_recebida = ctx.phone, ctx.info, ctx.msg_recebida
+    acolhimento = chamar_ia_custom(msg_recebida) or "Compreendo perfeitamente, e saiba que estamos aqui para cuidar de você da melhor forma."
+    conv_salvo = info.get("convenio", "")
+    update_paciente(phone, {"queixa": msg_recebida, "queixa_ia": acolhimento})
+
+    if conv_salvo and conv_salvo.lower() != "particular":
+        update_paciente(phone, {"status": "confirmando_convenio_salvo"})
+        enviar_botoes(phone, f"{acolhimento}\n\nVi aqui que você utilizou o convênio *{conv_salvo}* anteriormente. Vamos seguir com ele?", [{"id": "c_manter", "title": "Sim, manter plano"}, {"id": "c_trocar", "title": "Troquei de plano"}, {"id": "c_part", "title": "Mudar p/ Particular"}])
+    else:
+        update_paciente(phone, {"status": "modalidade"})
+        enviar_botoes(phone, f"{acolhimento}\n\nAs novas sessões serão pelo seu CONVÊNIO ou de forma PARTICULAR?", [{"id": "m1", "title": "Convênio"}, {"id": "m2", "title": "Particular"}])
+
+
+@registro.estado(
+    "menu_secretaria",
+    transicoes=["atendimento_humano", "cancelando_tratamento", "enviando_exames", "menu_veterano"],
+    botoes=["s6"],
+)
+def estado_menu_secretaria(ctx):
+    phone, info, msg_recebida = ctx.phone, ctx.info, ctx.msg_recebida
+    if "Voltar" in msg_recebida:
+        update_paciente(phone, {"status": "menu_veterano"})
+        nome_s_sec = info.get("title", "Paciente").split()[0]
+        secoes = [{"title": "Como posso ajudar?", "rows": [{"id": "v1", "title": "🗓️ Meus Agendamentos"}, {"id": "v2", "title": "🔄 Nova Guia/Tratamento"}, {"id": "v3", "title": "➕ Novo Serviço"}, {"id": "v5", "title": "🔑 Enviar Token"}, {"id": "v4", "title": "📁 Secretaria"}]}]
+        enviar_lista(phone, f"Voltando ao menu principal. Como posso ajudar, {nome_s_sec}?", "Ver Opções", secoes)
+    elif "Exames" in msg_recebida:
+        update_paciente(phone, {"status": "enviando_exames"})
+        responder_texto(phone, "Perfeito! ✅ Pode enviar os arquivos (PDF ou Foto) agora mesmo. Eu vou anexá-los diretamente ao seu prontuário para o fisioterapeuta analisar.")
+    elif "Cancelar Tratamento" in msg_recebida or msg_recebida == "s6":
+        update_paciente(phone, {"status": "cancelando_tratamento"})
+        enviar_botoes(phone,
+            "Entendo. Cancelar um tratamento é uma decisão importante e nossa equipe quer garantir o melhor para você. 💙\n\n"
+            "Deseja informar o motivo do cancelamento?",
+            [{"id": "ct_motivo", "title": "Sim, informar motivo"}, {"id": "ct_direto", "title": "Não, só cancelar"}])
+    else:
+        update_paciente(phone, {"status": "atendimento_humano", "queixa": f"[SECRETARIA]: {msg_recebida}"})
+        responder_texto(phone, f"A sua solicitação para '{msg_recebida}' foi registada com sucesso. A nossa equipe de secretaria vai assumir o atendimento para providenciar os detalhes. Aguarde um instante! 👩‍💻")
+
+
+@registro.estado("enviando_exames", transicoes=["atendimento_humano"])
+def estado_enviando_exames(ctx):
+    phone, info, tem_anexo, media_id = ctx.phone, ctx.info, ctx.tem_anexo, ctx.media_id
+    if tem_anexo:
+        media_data = salvar_midia_imediata(phone, "exame", media_id) if media_id else {}
+        update_fields = {
+            "status": "atendimento_humano",
+            "queixa": "[EXAME ENVIADO]: Paciente enviou exames via robô.",
+            "tem_exame": True,
+        }
+        update_fields.update(media_data)
+        update_paciente(phone, update_fields)
+        if info.get("feegow_id") and media_data.get("exame_storage_url"):
+            try:
+                feegow_id_int = int(info["feegow_id"])
+                conteudo_bytes, mime_type = baixar_midia_whatsapp_raw(media_id) if media_id else (None, None)
+                if not conteudo_bytes:
+                    res_stor = http_get(media_data["exame_storage_url"], timeout=20)
+                    conteudo_bytes = res_stor.content if res_stor.status_code == 200 else None
+                    mime_type = res_stor.headers.get("Content-Type", "image/jpeg") if conteudo_bytes else None
+                if conteudo_bytes:
+                    b64_puro = base64.b64encode(conteudo_bytes).decode("utf-8")
+                    data_uri = f"data:{mime_type};base64,{b64_puro}"
+                    headers_up = {"x-access-token": FEEGOW_TOKEN, "Content-Type": "application/json", "User-Agent": "Conectifisio-Integration/1.0"}
+                    for ep in ["/patient/upload-prontuario", "/patient/upload-base64"]:
+                        res_up = http_post(f"https://api.feegow.com/v1/api{ep}",
+                            json={"paciente_id": feegow_id_int, "arquivo_descricao": "Exame (Robô)", "base64_file": data_uri},
+                            headers=headers_up, timeout=30)
+                        print(f"[FEEGOW-EXAME] {ep}: HTTP {res_up.status_code} | {res_up.text[:300]}", file=sys.stderr)
+                        if res_up.status_code == 200:
+                            break
+            except Exception as e_ex:
+                import sys
+                print(f"[FEEGOW-EXAME] Erro: {e_ex}", file=sys.stderr)
+        responder_texto(phone, "Recebido com sucesso! 📁 O arquivo foi salvo e nossa equipe vai analisar em breve.")
+    else:
+        responder_texto(phone, "❌ Não recebi o arquivo. Por favor, envie o seu exame ou resultado (Foto ou PDF).")
+
+
+@registro.estado(
+    "confirmando_convenio_salvo",
+    transicoes=["agendando", "cobertura_recusada", "foto_pedido_medico", "nome_convenio"],
+)
+def estado_confirmando_convenio_salvo(ctx):
+    phone, info, msg_recebida, servico = ctx.phone, ctx.info, ctx.msg_recebida, ctx.servico
+    if "manter" in msg_recebida.lower():
+        conv_salvo = info.get("convenio", "")
+        if not verificar_cobertura(conv_salvo, servico or "Fisio Ortopédica"):
+            update_paciente(phone, {"status": "cobertura_recusada"})
+            enviar_botoes(phone, f"⚠️ O seu plano *{conv_salvo}* não possui cobertura para *{servico}*.\n\nVocê pode realizar o atendimento Particular para reembolso. Deseja seguir no particular?", [{"id": "part", "title": "Seguir Particular"}, {"id": "out", "title": "Escolher outro"}])
+        else:
+            update_paciente(phone, {"modalidade": "Convênio", "status": "foto_pedido_medico"})
+            responder_texto(phone, "Perfeito! ✅ Como você manteve o plano, precisamos apenas do novo pedido médico.\n\nPor favor, envie a FOTO ou PDF DO SEU PEDIDO MÉDICO atualizado.")
+    elif "Particular" in msg_recebida:
+        update_paciente(phone, {"modalidade": "Particular", "status": "agendando"})
+        enviar_botoes(phone, "Perfeito! Mudamos para Particular. Qual o melhor período para você? ☀️ ⛅", [{"id": "t1", "title": "Manhã"}, {"id": "t2", "title": "Tarde"}])
+    else:
+        update_paciente(phone, {"status": "nome_convenio"})
+        secoes = [{"title": "Convênios Aceitos", "rows": [{"id": "c1", "title": "Saúde Petrobras"}, {"id": "c2", "title": "Mediservice"}, {"id": "c3", "title": "Cassi"}, {"id": "c4", "title": "Geap Saúde"}, {"id": "c5", "title": "Amil"}, {"id": "c6", "title": "Bradesco Saúde"}, {"id": "c7", "title": "Porto Seguro Saúde"}, {"id": "c8", "title": "Prevent Senior"}, {"id": "c9", "title": "Saúde Caixa"}]}]
+        enviar_lista(phone, "Entendido! Selecione o seu NOVO plano de saúde:", "Ver Convênios", secoes)
@@ -0,0 +1,71 @@
+"""
+Canal de eventos em tempo real para o dashboard (SSE / long-poll).
+
+Alimentado pelas próprias escritas do webhook (registrar_historico → "mensagem",
+gravação do card → "card"). Cada evento recebe um seq crescente e fica num
+buffer circular; conexões atrasadas retomam pelo seq (Last-Event-ID) e, se o
+seq já saiu do buffer, recebem "resync" (o dashboard faz um fetch completo).
+
+Escopo por instância: com várias instâncias no Cloud Run cada dashboard só vê
+as escritas da instância em que está conectado — o dashboard mantém um poll
+incremental lento (get_patients&since) para reconciliar, e o chat aberto
+reconcilia o histórico a cada 30s mesmo com o SSE conectado.
+
+Cada conexão SSE/long-poll ocupa um thread do gunicorn enquanto dura:
+reservar_conexao() limita quantas ficam abertas ao mesmo tempo (SSE_MAX_CONEXOES),
+para que abas do dashboard não tirem threads dos POSTs do webhook.
+"""
+import os
+import json
+import threading
+from collections import deque
+
+MAX_BUFFER = 2000
+SSE_MAX_CONEXOES = int(os.environ.get("SSE_MAX_CONEXOES", "2"))  # gunicorn roda com --threads 8
+
+
+class CanalEventos:
+    def __init__(self, max_buffer=MAX_BUFFER, max_conexoes=SSE_MAX_CONEXOES):
+        self._cond = threading.Condition()
+        self._buffer = deque(maxlen=max_buffer)
+        self._seq = 0
+        self.max_conexoes = max_conexoes
+        self.conexoes = 0
+        self.recusadas = 0
+
+    def reservar_conexao(self):
+        """True se há vaga para mais uma conexão bloqueante (devolver com liberar_conexao)."""
+        with self._cond:
+            if self.conexoes >= self.max_conexoes:
+                self.recusadas += 1
+                return False
+            self.conexoes += 1
+            return True
+
+    def liberar_conexao(self):
+        with self._cond:
+            self.conexoes -= 1
+
+    def publicar(self, tipo, dados):
+        with self._cond:
+            self._seq += 1
+            self._buffer.append((self._seq, tipo, dados))
+            self._cond.notify_all()
+
+    def ultimo_seq(self):
+        return self._seq
+
+    def aguardar(self, desde, timeout):
+        """Eventos com seq > desde; bloqueia até chegar algum ou estourar o timeout.
+        Retorna [(seq, tipo, dados)] — [] no timeout."""
+        with self._cond:
+            # Seq de antes de um restart, ou já fora do buffer → cliente precisa recarregar tudo
+            if desde > self._seq or (self._buffer and desde < self._buffer[0][0] - 1):
+                return [(self._seq, "resync", {})]
+            if desde >= self._seq:
+                self._cond.wait(timeout)
+            return [ev for ev in self._buffer if ev[0] > desde]
+
+
+def formatar_sse(seq, tipo, dados):
+    return f"id: {seq}\nevent: {tipo}\ndata: {json.dumps(dados, default=str, ensure_ascii=False)}\n\n"
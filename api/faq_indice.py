@@ -0,0 +1,163 @@
+"""
+FAQ em memória, mantido pelo listener on_snapshot da coleção FAQ.
+
+_carregar_faq relia a coleção inteira a cada _FAQ_CACHE_TTL (5 min) e a primeira
+mensagem depois do vencimento pagava a leitura completa. Agora:
+
+  - o listener aplica cada alteração como upsert/remoção do documento — o FAQ
+    editado no painel vale em segundos, sem reler o resto; o índice semântico
+    (faq_semantico.py) só pede embeddings dos textos novos;
+  - aquecer() sobe o listener e espera o primeiro snapshot no import do webhook,
+    antes da primeira requisição (com leitura completa se o listener não vier);
+  - se o listener cair: o conteúdo em memória continua valendo por até um TTL
+    enquanto ele reconecta; sem listener, leitura completa via cache com TTL,
+    como antes, e em erro o último conteúdo conhecido (obsoleto, mas não vazio).
+
+Ordem dos itens = ordem do stream() do Firestore (id do documento).
+"""
+import os
+import sys
+import time
+import threading
+
+FAQ_CACHE_TTL = int(os.environ.get("FAQ_CACHE_TTL", "300"))  # segundos, só sem listener
+FAQ_AQUECIMENTO_S = float(os.environ.get("FAQ_AQUECIMENTO_S", "5"))  # espera pelo 1º snapshot no startup
+FAQ_LISTENER_RETRY = 60  # segundos entre tentativas de subir o listener
+
+
+class IndiceFAQ:
+    def __init__(self, cache, colecao="FAQ"):
+        self._cache = cache  # cache_compartilhado.Cache (fallback sem listener)
+        self._colecao = colecao
+        self._lock = threading.Lock()           # conteúdo
+        self._lock_listener = threading.Lock()  # subida/reinício do listener
+        self._watch = None
+        self._sincronizado = threading.Event()  # primeiro snapshot do listener aplicado
+        self._proxima_tentativa = 0.0
+        self._docs = {}         # doc_id → dict
+        self._itens = None      # lista na ordem do id; trocada (nunca alterada) a cada mudança
+        self._versao = 0
+        self._valido_ate = 0.0  # conteúdo em memória ainda vale sem listener até aqui (monotonic)
+        self.metricas = {"consultas": 0, "via_listener": 0, "leituras_completas": 0, "upserts": 0,
+                         "remocoes": 0, "reinicios_listener": 0, "obsoletos_servidos": 0}
+
+    # ------------------------------------------
+    # Estado interno
+    # ------------------------------------------
+    def _aplicar(self, upserts, remocoes, completo=False):
+        """upserts: {doc_id: dict}; remocoes: [doc_id]. completo=True substitui tudo."""
+        with self._lock:
+            if completo:
+                remocoes = [i for i in self._docs if i not in upserts]
+            mudou = False
+            for doc_id in remocoes:
+                if self._docs.pop(doc_id, None) is not None:
+                    self.metricas["remocoes"] += 1
+                    mudou = True
+            for doc_id, dados in upserts.items():
+                if self._docs.get(doc_id) == dados:
+                    continue
+                self._docs[doc_id] = dados
+                self.metricas["upserts"] += 1
+                mudou = True
+            if mudou or self._itens is None:
+                self._itens = [self._docs[i] for i in sorted(self._docs)]
+                self._versao += 1
+            return mudou
+
+    # ------------------------------------------
+    # Listener
+    # ------------------------------------------
+    def _listener_ativo(self):
+        return self._watch is not None and getattr(self._watch, "is_active", True)
+
+    def iniciar(self, db):
+        """Sobe (ou reinicia) o listener. Idempotente — chamado a cada consulta."""
+        if not db:
+            return False
+        with self._lock_listener:
+            if self._listener_ativo():
+                return True
+            if time.monotonic() < self._proxima_tentativa:
+                return False
+            if self._watch is not None:
+                self.metricas["reinicios_listener"] += 1
+                print("[FAQ] Listener caiu — reiniciando", file=sys.stderr)
+                try: self._watch.unsubscribe()
+                except Exception: pass
+            self._sincronizado.clear()
+            try:
+                self._watch = db.collection(self._colecao).on_snapshot(self._on_snapshot)
+            except Exception as e:
+                self._watch = None
+                self._proxima_tentativa = time.monotonic() + FAQ_LISTENER_RETRY
+                print(f"[FAQ] Listener indisponível ({e}) — usando TTL de {FAQ_CACHE_TTL}s", file=sys.stderr)
+                return False
+        return True
+
+    def _on_snapshot(self, docs, changes, read_time):
+        if not self._sincronizado.is_set():
+            # Primeiro snapshot (ou após reinício): conteúdo completo da coleção
+            self._aplicar({d.id: d.to_dict() or {} for d in docs}, [], completo=True)
+            self._sincronizado.set()
+            print(f"[FAQ] Listener sincronizado: {len(self._docs)} categorias", file=sys.stderr)
+            return
+        upserts, remocoes = {}, []
+        for change in changes:
+            tipo = getattr(change.type, "name", str(change.type))
+            if tipo == "REMOVED":
+                remocoes.append(change.document.id)
+            else:
+                upserts[change.document.id] = change.document.to_dict() or {}
+        if self._aplicar(upserts, remocoes):
+            print(f"[FAQ] Listener: {len(upserts)} atualizadas, {len(remocoes)} removidas", file=sys.stderr)
+
+    def aquecer(self, db, espera=FAQ_AQUECIMENTO_S):
+        """Startup: listener + primeiro snapshot, ou leitura completa se não vier a tempo."""
+        if not db:
+            return
+        inicio = time.perf_counter()
+        if not (self.iniciar(db) and self._sincronizado.wait(espera)):
+            self.itens(db)
+        print(f"[FAQ] Aquecido: {len(self._docs)} categorias em {(time.perf_counter() - inicio) * 1000:.0f}ms",
+              file=sys.stderr)
+
+    # ------------------------------------------
+    # Consulta
+    # ------------------------------------------
+    def _ler_completo(self, db):
+        self.metricas["leituras_completas"] += 1
+        docs = {d.id: d.to_dict() for d in db.collection(self._colecao).stream()}
+        print(f"[FAQ] Leitura completa: {len(docs)} categorias carregadas", file=sys.stderr)
+        return docs
+
+    def itens(self, db):
+        """Documentos da coleção FAQ (lista de dicts)."""
+        self.metricas["consultas"] += 1
+        if not db:
+            return []
+        self.iniciar(db)
+        if self._listener_ativo() and self._sincronizado.is_set():
+            self.metricas["via_listener"] += 1
+            self._valido_ate = time.monotonic() + FAQ_CACHE_TTL
+            return self._itens
+        if self._itens is not None and time.monotonic() < self._valido_ate:
+            # Listener reconectando: o último conteúdo vale por até um TTL, como o cache antigo
+            self.metricas["obsoletos_servidos"] += 1
+            return self._itens
+        try:
+            # Em erro de leitura o Cache devolve o último valor conhecido, se houver
+            docs = self._cache.obter("documentos", lambda: self._ler_completo(db), FAQ_CACHE_TTL)
+        except Exception as e:
+            print(f"[FAQ] Erro ao carregar Firestore: {e}", file=sys.stderr)
+            docs = None
+        if docs is not None:
+            self._aplicar(docs, [], completo=True)
+        elif self._itens:
+            self.metricas["obsoletos_servidos"] += 1
+            print("[FAQ] Servindo o último conteúdo conhecido", file=sys.stderr)
+        return self._itens or []
+
+    def status(self):
+        return {**self.metricas, "listener_ativo": self._listener_ativo(),
+                "sincronizado": self._sincronizado.is_set(), "categorias": len(self._docs), "versao": self._versao}
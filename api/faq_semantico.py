@@ -0,0 +1,256 @@
+"""
+Cache semântico de respostas do FAQ, na frente do modelo fine-tuned.
+
+consultar_faq mandava quase toda mensagem livre para o modelo (até 15s), mas a
+maioria das dúvidas é paráfrase das mesmas perguntas do FAQ. O índice guarda o
+embedding de:
+
+  - cada pergunta/variação da coleção FAQ → resposta_ideal;
+  - cada resposta do modelo aprovada por uma pessoa da clínica (coleção
+    FAQRespostasAprovadas, aprovada=True, com a pergunta escrita por quem aprovou)
+    → resposta do modelo. Resposta que só passou pelos filtros fica "pendente"
+    e não entra no índice.
+
+Mensagem com similaridade de cosseno >= FAQ_SEMANTICO_LIMIAR com alguma entrada
+é respondida localmente; só as demais vão para o modelo.
+
+Busca por força bruta (as entradas são poucas centenas): produto matriz × vetor
+com NumPy se instalado, senão em Python puro. Os embeddings ficam em SQLite no
+disco (chave = modelo + texto), então reconstruir o índice depois de um reload do
+FAQ ou de um restart só pede à API os textos novos. O arquivo guarda no máximo
+FAQ_EMBEDDINGS_MAX vetores (os menos usados saem primeiro) — as mensagens dos
+pacientes também passam por ele.
+"""
+import os
+import sys
+import json
+import time
+import array
+import hashlib
+import sqlite3
+import threading
+from collections import deque
+
+try:
+    import numpy as np
+    NUMPY_DISPONIVEL = True
+except ImportError:
+    np = None
+    NUMPY_DISPONIVEL = False
+
+FAQ_SEMANTICO = os.environ.get("FAQ_SEMANTICO", "1") == "1"
+FAQ_SEMANTICO_LIMIAR = float(os.environ.get("FAQ_SEMANTICO_LIMIAR", "0.90"))
+FAQ_EMBEDDINGS_MODELO = os.environ.get("FAQ_EMBEDDINGS_MODELO", "text-embedding-3-small")
+FAQ_EMBEDDINGS_PATH = os.environ.get("FAQ_EMBEDDINGS_PATH", "/tmp/faq_embeddings.db")
+FAQ_APROVADAS_VALIDADE_DIAS = int(os.environ.get("FAQ_APROVADAS_VALIDADE_DIAS", "30"))
+FAQ_EMBEDDINGS_MAX = int(os.environ.get("FAQ_EMBEDDINGS_MAX", "5000"))
+
+LOTE_EMBEDDINGS = 100  # textos por chamada à API de embeddings
+AMOSTRAS_LATENCIA = 500
+
+
+def normalizar_pergunta(texto):
+    return " ".join((texto or "").lower().split())
+
+
+def _unitario(vetor):
+    norma = sum(x * x for x in vetor) ** 0.5
+    return [x / norma for x in vetor] if norma else list(vetor)
+
+
+def _percentis(amostras):
+    if not amostras:
+        return {}
+    ordenadas = sorted(amostras)
+    n = len(ordenadas)
+    return {"media_ms": round(1000 * sum(ordenadas) / n, 1),
+            "p50_ms": round(1000 * ordenadas[n // 2], 1),
+            "p95_ms": round(1000 * ordenadas[min(n - 1, int(n * 0.95))], 1)}
+
+
+class CacheEmbeddings:
+    """Embeddings já calculados, em SQLite (sobrevive a restart e é compartilhado
+    entre workers da mesma máquina). Limitado a max_itens, por uso mais recente."""
+
+    def __init__(self, caminho=FAQ_EMBEDDINGS_PATH, modelo=FAQ_EMBEDDINGS_MODELO, max_itens=FAQ_EMBEDDINGS_MAX):
+        self._modelo = modelo
+        self._max = max_itens
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(caminho, check_same_thread=False, isolation_level=None)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (chave TEXT PRIMARY KEY, vetor BLOB)")
+        colunas = {row[1] for row in self._conn.execute("PRAGMA table_info(embeddings)")}
+        if "usado_em" not in colunas:  # arquivo de antes do limite
+            self._conn.execute("ALTER TABLE embeddings ADD COLUMN usado_em REAL DEFAULT 0")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_uso ON embeddings (usado_em)")
+
+    def _chave(self, texto):
+        return hashlib.sha1(f"{self._modelo}\n{texto}".encode("utf-8")).hexdigest()
+
+    def obter(self, textos):
+        """{texto: vetor} só dos textos que já estão no disco."""
+        encontrados, usados = {}, []
+        with self._lock:
+            for texto in textos:
+                chave = self._chave(texto)
+                row = self._conn.execute("SELECT vetor FROM embeddings WHERE chave = ?", (chave,)).fetchone()
+                if row:
+                    encontrados[texto] = array.array("f", row[0]).tolist()
+                    usados.append(chave)
+            if usados:
+                agora = time.time()
+                self._conn.executemany("UPDATE embeddings SET usado_em = ? WHERE chave = ?",
+                                       [(agora, chave) for chave in usados])
+        return encontrados
+
+    def gravar(self, pares):
+        agora = time.time()
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (chave, vetor, usado_em) VALUES (?, ?, ?)",
+                                   [(self._chave(t), array.array("f", v).tobytes(), agora) for t, v in pares])
+            excesso = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] - self._max
+            if excesso > 0:
+                self._conn.execute("DELETE FROM embeddings WHERE chave IN "
+                                   "(SELECT chave FROM embeddings ORDER BY usado_em LIMIT ?)", (excesso,))
+
+
+class IndiceFAQSemantico:
+    def __init__(self, gerar_embeddings, cache_embeddings=None, limiar=FAQ_SEMANTICO_LIMIAR):
+        self._gerar_embeddings = gerar_embeddings  # [texto] → [vetor], na mesma ordem
+        self._cache_embeddings = cache_embeddings
+        self.limiar = limiar
+        self._lock = threading.Lock()  # só para reconstrução/inclusão; busca lê o snapshot
+        # (entradas, matriz) publicados juntos numa única atribuição — a busca lê uma vez
+        # entradas: ((texto, resposta, origem), ...); matriz: np.ndarray (n × d) ou lista de vetores unitários
+        self._snapshot = ((), None)
+        self._assinatura = None
+        self._fontes = (None, None)
+        self._lock_metricas = threading.Lock()
+        self._lat_local = deque(maxlen=AMOSTRAS_LATENCIA)
+        self._lat_modelo = deque(maxlen=AMOSTRAS_LATENCIA)
+        self.metricas = {"consultas": 0, "hits_faq": 0, "hits_aprovada": 0, "misses": 0, "recusadas": 0, "erros": 0,
+                         "reconstrucoes": 0, "embeddings_api": 0, "embeddings_disco": 0}
+
+    # ------------------------------------------
+    # Embeddings
+    # ------------------------------------------
+    def _embeddings(self, textos):
+        vetores = self._cache_embeddings.obter(textos) if self._cache_embeddings else {}
+        self.metricas["embeddings_disco"] += len(vetores)
+        faltando = [t for t in dict.fromkeys(textos) if t not in vetores]
+        for i in range(0, len(faltando), LOTE_EMBEDDINGS):
+            lote = faltando[i:i + LOTE_EMBEDDINGS]
+            novos = [_unitario(v) for v in self._gerar_embeddings(lote)]
+            self.metricas["embeddings_api"] += len(lote)
+            if self._cache_embeddings:
+                self._cache_embeddings.gravar(zip(lote, novos))
+            vetores.update(zip(lote, novos))
+        return [vetores[t] for t in textos]
+
+    def _montar_matriz(self, vetores):
+        if NUMPY_DISPONIVEL:
+            return np.array(vetores, dtype=np.float32) if vetores else None
+        return list(vetores)
+
+    # ------------------------------------------
+    # Construção
+    # ------------------------------------------
+    def reconstruir_se_mudou(self, faq_data, aprovadas):
+        """faq_data: documentos da coleção FAQ; aprovadas: [{"pergunta", "resposta"}].
+        Barato quando nada mudou. Se outro thread já está reconstruindo, segue com o
+        índice atual em vez de esperar."""
+        if (faq_data, aprovadas) == self._fontes and self._assinatura is not None:
+            return
+        entradas = []
+        for cat in faq_data or []:
+            for pq in cat.get("perguntas_frequentes", []):
+                resposta = pq.get("resposta_ideal")
+                if not resposta:
+                    continue
+                for texto in [pq.get("pergunta", "")] + list(pq.get("variacoes", [])):
+                    texto = normalizar_pergunta(texto)
+                    if texto:
+                        entradas.append((texto, resposta, "faq"))
+        for item in aprovadas or []:
+            texto = normalizar_pergunta(item.get("pergunta"))
+            if texto and item.get("resposta"):
+                entradas.append((texto, item["resposta"], "aprovada"))
+
+        assinatura = hashlib.sha1(json.dumps(entradas, ensure_ascii=False).encode("utf-8")).hexdigest()
+        if assinatura == self._assinatura:
+            self._fontes = (faq_data, aprovadas)
+            return
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            inicio = time.perf_counter()
+            vetores = self._embeddings([e[0] for e in entradas])
+            self._snapshot = (tuple(entradas), self._montar_matriz(vetores))
+            self._assinatura, self._fontes = assinatura, (faq_data, aprovadas)
+            self.metricas["reconstrucoes"] += 1
+            print(f"[FAQ-SEM] Índice com {len(entradas)} entradas em "
+                  f"{(time.perf_counter() - inicio) * 1000:.0f}ms", file=sys.stderr)
+        except Exception as e:
+            self.metricas["erros"] += 1
+            print(f"[FAQ-SEM] Erro reconstruindo índice: {e}", file=sys.stderr)
+        finally:
+            self._lock.release()
+
+    # ------------------------------------------
+    # Busca
+    # ------------------------------------------
+    def _mais_proxima(self, vetor, entradas, matriz):
+        if NUMPY_DISPONIVEL:
+            scores = matriz @ np.asarray(vetor, dtype=np.float32)
+            i = int(scores.argmax())
+            return i, float(scores[i])
+        melhor, melhor_score = 0, -1.0
+        for i, linha in enumerate(matriz):
+            score = sum(a * b for a, b in zip(linha, vetor))
+            if score > melhor_score:
+                melhor, melhor_score = i, score
+        return melhor, melhor_score
+
+    def buscar(self, mensagem, compativel=None):
+        """Resposta local se houver entrada similar o bastante, senão None.
+        compativel(texto_da_entrada) → False recusa a entrada mais próxima (ex.: outro convênio)."""
+        texto = normalizar_pergunta(mensagem)
+        entradas, matriz = self._snapshot
+        if not entradas or len(texto) < 5:
+            return None
+        self.metricas["consultas"] += 1
+        inicio = time.perf_counter()
+        try:
+            vetor = self._embeddings([texto])[0]
+            i, score = self._mais_proxima(vetor, entradas, matriz)
+        except Exception as e:
+            self.metricas["erros"] += 1
+            print(f"[FAQ-SEM] Erro na busca: {e}", file=sys.stderr)
+            return None
+        with self._lock_metricas:
+            self._lat_local.append(time.perf_counter() - inicio)
+        texto_entrada, resposta, origem = entradas[i]
+        if score < self.limiar:
+            self.metricas["misses"] += 1
+            return None
+        if compativel and not compativel(texto_entrada):
+            self.metricas["recusadas"] += 1
+            print(f"[FAQ-SEM] Recusada ({score:.3f}): '{texto_entrada[:40]}' cita outro convênio/serviço", file=sys.stderr)
+            return None
+        self.metricas["hits_" + origem] += 1
+        print(f"[FAQ-SEM] Hit {origem} ({score:.3f}): '{texto_entrada[:40]}'", file=sys.stderr)
+        return resposta
+
+    def registrar_modelo(self, segundos):
+        """Latência de uma ida ao modelo (miss do índice), para comparação."""
+        with self._lock_metricas:
+            self._lat_modelo.append(segundos)
+
+    def status(self):
+        m = dict(self.metricas)
+        hits = m["hits_faq"] + m["hits_aprovada"]
+        with self._lock_metricas:
+            lat_local, lat_modelo = list(self._lat_local), list(self._lat_modelo)
+        m.update({"entradas": len(self._snapshot[0]), "limiar": self.limiar, "numpy": NUMPY_DISPONIVEL,
+                  "taxa_acerto": round(hits / m["consultas"], 3) if m["consultas"] else 0.0,
+                  "latencia_local": _percentis(lat_local), "latencia_modelo": _percentis(lat_modelo)})
+        return m
@@ -0,0 +1,372 @@
+"""
+Cliente único da API do Feegow (whatsapp.py e totem/feegow_api.py).
+
+Cada função montava a própria URL, os próprios cabeçalhos e o próprio
+tratamento de erro. Aqui:
+
+  - sessão: as requisições passam pelo http_cliente (um requests.Session por
+    host, pool e keep-alive); para o Feegow o adaptador só repete falha de
+    conexão — 429/5xx são tratados aqui;
+  - 429: sempre repete (a requisição foi recusada, não processada), respeitando
+    Retry-After; 5xx e conexão: só em chamadas idempotentes (GET, statusUpdate,
+    patient/edit). Timeout de leitura não repete (como o read=0 do http_cliente):
+    o Feegow lento não melhora na segunda vez e segura a thread do webhook.
+    Backoff exponencial com jitter até FEEGOW_BACKOFF_MAX_S;
+  - prazo total por chamada (FEEGOW_PRAZO_S), repetições incluídas: cada
+    tentativa usa o que resta, e não se dorme além dele;
+  - cf-ray (Cloudflare) de toda resposta com erro vai para o log e para as
+    métricas — é o que o suporte do Feegow pede;
+  - respostas tipadas: RespostaFeegow (status HTTP, success, content, cf-ray) e
+    Paciente/Agendamento com as chaves normalizadas (id/patient_id/paciente_id,
+    nome_completo/nome/name, horario/hora, datas DD-MM-YYYY → ISO);
+  - histograma de latência por endpoint (metricas_feegow).
+
+Os métodos de consulta devolvem None/[] para "não encontrado" e levantam
+ErroFeegow em falha (HTTP != 200 depois das tentativas, timeout, conexão).
+
+FEEGOW_BASE_URL permite apontar para o servidor falso (scripts/servidor_feegow_falso.py).
+"""
+import os
+import re
+import sys
+import time
+import random
+import threading
+from collections import deque
+from urllib.parse import urlsplit
+
+import requests
+from urllib3.exceptions import ReadTimeoutError
+
+from http_cliente import requisicao, POLITICAS_HOST
+
+FEEGOW_BASE_URL = os.environ.get("FEEGOW_BASE_URL", "https://api.feegow.com/v1/api").rstrip("/")
+FEEGOW_TENTATIVAS = int(os.environ.get("FEEGOW_TENTATIVAS", "3"))
+FEEGOW_BACKOFF_S = float(os.environ.get("FEEGOW_BACKOFF_S", "0.5"))
+FEEGOW_BACKOFF_MAX_S = float(os.environ.get("FEEGOW_BACKOFF_MAX_S", "8"))
+FEEGOW_PRAZO_S = float(os.environ.get("FEEGOW_PRAZO_S", "12"))  # segundos por chamada, repetições incluídas
+
+_STATUS_RETRY = (429, 500, 502, 503, 504)
+_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+_CF_RAYS_GUARDADOS = 20
+_PRAZO_MINIMO = 0.5  # abaixo disso não vale abrir outra tentativa
+
+
+# ==========================================
+# TIPOS
+# ==========================================
+class ErroFeegow(Exception):
+    def __init__(self, mensagem, endpoint=None, status=None, cf_ray=None):
+        super().__init__(mensagem)
+        self.endpoint = endpoint
+        self.status = status
+        self.cf_ray = cf_ray
+
+
+class RespostaFeegow:
+    """Resultado de uma chamada. ok = HTTP 200 e success != False."""
+
+    __slots__ = ("endpoint", "status", "dados", "cf_ray", "erro", "tentativas", "segundos")
+
+    def __init__(self, endpoint, status=None, dados=None, cf_ray=None, erro=None, tentativas=1, segundos=0.0):
+        self.endpoint = endpoint
+        self.status = status
+        self.dados = dados if isinstance(dados, dict) else {}
+        self.cf_ray = cf_ray
+        self.erro = erro
+        self.tentativas = tentativas
+        self.segundos = segundos
+
+    @property
+    def http_ok(self):
+        return self.status == 200
+
+    @property
+    def sucesso(self):
+        return self.dados.get("success") != False
+
+    @property
+    def ok(self):
+        return self.http_ok and self.sucesso
+
+    @property
+    def conteudo(self):
+        return self.dados.get("content")
+
+    def exigir(self):
+        """Levanta ErroFeegow se a chamada falhou no transporte/HTTP (success=false não é falha)."""
+        if not self.http_ok:
+            raise ErroFeegow(f"{self.endpoint}: {self.erro or f'HTTP {self.status}'}",
+                             self.endpoint, self.status, self.cf_ray)
+        return self
+
+    def __bool__(self):
+        return self.ok
+
+    def __repr__(self):
+        return f"RespostaFeegow({self.endpoint} status={self.status} ok={self.ok} cf_ray={self.cf_ray})"
+
+
+def _data_iso(valor):
+    """'DD-MM-YYYY', 'YYYY-MM-DD' ou 'YYYY-MM-DDTHH:MM:SS' → 'YYYY-MM-DD' (outros formatos: como vieram)."""
+    data_raw = str(valor or "").split("T")[0]
+    if re.match(r"^\d{2}-\d{2}-\d{4}$", data_raw):
+        p = data_raw.split("-")
+        return f"{p[2]}-{p[1]}-{p[0]}"
+    return data_raw
+
+
+class Paciente:
+    __slots__ = ("id", "nome", "cpf", "nascimento", "email", "celular", "bruto")
+
+    def __init__(self, id, nome="", cpf="", nascimento="", email="", celular="", bruto=None):
+        self.id = id
+        self.nome = nome
+        self.cpf = cpf
+        self.nascimento = nascimento
+        self.email = email
+        self.celular = celular
+        self.bruto = bruto or {}
+
+    @classmethod
+    def de_feegow(cls, p):
+        return cls(
+            id=p.get("paciente_id") or p.get("patient_id") or p.get("id"),
+            nome=p.get("nome_completo") or p.get("nome") or p.get("name") or "",
+            cpf=p.get("cpf") or "",
+            nascimento=p.get("data_nascimento") or "",
+            email=p.get("email1") or p.get("email") or "",
+            celular=p.get("celular1") or p.get("celular") or "",
+            bruto=p,
+        )
+
+    def como_dict(self):
+        return {"id": self.id, "nome": self.nome, "cpf": self.cpf}
+
+    def __repr__(self):
+        return f"Paciente(id={self.id}, nome={self.nome!r})"
+
+
+class Agendamento:
+    __slots__ = ("id", "paciente_id", "data", "hora", "status_id", "local_id", "procedimento_id",
+                 "profissional_id", "convenio", "bruto")
+
+    def __init__(self, id, paciente_id=None, data="", hora="", status_id=1, local_id=None, procedimento_id=None,
+                 profissional_id=None, convenio="", bruto=None):
+        self.id = id
+        self.paciente_id = paciente_id
+        self.data = data
+        self.hora = hora
+        self.status_id = status_id
+        self.local_id = local_id
+        self.procedimento_id = procedimento_id
+        self.profissional_id = profissional_id
+        self.convenio = convenio
+        self.bruto = bruto or {}
+
+    @classmethod
+    def de_feegow(cls, a):
+        return cls(
+            id=a.get("agendamento_id") or a.get("id"),
+            paciente_id=a.get("paciente_id") or a.get("patient_id"),
+            data=_data_iso(a.get("data")),
+            hora=str(a.get("horario") or a.get("hora", ""))[:5],
+            status_id=a.get("status_id", 1),
+            local_id=a.get("local_id"),
+            procedimento_id=a.get("procedimento_id"),
+            profissional_id=a.get("profissional_id"),
+            convenio=a.get("convenio") or "",
+            bruto=a,
+        )
+
+    def __repr__(self):
+        return f"Agendamento(id={self.id}, {self.data} {self.hora}, status={self.status_id})"
+
+
+def _lista(conteudo):
+    if isinstance(conteudo, list):
+        return conteudo
+    return [conteudo] if isinstance(conteudo, dict) and conteudo else []
+
+
+# ==========================================
+# MÉTRICAS (compartilhadas entre instâncias)
+# ==========================================
+_lock_metricas = threading.Lock()
+_histogramas = {}  # endpoint → {...}
+_cf_rays = deque(maxlen=_CF_RAYS_GUARDADOS)  # últimas falhas: (endpoint, status, cf-ray)
+
+
+def _registrar(endpoint, status, segundos, tentativas):
+    with _lock_metricas:
+        h = _histogramas.setdefault(endpoint, {"contagem": 0, "soma": 0.0, "erros": 0, "repeticoes": 0,
+                                               "buckets": [0] * (len(_BUCKETS) + 1)})
+        h["contagem"] += 1
+        h["soma"] += segundos
+        h["repeticoes"] += tentativas - 1
+        if status != 200:
+            h["erros"] += 1
+        for i, limite in enumerate(_BUCKETS):
+            if segundos <= limite:
+                h["buckets"][i] += 1
+                break
+        else:
+            h["buckets"][-1] += 1
+
+
+def metricas_feegow():
+    with _lock_metricas:
+        rotulos = [f"<={b}s" for b in _BUCKETS] + [f">{_BUCKETS[-1]}s"]
+        resultado = {ep: {"contagem": h["contagem"], "erros": h["erros"], "repeticoes": h["repeticoes"],
+                          "media_ms": round(1000 * h["soma"] / h["contagem"], 1) if h["contagem"] else 0,
+                          "histograma": dict(zip(rotulos, h["buckets"]))}
+                     for ep, h in _histogramas.items()}
+        resultado["_cf_rays_recentes"] = [{"endpoint": e, "status": s, "cf_ray": c} for e, s, c in _cf_rays]
+        return resultado
+
+
+def _leitura_expirou(e):
+    """Timeout de leitura — com read=0 no adaptador ele chega embrulhado num ConnectionError."""
+    if isinstance(e, requests.exceptions.ReadTimeout):
+        return True
+    motivo = getattr(e.args[0], "reason", None) if e.args else None
+    return isinstance(motivo, ReadTimeoutError)
+
+
+# ==========================================
+# CLIENTE
+# ==========================================
+class ClienteFeegow:
+    def __init__(self, token, base_url=None, user_agent="Conectifisio-Integration/1.0",
+                 tentativas=FEEGOW_TENTATIVAS, prazo=FEEGOW_PRAZO_S, dormir=time.sleep):
+        self._token = token  # callable → token atual (lido a cada chamada)
+        self.base_url = (base_url or FEEGOW_BASE_URL).rstrip("/")
+        self.user_agent = user_agent
+        self.tentativas = max(1, tentativas)
+        self.prazo = prazo
+        self._dormir = dormir
+        # FEEGOW_BASE_URL em outro host (proxy, servidor falso): mesma política de sessão do Feegow
+        POLITICAS_HOST.setdefault(urlsplit(self.base_url).hostname, POLITICAS_HOST["api.feegow.com"])
+
+    def configurado(self):
+        return bool(self._token())
+
+    def cabecalhos(self):
+        token = self._token()
+        return {"Content-Type": "application/json", "x-access-token": token, "token": token,
+                "User-Agent": self.user_agent}
+
+    @staticmethod
+    def _espera(tentativa, resposta):
+        retry_after = resposta.headers.get("Retry-After") if resposta is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), FEEGOW_BACKOFF_MAX_S)
+            except ValueError:
+                pass
+        return min(FEEGOW_BACKOFF_S * (2 ** tentativa), FEEGOW_BACKOFF_MAX_S) * random.uniform(0.8, 1.2)
+
+    def requisitar(self, metodo, endpoint, params=None, json=None, timeout=10, idempotente=None, prazo=None):
+        """Uma chamada ao endpoint (ex.: "appoints/search"), com as repetições da política,
+        tudo dentro de prazo (padrão self.prazo) segundos. Nunca levanta."""
+        if idempotente is None:
+            idempotente = metodo == "GET"
+        url = f"{self.base_url}/{endpoint}"
+        limite = time.monotonic() + (prazo or self.prazo)
+        inicio = time.perf_counter()
+        status, dados, cf_ray, erro = None, None, None, None
+        tentativa = 0
+        while True:
+            tentativa += 1
+            resposta = None
+            try:
+                resta = max(limite - time.monotonic(), _PRAZO_MINIMO)
+                resposta = requisicao(metodo, url, params=params, json=json, headers=self.cabecalhos(),
+                                      timeout=min(timeout, resta))
+                status = resposta.status_code
+                cf_ray = resposta.headers.get("cf-ray")
+                erro = None if status == 200 else f"HTTP {status} | {resposta.text[:200]}"
+                repetir = status == 429 or (idempotente and status in _STATUS_RETRY)
+            except requests.exceptions.RequestException as e:
+                status, erro = None, f"{type(e).__name__}: {e}"
+                cf_ray = e.response.headers.get("cf-ray") if e.response is not None else None
+                # Conexão recusada já foi repetida pelo adaptador; aqui só o que é seguro repetir
+                repetir = idempotente and not _leitura_expirou(e)
+            if status == 200:
+                try:
+                    dados = resposta.json()
+                except ValueError:
+                    dados, erro, status = None, f"JSON inválido | {resposta.text[:200]}", None
+                break
+            if cf_ray:
+                with _lock_metricas:
+                    _cf_rays.append((endpoint, status, cf_ray))
+            if not repetir or tentativa >= self.tentativas:
+                break
+            espera = self._espera(tentativa - 1, resposta)
+            if espera + _PRAZO_MINIMO > limite - time.monotonic():
+                erro = f"{erro} — prazo de {prazo or self.prazo:.0f}s esgotado"
+                break
+            print(f"[FEEGOW] {metodo} {endpoint}: {erro} (cf-ray={cf_ray or 'N/A'}) — tentativa "
+                  f"{tentativa + 1}/{self.tentativas} em {espera:.1f}s", file=sys.stderr)
+            self._dormir(espera)
+        segundos = time.perf_counter() - inicio
+        _registrar(endpoint, status, segundos, tentativa)
+        if status != 200:
+            print(f"[FEEGOW] {metodo} {endpoint} falhou após {tentativa} tentativa(s): {erro} "
+                  f"(cf-ray={cf_ray or 'N/A'})", file=sys.stderr)
+        return RespostaFeegow(endpoint, status, dados, cf_ray, erro, tentativa, segundos)
+
+    def get(self, endpoint, params=None, **kwargs):
+        return self.requisitar("GET", endpoint, params=params, **kwargs)
+
+    def post(self, endpoint, json=None, **kwargs):
+        return self.requisitar("POST", endpoint, json=json, **kwargs)
+
+    # ------------------------------------------
+    # Pacientes
+    # ------------------------------------------
+    def listar_pacientes(self, **filtros):
+        """patient/list (telefone=..., cpf=...) → [Paciente]."""
+        resp = self.get("patient/list", params=filtros).exigir()
+        return [Paciente.de_feegow(p) for p in _lista(resp.conteudo)] if resp.sucesso else []
+
+    def buscar_paciente(self, paciente_id=None, cpf=None):
+        """patient/search por id ou CPF → Paciente ou None."""
+        params = {"photo": "false"}
+        if paciente_id:
+            params["paciente_id"] = paciente_id
+        if cpf:
+            params["paciente_cpf"] = cpf
+        resp = self.get("patient/search", params=params).exigir()
+        pacientes = _lista(resp.conteudo) if resp.sucesso else []
+        return Paciente.de_feegow(pacientes[0]) if pacientes else None
+
+    def criar_paciente(self, dados):
+        """patient/create → paciente_id ou None. Não repete em 5xx (poderia duplicar o cadastro)."""
+        resp = self.post("patient/create", json=dados)
+        if not resp.ok:
+            return None
+        conteudo = resp.conteudo if isinstance(resp.conteudo, dict) else {}
+        return conteudo.get("paciente_id") or resp.dados.get("paciente_id")
+
+    def editar_paciente(self, dados):
+        return self.post("patient/edit", json=dados, idempotente=True)
+
+    # ------------------------------------------
+    # Agenda
+    # ------------------------------------------
+    def agendamentos(self, paciente_id, data_start, data_end, **filtros):
+        """appoints/search → [Agendamento] (datas no formato que o chamador já usa)."""
+        params = {"paciente_id": paciente_id, "data_start": data_start, "data_end": data_end, **filtros}
+        resp = self.get("appoints/search", params=params).exigir()
+        return [Agendamento.de_feegow(a) for a in _lista(resp.conteudo)] if resp.sucesso else []
+
+    def horarios_disponiveis(self, **params):
+        """appoints/available-schedule — o content tem formatos variados; quem chama interpreta."""
+        return self.get("appoints/available-schedule", params=params)
+
+    def atualizar_status(self, agendamento_id, status_id, obs=""):
+        """appoints/statusUpdate (idempotente: repetir grava o mesmo status)."""
+        payload = {"AgendamentoID": int(agendamento_id), "StatusID": str(status_id), "Obs": obs}
+        return self.post("appoints/statusUpdate", json=payload, idempotente=True)
@@ -0,0 +1,213 @@
+"""
+Fila de saída das mensagens do robô (responder_texto, enviar_botoes, enviar_lista,
+enviar_localizacao).
+
+Com ENVIO_ASSINCRONO=1 as funções de envio só enfileiram e retornam; workers em
+segundo plano fazem o POST na Graph API pelo cliente HTTP compartilhado:
+
+  - Ordem por destinatário: cada telefone tem sua própria fila e no máximo um
+    envio em andamento — a mensagem N+1 nunca sai antes da N.
+  - Limite por número remetente: balde de tokens por phone_number_id
+    (ENVIO_TAXA_POR_NUMERO msg/s, rajada ENVIO_RAJADA) — respeita o throughput
+    da Meta mesmo com vários pacientes sendo atendidos ao mesmo tempo.
+  - Atrasos agendados: enfileirar(..., atraso=1) agenda o envio para 1s depois
+    do envio anterior ao mesmo destinatário, sem segurar a thread do webhook
+    (substitui os time.sleep entre mensagens).
+  - Histórico em lote: as mensagens vão para o histórico no momento em que são
+    enfileiradas (mantém a ordem) e um thread grava o buffer em um único
+    batch do Firestore a cada ENVIO_HISTORICO_INTERVALO.
+
+Escopo por processo (memória): mensagens ainda na fila se perdem se o processo
+morrer — drenar() é chamado no encerramento para esvaziar o que der.
+"""
+import os
+import sys
+import time
+import heapq
+import atexit
+import threading
+import traceback
+from collections import deque
+
+ENVIO_ASSINCRONO = os.environ.get("ENVIO_ASSINCRONO", "0") == "1"
+ENVIO_WORKERS = int(os.environ.get("ENVIO_WORKERS", "4"))
+ENVIO_TAXA_POR_NUMERO = float(os.environ.get("ENVIO_TAXA_POR_NUMERO", "20"))  # msg/s por phone_number_id
+ENVIO_RAJADA = int(os.environ.get("ENVIO_RAJADA", "20"))
+ENVIO_HISTORICO_INTERVALO = float(os.environ.get("ENVIO_HISTORICO_INTERVALO", "0.2"))  # segundos
+ENVIO_HISTORICO_LOTE = 200  # mensagens por batch (cada uma = 1 escrita + 1 por card tocado; limite 500)
+
+
+class BaldeTokens:
+    """Token bucket: `taxa` tokens/s, até `capacidade` acumulados."""
+
+    def __init__(self, taxa, capacidade):
+        self.taxa = taxa
+        self.capacidade = capacidade
+        self._tokens = float(capacidade)
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reservar(self):
+        """Consome um token e devolve quantos segundos esperar antes de usá-lo (0 = já)."""
+        with self._lock:
+            agora = time.monotonic()
+            self._tokens = min(self.capacidade, self._tokens + (agora - self._ultimo) * self.taxa)
+            self._ultimo = agora
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.taxa
+
+
+class FilaEnvio:
+    def __init__(self, enviar, gravar_historico, num_workers=ENVIO_WORKERS,
+                 taxa=ENVIO_TAXA_POR_NUMERO, rajada=ENVIO_RAJADA,
+                 intervalo_historico=ENVIO_HISTORICO_INTERVALO):
+        self._enviar = enviar                    # (numero_id, destino, payload) → Response | None
+        self._gravar_historico = gravar_historico  # ([(phone, msg)]) → None
+        self._num_workers = num_workers
+        self._taxa = taxa
+        self._rajada = rajada
+        self._intervalo_historico = intervalo_historico
+
+        self._cond = threading.Condition()
+        self._filas = {}        # destino → deque[(numero_id, payload, atraso)]
+        self._em_envio = set()  # destinos com um worker enviando agora
+        self._agenda = []       # heap (pronto_em, seq, destino) — um por destino ocioso com fila
+        self._seq = 0
+        self._baldes = {}
+
+        self._lock_hist = threading.Lock()
+        self._buffer_hist = []
+
+        self._iniciado = False
+        self._lock_inicio = threading.Lock()
+        self.metricas = {"enfileiradas": 0, "enviadas": 0, "falhas": 0,
+                         "espera_limite_s": 0.0, "historico_lotes": 0, "historico_mensagens": 0}
+
+    # ------------------------------------------
+    # API
+    # ------------------------------------------
+    def enfileirar(self, numero_id, destino, payload, historico=None, atraso=0):
+        """historico: (phone, msg) já montado — entra no buffer agora, na ordem de chamada."""
+        self._iniciar()
+        if historico is not None:
+            with self._lock_hist:
+                self._buffer_hist.append(historico)
+        with self._cond:
+            self.metricas["enfileiradas"] += 1
+            fila = self._filas.setdefault(destino, deque())
+            fila.append((numero_id, payload, atraso))
+            # Destino ocioso e sem agendamento → agenda a cabeça da fila
+            if len(fila) == 1 and destino not in self._em_envio:
+                self._agendar(destino, time.monotonic() + atraso)
+            self._cond.notify()
+
+    def pendentes(self):
+        with self._cond:
+            return sum(len(f) for f in self._filas.values()) + len(self._em_envio)
+
+    def drenar(self, timeout=10):
+        """Espera a fila esvaziar (ou o timeout) e grava o histórico pendente."""
+        limite = time.monotonic() + timeout
+        while self.pendentes() and time.monotonic() < limite:
+            time.sleep(0.05)
+        self._descarregar_historico()
+
+    def status(self):
+        with self._cond:
+            return {**self.metricas,
+                    "espera_limite_s": round(self.metricas["espera_limite_s"], 3),
+                    "pendentes": sum(len(f) for f in self._filas.values()) + len(self._em_envio),
+                    "destinos_ativos": len(self._filas),
+                    "workers": self._num_workers if self._iniciado else 0,
+                    "taxa_por_numero": self._taxa,
+                    "historico_buffer": len(self._buffer_hist)}
+
+    # ------------------------------------------
+    # Internos
+    # ------------------------------------------
+    def _agendar(self, destino, pronto_em):
+        self._seq += 1
+        heapq.heappush(self._agenda, (pronto_em, self._seq, destino))
+
+    def _balde(self, numero_id):
+        balde = self._baldes.get(numero_id)
+        if balde is None:
+            balde = self._baldes[numero_id] = BaldeTokens(self._taxa, self._rajada)
+        return balde
+
+    def _iniciar(self):
+        if self._iniciado:
+            return
+        with self._lock_inicio:
+            if self._iniciado:
+                return
+            for i in range(self._num_workers):
+                threading.Thread(target=self._loop_envio, name=f"envio-wa-{i}", daemon=True).start()
+            threading.Thread(target=self._loop_historico, name="envio-wa-historico", daemon=True).start()
+            atexit.register(self.drenar)
+            self._iniciado = True
+            print(f"[FILA-ENVIO] {self._num_workers} workers, {self._taxa} msg/s por número", file=sys.stderr)
+
+    def _proximo(self):
+        """Bloqueia até haver um destino pronto; devolve (destino, numero_id, payload)."""
+        with self._cond:
+            while True:
+                agora = time.monotonic()
+                if self._agenda and self._agenda[0][0] <= agora:
+                    _, _, destino = heapq.heappop(self._agenda)
+                    numero_id, payload, _ = self._filas[destino].popleft()
+                    self._em_envio.add(destino)
+                    return destino, numero_id, payload
+                espera = self._agenda[0][0] - agora if self._agenda else None
+                self._cond.wait(espera)
+
+    def _concluir(self, destino):
+        with self._cond:
+            self._em_envio.discard(destino)
+            fila = self._filas.get(destino)
+            if fila:
+                # Atraso da próxima conta a partir deste envio
+                self._agendar(destino, time.monotonic() + fila[0][2])
+                self._cond.notify()
+            else:
+                self._filas.pop(destino, None)
+
+    def _loop_envio(self):
+        while True:
+            destino, numero_id, payload = self._proximo()
+            try:
+                espera = self._balde(numero_id).reservar()
+                if espera > 0:
+                    self.metricas["espera_limite_s"] += espera
+                    time.sleep(espera)
+                res = self._enviar(numero_id, destino, payload)
+                if res is not None and getattr(res, "status_code", 200) < 400:
+                    self.metricas["enviadas"] += 1
+                else:
+                    self.metricas["falhas"] += 1
+                    detalhe = getattr(res, "text", "sem resposta")
+                    print(f"[FILA-ENVIO] Falha ao enviar para {destino}: {str(detalhe)[:300]}", file=sys.stderr)
+            except Exception:
+                self.metricas["falhas"] += 1
+                print(f"[FILA-ENVIO] Erro enviando para {destino}:\n{traceback.format_exc()}", file=sys.stderr)
+            finally:
+                self._concluir(destino)
+
+    def _loop_historico(self):
+        while True:
+            time.sleep(self._intervalo_historico)
+            self._descarregar_historico()
+
+    def _descarregar_historico(self):
+        with self._lock_hist:
+            itens, self._buffer_hist = self._buffer_hist, []
+        for i in range(0, len(itens), ENVIO_HISTORICO_LOTE):
+            lote = itens[i:i + ENVIO_HISTORICO_LOTE]
+            try:
+                self._gravar_historico(lote)
+                self.metricas["historico_lotes"] += 1
+                self.metricas["historico_mensagens"] += len(lote)
+            except Exception as e:
+                print(f"[FILA-ENVIO] Erro gravando histórico ({len(lote)} msgs): {e}", file=sys.stderr)
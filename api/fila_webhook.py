@@ -0,0 +1,267 @@
+"""
+Fila de ingestão do webhook WhatsApp.
+
+O webhook valida o payload, enfileira e devolve 200 para a Meta em milissegundos;
+um pool limitado de workers drena a fila em segundo plano.
+
+Ordenação: cada telefone é sempre roteado para o mesmo shard (crc32 % N) e cada
+shard tem um único worker — as mensagens de um paciente ficam sequenciais e
+pacientes diferentes rodam em paralelo.
+
+Falha: item cujo processador levanta exceção é repetido no próprio worker (até
+WEBHOOK_FILA_TENTATIVAS vezes, com espera crescente — o shard espera junto, para
+não passar mensagens do mesmo paciente na frente). Esgotadas as tentativas, o item
+vai para 'falhou' (lista à parte na memória / status no SQLite), aparece em
+status()["falhas"] e o chamador é avisado por ao_desistir(payload).
+
+Backends:
+  - FilaMemoria: queue.Queue por shard (padrão, ideal para testes locais)
+  - FilaSQLite:  arquivo SQLite local — sobrevive a restart do processo
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import sqlite3
+import threading
+import queue as _queue
+import traceback
+from collections import deque
+
+WEBHOOK_ASSINCRONO = os.environ.get("WEBHOOK_ASSINCRONO", "0") == "1"
+WEBHOOK_WORKERS = int(os.environ.get("WEBHOOK_WORKERS", "4"))
+WEBHOOK_FILA_BACKEND = os.environ.get("WEBHOOK_FILA_BACKEND", "memoria")  # memoria | sqlite
+WEBHOOK_FILA_SQLITE = os.environ.get("WEBHOOK_FILA_SQLITE", "/tmp/fila_webhook.db")
+WEBHOOK_FILA_MAX = int(os.environ.get("WEBHOOK_FILA_MAX", "500"))  # por shard — acima disso processa inline
+WEBHOOK_FILA_TENTATIVAS = int(os.environ.get("WEBHOOK_FILA_TENTATIVAS", "3"))
+WEBHOOK_FILA_ESPERA_S = float(os.environ.get("WEBHOOK_FILA_ESPERA_S", "2"))  # dobra a cada repetição
+
+_FALHAS_MEMORIA_MAX = 1000
+
+
+# ==========================================
+# BACKENDS DA FILA
+# ==========================================
+class FilaMemoria:
+    """Backend em memória: uma queue.Queue limitada por shard."""
+
+    def __init__(self, num_shards, max_por_shard=WEBHOOK_FILA_MAX):
+        self._filas = [_queue.Queue(maxsize=max_por_shard) for _ in range(num_shards)]
+        self._falhas = deque(maxlen=_FALHAS_MEMORIA_MAX)  # (item_id, chave, payload) desistidos
+        self._em_processo = {}  # item_id → (chave, payload), até confirmar/falhar
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def enfileirar(self, shard, chave, payload):
+        with self._lock:
+            self._seq += 1
+            item_id = self._seq
+        try:
+            self._filas[shard].put_nowait((item_id, chave, payload))
+            return item_id
+        except _queue.Full:
+            return None
+
+    def proximo(self, shard, timeout=1.0):
+        try:
+            item = self._filas[shard].get(timeout=timeout)
+        except _queue.Empty:
+            return None
+        self._em_processo[item[0]] = item[1:]
+        return item
+
+    def confirmar(self, shard, item_id):
+        self._em_processo.pop(item_id, None)
+        self._filas[shard].task_done()
+
+    def falhar(self, shard, item_id):
+        chave, payload = self._em_processo.pop(item_id, (None, None))
+        self._falhas.append((item_id, chave, payload))
+        self._filas[shard].task_done()
+
+    def pendentes(self):
+        return sum(f.qsize() for f in self._filas)
+
+    def falhas(self):
+        return len(self._falhas)
+
+
+class FilaSQLite:
+    """Backend SQLite: itens persistidos até serem confirmados.
+    Itens 'processando' de um processo anterior voltam para 'pendente' na abertura;
+    itens 'falhou' ficam na tabela para inspeção/reprocessamento manual."""
+
+    def __init__(self, num_shards, caminho=WEBHOOK_FILA_SQLITE, max_por_shard=WEBHOOK_FILA_MAX):
+        self._max = max_por_shard
+        self._lock = threading.Lock()
+        self._conds = [threading.Condition(self._lock) for _ in range(num_shards)]
+        self._conn = sqlite3.connect(caminho, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS fila_webhook ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, shard INTEGER, chave TEXT,"
+            " payload TEXT, status TEXT DEFAULT 'pendente', criado_em REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_fila_shard ON fila_webhook (shard, status, id)")
+        self._conn.execute("UPDATE fila_webhook SET status = 'pendente' WHERE status = 'processando'")
+
+    def enfileirar(self, shard, chave, payload):
+        with self._lock:
+            qtd = self._conn.execute(
+                "SELECT COUNT(*) FROM fila_webhook WHERE shard = ? AND status != 'falhou'", (shard,)
+            ).fetchone()[0]
+            if qtd >= self._max:
+                return None
+            cur = self._conn.execute(
+                "INSERT INTO fila_webhook (shard, chave, payload, criado_em) VALUES (?, ?, ?, ?)",
+                (shard, chave, json.dumps(payload), time.time())
+            )
+            self._conds[shard].notify()
+            return cur.lastrowid
+
+    def proximo(self, shard, timeout=1.0):
+        with self._lock:
+            row = self._buscar(shard)
+            if row is None:
+                self._conds[shard].wait(timeout)
+                row = self._buscar(shard)
+            if row is None:
+                return None
+            self._conn.execute("UPDATE fila_webhook SET status = 'processando' WHERE id = ?", (row[0],))
+            return row[0], row[1], json.loads(row[2])
+
+    def _buscar(self, shard):
+        return self._conn.execute(
+            "SELECT id, chave, payload FROM fila_webhook WHERE shard = ? AND status = 'pendente' ORDER BY id LIMIT 1",
+            (shard,)
+        ).fetchone()
+
+    def confirmar(self, shard, item_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM fila_webhook WHERE id = ?", (item_id,))
+
+    def falhar(self, shard, item_id):
+        with self._lock:
+            self._conn.execute("UPDATE fila_webhook SET status = 'falhou' WHERE id = ?", (item_id,))
+
+    def pendentes(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM fila_webhook WHERE status != 'falhou'").fetchone()[0]
+
+    def falhas(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM fila_webhook WHERE status = 'falhou'").fetchone()[0]
+
+
+# ==========================================
+# POOL DE WORKERS COM ORDENAÇÃO POR TELEFONE
+# ==========================================
+class PoolWebhook:
+    """Pool limitado de workers. `processador(payload)` é chamado no thread do worker;
+    `ao_desistir(payload)`, se dado, quando o item esgota as tentativas."""
+
+    def __init__(self, processador, num_workers=WEBHOOK_WORKERS, backend=None, ao_desistir=None,
+                 tentativas=WEBHOOK_FILA_TENTATIVAS, espera_s=WEBHOOK_FILA_ESPERA_S):
+        self.num_workers = max(1, num_workers)
+        self.processador = processador
+        self.ao_desistir = ao_desistir
+        self.tentativas = max(1, tentativas)
+        self.espera_s = espera_s
+        self.backend = backend or criar_backend(self.num_workers)
+        self.metricas = {"enfileirados": 0, "processados": 0, "erros": 0, "repeticoes": 0,
+                         "desistidos": 0, "rejeitados_fila_cheia": 0}
+        self._iniciado = False
+        self._lock = threading.Lock()
+
+    def _shard(self, chave):
+        return zlib.crc32(str(chave or "").encode("utf-8")) % self.num_workers
+
+    def iniciar(self):
+        # Threads sobem no primeiro uso (depois do fork do gunicorn), nunca no import
+        with self._lock:
+            if self._iniciado:
+                return
+            for shard in range(self.num_workers):
+                t = threading.Thread(target=self._loop, args=(shard,), daemon=True, name=f"fila-webhook-{shard}")
+                t.start()
+            self._iniciado = True
+            print(f"[FILA] {self.num_workers} workers iniciados (backend={type(self.backend).__name__})", file=sys.stderr)
+
+    def enfileirar(self, chave, payload):
+        """Retorna True se enfileirou; False se a fila do shard está cheia (chamador processa inline)."""
+        self.iniciar()
+        item_id = self.backend.enfileirar(self._shard(chave), chave, payload)
+        if item_id is None:
+            self.metricas["rejeitados_fila_cheia"] += 1
+            print(f"[FILA] Shard cheio para {chave} — processando inline", file=sys.stderr)
+            return False
+        self.metricas["enfileirados"] += 1
+        return True
+
+    def _loop(self, shard):
+        while True:
+            item = self.backend.proximo(shard, timeout=1.0)
+            if item is None:
+                continue
+            item_id, chave, payload = item
+            if self._processar(item_id, chave, payload):
+                self.backend.confirmar(shard, item_id)
+                continue
+            # Não confirma: o item não pode sumir da fila (a Meta já recebeu 200)
+            self.metricas["desistidos"] += 1
+            self.backend.falhar(shard, item_id)
+            print(f"[FILA] Item {item_id} ({chave}) desistido após {self.tentativas} tentativa(s)", file=sys.stderr)
+            if self.ao_desistir:
+                try:
+                    self.ao_desistir(payload)
+                except Exception:
+                    print(f"[FILA] Erro em ao_desistir do item {item_id}: {traceback.format_exc()}", file=sys.stderr)
+
+    def _processar(self, item_id, chave, payload):
+        """Roda o processador com as repetições. True = processado."""
+        for tentativa in range(1, self.tentativas + 1):
+            try:
+                self.processador(payload)
+                self.metricas["processados"] += 1
+                return True
+            except Exception:
+                self.metricas["erros"] += 1
+                print(f"[FILA] Erro processando item {item_id} ({chave}), tentativa {tentativa}/{self.tentativas}: "
+                      f"{traceback.format_exc()}", file=sys.stderr)
+            if tentativa < self.tentativas:
+                self.metricas["repeticoes"] += 1
+                time.sleep(self.espera_s * (2 ** (tentativa - 1)))
+        return False
+
+    def status(self):
+        return {**self.metricas, "pendentes": self.backend.pendentes(), "falhas": self.backend.falhas(),
+                "workers": self.num_workers, "backend": type(self.backend).__name__}
+
+
+def criar_backend(num_shards):
+    if WEBHOOK_FILA_BACKEND == "sqlite":
+        return FilaSQLite(num_shards)
+    return FilaMemoria(num_shards)
+
+
+def dividir_por_telefone(data):
+    """Quebra um payload da Meta (várias entries/changes/mensagens) em um payload por telefone.
+    Retorna [(telefone, payload)] — cada parte vai para o shard do seu telefone."""
+    partes = {}
+    for entry in data.get("entry", []) or []:
+        for change in entry.get("changes", []) or []:
+            val = change.get("value", {}) or {}
+            base = {k: v for k, v in val.items() if k not in ("messages", "statuses", "contacts")}
+            eventos = [("messages", m, m.get("from")) for m in val.get("messages", []) or []]
+            eventos += [("statuses", s, s.get("recipient_id")) for s in val.get("statuses", []) or []]
+            for campo, evento, phone in eventos:
+                phone = phone or ""
+                if phone not in partes:
+                    partes[phone] = {"object": data.get("object"), "entry": []}
+                entries = partes[phone]["entry"]
+                # Mesmo value de origem (mesmo número da clínica) → agrupa na mesma change
+                if not entries or entries[-1]["changes"][0]["value"].get("metadata") != base.get("metadata"):
+                    entries.append({"id": entry.get("id"), "changes": [{"field": change.get("field"), "value": dict(base)}]})
+                entries[-1]["changes"][0]["value"].setdefault(campo, []).append(evento)
+    return list(partes.items())
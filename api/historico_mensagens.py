@@ -0,0 +1,124 @@
+"""
+Histórico de conversa em subcoleção append-only: PatientsKanban/{phone}/mensagens.
+
+Antes cada mensagem entrava no array "historico" do próprio card (ArrayUnion),
+reescrevendo um documento cada vez maior (limite de 1 MB do Firestore) e
+fazendo toda leitura do Kanban baixar as conversas inteiras.
+
+Cada mensagem agora é um documento pequeno:
+    {de, tipo, conteudo, data (ISO), ts (epoch float — ordenação/cursor), media_id?}
+
+Leitura paginada por cursor (ts da mensagem mais antiga da página). Cards ainda
+não migrados continuam legíveis: o array legado é somado à primeira página.
+Migração: scripts/migrar_historico.py
+"""
+import sys
+import time
+from datetime import datetime, timezone
+from firebase_admin import firestore
+
+SUBCOLECAO = "mensagens"
+LIMITE_PADRAO = 200
+LIMITE_MAXIMO = 1000
+_LOTE_MIGRACAO = 400  # abaixo do limite de 500 operações por batch
+
+
+def _colecao(db, phone):
+    return db.collection("PatientsKanban").document(phone).collection(SUBCOLECAO)
+
+
+def nova_mensagem(remetente, tipo, conteudo, media_id=None):
+    """Monta o documento de uma mensagem (mesmo formato do antigo item do array + ts)."""
+    agora = time.time()
+    msg = {
+        "de": remetente,  # 'paciente', 'clinica' ou 'robo'
+        "tipo": tipo,
+        "conteudo": conteudo,
+        "data": datetime.fromtimestamp(agora, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S+00:00'),
+        "ts": agora
+    }
+    if media_id:
+        msg["media_id"] = media_id  # Salva para exibir miniatura no Dashboard
+    return msg
+
+
+def referencia_nova_mensagem(db, phone):
+    return _colecao(db, phone).document()
+
+
+def _ts_legado(msg, posicao):
+    """ts sintético para itens do array antigo: data ISO + posição (desempate estável)."""
+    try:
+        dt = datetime.fromisoformat(str(msg.get("data", "")).replace("Z", "+00:00"))
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return dt.timestamp() + posicao * 1e-6
+    except Exception:
+        return posicao * 1e-6
+
+
+def listar_mensagens(db, phone, limite=LIMITE_PADRAO, antes=None):
+    """Página de mensagens em ordem cronológica.
+    antes = cursor (ts) devolvido pela página anterior; None = mais recentes.
+    Retorna (mensagens, cursor_para_pagina_anterior_ou_None)."""
+    limite = max(1, min(int(limite or LIMITE_PADRAO), LIMITE_MAXIMO))
+    query = _colecao(db, phone).order_by("ts", direction=firestore.Query.DESCENDING)
+    if antes is not None:
+        query = query.start_after({"ts": float(antes)})
+    docs = list(query.limit(limite + 1).stream())
+    tem_mais = len(docs) > limite
+    mensagens = [d.to_dict() for d in docs[:limite]]
+    mensagens.reverse()
+    cursor = mensagens[0]["ts"] if tem_mais and mensagens else None
+
+    if not tem_mais:
+        # Chegou ao início da subcoleção: completa com o array legado (card não migrado)
+        legado = _historico_legado(db, phone)
+        if legado:
+            limite_ts = mensagens[0]["ts"] if mensagens else float("inf")
+            if antes is not None:
+                limite_ts = min(limite_ts, float(antes))
+            anteriores = [m for m in legado if m["ts"] < limite_ts]
+            vagas = limite - len(mensagens)
+            if len(anteriores) > vagas:
+                anteriores = anteriores[len(anteriores) - vagas:] if vagas > 0 else []
+                cursor = anteriores[0]["ts"] if anteriores else (mensagens[0]["ts"] if mensagens else None)
+            mensagens = anteriores + mensagens
+    return mensagens, cursor
+
+
+def _historico_legado(db, phone):
+    doc = db.collection("PatientsKanban").document(phone).get(field_paths=["historico"])
+    if not doc.exists:
+        return []
+    historico = (doc.to_dict() or {}).get("historico") or []
+    return [{**m, "ts": m.get("ts") or _ts_legado(m, i)} for i, m in enumerate(historico)]
+
+
+def mensagens_desde(db, phone, desde_iso):
+    """Mensagens da subcoleção com data >= desde_iso (exportação)."""
+    docs = _colecao(db, phone).where("data", ">=", desde_iso).stream()
+    mensagens = [d.to_dict() for d in docs]
+    mensagens.sort(key=lambda m: m.get("ts", 0))
+    return mensagens
+
+
+def migrar_documento(db, phone, dry_run=False):
+    """Copia o array "historico" do card para a subcoleção e remove o campo.
+    Idempotente: ids determinísticos (legado-000000...) — rodar de novo não duplica."""
+    doc_ref = db.collection("PatientsKanban").document(phone)
+    doc = doc_ref.get(field_paths=["historico"])
+    historico = (doc.to_dict() or {}).get("historico") if doc.exists else None
+    if not historico:
+        return 0
+    if dry_run:
+        return len(historico)
+    colecao = _colecao(db, phone)
+    for inicio in range(0, len(historico), _LOTE_MIGRACAO):
+        batch = db.batch()
+        for i, msg in enumerate(historico[inicio:inicio + _LOTE_MIGRACAO], start=inicio):
+            batch.set(colecao.document(f"legado-{i:06d}"), {**msg, "ts": msg.get("ts") or _ts_legado(msg, i)})
+        batch.commit()
+    doc_ref.update({"historico": firestore.DELETE_FIELD})
+    print(f"[MIGRACAO-HIST] {phone}: {len(historico)} mensagens movidas", file=sys.stderr)
+    return len(historico)
@@ -0,0 +1,141 @@
+"""
+Cliente HTTP compartilhado para todas as chamadas externas (Graph API, Feegow,
+OpenAI, Porto Seguro, Storage, TISS).
+
+Um requests.Session por host, com pool de conexões dimensionado para o upstream
+e keep-alive — DNS/TCP/TLS só na primeira chamada. Cada host tem timeout padrão
+e política de retry própria:
+  - falha de conexão (requisição não chegou ao servidor): sempre repete;
+  - status 429/5xx: repete só em métodos idempotentes, ou em hosts cujo POST é
+    seguro repetir (OpenAI). Envio de mensagem na Graph API NUNCA é repetido por
+    status — evita mensagem duplicada para o paciente.
+
+Latência: histograma por host (metricas_http) + observadores plugáveis
+(registrar_observador(fn(host, metodo, status, segundos))).
+"""
+import sys
+import time
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+_IDEMPOTENTES = frozenset(["GET", "HEAD", "OPTIONS", "PUT", "DELETE"])
+_STATUS_RETRY = (429, 500, 502, 503, 504)
+
+# pool = conexões mantidas abertas; timeout = (conexão, leitura)
+POLITICAS_HOST = {
+    "graph.facebook.com":              {"pool": 20, "timeout": (3.05, 15), "tentativas": 2, "post_seguro": False},
+    # Feegow: 429/5xx repetidos pelo feegow_cliente (backoff + cf-ray); aqui só falha de conexão
+    "api.feegow.com":                  {"pool": 10, "timeout": (3.05, 10), "tentativas": 3, "post_seguro": False,
+                                        "repetir_status": False},
+    "api.openai.com":                  {"pool": 10, "timeout": (3.05, 15), "tentativas": 2, "post_seguro": True},
+    "wwws.portoseguro.com.br":         {"pool": 4,  "timeout": (5, 15),    "tentativas": 2, "post_seguro": False},
+    "firebasestorage.googleapis.com":  {"pool": 10, "timeout": (3.05, 20), "tentativas": 2, "post_seguro": False},
+    "storage.googleapis.com":          {"pool": 10, "timeout": (3.05, 20), "tentativas": 2, "post_seguro": False},
+}
+POLITICA_PADRAO = {"pool": 10, "timeout": (3.05, 15), "tentativas": 2, "post_seguro": False}
+
+_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_sessoes = {}
+_lock = threading.Lock()
+_observadores = []
+_histogramas = {}
+
+
+def politica(host):
+    return POLITICAS_HOST.get(host, POLITICA_PADRAO)
+
+
+def _criar_sessao(host):
+    pol = politica(host)
+    metodos = _IDEMPOTENTES | ({"POST"} if pol["post_seguro"] else set())
+    retry = Retry(
+        total=pol["tentativas"],
+        connect=pol["tentativas"],
+        read=0,  # leitura interrompida = servidor pode ter processado; não repete
+        status=pol["tentativas"] if pol.get("repetir_status", True) else 0,
+        status_forcelist=_STATUS_RETRY,
+        allowed_methods=metodos,
+        backoff_factor=0.5,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pol["pool"], max_retries=retry)
+    sessao = requests.Session()
+    sessao.mount("https://", adapter)
+    sessao.mount("http://", adapter)
+    return sessao
+
+
+def obter_sessao(url_ou_host):
+    host = urlsplit(url_ou_host).hostname if "://" in url_ou_host else url_ou_host
+    with _lock:
+        sessao = _sessoes.get(host)
+        if sessao is None:
+            sessao = _sessoes[host] = _criar_sessao(host)
+        return sessao
+
+
+def registrar_observador(fn):
+    """fn(host, metodo, status_ou_None, segundos) — chamado após cada requisição."""
+    _observadores.append(fn)
+
+
+def _registrar_latencia(host, metodo, status, segundos):
+    with _lock:
+        h = _histogramas.setdefault(host, {"contagem": 0, "soma": 0.0, "erros": 0, "buckets": [0] * (len(_BUCKETS) + 1)})
+        h["contagem"] += 1
+        h["soma"] += segundos
+        if status is None or status >= 500:
+            h["erros"] += 1
+        for i, limite in enumerate(_BUCKETS):
+            if segundos <= limite:
+                h["buckets"][i] += 1
+                break
+        else:
+            h["buckets"][-1] += 1
+    for fn in list(_observadores):
+        try:
+            fn(host, metodo, status, segundos)
+        except Exception as e:
+            print(f"[HTTP] Observador falhou: {e}", file=sys.stderr)
+
+
+def requisicao(metodo, url, **kwargs):
+    """Como requests.request, mas pelo pool do host e com o timeout padrão dele."""
+    host = urlsplit(url).hostname or ""
+    kwargs.setdefault("timeout", politica(host)["timeout"])
+    inicio = time.perf_counter()
+    status = None
+    try:
+        resposta = obter_sessao(host).request(metodo, url, **kwargs)
+        status = resposta.status_code
+        return resposta
+    finally:
+        _registrar_latencia(host, metodo, status, time.perf_counter() - inicio)
+
+
+def http_get(url, **kwargs):
+    return requisicao("GET", url, **kwargs)
+
+
+def http_post(url, **kwargs):
+    return requisicao("POST", url, **kwargs)
+
+
+def metricas_http():
+    with _lock:
+        resultado = {}
+        for host, h in _histogramas.items():
+            rotulos = [f"<={b}s" for b in _BUCKETS] + [f">{_BUCKETS[-1]}s"]
+            resultado[host] = {
+                "contagem": h["contagem"],
+                "erros": h["erros"],
+                "media_ms": round(1000 * h["soma"] / h["contagem"], 1) if h["contagem"] else 0,
+                "histograma": dict(zip(rotulos, h["buckets"])),
+            }
+        return resultado
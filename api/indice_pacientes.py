@@ -0,0 +1,184 @@
+"""
+Índice local telefone/CPF → paciente do Feegow (paciente_id, nome, cpf).
+
+buscar_feegow_por_telefone, buscar_feegow_por_cpf, o prelúdio do integrar_feegow
+e o totem (feegow_api.buscar_agendamento_hoje_por_cpf) consultavam patient/list
+ou patient/search a cada chamada. Agora:
+
+  - cada busca bem-sucedida (e cada patient/create) grava a entrada no índice:
+    memória (cache_compartilhado.Cache) + coleção INDICE_PACIENTES_COLECAO do
+    Firestore, documento "tel:<celular>" ou "cpf:<cpf>";
+  - "não encontrado" também é guardado, com validade curta
+    (INDICE_PACIENTES_NEGATIVO_S) — número desconhecido não vai ao Feegow a cada
+    mensagem, e um cadastro novo no Feegow aparece em minutos;
+  - entradas positivas valem INDICE_PACIENTES_VALIDADE_DIAS no Firestore
+    (telefone pode mudar de dono) e INDICE_PACIENTES_TTL em memória;
+  - CPF entra na chave só com dígitos, venha formatado ou não;
+  - o totem ignora entradas negativas (negativo=False): quem ele manda à
+    recepção se cadastra e volta em seguida;
+  - erro do Feegow não vira entrada negativa: a exceção sobe para o chamador,
+    que mantém o tratamento de erro de antes.
+
+Sem Firestore (firebase_admin não inicializado), o índice fica só em memória.
+"""
+import os
+import re
+import sys
+import time
+import threading
+
+from cache_compartilhado import Cache
+
+INDICE_PACIENTES_COLECAO = os.environ.get("INDICE_PACIENTES_COLECAO", "IndicePacientesFeegow")
+INDICE_PACIENTES_TTL = int(os.environ.get("INDICE_PACIENTES_TTL", "3600"))  # segundos, em memória
+INDICE_PACIENTES_NEGATIVO_S = int(os.environ.get("INDICE_PACIENTES_NEGATIVO_S", "600"))
+INDICE_PACIENTES_VALIDADE_DIAS = int(os.environ.get("INDICE_PACIENTES_VALIDADE_DIAS", "30"))
+
+_NAO_ENCONTRADO = {"negativo": True}
+
+
+def _db_firebase():
+    """Cliente do Firestore do app padrão, se já inicializado (sem inicializar nada aqui)."""
+    try:
+        import firebase_admin
+        if not firebase_admin._apps:
+            return None
+        from firebase_admin import firestore
+        return firestore.client()
+    except Exception:
+        return None
+
+
+def _chave(tipo, valor):
+    """CPF só com dígitos — o Feegow devolve formatado, as buscas usam só dígitos."""
+    if tipo == "cpf":
+        valor = re.sub(r'\D', '', str(valor))
+    return f"{tipo}:{valor}" if valor else None
+
+
+class IndicePacientes:
+    def __init__(self, obter_db=None, colecao=INDICE_PACIENTES_COLECAO):
+        self._obter_db = obter_db or _db_firebase
+        self._colecao = colecao
+        self._cache = Cache("indice_pacientes", INDICE_PACIENTES_TTL)
+        self._lock = threading.Lock()
+        self.metricas = {"consultas": 0, "memoria": 0, "firestore": 0, "feegow": 0,
+                         "negativos_servidos": 0, "registros": 0, "erros_firestore": 0}
+
+    def definir_db(self, obter_db):
+        """obter_db: () → cliente Firestore (ou None). O whatsapp.py passa o seu `db`."""
+        self._obter_db = obter_db
+
+    def _contar(self, chave):
+        with self._lock:
+            self.metricas[chave] += 1
+
+    # ------------------------------------------
+    # Persistência
+    # ------------------------------------------
+    def _doc(self, chave):
+        db = self._obter_db()
+        return db.collection(self._colecao).document(chave) if db else None
+
+    def _ler_firestore(self, chave):
+        try:
+            doc_ref = self._doc(chave)
+            snap = doc_ref.get() if doc_ref else None
+        except Exception as e:
+            self._contar("erros_firestore")
+            print(f"[INDICE-PAC] Erro lendo {chave}: {e}", file=sys.stderr)
+            return None
+        if not snap or not snap.exists:
+            return None
+        dados = snap.to_dict() or {}
+        agora = time.time()
+        if dados.get("negativo"):
+            return _NAO_ENCONTRADO if dados.get("expira_em", 0) > agora else None
+        if dados.get("atualizado_em", 0) + INDICE_PACIENTES_VALIDADE_DIAS * 86400 < agora:
+            return None
+        return {"id": dados.get("paciente_id"), "nome": dados.get("nome") or "", "cpf": dados.get("cpf") or ""}
+
+    def _gravar(self, chave, entrada):
+        if entrada is _NAO_ENCONTRADO:
+            dados = {"negativo": True, "expira_em": time.time() + INDICE_PACIENTES_NEGATIVO_S}
+            self._cache.definir(chave, _NAO_ENCONTRADO, INDICE_PACIENTES_NEGATIVO_S)
+        else:
+            dados = {"paciente_id": entrada["id"], "nome": entrada.get("nome") or "",
+                     "cpf": entrada.get("cpf") or "", "atualizado_em": time.time()}
+            self._cache.definir(chave, dict(entrada))
+        try:
+            doc_ref = self._doc(chave)
+            if doc_ref:
+                doc_ref.set(dados)
+        except Exception as e:
+            self._contar("erros_firestore")
+            print(f"[INDICE-PAC] Erro gravando {chave}: {e}", file=sys.stderr)
+
+    # ------------------------------------------
+    # API
+    # ------------------------------------------
+    def buscar(self, tipo, valor, consultar, negativo=True):
+        """tipo: "tel" | "cpf". consultar() → {"id", "nome", "cpf"?} | None (não encontrado);
+        exceção = falha do Feegow (não é guardada). Retorna a entrada (cópia) ou None.
+        negativo=False: entrada "não encontrado" guardada não vale — consulta o Feegow de novo."""
+        chave = _chave(tipo, valor)
+        if not chave:
+            return None
+        self._contar("consultas")
+        entrada, origem = self._cache.obter_com_origem(chave)
+        if not negativo and entrada is not None and entrada.get("negativo"):
+            entrada, origem = None, None
+        if origem is not None:
+            self._contar("memoria")
+        else:
+            entrada = self._ler_firestore(chave)
+            if not negativo and entrada is _NAO_ENCONTRADO:
+                entrada = None
+            if entrada is not None:
+                self._contar("firestore")
+                ttl = INDICE_PACIENTES_NEGATIVO_S if entrada is _NAO_ENCONTRADO else None
+                self._cache.definir(chave, entrada, ttl)
+            else:
+                self._contar("feegow")
+                entrada = consultar() or _NAO_ENCONTRADO
+                if entrada is _NAO_ENCONTRADO or not entrada.get("id"):
+                    entrada = _NAO_ENCONTRADO
+                    self._gravar(chave, entrada)
+                else:
+                    self.registrar(tel=valor if tipo == "tel" else None,
+                                   cpf=entrada.get("cpf") or (valor if tipo == "cpf" else None),
+                                   paciente_id=entrada["id"], nome=entrada.get("nome"))
+        if entrada is None or entrada.get("negativo"):
+            if entrada is not None:
+                self._contar("negativos_servidos")
+            return None
+        return dict(entrada)
+
+    def registrar(self, paciente_id, nome="", tel=None, cpf=None):
+        """Grava (ou sobrescreve) as entradas do paciente — após busca ou patient/create."""
+        if not paciente_id:
+            return
+        entrada = {"id": paciente_id, "nome": nome or "", "cpf": cpf or ""}
+        for chave in filter(None, (_chave("tel", tel), _chave("cpf", cpf))):
+            self._gravar(chave, entrada)
+            self._contar("registros")
+
+    def esquecer(self, tel=None, cpf=None):
+        """Remove as entradas (ex.: paciente apagado/mesclado no Feegow)."""
+        for chave in filter(None, (_chave("tel", tel), _chave("cpf", cpf))):
+            self._cache.invalidar(chave)
+            try:
+                doc_ref = self._doc(chave)
+                if doc_ref:
+                    doc_ref.delete()
+            except Exception as e:
+                print(f"[INDICE-PAC] Erro removendo {chave}: {e}", file=sys.stderr)
+
+    def status(self):
+        with self._lock:
+            m = dict(self.metricas)
+        m["taxa_sem_feegow"] = round(1 - m["feegow"] / m["consultas"], 3) if m["consultas"] else 0.0
+        return m
+
+
+indice = IndicePacientes()
@@ -0,0 +1,138 @@
+"""
+Busca indexada de horários (slots do Feegow) para o reagendamento.
+
+encontrar_horarios_proximos ordenava todos os slots com strptime dentro da
+chave de ordenação, e o _tem_conflito do reagendando_preferencia comparava cada
+slot com cada agendamento (strptime por par). Agora:
+
+  - IndiceSlots guarda, por dia, os minutos do dia (int) ordenados e, para cada
+    minuto, os slots na ordem de entrada; a hora é convertida uma vez só;
+  - proximos() percorre os dias em ordem e, dentro do dia, caminha para os dois
+    lados a partir do bisect do horário preferido — para assim que junta qtd;
+  - periodo ("manha"/"tarde"/"noite") põe na frente, dentro do mesmo dia, os
+    slots do período (faixa achada por bisect) e depois os demais;
+  - filtrar_conflitos() monta os minutos agendados por dia uma vez e testa cada
+    slot com dois bisects (conflito = diferença < 30 min no mesmo dia).
+
+Ordem idêntica à anterior: (data, distância ao horário preferido), empate na
+ordem de entrada; hora inválida vai para o fim do dia; horário preferido
+inválido → ordem de (data, hora). Um slot com hora inválida nunca conflita.
+"""
+import re
+from bisect import bisect_left, bisect_right
+
+_RE_HORA = re.compile(r"^(\d{1,2}):(\d{1,2})$")
+
+# Faixas [início, fim) em minutos do dia — mesmas palavras de preferencia_data
+PERIODOS = {"manha": (0, 12 * 60), "tarde": (12 * 60, 18 * 60), "noite": (18 * 60, 24 * 60)}
+
+JANELA_CONFLITO_MIN = 30
+
+
+def minutos(hora):
+    """Hora "HH:MM" → minutos do dia (int); None se inválida (mesmas regras do strptime "%H:%M")."""
+    m = _RE_HORA.match(hora or "") if isinstance(hora, str) else None
+    if not m:
+        return None
+    h, mi = int(m.group(1)), int(m.group(2))
+    if h > 23 or mi > 59:
+        return None
+    return h * 60 + mi
+
+
+class IndiceSlots:
+    def __init__(self, slots):
+        self._slots = list(slots or [])
+        grupos = {}  # data → {minuto: [posição]}
+        invalidos = {}  # data → [posição] (hora inválida: fim do dia)
+        for pos, s in enumerate(self._slots):
+            data = s.get("data", "")
+            m = minutos(s.get("hora", ""))
+            if m is None:
+                invalidos.setdefault(data, []).append(pos)
+            else:
+                grupos.setdefault(data, {}).setdefault(m, []).append(pos)
+        self._dias = {}  # data → ([minutos únicos ordenados], [[posições] por minuto], [posições inválidas])
+        for data in set(grupos) | set(invalidos):
+            por_minuto = grupos.get(data, {})
+            chaves = sorted(por_minuto)
+            self._dias[data] = (chaves, [por_minuto[k] for k in chaves], invalidos.get(data, []))
+        self._datas = sorted(self._dias)
+
+    def __len__(self):
+        return len(self._slots)
+
+    @staticmethod
+    def _caminhar(chaves, posicoes, alvo, ini, fim, pular=(0, 0)):
+        """Posições do dia em ordem de |minuto - alvo| (empate: ordem de entrada), só em
+        chaves[ini:fim] e fora de chaves[pular[0]:pular[1]]."""
+        p = min(max(bisect_left(chaves, alvo), ini), fim)
+        esq, dir_ = p - 1, p
+        while esq >= ini or dir_ < fim:
+            d_esq = alvo - chaves[esq] if esq >= ini else None
+            d_dir = chaves[dir_] - alvo if dir_ < fim else None
+            if d_dir is None or (d_esq is not None and d_esq < d_dir):
+                indices = [esq]
+                esq -= 1
+            elif d_esq is None or d_dir < d_esq:
+                indices = [dir_]
+                dir_ += 1
+            else:
+                indices = [esq, dir_]
+                esq -= 1
+                dir_ += 1
+            grupo = [pos for i in indices if not pular[0] <= i < pular[1] for pos in posicoes[i]]
+            yield from (sorted(grupo) if len(indices) > 1 else grupo)
+
+    def _ordem_dia(self, data, alvo, periodo):
+        chaves, posicoes, invalidos = self._dias[data]
+        faixa = PERIODOS.get(periodo)
+        if faixa is None:
+            yield from self._caminhar(chaves, posicoes, alvo, 0, len(chaves))
+        else:
+            ini, fim = bisect_left(chaves, faixa[0]), bisect_left(chaves, faixa[1])
+            yield from self._caminhar(chaves, posicoes, alvo, ini, fim)
+            yield from self._caminhar(chaves, posicoes, alvo, 0, len(chaves), pular=(ini, fim))
+        yield from invalidos
+
+    def proximos(self, hora_preferida, qtd=2, periodo=None):
+        """Os qtd slots mais próximos: data mais próxima, depois (período e) distância ao horário preferido."""
+        if not self._slots or qtd <= 0:
+            return []
+        alvo = minutos(hora_preferida)
+        if alvo is None:
+            return sorted(self._slots, key=lambda x: (x["data"], x["hora"]))[:qtd]
+        resultado = []
+        for data in self._datas:
+            for pos in self._ordem_dia(data, alvo, periodo):
+                resultado.append(self._slots[pos])
+                if len(resultado) >= qtd:
+                    return resultado
+        return resultado
+
+
+def encontrar_horarios_proximos(slots, hora_preferida, qtd=2, periodo=None):
+    """Retorna os qtd slots mais próximos — prioriza data mais próxima,
+    desempata por proximidade de horário preferido."""
+    return IndiceSlots(slots).proximos(hora_preferida, qtd, periodo)
+
+
+def filtrar_conflitos(slots, agendamentos, janela_min=JANELA_CONFLITO_MIN):
+    """Slots sem agendamento a menos de janela_min minutos no mesmo dia (ordem mantida)."""
+    agenda = {}  # data → [minutos agendados ordenados]
+    for ag in agendamentos or []:
+        m = minutos(ag.get("hora", ""))
+        if m is not None:
+            agenda.setdefault(ag.get("data"), []).append(m)
+    if not agenda:
+        return list(slots or [])
+    for lista in agenda.values():
+        lista.sort()
+    livres = []
+    for s in slots or []:
+        ocupados = agenda.get(s.get("data", ""))
+        m = minutos(s.get("hora", "")) if ocupados else None
+        if m is not None and bisect_left(ocupados, m - janela_min + 1) < bisect_right(ocupados, m + janela_min - 1):
+            continue
+        livres.append(s)
+    return livres
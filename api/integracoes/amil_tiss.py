@@ -1,6 +1,6 @@
 import os
 import hashlib
-import requests
+from http_cliente import http_post
 import xml.etree.ElementTree as ET
 from datetime import datetime
 import uuid
@@ -119,7 +119,7 @@ class AmilTISSIntegration:
 
         try:
             print(f"Enviando requisição para: {url}")
-            response = requests.post(url, data=soap_request.encode('utf-8'), headers=headers, timeout=15)
+            response = http_post(url, data=soap_request.encode('utf-8'), headers=headers, timeout=15)
             print(f"Status Code: {response.status_code}")
             return self._parse_resposta_elegibilidade(response.text)
         except Exception as e:
@@ -11,7 +11,7 @@ Operadoras suportadas via Orizon:
 
 import os
 import hashlib
-import requests
+from http_cliente import http_post
 import xml.etree.ElementTree as ET
 from datetime import datetime
 import uuid
@@ -218,7 +218,7 @@ class OrizonTISSIntegration:
 
         try:
             print(f"[Orizon] Enviando para {op['nome']} ({registro_ans}) → {url}")
-            response = requests.post(
+            response = http_post(
                 url,
                 data=soap_request.encode("utf-8"),
                 headers=headers,
@@ -0,0 +1,111 @@
+"""
+Interruptor global do robô (Config/global.robo_ligado) em memória.
+
+O webhook consultava o Firestore a cada POST para um flag que muda poucas vezes
+por mês. Agora:
+
+  - um listener on_snapshot no documento Config/global mantém o valor atualizado
+    em todas as instâncias — o desligamento de emergência chega em segundos;
+  - o POST de /api/robo/status atualiza o valor local na hora (definir) e o
+    grava no cache compartilhado;
+  - se o listener não subir ou cair, o valor vem do cache com TTL curto
+    (ROBO_FLAG_TTL) e, vencido, de uma leitura do documento.
+
+Sem o campo, ou com erro de leitura sem valor anterior, o robô é considerado
+ligado (mesmo comportamento de antes).
+"""
+import os
+import sys
+import time
+import threading
+
+ROBO_FLAG_TTL = int(os.environ.get("ROBO_FLAG_TTL", "10"))  # segundos, só sem listener
+ROBO_LISTENER_RETRY = 60  # segundos entre tentativas de subir o listener
+
+
+class InterruptorRobo:
+    def __init__(self, cache, colecao="Config", documento="global"):
+        self._cache = cache  # cache_compartilhado.Cache
+        self._colecao = colecao
+        self._documento = documento
+        self._lock = threading.Lock()
+        self._watch = None
+        self._valor_listener = None  # None = listener ainda sem snapshot
+        self._proxima_tentativa = 0.0
+        self.metricas = {"consultas": 0, "via_listener": 0, "leituras_firestore": 0, "reinicios_listener": 0}
+
+    # ------------------------------------------
+    # Listener
+    # ------------------------------------------
+    def iniciar(self, db):
+        """Sobe (ou reinicia) o listener. Idempotente — chamado a cada consulta."""
+        if not db:
+            return False
+        with self._lock:
+            if self._watch is not None and getattr(self._watch, "is_active", True):
+                return True
+            if time.monotonic() < self._proxima_tentativa:
+                return False
+            if self._watch is not None:
+                self.metricas["reinicios_listener"] += 1
+                print("[ROBO-FLAG] Listener caiu — reiniciando", file=sys.stderr)
+                try: self._watch.unsubscribe()
+                except Exception: pass
+            self._valor_listener = None
+            try:
+                ref = db.collection(self._colecao).document(self._documento)
+                self._watch = ref.on_snapshot(self._on_snapshot)
+            except Exception as e:
+                self._watch = None
+                self._proxima_tentativa = time.monotonic() + ROBO_LISTENER_RETRY
+                print(f"[ROBO-FLAG] Listener indisponível ({e}) — usando TTL de {ROBO_FLAG_TTL}s", file=sys.stderr)
+                return False
+        return True
+
+    def _on_snapshot(self, docs, changes, read_time):
+        doc = docs[0] if docs else None
+        valor = self._extrair(doc)
+        if valor != self._valor_listener:
+            print(f"[ROBO-FLAG] robo_ligado={valor} (listener)", file=sys.stderr)
+        self._valor_listener = valor
+        self._cache.definir("robo_ligado", valor)
+
+    @staticmethod
+    def _extrair(doc):
+        if doc is None or not doc.exists:
+            return True
+        return (doc.to_dict() or {}).get("robo_ligado") != False  # noqa: E712 — 0/False desligam, como antes
+
+    # ------------------------------------------
+    # Consulta / atualização
+    # ------------------------------------------
+    def ligado(self, db):
+        self.metricas["consultas"] += 1
+        if not db:
+            return True
+        self.iniciar(db)
+        valor = self._valor_listener
+        if valor is not None and self._watch is not None and getattr(self._watch, "is_active", True):
+            self.metricas["via_listener"] += 1
+            return valor
+
+        def ler():
+            self.metricas["leituras_firestore"] += 1
+            return self._extrair(db.collection(self._colecao).document(self._documento).get())
+        try:
+            # Em erro de leitura o Cache devolve o último valor conhecido, se houver
+            return self._cache.obter("robo_ligado", ler, ROBO_FLAG_TTL)
+        except Exception as e:
+            print(f"[ROBO-FLAG] Erro lendo Config/global: {e}", file=sys.stderr)
+            return True
+
+    def definir(self, valor):
+        """Chamado depois de gravar Config/global (POST /api/robo/status)."""
+        valor = valor != False  # noqa: E712
+        if self._watch is not None:
+            self._valor_listener = valor
+        self._cache.definir("robo_ligado", valor, ROBO_FLAG_TTL)
+
+    def status(self):
+        return {**self.metricas, "listener_ativo": self._watch is not None and getattr(self._watch, "is_active", True),
+                "valor_listener": self._valor_listener}
@@ -0,0 +1,148 @@
+"""
+Sincronização incremental do Kanban (get_patients&since=<cursor>).
+
+Um listener on_snapshot na coleção PatientsKanban mantém em memória a projeção
+de todos os cards; cada alteração recebe um número de sequência. O dashboard
+guarda o cursor devolvido e, no próximo poll, recebe só o que mudou depois dele
+— polling em regime estável custa zero leituras no Firestore (o listener só é
+cobrado pelos documentos que de fato mudam).
+
+Cursor = "<epoca>:<seq>". A época muda a cada (re)início do listener; cursor de
+outra época/instância → resposta completa (delta=False) e o dashboard recomeça.
+
+Cards arquivados viram tombstone (saem do board); a projeção segue junto para
+a aba de histórico. Documentos apagados viram tombstone sem card.
+
+Com filtro de status (?status=...), um card alterado que saiu dos status pedidos
+vira tombstone "fora_do_filtro" — senão o cliente o manteria para sempre.
+"""
+import sys
+import uuid
+import threading
+
+MAX_TOMBSTONES = 5000
+
+
+class EstadoKanban:
+    def __init__(self, projetar):
+        self._projetar = projetar  # (doc_id, dict) → card serializável
+        self._lock = threading.RLock()
+        self._watch = None
+        self._reset()
+
+    def _reset(self):
+        self.epoca = uuid.uuid4().hex[:8]
+        self._seq = 0
+        self._seq_minimo = 0  # cursores abaixo disso perderam tombstones podados
+        self._cards = {}        # id → card ativo
+        self._arquivados = {}   # id → card arquivado (tombstone com projeção)
+        self._versao = {}       # id → seq da última alteração
+        self._removidos = {}    # id → seq (documento apagado)
+        self._pronto = threading.Event()
+
+    # ------------------------------------------
+    # Listener
+    # ------------------------------------------
+    def iniciar(self, db):
+        """Sobe (ou reinicia) o listener. Idempotente — chamado a cada get_patients."""
+        if not db:
+            return False
+        with self._lock:
+            ativo = self._watch is not None and getattr(self._watch, "is_active", True)
+            if ativo:
+                return self._pronto.is_set()
+            if self._watch is not None:
+                print("[KANBAN-SYNC] Listener caiu — reiniciando com nova época", file=sys.stderr)
+                try: self._watch.unsubscribe()
+                except Exception: pass
+            self._reset()
+            try:
+                self._watch = db.collection("PatientsKanban").on_snapshot(self._on_snapshot)
+                print(f"[KANBAN-SYNC] Listener iniciado (época {self.epoca})", file=sys.stderr)
+            except Exception as e:
+                self._watch = None
+                print(f"[KANBAN-SYNC] Falha ao iniciar listener: {e}", file=sys.stderr)
+        return False
+
+    def _on_snapshot(self, docs, changes, read_time):
+        with self._lock:
+            for change in changes:
+                doc = change.document
+                self._seq += 1
+                tipo = getattr(change.type, "name", str(change.type))
+                if tipo == "REMOVED":
+                    self._cards.pop(doc.id, None)
+                    self._arquivados.pop(doc.id, None)
+                    self._versao.pop(doc.id, None)
+                    self._removidos[doc.id] = self._seq
+                    continue
+                card = self._projetar(doc.id, doc.to_dict() or {})
+                self._removidos.pop(doc.id, None)
+                if card.get("status") == "arquivado":
+                    self._cards.pop(doc.id, None)
+                    self._arquivados[doc.id] = card
+                else:
+                    self._arquivados.pop(doc.id, None)
+                    self._cards[doc.id] = card
+                self._versao[doc.id] = self._seq
+            self._podar_tombstones()
+        self._pronto.set()
+
+    def _podar_tombstones(self):
+        if len(self._removidos) <= MAX_TOMBSTONES:
+            return
+        antigos = sorted(self._removidos.items(), key=lambda kv: kv[1])[:len(self._removidos) - MAX_TOMBSTONES]
+        for doc_id, seq in antigos:
+            del self._removidos[doc_id]
+            self._seq_minimo = max(self._seq_minimo, seq)
+
+    # ------------------------------------------
+    # Consultas
+    # ------------------------------------------
+    def pronto(self):
+        return self._pronto.is_set()
+
+    def _cursor(self):
+        return f"{self.epoca}:{self._seq}"
+
+    def completo(self, status_filtro=()):
+        """Todos os cards (ativos + arquivados — a aba de histórico usa os arquivados)."""
+        with self._lock:
+            items = list(self._cards.values()) + list(self._arquivados.values())
+            if status_filtro:
+                items = [c for c in items if c.get("status") in status_filtro]
+            return {"items": items, "cursor": self._cursor(), "delta": False}
+
+    def delta(self, cursor, status_filtro=()):
+        """Alterações depois do cursor, ou None se o cursor não serve (→ resposta completa)."""
+        try:
+            epoca, seq = cursor.split(":")
+            seq = int(seq)
+        except (ValueError, AttributeError):
+            return None
+        with self._lock:
+            if epoca != self.epoca or seq < self._seq_minimo or seq > self._seq:
+                return None
+            items, removidos = [], []
+            for doc_id, versao in self._versao.items():
+                if versao <= seq:
+                    continue
+                if doc_id in self._arquivados:
+                    tombstone = {"id": doc_id, "motivo": "arquivado"}
+                    if not status_filtro or "arquivado" in status_filtro:
+                        tombstone["card"] = self._arquivados[doc_id]  # projeção segue para o histórico
+                    removidos.append(tombstone)
+                elif status_filtro and self._cards[doc_id].get("status") not in status_filtro:
+                    removidos.append({"id": doc_id, "motivo": "fora_do_filtro"})
+                else:
+                    items.append(self._cards[doc_id])
+            removidos += [{"id": doc_id, "motivo": "removido"}
+                          for doc_id, versao in self._removidos.items() if versao > seq]
+            return {"items": items, "removidos": removidos, "cursor": self._cursor(), "delta": True}
+
+    def status(self):
+        with self._lock:
+            return {"epoca": self.epoca, "seq": self._seq, "pronto": self._pronto.is_set(),
+                    "cards_ativos": len(self._cards), "arquivados": len(self._arquivados),
+                    "tombstones": len(self._removidos),
+                    "listener_ativo": self._watch is not None and getattr(self._watch, "is_active", True)}
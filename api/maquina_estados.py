@@ -0,0 +1,186 @@
+"""
+Máquina de estados da conversa do robô.
+
+Cada status do card (PatientsKanban.status) tem um handler registrado com
+@registro.estado(...) nos módulos de api/estados/. O webhook monta um Contexto
+com a mensagem já normalizada e chama registro.despachar(ctx): a escolha do
+handler é um lookup no dict, em vez de percorrer a cadeia de elif.
+
+Cada handler declara:
+  - transicoes:   status para os quais ele pode mover o card
+  - botoes:       ids/títulos de botão e lista que ele reconhece em msg_recebida
+  - aceita_anexo: se o estado recebe foto/documento (os demais recusam anexo)
+  - acolhimento:  se o handler abre a resposta com uma frase de acolhimento do LLM
+                  (chamar_ia_custom) — o webhook dispara essa chamada antes do despacho
+
+Os módulos de estados importam helpers do whatsapp.py, por isso são carregados
+sob demanda no primeiro despacho (depois que o whatsapp.py terminou de carregar).
+
+Métricas por estado: chamadas, erros e latência (média, p50, p95, máx) das
+últimas AMOSTRAS_LATENCIA execuções.
+"""
+import sys
+import time
+import threading
+import importlib
+from collections import deque
+
+MODULOS_ESTADOS = ["estados.cadastro", "estados.veterano", "estados.pilates"]
+
+# Status sem handler: o robô não conduz a conversa (equipe humana, fim de fluxo)
+# — tratados pelas verificações globais do webhook ou silenciosos.
+ESTADOS_TERMINAIS = {"pausado", "arquivado", "finalizado", "atendimento_humano", "pendente_feegow",
+                     "pilates_lead_morno", "pilates_pendente_recepcao"}
+
+AMOSTRAS_LATENCIA = 500
+
+
+class Contexto:
+    """Mensagem recebida + card do paciente, como os handlers de estado enxergam."""
+
+    __slots__ = ("phone", "info", "status", "msg_recebida", "msg_limpa", "msg_type", "tem_anexo",
+                 "media_id", "servico", "modalidade", "convenio", "is_veteran", "is_cortesia",
+                 "numero_id", "agora_iso")
+
+    def __init__(self, **campos):
+        for nome in self.__slots__:
+            setattr(self, nome, campos.pop(nome, None))
+        if campos:
+            raise TypeError(f"Campos desconhecidos no Contexto: {sorted(campos)}")
+
+    def agenda_feegow(self, historico=False):
+        """Agenda do paciente no Feegow ({"sessoes", "agendamentos"}) ou None — servida pelo
+        cache de agenda do whatsapp.py: a sessão do veterano faz uma busca só."""
+        feegow_id = (self.info or {}).get("feegow_id")
+        if not feegow_id:
+            return None
+        from whatsapp import consultar_agenda_feegow  # sob demanda, como os módulos de estados
+        return consultar_agenda_feegow(feegow_id, retornar_raw=True, historico=historico)
+
+
+class Estado:
+    __slots__ = ("nome", "handler", "transicoes", "botoes", "aceita_anexo", "acolhimento")
+
+    def __init__(self, nome, handler, transicoes=(), botoes=(), aceita_anexo=False, acolhimento=False):
+        self.nome = nome
+        self.handler = handler
+        self.transicoes = frozenset(transicoes)
+        self.botoes = frozenset(botoes)
+        self.aceita_anexo = aceita_anexo
+        self.acolhimento = acolhimento
+
+
+class RegistroEstados:
+    def __init__(self, modulos=MODULOS_ESTADOS):
+        self._modulos = modulos
+        self._estados = {}
+        self._carregado = False
+        self._lock_carga = threading.Lock()
+        self._lock = threading.Lock()
+        self._metricas = {}
+
+    def estado(self, nome, transicoes=(), botoes=(), aceita_anexo=False, acolhimento=False):
+        """Decorator: registra o handler do status `nome`."""
+        def registrar(handler):
+            if nome in self._estados:
+                raise ValueError(f"Estado '{nome}' registrado duas vezes")
+            self._estados[nome] = Estado(nome, handler, transicoes, botoes, aceita_anexo, acolhimento)
+            return handler
+        return registrar
+
+    # ------------------------------------------
+    # Carga (sob demanda)
+    # ------------------------------------------
+    def carregar(self):
+        if self._carregado:
+            return
+        with self._lock_carga:
+            if self._carregado:
+                return
+            inicio = time.perf_counter()
+            for modulo in self._modulos:
+                importlib.import_module(modulo)
+            self._carregado = True
+            print(f"[ESTADOS] {len(self._estados)} estados carregados em "
+                  f"{(time.perf_counter() - inicio) * 1000:.0f}ms", file=sys.stderr)
+            self.validar()
+
+    def validar(self):
+        """Avisa sobre transições para status que ninguém trata."""
+        conhecidos = set(self._estados) | ESTADOS_TERMINAIS
+        for est in self._estados.values():
+            for destino in sorted(est.transicoes - conhecidos):
+                print(f"[ESTADOS] '{est.nome}' transiciona para '{destino}', que não tem handler", file=sys.stderr)
+
+    # ------------------------------------------
+    # Consulta / despacho
+    # ------------------------------------------
+    def obter(self, nome):
+        self.carregar()
+        return self._estados.get(nome)
+
+    def aceita_anexo(self, nome):
+        est = self.obter(nome)
+        return bool(est and est.aceita_anexo)
+
+    def pede_acolhimento(self, nome):
+        est = self.obter(nome)
+        return bool(est and est.acolhimento)
+
+    def despachar(self, ctx):
+        """Executa o handler do ctx.status. Retorna a resposta do handler, ou None
+        se o status não tem handler / o handler não devolveu resposta."""
+        est = self.obter(ctx.status)
+        if est is None:
+            self._registrar(ctx.status or "", 0.0, erro=False, sem_handler=True)
+            return None
+        inicio = time.perf_counter()
+        erro = True
+        try:
+            resposta = est.handler(ctx)
+            erro = False
+            return resposta
+        finally:
+            self._registrar(est.nome, time.perf_counter() - inicio, erro=erro)
+
+    def _registrar(self, nome, segundos, erro, sem_handler=False):
+        with self._lock:
+            m = self._metricas.get(nome)
+            if m is None:
+                m = self._metricas[nome] = {"chamadas": 0, "erros": 0, "sem_handler": 0,
+                                            "amostras": deque(maxlen=AMOSTRAS_LATENCIA)}
+            m["chamadas"] += 1
+            if erro:
+                m["erros"] += 1
+            if sem_handler:
+                m["sem_handler"] += 1
+            else:
+                m["amostras"].append(segundos)
+
+    def metricas(self):
+        with self._lock:
+            resultado = {}
+            for nome, m in self._metricas.items():
+                amostras = sorted(m["amostras"])
+                item = {"chamadas": m["chamadas"], "erros": m["erros"]}
+                if m["sem_handler"]:
+                    item["sem_handler"] = m["sem_handler"]
+                if amostras:
+                    item.update({
+                        "media_ms": round(1000 * sum(amostras) / len(amostras), 1),
+                        "p50_ms": round(1000 * amostras[len(amostras) // 2], 1),
+                        "p95_ms": round(1000 * amostras[min(len(amostras) - 1, int(len(amostras) * 0.95))], 1),
+                        "max_ms": round(1000 * amostras[-1], 1),
+                    })
+                resultado[nome] = item
+            return resultado
+
+    def grafo(self):
+        """{status: {"transicoes": [...], "botoes": [...], "aceita_anexo": bool, "acolhimento": bool}}"""
+        self.carregar()
+        return {nome: {"transicoes": sorted(e.transicoes), "botoes": sorted(e.botoes),
+                       "aceita_anexo": e.aceita_anexo, "acolhimento": e.acolhimento}
+                for nome, e in sorted(self._estados.items())}
+
+
+registro = RegistroEstados()
@@ -0,0 +1,164 @@
+"""
+Interpretação local da preferência de data/horário do paciente ("amanhã de manhã",
+"dia 20", "sexta da semana que vem às 14h").
+
+extrair_preferencia_data só resolvia dias da semana sem IA; o resto ia para o
+gpt-4o-mini, mesmo sendo as mesmas frases o dia todo. interpretar_preferencia
+cobre:
+
+  - hoje / amanhã / depois de amanhã / daqui a N dias
+  - dias da semana, inclusive "da semana que vem" / "da próxima semana"
+  - "próxima semana" / "semana que vem" sozinhos → segunda-feira seguinte
+  - dia do mês: "dia 20", "dia 20/05", "20/05/2026", "dia 20 de maio"
+  - horário: "14h", "14:30", "às 9", "meio-dia"
+  - período: manhã/cedo, tarde, noite
+
+e diz se entendeu o texto inteiro (completo=False quando sobra algo com cara de
+data — número, mês, um segundo dia da semana, "feriado"... — ou uma negação como
+"não posso segunda, só terça"), caso em que o chamador ainda consulta o LLM.
+"""
+import re
+import threading
+from datetime import timedelta
+
+from casamento_padroes import normalizar_texto
+
+DIAS_SEMANA = {"segunda": 0, "terca": 1, "quarta": 2, "quinta": 3, "sexta": 4, "sabado": 5, "domingo": 6}
+MESES = {"janeiro": 1, "fevereiro": 2, "marco": 3, "abril": 4, "maio": 5, "junho": 6, "julho": 7,
+         "agosto": 8, "setembro": 9, "outubro": 10, "novembro": 11, "dezembro": 12}
+
+_RE_DEPOIS_AMANHA = re.compile(r"\bdepois de amanha\b")
+_RE_AMANHA = re.compile(r"\bamanha\b")
+_RE_HOJE = re.compile(r"\bhoje\b")
+_RE_DAQUI = re.compile(r"\b(?:daqui a|em)\s+(\d{1,2})\s+dias?\b")
+_RE_PROXIMA_SEMANA = re.compile(r"\b(?:(?:da|na)\s+)?(?:proxima semana|semana que vem|semana seguinte)\b")
+_RE_DIA_SEMANA = re.compile(r"\b(segunda|terca|quarta|quinta|sexta|sabado|domingo)(?:[- ]feira)?\b")
+_RE_DATA_BARRA = re.compile(r"\b(?:dia\s+)?(\d{1,2})/(\d{1,2})(?:/(\d{2,4}))?\b")
+_RE_DIA_MES = re.compile(r"\bdia\s+(\d{1,2})(?:\s+de\s+(" + "|".join(MESES) + r"))?\b")
+_RE_HORA = re.compile(r"(\d{1,2})[h:](\d{2})?")
+_RE_HORA_AS = re.compile(r"\b(?:as|a partir das|depois das|apos as)\s+(\d{1,2})\b(?![/\d])")
+_RE_MEIO_DIA = re.compile(r"\bmeio[- ]dia\b")
+_RE_MANHA = re.compile(r"\b(?:manha|cedo|cedinho)\b")
+_RE_TARDE = re.compile(r"\btarde\b")
+_RE_NOITE = re.compile(r"\bnoite\b")
+# Sobrou algo disso depois de tirar o que foi entendido → o LLM decide
+_RE_PISTA_DATA = re.compile(r"\d|\b(?:" + "|".join(MESES) + "|" + "|".join(DIAS_SEMANA) + r"|mes|meses|semanas?|feriados?|daqui|proxim\w*|anos?|quinzena"
+                            r"|(?:fim|final) de semana)\b")
+# Negação muda qual data vale ("não posso segunda, só terça") — o LLM decide
+_RE_NEGACAO = re.compile(r"\b(?:nao|exceto|menos|tirando|sem ser)\b")
+
+_lock_metricas = threading.Lock()
+METRICAS = {"python": 0, "llm": 0, "llm_falhas": 0}
+
+
+def contar(chave):
+    with _lock_metricas:
+        METRICAS[chave] += 1
+
+
+def chave_texto(texto):
+    """Forma normalizada usada como chave de cache (sem acento, caixa, espaços extras e pontuação nas pontas)."""
+    return " ".join(normalizar_texto(texto).split()).strip(" .,!?;")
+
+
+def _data_valida(hoje, ano, mes, dia):
+    try:
+        return hoje.replace(year=ano, month=mes, day=dia, hour=0, minute=0, second=0, microsecond=0)
+    except ValueError:
+        return None
+
+
+def _consumir(regex, txt):
+    """(match, texto sem o trecho casado) — o trecho vira espaço para não casar de novo."""
+    m = regex.search(txt)
+    if not m:
+        return None, txt
+    return m, txt[:m.start()] + " " + txt[m.end():]
+
+
+def _consumir_ultimo(regex, txt):
+    """Como _consumir, mas com a última ocorrência — as anteriores ficam no texto."""
+    m = None
+    for m in regex.finditer(txt):
+        pass
+    if not m:
+        return None, txt
+    return m, txt[:m.start()] + " " + txt[m.end():]
+
+
+def interpretar_preferencia(texto, hoje):
+    """→ ({"data": "YYYY-MM-DD"|None, "hora": "HH:MM"|None, "periodo": "manha"|"tarde"|"noite"|None}, completo)"""
+    txt = chave_texto(texto)
+    data = None
+
+    m, txt = _consumir(_RE_DEPOIS_AMANHA, txt)
+    if m:
+        data = hoje + timedelta(days=2)
+    m, txt = _consumir(_RE_AMANHA, txt)
+    if m and data is None:
+        data = hoje + timedelta(days=1)
+    m, txt = _consumir(_RE_HOJE, txt)
+    if m and data is None:
+        data = hoje
+    m, txt = _consumir(_RE_DAQUI, txt)
+    if m and data is None:
+        data = hoje + timedelta(days=int(m.group(1)))
+
+    prox_semana, txt = _consumir(_RE_PROXIMA_SEMANA, txt)
+    # Vale o último dia da semana citado ("não posso segunda, só terça"); os outros
+    # ficam no texto e deixam o resultado incompleto
+    m, txt = _consumir_ultimo(_RE_DIA_SEMANA, txt)
+    if m and data is None:
+        wd = DIAS_SEMANA[m.group(1)]
+        if prox_semana:
+            data = hoje + timedelta(days=7 - hoje.weekday() + wd)
+        else:
+            data = next(hoje + timedelta(days=i) for i in range(1, 8) if (hoje + timedelta(days=i)).weekday() == wd)
+    elif prox_semana and data is None:
+        data = hoje + timedelta(days=7 - hoje.weekday())
+
+    m, txt = _consumir(_RE_DATA_BARRA, txt)
+    if m and data is None:
+        dia, mes = int(m.group(1)), int(m.group(2))
+        ano = int(m.group(3)) if m.group(3) else hoje.year
+        ano = ano + 2000 if ano < 100 else ano
+        data = _data_valida(hoje, ano, mes, dia)
+        if data and not m.group(3) and data.date() < hoje.date():
+            data = _data_valida(hoje, ano + 1, mes, dia)
+        if data is None:
+            return {"data": None, "hora": None, "periodo": None}, False
+    m, txt = _consumir(_RE_DIA_MES, txt)
+    if m and data is None:
+        dia = int(m.group(1))
+        if m.group(2):
+            mes = MESES[m.group(2)]
+            data = _data_valida(hoje, hoje.year, mes, dia)
+            if data and data.date() < hoje.date():
+                data = _data_valida(hoje, hoje.year + 1, mes, dia)
+        else:
+            # Dia do mês sem mês: este mês se ainda não passou, senão o próximo
+            ano, mes = (hoje.year, hoje.month) if dia >= hoje.day else \
+                ((hoje.year + 1, 1) if hoje.month == 12 else (hoje.year, hoje.month + 1))
+            data = _data_valida(hoje, ano, mes, dia)
+        if data is None:
+            return {"data": None, "hora": None, "periodo": None}, False
+
+    hora = None
+    m, txt = _consumir(_RE_HORA, txt)
+    if m and 0 <= int(m.group(1)) <= 23:
+        hora = f"{int(m.group(1)):02d}:{int(m.group(2) or 0):02d}"
+    m, txt = _consumir(_RE_HORA_AS, txt)
+    if m and hora is None and 0 <= int(m.group(1)) <= 23:
+        hora = f"{int(m.group(1)):02d}:00"
+    m, txt = _consumir(_RE_MEIO_DIA, txt)
+    if m and hora is None:
+        hora = "12:00"
+
+    periodo = None
+    for nome, regex in (("manha", _RE_MANHA), ("tarde", _RE_TARDE), ("noite", _RE_NOITE)):
+        m, txt = _consumir(regex, txt)
+        if m and periodo is None:
+            periodo = nome
+
+    resultado = {"data": data.strftime('%Y-%m-%d') if data else None, "hora": hora, "periodo": periodo}
+    return resultado, not _RE_PISTA_DATA.search(txt) and not _RE_NEGACAO.search(txt)
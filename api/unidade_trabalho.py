@@ -0,0 +1,166 @@
+"""
+Unidade de trabalho do webhook: agrupa as escritas no Firestore de um lote de
+mensagens do mesmo paciente em um único commit.
+
+Sem ela, cada mensagem recebida gera várias idas ao mesmo documento — histórico
+do paciente, lastPatientInteraction, um ou mais update_paciente, histórico de
+cada resposta do robô. Dentro da unidade:
+
+  - escritas no card (set merge) se acumulam num único dict por documento,
+    com merge profundo de mapas; ArrayUnion + ArrayUnion viram um só ArrayUnion
+    e Increment + Increment somam;
+  - documentos novos (mensagens da subcoleção) entram na fila do mesmo batch;
+  - confirmar() grava tudo num WriteBatch e só então roda os callbacks
+    (eventos SSE do dashboard).
+
+Combinações que não dá para fundir localmente (ex.: ArrayUnion seguido de
+ArrayRemove no mesmo campo) forçam um commit intermediário — a ordem das
+escritas é sempre preservada.
+"""
+import sys
+import threading
+
+from firebase_admin import firestore
+
+MAX_OPS_BATCH = 450  # limite do Firestore é 500 escritas por batch
+
+_lock_metricas = threading.Lock()
+METRICAS = {"unidades": 0, "escritas_recebidas": 0, "commits": 0, "documentos_gravados": 0,
+            "commits_antecipados": 0}
+
+
+def _contar(**valores):
+    with _lock_metricas:
+        for chave, valor in valores.items():
+            METRICAS[chave] += valor
+
+
+class _Conflito(Exception):
+    """Os dois valores não podem ser fundidos num único set(merge)."""
+
+
+def _eh_transformacao(valor):
+    return isinstance(valor, (firestore.ArrayUnion, firestore.ArrayRemove, firestore.Increment))
+
+
+def _copiar(valor):
+    # Cópia dos containers: o chamador pode continuar mexendo no dict que passou
+    if isinstance(valor, dict):
+        return {k: _copiar(v) for k, v in valor.items()}
+    if isinstance(valor, list):
+        return [_copiar(v) for v in valor]
+    return valor
+
+
+def _fundir_valor(atual, novo):
+    if isinstance(atual, dict) and isinstance(novo, dict):
+        resultado = dict(atual)
+        _fundir(resultado, novo)
+        return resultado
+    if isinstance(novo, firestore.ArrayUnion):
+        if isinstance(atual, firestore.ArrayUnion):
+            valores = list(atual.values)
+        elif isinstance(atual, list):
+            return atual + [v for v in novo.values if v not in atual]
+        else:
+            raise _Conflito()
+        return firestore.ArrayUnion(valores + [v for v in novo.values if v not in valores])
+    if isinstance(novo, firestore.Increment):
+        if isinstance(atual, firestore.Increment):
+            return firestore.Increment(atual.value + novo.value)
+        if isinstance(atual, (int, float)) and not isinstance(atual, bool):
+            return atual + novo.value
+        raise _Conflito()
+    if _eh_transformacao(novo):
+        raise _Conflito()
+    # Valor comum, SERVER_TIMESTAMP ou DELETE_FIELD: o último vence
+    return _copiar(novo)
+
+
+def _fundir(destino, dados):
+    for campo, valor in dados.items():
+        if campo in destino:
+            destino[campo] = _fundir_valor(destino[campo], valor)
+        else:
+            destino[campo] = _copiar(valor)
+
+
+class UnidadeTrabalho:
+    def __init__(self, db):
+        self._db = db
+        self._merges = {}      # caminho → (ref, dict acumulado)
+        self._documentos = []  # [(ref, dados)] — set sem merge (documentos novos)
+        self._callbacks = []
+        _contar(unidades=1)
+
+    def pendentes(self):
+        return len(self._merges) + len(self._documentos)
+
+    def gravar_merge(self, ref, dados):
+        """Equivalente a ref.set(dados, merge=True), adiado até confirmar()."""
+        _contar(escritas_recebidas=1)
+        caminho = ref.path
+        if caminho in self._merges:
+            acumulado = self._merges[caminho][1]
+            tentativa = dict(acumulado)
+            try:
+                _fundir(tentativa, dados)
+            except _Conflito:
+                _contar(commits_antecipados=1)
+                self.confirmar()
+                self._merges[caminho] = (ref, _copiar(dados))
+                return
+            self._merges[caminho] = (ref, tentativa)
+        else:
+            self._merges[caminho] = (ref, _copiar(dados))
+        self._limitar()
+
+    def gravar_documento(self, ref, dados):
+        """Equivalente a ref.set(dados), adiado até confirmar()."""
+        _contar(escritas_recebidas=1)
+        self._documentos.append((ref, dados))
+        self._limitar()
+
+    def apos_confirmar(self, callback):
+        self._callbacks.append(callback)
+
+    def dados_pendentes(self, ref):
+        item = self._merges.get(ref.path)
+        return dict(item[1]) if item else {}
+
+    def _limitar(self):
+        if self.pendentes() >= MAX_OPS_BATCH:
+            _contar(commits_antecipados=1)
+            self.confirmar()
+
+    def confirmar(self):
+        """Grava tudo o que está pendente num único batch e dispara os callbacks."""
+        if not self._merges and not self._documentos:
+            self._disparar()
+            return
+        batch = self._db.batch()
+        # Documentos novos primeiro: no mesmo batch a ordem não muda o resultado
+        for ref, dados in self._documentos:
+            batch.set(ref, dados)
+        for ref, dados in self._merges.values():
+            batch.set(ref, dados, merge=True)
+        total = len(self._documentos) + len(self._merges)
+        self._documentos, self._merges = [], {}
+        batch.commit()
+        _contar(commits=1, documentos_gravados=total)
+        self._disparar()
+
+    def _disparar(self):
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"[UNIDADE-TRABALHO] Callback falhou: {e}", file=sys.stderr)
+
+
+def metricas_unidade_trabalho():
+    with _lock_metricas:
+        m = dict(METRICAS)
+    m["escritas_por_commit"] = round(m["escritas_recebidas"] / m["commits"], 2) if m["commits"] else 0.0
+    return m
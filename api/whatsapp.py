@@ -3,20 +3,41 @@ import json
 import re
 import traceback
 import io
-import requests
 import base64
 from datetime import datetime, timedelta, timezone
 import threading
+import time
 _thread_local = threading.local()
 try:
     from PIL import Image as PILImage
     PILLOW_AVAILABLE = True
 except ImportError:
     PILLOW_AVAILABLE = False
-from flask import Flask, request, jsonify, send_from_directory, render_template
+from flask import Flask, request, jsonify, send_from_directory, render_template, Response
 import firebase_admin
 from firebase_admin import credentials, firestore, storage as fb_storage
 from totem import totem_bp
+from fila_webhook import PoolWebhook, WEBHOOK_ASSINCRONO, dividir_por_telefone
+from dedupe_mensagens import DedupeMensagens, PersistenciaFirestore, PersistenciaSQLite
+import historico_mensagens
+from kanban_sync import EstadoKanban
+from eventos_dashboard import CanalEventos, formatar_sse
+from cache_compartilhado import Cache, metricas_caches
+from http_cliente import http_get, http_post, metricas_http
+from fila_envio import FilaEnvio, ENVIO_ASSINCRONO
+from maquina_estados import Contexto, registro as registro_estados
+from unidade_trabalho import UnidadeTrabalho, metricas_unidade_trabalho
+from interruptor_robo import InterruptorRobo, ROBO_FLAG_TTL
+from casamento_padroes import CasadorPadroes, normalizar_texto
+from faq_indice import IndiceFAQ, FAQ_CACHE_TTL
+from cache_slots import CacheSlots
+from feegow_cliente import ClienteFeegow, ErroFeegow, Agendamento, metricas_feegow
+from indice_pacientes import indice as indice_pacientes
+from indice_slots import encontrar_horarios_proximos  # noqa: F401 — usado pelos estados (veterano)
+from preferencia_data import interpretar_preferencia, chave_texto, contar as contar_preferencia, METRICAS as METRICAS_PREFERENCIA_DATA
+from acolhimento import ACOLHIMENTO_LOCAL, acolhimento_local, classificar_queixa, metricas_acolhimento
+from cliente_llm import ClienteLLM, iniciar_orcamento, encerrar_orcamento, restante as orcamento_restante
+from faq_semantico import IndiceFAQSemantico, CacheEmbeddings, FAQ_SEMANTICO, FAQ_EMBEDDINGS_MODELO, FAQ_APROVADAS_VALIDADE_DIAS
 # Configura o Flask para encontrar templates e static a partir da raiz do projeto
 _ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 app = Flask(__name__, template_folder=os.path.join(_ROOT_DIR, 'templates'), static_folder=os.path.join(_ROOT_DIR, 'static'))
@@ -41,6 +62,7 @@ OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "")
 OPENAI_MODEL = os.environ.get("OPENAI_MODEL", "ft:gpt-4o-mini-2024-07-18:conectifisio:conectifisio-v8:DiX7KzHF")
 OPENAI_FAQ_MODEL = os.environ.get("OPENAI_FAQ_MODEL", OPENAI_MODEL) # Modelo FAQ v8 — system prompt unificado
 FEEGOW_TOKEN = os.environ.get("FEEGOW_TOKEN", "")
+llm = ClienteLLM(lambda: OPENAI_API_KEY)  # todas as chamadas à OpenAI (ver cliente_llm.py)
 VERIFY_TOKEN = os.environ.get("VERIFY_TOKEN", "conectifisio_webhook_2026")
 PORTO_SEGURO_CPF = os.environ.get("PORTO_SEGURO_CPF", "25052258852")
 PORTO_SEGURO_SENHA = os.environ.get("PORTO_SEGURO_SENHA", "")
@@ -71,12 +93,38 @@ if firebase_creds_json:
             storage_bucket = None
     except: pass
 
+# Índice telefone/CPF → paciente do Feegow persiste no mesmo Firestore do webhook
+indice_pacientes.definir_db(lambda: db)
+
+# Idempotência: wamid já processado é descartado antes de qualquer leitura/envio
+_dedupe_mensagens = DedupeMensagens(
+    PersistenciaFirestore(lambda: db) if db else PersistenciaSQLite()
+)
+
+# Push para o dashboard (SSE /api/eventos) — alimentado pelas escritas do próprio webhook
+_eventos_dashboard = CanalEventos()
+SSE_DURACAO_MAX = 240  # segundos por conexão; o EventSource reconecta sozinho com Last-Event-ID
+
 # ==========================================
 # CACHE EM MEMÓRIA PARA EVITAR EXCEDER COTA DO FIREBASE
 # ==========================================
-_patients_cache = {"data": None, "ts": 0}
 _CACHE_TTL = 25  # segundos — Dashboard atualiza a cada 20s, cache de 25s evita leituras duplas
 # Nota: Firestore Free Tier = 50.000 leituras/dia. Com TTL=25s: máx ~3.456 leituras/dia (seguro)
+# Backend compartilhado (CACHE_BACKEND=disco|redis) → uma leitura serve todos os workers/instâncias
+_patients_cache = Cache("kanban", _CACHE_TTL)  # chave "status1,status2|limite"
+
+# Esquema do card do Kanban — ÚNICOS campos que o dashboard lê (templates/index.html).
+# get_patients usa projeção (select) com esta lista: historico legado, carteirinha_b64,
+# pedido_b64 e demais campos internos do fluxo nunca saem do Firestore.
+# Campo novo exibido no card → acrescentar aqui.
+CAMPOS_CARD_KANBAN = [
+    "title", "cellphone", "status", "servico", "modalidade", "convenio", "unit",
+    "numCarteirinha", "cpf", "periodo", "queixa", "queixa_ia", "experiencia_pilates",
+    "motivo_lead_morno", "precisa_recepcao", "motivo_recepcao",
+    "carteirinha_media_id", "pedido_media_id",
+    "lastInteraction", "lastPatientInteraction", "humanInteractionAt",
+    "atendendo_por", "atendendo_em", "finalizado_por", "finalizado_em",
+]
 
 # ==========================================
 # UNIDADES — ENDEREÇOS E RECOMENDAÇÕES
@@ -148,46 +196,131 @@ def validar_data_nascimento(data_str):
 # ==========================================
 def get_paciente(phone):
     if not db: return {}
+    lote = getattr(_thread_local, "lote_pacientes", None)
+    if lote is not None and phone in lote:
+        return dict(lote[phone])
     doc = db.collection("PatientsKanban").document(phone).get()
-    return doc.to_dict() if doc.exists else {}
+    info = doc.to_dict() if doc.exists else {}
+    if lote is not None:
+        lote[phone] = dict(info)
+    return info
+
+def _gravar_paciente(phone, data):
+    """Único ponto de escrita no card. Durante um lote do webhook, a escrita vai para a
+    unidade de trabalho (um commit no fim do lote) e os valores são espelhados no estado
+    em memória para que a próxima leitura do mesmo paciente não vá ao Firestore."""
+    if not db: return
+    ref = db.collection("PatientsKanban").document(phone)
+    uow = getattr(_thread_local, "unidade_trabalho", None)
+    if uow is not None:
+        uow.gravar_merge(ref, data)
+        uow.apos_confirmar(lambda dados=dict(data): _publicar_card(phone, dados))
+    else:
+        ref.set(data, merge=True)
+    lote = getattr(_thread_local, "lote_pacientes", None)
+    if lote is not None and phone in lote:
+        for campo, valor in data.items():
+            # Sentinelas (SERVER_TIMESTAMP, ArrayUnion) não têm valor local — ignorados
+            if not _eh_sentinela(valor):
+                lote[phone][campo] = valor
+    if uow is None:
+        _publicar_card(phone, data)
+
+def _confirmar_escritas():
+    """Grava agora o que a unidade de trabalho acumulou — antes de disparar algo
+    (thread, outra instância) que vá ler o card direto do Firestore."""
+    uow = getattr(_thread_local, "unidade_trabalho", None)
+    if uow is not None:
+        uow.confirmar()
+
+def _eh_sentinela(valor):
+    return type(valor).__module__.startswith("google.cloud.firestore")
+
+def _publicar_card(phone, data):
+    """Avisa os dashboards conectados (SSE) só com os campos que o card exibe."""
+    campos = {}
+    for campo, valor in data.items():
+        if campo not in CAMPOS_CARD_KANBAN:
+            continue
+        if valor is firestore.SERVER_TIMESTAMP:
+            campos[campo] = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S+00:00')
+        elif not _eh_sentinela(valor):
+            campos[campo] = valor
+    if campos:
+        _eventos_dashboard.publicar("card", {"phone": phone, "campos": campos})
 
 # ==========================================
 # FAQ COM IA — Modelo fine-tuned v8 (OpenAI)
 # ==========================================
-_faq_cache = {"data": None, "ts": 0}
-_FAQ_CACHE_TTL = 300  # 5 minutos — evita leituras repetidas do Firestore
+_faq_cache = Cache("faq", FAQ_CACHE_TTL)  # documentos (sem listener) e respostas aprovadas
+
+# FAQ em memória mantido por listener, com leitura completa + TTL como reserva (ver faq_indice.py)
+_faq_indice = IndiceFAQ(_faq_cache)
 
 def _carregar_faq():
-    """Carrega o FAQ do Firestore com cache de 5 minutos."""
-    import sys, time
-    now = time.time()
-    if _faq_cache["data"] is not None and (now - _faq_cache["ts"]) < _FAQ_CACHE_TTL:
-        return _faq_cache["data"]
-    if not db:
-        return []
+    """Documentos da coleção FAQ (listener; sem ele, cache de 5 minutos com o último conteúdo em erro)."""
+    return _faq_indice.itens(db)
+
+# Cache semântico na frente do modelo (ver faq_semantico.py)
+def _gerar_embeddings(textos):
+    return llm.embeddings("faq_embeddings", textos, FAQ_EMBEDDINGS_MODELO)
+
+try:
+    _faq_semantico = IndiceFAQSemantico(_gerar_embeddings, CacheEmbeddings()) if FAQ_SEMANTICO else None
+except Exception as e_sem:
+    import sys; print(f"[FAQ-SEM] Desativado: {e_sem}", file=sys.stderr)
+    _faq_semantico = None
+
+def _ler_faq_aprovadas():
+    """Só entradas com aprovada=True (marcada por uma pessoa da clínica, que também escreve
+    a "pergunta"); a validade conta da aprovação."""
+    import sys
+    limite = (datetime.utcnow() - timedelta(days=FAQ_APROVADAS_VALIDADE_DIAS)).strftime('%Y-%m-%dT%H:%M:%S')
+    itens = []
+    for d in db.collection("FAQRespostasAprovadas").where("aprovada", "==", True).stream():
+        item = d.to_dict()
+        if item.get("pergunta") and (item.get("aprovada_em") or item.get("criado_em") or "") >= limite:
+            itens.append(item)
+    print(f"[FAQ-SEM] {len(itens)} respostas aprovadas carregadas", file=sys.stderr)
+    return itens
+
+def _indice_faq():
+    """Índice semântico atualizado com o FAQ e as respostas aprovadas (None se indisponível)."""
+    import sys
+    if _faq_semantico is None or not db or not OPENAI_API_KEY:
+        return None
     try:
-        docs = db.collection("FAQ").stream()
-        faq = [doc.to_dict() for doc in docs]
-        _faq_cache["data"] = faq
-        _faq_cache["ts"] = now
-        print(f"[FAQ] Cache atualizado: {len(faq)} categorias carregadas", file=sys.stderr)
-        return faq
+        aprovadas = _faq_cache.obter("aprovadas", _ler_faq_aprovadas) or []
     except Exception as e:
-        print(f"[FAQ] Erro ao carregar Firestore: {e}", file=sys.stderr)
-        return _faq_cache["data"] or []
-
-def _busca_por_keywords(msg_limpa, faq_data):
-    """Busca rápida por palavras-chave — sem custo de API."""
+        print(f"[FAQ-SEM] Erro ao carregar respostas aprovadas: {e}", file=sys.stderr)
+        aprovadas = []
+    _faq_semantico.reconstruir_se_mudou(_carregar_faq(), aprovadas)
+    return _faq_semantico
+
+def _registrar_resposta_pendente(resposta):
+    """Resposta do modelo que passou pelos filtros fica "pendente" para revisão humana.
+    Sem a mensagem do paciente (pode ter dados pessoais/de saúde): quem aprova escreve a
+    pergunta e marca aprovada=True — só então ela entra no índice semântico."""
     import sys
-    for cat in faq_data:
-        for pq in cat.get("perguntas_frequentes", []):
-            todas = [pq.get("pergunta", "")] + pq.get("variacoes", [])
-            for v in todas:
-                if not v: continue
-                if v.lower() in msg_limpa or msg_limpa in v.lower():
-                    print(f"[FAQ-KW] Match: '{v[:40]}'", file=sys.stderr)
-                    return pq.get("resposta_ideal")
-    return None
+    import hashlib
+    from google.api_core.exceptions import AlreadyExists
+    agora = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S')
+    try:
+        doc_id = hashlib.sha1(resposta.encode("utf-8")).hexdigest()
+        doc_ref = db.collection("FAQRespostasAprovadas").document(doc_id)
+        try:
+            doc_ref.create({"resposta": resposta, "modelo": OPENAI_FAQ_MODEL, "status": "pendente",
+                            "aprovada": False, "criado_em": agora, "ultima_ocorrencia": agora, "ocorrencias": 1})
+        except AlreadyExists:
+            # Já registrada (pendente ou revisada): não mexe no status, só conta a ocorrência
+            doc_ref.update({"ultima_ocorrencia": agora, "ocorrencias": firestore.Increment(1)})
+    except Exception as e:
+        print(f"[FAQ-SEM] Erro gravando resposta pendente: {e}", file=sys.stderr)
+
+# Startup: FAQ carregado antes da primeira mensagem; o índice semântico (embeddings) em segundo plano
+_faq_indice.aquecer(db)
+if _faq_semantico is not None and db:
+    threading.Thread(target=_indice_faq, daemon=True, name="faq-semantico-aquecer").start()
 
 def _busca_por_ia(mensagem, faq_data):
     """Usa o modelo fine-tuned v8 para responder dúvidas da clínica.
@@ -213,37 +346,130 @@ def _busca_por_ia(mensagem, faq_data):
         "7. Responda de forma natural e direta. Use emojis com moderação."
     )
 
-    url = "https://api.openai.com/v1/chat/completions"
-    headers_oai = {
-        "Authorization": "Bearer " + OPENAI_API_KEY,
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "model": OPENAI_FAQ_MODEL,
-        "messages": [
-            {"role": "system", "content": system_prompt_v8},
-            {"role": "user", "content": mensagem[:3000]}
-        ],
-        "max_tokens": 800,
-        "temperature": 0.0
-    }
+    resposta_ia = llm.completar("faq", [{"role": "system", "content": system_prompt_v8},
+                                        {"role": "user", "content": mensagem[:3000]}],
+                                modelo=OPENAI_FAQ_MODEL, max_tokens=800, temperature=0.0, timeout=15, hedge=True)
+    if resposta_ia is None:
+        return None
+    print("[FAQ-IA] OpenAI v8: " + resposta_ia[:80], file=sys.stderr)
+    # Rejeita respostas truncadas (menos de 15 chars ou sem pontuação final)
+    if resposta_ia and resposta_ia.upper() != "NENHUMA" and len(resposta_ia) > 15:
+        return resposta_ia
+    return None
 
-    try:
-        res = requests.post(url, json=payload, headers=headers_oai, timeout=15)
-        if res.status_code == 200:
-            resposta_ia = res.json().get("choices", [{}])[0].get("message", {}).get("content", "").strip()
-            print("[FAQ-IA] OpenAI v8: " + resposta_ia[:80], file=sys.stderr)
-            # Rejeita respostas truncadas (menos de 15 chars ou sem pontuação final)
-            if resposta_ia and resposta_ia.upper() != "NENHUMA" and len(resposta_ia) > 15:
-                return resposta_ia
-        else:
-            print("[FAQ-IA] OpenAI HTTP " + str(res.status_code) + ": " + res.text[:200], file=sys.stderr)
-    except Exception as e:
-        print("[FAQ-IA] Erro: " + str(e), file=sys.stderr)
+# ==========================================
+# PALAVRAS-CHAVE DE INTENÇÃO — um autômato só (ver casamento_padroes.py)
+# ==========================================
+PALAVRAS_MASSAGEM = ["massagem", "massoterapia", "massotera", "massagista"]
+PALAVRAS_MASSAGEM_EXCECAO = ["miofascial", "liberação"]  # paciente já sabe da Liberação Miofascial
+SERVICOS_NAO_ATENDIDOS_KEYWORDS = {
+    "ATM / disfunção temporomandibular": ["atm", "articulação temporomandibular", "temporomandibular", "disfunção temporomandibular", "disfuncao temporomandibular", "disfunção tm"],
+    "fisioterapia facial / estética facial": ["fisioterapia facial", "fisio facial", "estética facial", "estetica facial"],
+    "fisioterapia pediátrica": ["fisioterapia pediátrica", "fisioterapia pediatrica", "fisio pediátrica", "fisio pediatrica", "fisioterapia infantil", "fisio infantil"],
+    "fisioterapia neuropediátrica": ["neuropediátrica", "neuropediatrica", "fisioterapia neurológica pediátrica", "fisio neuro pediátrica", "fisio neuro pediatrica"],
+    "drenagem linfática": ["drenagem linfática", "drenagem linfatica", "drenagem"],
+    "RPG": [" rpg ", " rpg?", " rpg.", " rpg!", "reeducação postural global"],
+    "quiropraxia": ["quiropraxia", "quiroprática", "quiropratica"],
+    "fisioterapia respiratória": ["fisioterapia respiratória", "fisioterapia respiratoria", "fisio respiratória", "fisio respiratoria"]
+}
+_SERVICOS_NAO_ATENDIDOS_LISTA = [(nome, kw) for nome, kws in SERVICOS_NAO_ATENDIDOS_KEYWORDS.items() for kw in kws]
+PALAVRAS_CORTESIA = ["obrigad", "obg", "ok", "valeu", "certo", "tá bom", "perfeito", "beleza", "show", "combinado", "agradeço", "ótimo", "otimo", "maravilh", "excelente", "muito bom", "legal", "entendi", "entendido", "claro"]
+EMOJIS_CORTESIA = ["👍", "🙏", "❤️", "👏", "😊", "🥰", "💙", "💚", "🤝", "✅"]
+PALAVRAS_INSTAGRAM = ["interesse", "informações", "pilates"]
+PALAVRAS_SOCORRO = ["ajuda", "humano", "atendente", "recepção", "falar com alguém", "pessoa"]
+SAUDACOES_PURAS = ["oi", "olá", "bom dia", "boa tarde", "boa noite", "oii", "oiii", "ei", "alô", "hey", "hi", "hello"]
+
+def _montar_casador_intencoes():
+    return CasadorPadroes({
+        "massagem": PALAVRAS_MASSAGEM,
+        "massagem_excecao": PALAVRAS_MASSAGEM_EXCECAO,
+        "servico_nao_atendido": [kw for _, kw in _SERVICOS_NAO_ATENDIDOS_LISTA],
+        "pedido_recepcao": PALAVRAS_PEDIDO_RECEPCAO,
+        "cortesia": PALAVRAS_CORTESIA,
+        "cortesia_emoji": EMOJIS_CORTESIA,
+        "instagram": PALAVRAS_INSTAGRAM,
+        "socorro": PALAVRAS_SOCORRO,
+        "saudacao": SAUDACOES_PURAS,
+    })
 
-    return None
+def analisar_intencoes(mensagem):
+    """Todas as palavras-chave de intenção da mensagem, numa passada (sem acento/maiúscula)."""
+    return _casador_intencoes.analisar(mensagem)
+
+# Convênios e serviços que distinguem perguntas quase iguais (chave canônica ← variações)
+_ENTIDADES_FAQ = {
+    "amil": ["amil"], "bradesco": ["bradesco"], "porto seguro": ["porto seguro", "porto"],
+    "prevent senior": ["prevent senior", "prevent"], "saude caixa": ["saude caixa", "caixa"],
+    "petrobras": ["petrobras"], "mediservice": ["mediservice"], "cassi": ["cassi"], "geap": ["geap"],
+    "unimed": ["unimed"], "notredame": ["notredame", "notre dame", "intermedica"],
+    "sulamerica": ["sulamerica", "sul america"], "hapvida": ["hapvida"], "golden cross": ["golden cross"],
+    "apivida": ["apivida"], "amesp": ["amesp"], "qualicorp": ["qualicorp"],
+    "wellhub": ["wellhub", "gympass"], "totalpass": ["totalpass", "total pass"],
+    "pilates": ["pilates"], "acupuntura": ["acupuntura"], "pelvica": ["pelvica", "pelvico"],
+    "atm": ["atm", "temporomandibular"], "facial": ["facial"], "pediatrica": ["pediatrica", "infantil", "neuropediatrica"],
+    "drenagem": ["drenagem"], "rpg": ["rpg"], "quiropraxia": ["quiropraxia", "quiropratica"],
+    "respiratoria": ["respiratoria"],
+}
+_RE_ENTIDADES_FAQ = re.compile(r"\b(" + "|".join(sorted((v for vs in _ENTIDADES_FAQ.values() for v in vs),
+                                                         key=len, reverse=True)) + r")\b")
+_ENTIDADE_CANONICA = {v: chave for chave, vs in _ENTIDADES_FAQ.items() for v in vs}
+
+def _entidades_faq(texto):
+    """Convênios/serviços citados no texto (sem acento/maiúscula), pela chave canônica."""
+    return {_ENTIDADE_CANONICA[m] for m in _RE_ENTIDADES_FAQ.findall(normalizar_texto(texto))}
+
+def _filtrar_resposta_faq(mensagem, resposta):
+    """Filtros de segurança sobre uma resposta do FAQ (modelo ou índice local).
+    → (resposta, None) se passou; (None, motivo|None) se bloqueada."""
+    import sys
+
+    # FILTRO 1: Bloqueia respostas que contenham valores monetários inventados
+    if re.search(r'R\$\s*[\d.,]+', resposta):
+        print(f"[FAQ-FILTRO] BLOQUEADO R$: {resposta[:80]}", file=sys.stderr)
+        return None, None
+
+    # FILTRO 2: Bloqueia se afirmar que atende convênio não aceito
+    _CONV_NAO_ATENDIDOS = ["notredame", "notre dame", "unimed", "sulamerica", "sulamérica", "hapvida", "golden cross", "apivida", "amesp", "qualicorp"]
+    resp_lower = resposta.lower()
+    for conv in _CONV_NAO_ATENDIDOS:
+        if conv in resp_lower:
+            # Se mencionou o convênio MAS sem negar → alucinação
+            tem_negacao = any(neg in resp_lower for neg in ["não", "nao", "infelizmente", "não somos", "não atendemos", "não trabalhamos"])
+            if not tem_negacao:
+                print(f"[FAQ-FILTRO] BLOQUEADO convênio não atendido afirmado: {resposta[:80]}", file=sys.stderr)
+                return None, None
+
+    # FILTRO 3: Bloqueia se afirmar serviço não atendido sem negar (anti-alucinação ATM, RPG, etc)
+    SERVICOS_BLOQUEADOS_NA_RESP = ["atm", "temporomandibular", "fisioterapia facial", "fisio facial",
+                                   "fisioterapia pediátrica", "fisioterapia pediatrica", "fisio pediátrica",
+                                   "neuropediátrica", "neuropediatrica", "drenagem linfática", "drenagem linfatica",
+                                   "quiropraxia", "fisioterapia respiratória", "fisioterapia respiratoria"]
+    for serv in SERVICOS_BLOQUEADOS_NA_RESP:
+        if serv in resp_lower:
+            tem_negacao = any(neg in resp_lower for neg in ["não", "nao", "infelizmente", "não realizamos", "não atendemos", "não fazemos", "não trabalhamos"])
+            if not tem_negacao:
+                print(f"[FAQ-FILTRO] BLOQUEADO serviço não atendido afirmado: {resposta[:80]}", file=sys.stderr)
+                return None, f"servico_nao_atendido:{serv}"
+
+    # FILTRO 4: Anti-alucinação de convênio aceito
+    # Se a resposta menciona um convênio específico mas a pergunta não mencionou → suspeita
+    CONV_ACEITOS = ["amil", "bradesco saúde", "porto seguro", "prevent senior", "saúde caixa",
+                    "saúde petrobras", "mediservice", "cassi", "geap"]
+    msg_lower_pergunta = mensagem.lower()
+    for conv_aceito in CONV_ACEITOS:
+        if conv_aceito in resp_lower and conv_aceito not in msg_lower_pergunta:
+            # Resposta afirma um convênio sem o paciente ter perguntado especificamente
+            # Só bloqueia se a resposta for afirmativa ("Sim, atendemos X")
+            if "sim" in resp_lower[:30] or "atendemos" in resp_lower[:60]:
+                # Caso especial: resposta lista TODOS os convênios (correto). Permite se listar 3+
+                qtd_conv = sum(1 for c in CONV_ACEITOS if c in resp_lower)
+                if qtd_conv < 3:
+                    print(f"[FAQ-FILTRO] Suspeita de alucinação convênio: paciente não citou '{conv_aceito}'", file=sys.stderr)
+                    return None, None
+
+    return resposta, None
 
-def consultar_faq(mensagem):
+def consultar_faq(mensagem, analise=None):
     """FAQ com modelo fine-tuned v8.
     Apenas o modelo treinado com system prompt unificado.
     Filtros de segurança bloqueiam alucinações residuais.
@@ -255,84 +481,46 @@ def consultar_faq(mensagem):
     - (None, None): sem resposta válida
     """
     import sys
-    msg_limpa = mensagem.lower().strip()
+    analise = analise or analisar_intencoes(mensagem)
 
     # PRÉ-FILTRO 1: Detecta pedido de massagem → redireciona para Liberação Miofascial
-    PALAVRAS_MASSAGEM = ["massagem", "massoterapia", "massotera", "massagista"]
-    if any(p in msg_limpa for p in PALAVRAS_MASSAGEM):
+    if analise.contem("massagem"):
         # Só redireciona se NÃO mencionar liberação miofascial (paciente já sabe)
-        if "miofascial" not in msg_limpa and "liberação" not in msg_limpa and "liberacao" not in msg_limpa:
+        if not analise.contem("massagem_excecao"):
             print(f"[FAQ-PRE] Detectado pedido de massagem → Liberação Miofascial", file=sys.stderr)
             return None, "massagem"
 
-    # PRÉ-FILTRO 2: Detecta serviço não atendido na PERGUNTA
-    SERVICOS_NAO_ATENDIDOS_KEYWORDS = {
-        "ATM / disfunção temporomandibular": ["atm", "articulação temporomandibular", "temporomandibular", "disfunção temporomandibular", "disfuncao temporomandibular", "disfunção tm"],
-        "fisioterapia facial / estética facial": ["fisioterapia facial", "fisio facial", "estética facial", "estetica facial"],
-        "fisioterapia pediátrica": ["fisioterapia pediátrica", "fisioterapia pediatrica", "fisio pediátrica", "fisio pediatrica", "fisioterapia infantil", "fisio infantil"],
-        "fisioterapia neuropediátrica": ["neuropediátrica", "neuropediatrica", "fisioterapia neurológica pediátrica", "fisio neuro pediátrica", "fisio neuro pediatrica"],
-        "drenagem linfática": ["drenagem linfática", "drenagem linfatica", "drenagem"],
-        "RPG": [" rpg ", " rpg?", " rpg.", " rpg!", "reeducação postural global"],
-        "quiropraxia": ["quiropraxia", "quiroprática", "quiropratica"],
-        "fisioterapia respiratória": ["fisioterapia respiratória", "fisioterapia respiratoria", "fisio respiratória", "fisio respiratoria"]
-    }
-    msg_pad = " " + msg_limpa + " "
-    for nome_serv, kws in SERVICOS_NAO_ATENDIDOS_KEYWORDS.items():
-        for kw in kws:
-            if kw in msg_pad:
-                print(f"[FAQ-PRE] Detectado serviço não atendido: {nome_serv}", file=sys.stderr)
-                return None, f"servico_nao_atendido:{nome_serv}"
+    # PRÉ-FILTRO 2: Detecta serviço não atendido na PERGUNTA (vale o primeiro serviço da lista)
+    achado = analise.primeiro("servico_nao_atendido")
+    if achado:
+        nome_serv = _SERVICOS_NAO_ATENDIDOS_LISTA[achado[0]][0]
+        print(f"[FAQ-PRE] Detectado serviço não atendido: {nome_serv}", file=sys.stderr)
+        return None, f"servico_nao_atendido:{nome_serv}"
+
+    # Índice semântico: paráfrase de pergunta do FAQ ou de resposta já aprovada → responde local.
+    # Só vale entrada que cita os mesmos convênios/serviços da mensagem ("atendem Unimed?" ≠
+    # "atendem Amil?", por mais próximos que sejam os embeddings) e passa pelos mesmos filtros
+    indice = _indice_faq()
+    if indice:
+        entidades = _entidades_faq(mensagem)
+        resposta_local = indice.buscar(mensagem, compativel=lambda pergunta: _entidades_faq(pergunta) == entidades)
+        if resposta_local:
+            resposta_local, motivo = _filtrar_resposta_faq(mensagem, resposta_local)
+            if resposta_local or motivo:
+                return resposta_local, motivo
 
     # Modelo fine-tuned v8 — responde pelo treinamento com system prompt unificado
+    inicio_ia = time.perf_counter()
     match_ia = _busca_por_ia(mensagem, [])
+    if indice:
+        indice.registrar_modelo(time.perf_counter() - inicio_ia)
     if match_ia:
-        import re as _re_faq
-
-        # FILTRO 1: Bloqueia respostas que contenham valores monetários inventados
-        if _re_faq.search(r'R\$\s*[\d.,]+', match_ia):
-            print(f"[FAQ-FILTRO] BLOQUEADO R$: {match_ia[:80]}", file=sys.stderr)
-            return None, None
-
-        # FILTRO 2: Bloqueia se afirmar que atende convênio não aceito
-        _CONV_NAO_ATENDIDOS = ["notredame", "notre dame", "unimed", "sulamerica", "sulamérica", "hapvida", "golden cross", "apivida", "amesp", "qualicorp"]
-        resp_lower = match_ia.lower()
-        for conv in _CONV_NAO_ATENDIDOS:
-            if conv in resp_lower:
-                # Se mencionou o convênio MAS sem negar → alucinação
-                tem_negacao = any(neg in resp_lower for neg in ["não", "nao", "infelizmente", "não somos", "não atendemos", "não trabalhamos"])
-                if not tem_negacao:
-                    print(f"[FAQ-FILTRO] BLOQUEADO convênio não atendido afirmado: {match_ia[:80]}", file=sys.stderr)
-                    return None, None
-
-        # FILTRO 3: Bloqueia se afirmar serviço não atendido sem negar (anti-alucinação ATM, RPG, etc)
-        SERVICOS_BLOQUEADOS_NA_RESP = ["atm", "temporomandibular", "fisioterapia facial", "fisio facial",
-                                       "fisioterapia pediátrica", "fisioterapia pediatrica", "fisio pediátrica",
-                                       "neuropediátrica", "neuropediatrica", "drenagem linfática", "drenagem linfatica",
-                                       "quiropraxia", "fisioterapia respiratória", "fisioterapia respiratoria"]
-        for serv in SERVICOS_BLOQUEADOS_NA_RESP:
-            if serv in resp_lower:
-                tem_negacao = any(neg in resp_lower for neg in ["não", "nao", "infelizmente", "não realizamos", "não atendemos", "não fazemos", "não trabalhamos"])
-                if not tem_negacao:
-                    print(f"[FAQ-FILTRO] BLOQUEADO serviço não atendido afirmado: {match_ia[:80]}", file=sys.stderr)
-                    return None, f"servico_nao_atendido:{serv}"
-
-        # FILTRO 4: Anti-alucinação de convênio aceito
-        # Se a resposta menciona um convênio específico mas a pergunta não mencionou → suspeita
-        CONV_ACEITOS = ["amil", "bradesco saúde", "porto seguro", "prevent senior", "saúde caixa",
-                        "saúde petrobras", "mediservice", "cassi", "geap"]
-        msg_lower_pergunta = mensagem.lower()
-        for conv_aceito in CONV_ACEITOS:
-            if conv_aceito in resp_lower and conv_aceito not in msg_lower_pergunta:
-                # Resposta afirma um convênio sem o paciente ter perguntado especificamente
-                # Só bloqueia se a resposta for afirmativa ("Sim, atendemos X")
-                if "sim" in resp_lower[:30] or "atendemos" in resp_lower[:60]:
-                    # Caso especial: resposta lista TODOS os convênios (correto). Permite se listar 3+
-                    qtd_conv = sum(1 for c in CONV_ACEITOS if c in resp_lower)
-                    if qtd_conv < 3:
-                        print(f"[FAQ-FILTRO] Suspeita de alucinação convênio: paciente não citou '{conv_aceito}'", file=sys.stderr)
-                        return None, None
-
+        match_ia, motivo = _filtrar_resposta_faq(mensagem, match_ia)
+        if not match_ia:
+            return None, motivo
         print("[FAQ-IA] Respondendo via modelo v8", file=sys.stderr)
+        if indice:
+            _registrar_resposta_pendente(match_ia)
     return match_ia, None
 
 # ============================================================
@@ -354,14 +542,13 @@ PALAVRAS_PEDIDO_RECEPCAO = [
     "vaga essa semana", "vaga semana", "primeira data", "data livre"
 ]
 
-def detectar_pedido_recepcao(msg):
+def detectar_pedido_recepcao(msg, analise=None):
     """Detecta pedidos sobre preço/vaga/desconto que devem ser tratados pela recepção
     sem mover o card para Intervenção (mantém na coluna comercial)."""
-    msg_lower = (msg or "").lower().strip()
-    for kw in PALAVRAS_PEDIDO_RECEPCAO:
-        if kw in msg_lower:
-            return kw
-    return None
+    achado = (analise or analisar_intencoes(msg)).primeiro("pedido_recepcao")
+    return achado[1] if achado else None
+
+_casador_intencoes = _montar_casador_intencoes()
 
 def marcar_precisa_recepcao(phone, motivo):
     """Marca paciente como precisando da recepção (selo no card, mantém na coluna).
@@ -424,40 +611,40 @@ def update_paciente(phone, data):
     if not db: return
     # lastInteraction é o timer GERAL (usado pelo Kanban)
     data["lastInteraction"] = firestore.SERVER_TIMESTAMP
-    db.collection("PatientsKanban").document(phone).set(data, merge=True)
+    _gravar_paciente(phone, data)
 
 def registrar_historico(phone, remetente, tipo, conteudo, media_id=None):
     if not db: return
-    now_iso = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S+00:00')
-    nova_msg = {
-        "de": remetente, # 'paciente', 'clinica' ou 'robo'
-        "tipo": tipo,
-        "conteudo": conteudo,
-        "data": now_iso
-    }
-    if media_id:
-        nova_msg["media_id"] = media_id  # Salva para exibir miniatura no Dashboard
-    
-    update_data = {
-        "historico": firestore.ArrayUnion([nova_msg]),
-        "lastInteraction": firestore.SERVER_TIMESTAMP
-    }
+    # Mensagem vai para a subcoleção PatientsKanban/{phone}/mensagens (ver historico_mensagens.py)
+    # — o card não cresce mais a cada mensagem
+    nova_msg = historico_mensagens.nova_mensagem(remetente, tipo, conteudo, media_id=media_id)
+    ref_msg = historico_mensagens.referencia_nova_mensagem(db, phone)
+    publicar = lambda: _eventos_dashboard.publicar("mensagem", {"phone": phone, "mensagem": nova_msg})
+    uow = getattr(_thread_local, "unidade_trabalho", None)
+    if uow is not None:
+        uow.gravar_documento(ref_msg, nova_msg)
+        uow.apos_confirmar(publicar)
+    else:
+        ref_msg.set(nova_msg)
+        publicar()
+
+    update_data = {"lastInteraction": firestore.SERVER_TIMESTAMP}
     
     # Bug 3: lastPatientInteraction é o timer de FOLLOW-UP (só reseta quando o PACIENTE fala)
     if remetente == "paciente":
         update_data["lastPatientInteraction"] = firestore.SERVER_TIMESTAMP
         
-    db.collection("PatientsKanban").document(phone).set(update_data, merge=True)
+    _gravar_paciente(phone, update_data)
 
 # ==========================================
 # INTEGRAÇÃO FEEGOW (BLINDADA CONTRA ERRO 403)
 # ==========================================
+# Chamadas ao Feegow pelo cliente único (feegow_cliente.py): sessão compartilhada,
+# repetição em 429/5xx com backoff, cf-ray no log e respostas tipadas
+feegow = ClienteFeegow(lambda: FEEGOW_TOKEN)
+
 def get_feegow_headers():
-    return {
-        "Content-Type": "application/json", 
-        "x-access-token": FEEGOW_TOKEN,
-        "User-Agent": "Conectifisio-Integration/1.0"
-    }
+    return feegow.cabecalhos()
 
 def formatar_data_feegow(data_br):
     """🛡️ Converte data BR para formato Feegow (YYYY-MM-DD).
@@ -508,12 +695,12 @@ def baixar_midia_whatsapp_raw(media_id):
     try:
         url_info = f"https://graph.facebook.com/v19.0/{media_id}"
         headers_wa = {"Authorization": f"Bearer {WHATSAPP_TOKEN}"}
-        res_info = requests.get(url_info, headers=headers_wa, timeout=10)
+        res_info = http_get(url_info, headers=headers_wa, timeout=10)
         if res_info.status_code != 200: return None, None
         info_json = res_info.json()
         media_url = info_json.get("url")
         mime_type = info_json.get("mime_type", "image/jpeg")
-        res_download = requests.get(media_url, headers=headers_wa, timeout=20)
+        res_download = http_get(media_url, headers=headers_wa, timeout=20)
         if res_download.status_code != 200: return None, None
         conteudo = res_download.content
         
@@ -564,7 +751,7 @@ def baixar_do_storage_como_data_uri(url, mime_type_hint="image/jpeg"):
     import sys
     if not url: return None
     try:
-        res = requests.get(url, timeout=20)
+        res = http_get(url, timeout=20)
         if res.status_code != 200:
             print(f"[STORAGE] Falha ao baixar {url}: status={res.status_code}", file=sys.stderr)
             return None
@@ -609,45 +796,48 @@ def salvar_midia_imediata(phone, tipo_doc, media_id):
     
     return result
 
-def buscar_feegow_por_telefone(phone):
-    if not FEEGOW_TOKEN: return None
+def _celular_feegow(phone):
     celular = re.sub(r'\D', '', phone)
     if celular.startswith("55") and len(celular) > 11: celular = celular[2:]
-    # Endpoint correto: /patient/list com parâmetro telefone
-    url = f"https://api.feegow.com/v1/api/patient/list?telefone={celular}"
+    return celular
+
+def buscar_feegow_por_telefone(phone):
+    """Paciente do Feegow pelo celular ({"id", "nome", "cpf"} ou None) — via índice local (indice_pacientes.py)."""
+    import sys
+    if not FEEGOW_TOKEN: return None
+    celular = _celular_feegow(phone)
     try:
-        import sys
-        print(f"[FEEGOW-BUSCA] Buscando paciente por telefone: {celular}", file=sys.stderr)
-        res = requests.get(url, headers=get_feegow_headers(), timeout=10)
-        print(f"[FEEGOW-BUSCA] HTTP {res.status_code} | resp={res.text[:300]}", file=sys.stderr)
-        if res.status_code == 200:
-            dados = res.json()
-            if dados.get("success") != False and dados.get("content"):
-                p = dados["content"][0] if isinstance(dados["content"], list) else dados["content"]
-                pid = p.get("patient_id") or p.get("paciente_id") or p.get("id")
-                nome = p.get("nome_completo") or p.get("nome") or ""
-                cpf = p.get("cpf", "")
-                print(f"[FEEGOW-BUSCA] Encontrado: id={pid} nome={nome}", file=sys.stderr)
-                return {"id": pid, "nome": nome, "cpf": cpf}
+        return indice_pacientes.buscar("tel", celular, lambda: _consultar_feegow_por_telefone(celular))
     except Exception as e:
-        import sys
         print(f"[FEEGOW-BUSCA] Erro: {e}", file=sys.stderr)
     return None
 
+def _consultar_feegow_por_telefone(celular):
+    """None = não encontrado; exceção = falha (não entra no índice como negativo)."""
+    import sys
+    # Endpoint correto: /patient/list com parâmetro telefone
+    print(f"[FEEGOW-BUSCA] Buscando paciente por telefone: {celular}", file=sys.stderr)
+    pacientes = feegow.listar_pacientes(telefone=celular)  # ErroFeegow em falha
+    if pacientes:
+        p = pacientes[0]
+        print(f"[FEEGOW-BUSCA] Encontrado: id={p.id} nome={p.nome}", file=sys.stderr)
+        return p.como_dict()
+    print(f"[FEEGOW-BUSCA] Nenhum paciente com telefone {celular}", file=sys.stderr)
+    return None
+
 def buscar_feegow_por_cpf(cpf):
+    """Paciente do Feegow pelo CPF ({"id", "nome", ...} ou None) — via índice local."""
     if not FEEGOW_TOKEN: return None
     cpf_limpo = re.sub(r'\D', '', str(cpf))
-    url = f"https://api.feegow.com/v1/api/patient/search?paciente_cpf={cpf_limpo}&photo=false"
     try:
-        res = requests.get(url, headers=get_feegow_headers(), timeout=10)
-        if res.status_code == 200:
-            dados = res.json()
-            if dados.get("success") != False and dados.get("content"):
-                p = dados["content"][0] if isinstance(dados["content"], list) else dados["content"]
-                return {"id": p.get("paciente_id") or p.get("id"), "nome": p.get("nome_completo") or p.get("nome")}
+        return indice_pacientes.buscar("cpf", cpf_limpo, lambda: _consultar_feegow_por_cpf(cpf_limpo))
     except: pass
     return None
 
+def _consultar_feegow_por_cpf(cpf_limpo):
+    p = feegow.buscar_paciente(cpf=cpf_limpo)  # ErroFeegow em falha
+    return {"id": p.id, "nome": p.nome, "cpf": cpf_limpo} if p else None
+
 # Mapa de equipamentos Feegow → unidade e serviço
 # local_id confirmado via URL ?P=Equipamentos&I=X no Feegow
 _LOCAL_ID_MAP = {
@@ -717,78 +907,101 @@ def _nome_para_unidade(nome_equipamento):
     if "scs" in nome or "são caetano" in nome or "santa paula" in nome: return "São Caetano"
     return None
 
-def consultar_agenda_feegow(paciente_id, retornar_raw=False, historico=False):
+# Agenda do paciente: UMA busca appoints/search de hoje-90 a hoje+90 dias por feegow_id,
+# servida aos dois modos (futuro / histórico) e invalidada a cada statusUpdate
+AGENDA_CACHE_TTL = int(os.environ.get("AGENDA_CACHE_TTL", "300"))  # segundos
+AGENDA_JANELA_DIAS = 90
+_agenda_cache = Cache("agenda_feegow", AGENDA_CACHE_TTL)  # chave feegow_id
+# agendamento_id → feegow_id, no mesmo backend da agenda (outra instância pode fazer o statusUpdate);
+# reserva para quem não sabe o dono — os estados passam paciente_id direto
+_agenda_dono = Cache("agenda_dono", AGENDA_CACHE_TTL * 12)
+_AGENDA_STATUS_VALIDOS = {1, 2, 4, 15}  # Marcado, Confirmado, Aguardando, Remarcado
+
+def _buscar_agenda_feegow(paciente_id):
+    """Janela completa (passado + futuro) já convertida. Exceção em falha — o Cache
+    serve o último valor conhecido, se houver."""
+    import sys
+    hoje = datetime.now()
+    ini = hoje - timedelta(days=AGENDA_JANELA_DIAS)
+    fim = hoje + timedelta(days=AGENDA_JANELA_DIAS)
+    print(f"[FEEGOW-AGENDA] Consultando: paciente_id={paciente_id} janela=±{AGENDA_JANELA_DIAS}d", file=sys.stderr)
+    res = feegow.get("appoints/search", params={"paciente_id": paciente_id, "data_start": ini.strftime('%d-%m-%Y'),
+                                                "data_end": fim.strftime('%d-%m-%Y')}).exigir()
+    if not res.sucesso:
+        raise ErroFeegow(f"appoints/search success=false | {str(res.dados)[:200]}", res.endpoint, res.status, res.cf_ray)
+    content = res.conteudo or []
+    datas, agendamentos = [], []
+    for a in map(Agendamento.de_feegow, content):
+        datas.append(a.data)  # já em YYYY-MM-DD
+        if a.status_id not in _AGENDA_STATUS_VALIDOS:
+            continue  # ignora cancelados, desmarcados, faltas
+        parts = a.data.split("-")
+        if len(parts) != 3:
+            continue
+        hora = a.hora
+        local_info = _LOCAL_ID_MAP.get(a.local_id, {})
+        servico_nome = local_info.get("servico") or _PROC_ID_SERVICO.get(a.procedimento_id) or a.bruto.get("procedimento_nome") or "Sessão"
+        agendamentos.append({
+            "agendamento_id": a.id,
+            "data": a.data,
+            "data_br": f"{parts[2]}/{parts[1]}/{parts[0]}",
+            "hora": hora,
+            "local_id": a.local_id,
+            "procedimento_id": a.procedimento_id,
+            "profissional_id": a.profissional_id,
+            "unidade": local_info.get("unidade", ""),
+            "servico": servico_nome,
+            "label": f"🗓️ *{parts[2]}/{parts[1]}/{parts[0]} às {hora}* - {servico_nome}"
+        })
+    for a in agendamentos:
+        if a["agendamento_id"]:
+            _agenda_dono.definir(str(a["agendamento_id"]), str(paciente_id))
+    print(f"[FEEGOW-AGENDA] HTTP 200 | {len(content)} item(ns), {len(agendamentos)} ativo(s)", file=sys.stderr)
+    return {"datas": datas, "agendamentos": agendamentos}
+
+def invalidar_agenda_feegow(paciente_id=None, agendamento_id=None):
+    """Descarta a agenda em cache do paciente (ou do dono do agendamento)."""
+    if not paciente_id and agendamento_id is not None:
+        paciente_id = _agenda_dono.obter(str(agendamento_id))
+    if paciente_id:
+        _agenda_cache.invalidar(str(paciente_id))
+
+def consultar_agenda_feegow(paciente_id, retornar_raw=False, historico=False, usar_cache=True):
     """Consulta agenda do paciente no Feegow.
     retornar_raw=True retorna dict com sessoes (labels) e agendamentos (dados brutos).
     historico=True busca os últimos 90 dias (para Nova Guia com sessões esgotadas).
     Usa local_id para determinar unidade e serviço reais de cada sessão.
+    Os dois modos saem da mesma busca em cache (AGENDA_CACHE_TTL); usar_cache=False força a busca.
     """
     import sys
     if not FEEGOW_TOKEN or not paciente_id:
         return None
-    hoje = datetime.now()
-    if historico:
-        ini = hoje - timedelta(days=90)
-        url = f"https://api.feegow.com/v1/api/appoints/search?paciente_id={paciente_id}&data_start={ini.strftime('%d-%m-%Y')}&data_end={hoje.strftime('%d-%m-%Y')}"
-    else:
-        futuro = hoje + timedelta(days=90)
-        url = f"https://api.feegow.com/v1/api/appoints/search?paciente_id={paciente_id}&data_start={hoje.strftime('%d-%m-%Y')}&data_end={futuro.strftime('%d-%m-%Y')}"
-    print(f"[FEEGOW-AGENDA] Consultando: paciente_id={paciente_id} historico={historico}", file=sys.stderr)
+    if not usar_cache:
+        invalidar_agenda_feegow(paciente_id)
     try:
-        res = requests.get(url, headers=get_feegow_headers(), timeout=10)
-        print(f"[FEEGOW-AGENDA] HTTP {res.status_code} | resp={res.text[:4000]}", file=sys.stderr)
-        if res.status_code == 200:
-            dados = res.json()
-            if dados.get("success") != False and dados.get("content"):
-                sessoes = []
-                agendamentos = []
-                VALID_STATUS_IDS = {1, 2, 4, 15}  # Marcado, Confirmado, Aguardando, Remarcado
-                for a in dados["content"]:
-                    status_id_ag = a.get("status_id", 1)
-                    if status_id_ag not in VALID_STATUS_IDS:
-                        continue  # ignora cancelados, desmarcados, faltas
-                    data_raw = str(a.get("data", "")).split("T")[0]
-                    # Converte DD-MM-YYYY para YYYY-MM-DD para comparação
-                    if re.match(r"^\d{2}-\d{2}-\d{4}$", data_raw):
-                        partes = data_raw.split("-")
-                        data_iso = f"{partes[2]}-{partes[1]}-{partes[0]}"
-                    else:
-                        data_iso = data_raw
-                    if (not historico and data_iso >= hoje.strftime('%Y-%m-%d')) or \
-                       (historico and data_iso < hoje.strftime('%Y-%m-%d')):
-                        hora = str(a.get("horario") or a.get("hora", ""))[:5]
-                        local_id = a.get("local_id")
-                        local_info = _LOCAL_ID_MAP.get(local_id, {})
-                        servico_nome = local_info.get("servico") or _PROC_ID_SERVICO.get(a.get("procedimento_id")) or a.get("procedimento_nome") or "Sessão"
-                        unidade_ag = local_info.get("unidade", "")
-                        parts = data_iso.split("-")
-                        if len(parts) == 3:
-                            label = f"🗓️ *{parts[2]}/{parts[1]}/{parts[0]} às {hora}* - {servico_nome}"
-                            sessoes.append(label)
-                            agendamentos.append({
-                                "agendamento_id": a.get("agendamento_id"),
-                                "data": data_iso,
-                                "data_br": f"{parts[2]}/{parts[1]}/{parts[0]}",
-                                "hora": hora,
-                                "local_id": local_id,
-                                "procedimento_id": a.get("procedimento_id"),
-                                "profissional_id": a.get("profissional_id"),
-                                "unidade": unidade_ag,
-                                "servico": servico_nome,
-                                "label": label
-                            })
-                print(f"[FEEGOW-AGENDA] {len(sessoes)} sessão(ões) encontrada(s)", file=sys.stderr)
-                if historico:
-                    agendamentos.sort(key=lambda x: x["data"], reverse=True)
-                if retornar_raw:
-                    return {"sessoes": sessoes, "agendamentos": agendamentos}
-                return sessoes
+        agenda = _agenda_cache.obter(str(paciente_id), lambda: _buscar_agenda_feegow(paciente_id))
     except Exception as e:
         print(f"[FEEGOW-AGENDA] Exceção: {e}", file=sys.stderr)
-    return None
+        return None
+    hoje_iso = datetime.now().strftime('%Y-%m-%d')
+    # Sem nenhum item na metade pedida da janela → None, como a busca antiga daquele intervalo
+    if historico:
+        if not any(d <= hoje_iso or len(d.split("-")) != 3 for d in agenda["datas"]):
+            return None
+        agendamentos = [dict(a) for a in agenda["agendamentos"] if a["data"] < hoje_iso]
+        agendamentos.sort(key=lambda x: x["data"], reverse=True)
+    else:
+        if not any(d >= hoje_iso or len(d.split("-")) != 3 for d in agenda["datas"]):
+            return None
+        agendamentos = [dict(a) for a in agenda["agendamentos"] if a["data"] >= hoje_iso]
+    sessoes = [a["label"] for a in agendamentos]
+    print(f"[FEEGOW-AGENDA] {len(sessoes)} sessão(ões) encontrada(s) historico={historico}", file=sys.stderr)
+    if retornar_raw:
+        return {"sessoes": sessoes, "agendamentos": agendamentos}
+    return sessoes
 
 def _buscar_servico_atual_feegow(paciente_id):
-    """Busca serviço mais recente: tenta futuro → histórico 90 dias.
+    """Busca serviço mais recente: tenta futuro → histórico 90 dias (a mesma busca em cache).
     Retorna dict com servico, unidade, local_id, procedimento_id ou None.
     """
     import sys
@@ -809,47 +1022,29 @@ def _buscar_servico_atual_feegow(paciente_id):
                 }
     return None
 
+_preferencia_cache = Cache("preferencia_data", 6 * 3600)  # chave "AAAA-MM-DD|texto normalizado"
+
 def extrair_preferencia_data(texto):
-    """Usa gpt-4o-mini para extrair data/hora. Fallback Python para dias da semana."""
-    import sys
+    """Data/hora/período preferidos do paciente. Parser Python primeiro (preferencia_data.py);
+    gpt-4o-mini só quando sobra algo que o parser não entendeu. Resultado em cache por
+    (texto normalizado, dia de hoje) — chamadas simultâneas com o mesmo texto fazem uma
+    única extração (single-flight do Cache)."""
     hoje = datetime.now()
+    chave = f"{hoje.strftime('%Y-%m-%d')}|{chave_texto(texto)}"
+    return dict(_preferencia_cache.obter(chave, lambda: _extrair_preferencia_data(texto, hoje)))
+
+def _extrair_preferencia_data(texto, hoje):
+    import sys
     dias_map = {0: "segunda", 1: "terça", 2: "quarta", 3: "quinta", 4: "sexta", 5: "sábado", 6: "domingo"}
     hoje_nome = dias_map.get(hoje.weekday(), "")
 
-    # Fallback Python — extrai dia da semana e hora do texto sem IA
-    def _fallback_parse(txt):
-        txt_lower = txt.lower()
-        dias_semana = {"segunda": 0, "terca": 1, "terça": 1, "quarta": 2, "quinta": 3, "sexta": 4}
-        data_result = None
-        hora_result = None
-        periodo_result = None
-        for nome, wd in dias_semana.items():
-            if nome in txt_lower:
-                for i in range(1, 8):
-                    cand = hoje + timedelta(days=i)
-                    if cand.weekday() == wd:
-                        data_result = cand.strftime('%Y-%m-%d')
-                        break
-        import re as _re
-        hora_match = _re.search(r'(\d{1,2})[h:](\d{2})?', txt_lower)
-        if hora_match:
-            h = int(hora_match.group(1))
-            m = int(hora_match.group(2)) if hora_match.group(2) else 0
-            if 0 <= h <= 23:
-                hora_result = f"{h:02d}:{m:02d}"
-        if "manhã" in txt_lower or "manha" in txt_lower: periodo_result = "manha"
-        elif "tarde" in txt_lower: periodo_result = "tarde"
-        return {"data": data_result, "hora": hora_result, "periodo": periodo_result}
-
-    # Python primeiro para dias da semana — mais confiável que IA
-    txt_lower_check = texto.lower()
-    dias_semana_check = {"segunda", "terca", "terça", "quarta", "quinta", "sexta"}
-    tem_dia_semana = any(d in txt_lower_check for d in dias_semana_check)
-    resultado_python = _fallback_parse(texto)
-    if tem_dia_semana and resultado_python.get("data"):
-        print(f"[EXTRAIR-DATA] Python (dia semana): {resultado_python}", file=sys.stderr)
+    resultado_python, completo = interpretar_preferencia(texto, hoje)
+    if completo:
+        contar_preferencia("python")
+        print(f"[EXTRAIR-DATA] Python: {resultado_python}", file=sys.stderr)
         return resultado_python
 
+    contar_preferencia("llm")
     try:
         import json as _json
         prompt = (
@@ -861,11 +1056,10 @@ def extrair_preferencia_data(texto):
             f"Retorne APENAS um JSON válido sem texto extra:\n"
             f"{{\"data\": \"YYYY-MM-DD\", \"hora\": \"HH:MM\"}}"
         )
-        url_oai = "https://api.openai.com/v1/chat/completions"
-        headers_oai = {"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"}
-        payload_oai = {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": prompt}], "max_tokens": 60, "temperature": 0}
-        res_oai = requests.post(url_oai, json=payload_oai, headers=headers_oai, timeout=10)
-        resp_text = res_oai.json().get("choices", [{}])[0].get("message", {}).get("content", "").strip()
+        resp_text = llm.completar("preferencia_data", [{"role": "user", "content": prompt}],
+                                  max_tokens=60, temperature=0, timeout=10, hedge=True)
+        if resp_text is None:
+            raise RuntimeError("LLM indisponível")
         print(f"[EXTRAIR-DATA] '{texto[:40]}' → {resp_text}", file=sys.stderr)
         # Remove possíveis backticks
         resp_text = resp_text.replace("```json", "").replace("```", "").strip()
@@ -880,49 +1074,69 @@ def extrair_preferencia_data(texto):
             result["periodo"] = None
         # Se IA falhou em extrair, usa fallback Python
         if not result.get("data") and not result.get("hora"):
-            result = _fallback_parse(texto)
+            result = resultado_python
             print(f"[EXTRAIR-DATA] Fallback Python: {result}", file=sys.stderr)
+        elif not result.get("periodo"):
+            result["periodo"] = resultado_python.get("periodo")
         return result
     except Exception as e:
+        contar_preferencia("llm_falhas")
         print(f"[EXTRAIR-DATA] Erro: {e} — usando fallback Python", file=sys.stderr)
-        return _fallback_parse(texto)
+        return resultado_python
 
-def cancelar_agendamento_feegow(agendamento_id, obs="Desmarcado pelo paciente via robô."):
-    """Cancela agendamento no Feegow — StatusID=11 (Desmarcado pelo paciente)."""
+def cancelar_agendamento_feegow(agendamento_id, obs="Desmarcado pelo paciente via robô.", data=None, paciente_id=None):
+    """Cancela agendamento no Feegow — StatusID=11 (Desmarcado pelo paciente).
+    data (ISO) = dia do agendamento: só ele sai do cache de horários; sem data, sai tudo.
+    paciente_id = feegow_id do dono: a agenda dele sai do cache."""
     import sys
     if not FEEGOW_TOKEN or not agendamento_id: return False
-    url = "https://api.feegow.com/v1/api/appoints/statusUpdate"
-    payload = {"AgendamentoID": int(agendamento_id), "StatusID": "11", "Obs": obs}
     try:
-        res = requests.post(url, json=payload, headers=get_feegow_headers(), timeout=10)
-        print(f"[FEEGOW-CANCEL] HTTP {res.status_code} | {res.text[:200]}", file=sys.stderr)
-        return res.status_code == 200 and res.json().get("success") != False
+        res = feegow.atualizar_status(agendamento_id, 11, obs)
+        print(f"[FEEGOW-CANCEL] HTTP {res.status} | {str(res.dados)[:200]} | cf-ray={res.cf_ray or 'N/A'}", file=sys.stderr)
+        return res.ok
     except Exception as e:
         print(f"[FEEGOW-CANCEL] Exceção: {e}", file=sys.stderr)
         return False
+    finally:
+        # Depois do statusUpdate: uma carga que começasse antes ainda veria o horário ocupado
+        invalidar_slots(data)
+        invalidar_agenda_feegow(paciente_id, agendamento_id)  # status mudou: a agenda em cache não vale mais
 
-def remarcar_agendamento_feegow(agendamento_id, obs="Remarcado pelo paciente via robô. Aguarda confirmação da recepção."):
-    """Marca agendamento como Remarcado no Feegow — StatusID=15."""
+def remarcar_agendamento_feegow(agendamento_id, obs="Remarcado pelo paciente via robô. Aguarda confirmação da recepção.", data=None, paciente_id=None):
+    """Marca agendamento como Remarcado no Feegow — StatusID=15. data/paciente_id: ver cancelar_agendamento_feegow."""
     import sys
     if not FEEGOW_TOKEN or not agendamento_id: return False
-    url = "https://api.feegow.com/v1/api/appoints/statusUpdate"
-    payload = {"AgendamentoID": int(agendamento_id), "StatusID": "15", "Obs": obs}
     try:
-        res = requests.post(url, json=payload, headers=get_feegow_headers(), timeout=10)
-        print(f"[FEEGOW-REMARCAR] HTTP {res.status_code} | {res.text[:200]}", file=sys.stderr)
-        return res.status_code == 200 and res.json().get("success") != False
+        res = feegow.atualizar_status(agendamento_id, 15, obs)
+        print(f"[FEEGOW-REMARCAR] HTTP {res.status} | {str(res.dados)[:200]} | cf-ray={res.cf_ray or 'N/A'}", file=sys.stderr)
+        return res.ok
     except Exception as e:
         print(f"[FEEGOW-REMARCAR] Exceção: {e}", file=sys.stderr)
         return False
+    finally:
+        invalidar_slots(data)
+        invalidar_agenda_feegow(paciente_id, agendamento_id)
+
+def consultar_disponibilidade_feegow(local_id, procedimento_id, data_inicio_iso, data_fim_iso, usar_cache=True):
+    """Horários disponíveis no Feegow entre as datas (ISO, inclusive), em ordem de (data, hora).
+    Servido pelo cache de horários (ver cache_slots.py); usar_cache=False consulta ao vivo."""
+    if not FEEGOW_TOKEN: return []
+    if not usar_cache:
+        return _consultar_disponibilidade_api(local_id, procedimento_id, data_inicio_iso, data_fim_iso) or []
+    return _cache_slots.obter(local_id, procedimento_id, _LOCAL_ID_UNIDADE.get(local_id, 0),
+                              data_inicio_iso, data_fim_iso)
+
+def invalidar_slots(data=None):
+    """Tira do cache de horários o dia (ISO) afetado por um agendamento/cancelamento — ou tudo, sem data."""
+    _cache_slots.invalidar(data)
 
-def consultar_disponibilidade_feegow(local_id, procedimento_id, data_inicio_iso, data_fim_iso):
+def _consultar_disponibilidade_api(local_id, procedimento_id, data_inicio_iso, data_fim_iso):
     """Consulta horarios disponiveis no Feegow.
     Endpoint: appoints/available-schedule
     Datas em ISO (YYYY-MM-DD) convertidas internamente para DD-MM-YYYY.
+    Retorna a lista de slots (vazia se não há horário) ou None em falha — falha não entra no cache.
     """
     import sys
-    if not FEEGOW_TOKEN: return []
-    url = "https://api.feegow.com/v1/api/appoints/available-schedule"
 
     def _fmt(iso):
         try:
@@ -995,25 +1209,25 @@ def consultar_disponibilidade_feegow(local_id, procedimento_id, data_inicio_iso,
     for params in tentativas:
         print(f"[FEEGOW-DISP] GET params={params}", file=sys.stderr)
         try:
-            res = requests.get(url, params=params, headers=get_feegow_headers(), timeout=10)
-            print(f"[FEEGOW-DISP] HTTP {res.status_code} | resp={res.text[:400]}", file=sys.stderr)
-            if res.status_code == 200:
-                dados = res.json()
-                if dados.get("success") != False and dados.get("content"):
-                    slots = _extrair_slots(dados)
-                    # Filtra pelo local_id correto da agenda para eliminar slots fantasmas
-                    if local_id_agenda and any(s.get("local_id") for s in slots):
-                        antes = len(slots)
-                        slots = [s for s in slots if s.get("local_id") == local_id_agenda]
-                        print(f"[FEEGOW-DISP] Filtro local_id={local_id_agenda}: {antes} → {len(slots)} slots", file=sys.stderr)
-                    if slots:
-                        print(f"[FEEGOW-DISP] {len(slots)} horário(s) encontrado(s)", file=sys.stderr)
-                        return slots
+            res = feegow.horarios_disponiveis(**params)
+            print(f"[FEEGOW-DISP] HTTP {res.status} | resp={str(res.dados)[:400]}", file=sys.stderr)
+            if not res.http_ok or not res.sucesso:
+                continue
+            slots = _extrair_slots(res.dados) if res.conteudo else []
+            # Filtra pelo local_id correto da agenda para eliminar slots fantasmas
+            if local_id_agenda and any(s.get("local_id") for s in slots):
+                antes = len(slots)
+                slots = [s for s in slots if s.get("local_id") == local_id_agenda]
+                print(f"[FEEGOW-DISP] Filtro local_id={local_id_agenda}: {antes} → {len(slots)} slots", file=sys.stderr)
+            if slots:
+                print(f"[FEEGOW-DISP] {len(slots)} horário(s) encontrado(s)", file=sys.stderr)
+            else:
+                print(f"[FEEGOW-DISP] Nenhum horário para local_id={local_id}", file=sys.stderr)
+            return slots
         except Exception as e:
             print(f"[FEEGOW-DISP] Exceção: {e}", file=sys.stderr)
 
-    print(f"[FEEGOW-DISP] Nenhum horário para local_id={local_id}", file=sys.stderr)
-    return []
+    return None
 
 def dias_uteis_a_partir(data_inicio, qtd_dias):
     """Retorna data_fim pulando domingos."""
@@ -1025,36 +1239,36 @@ def dias_uteis_a_partir(data_inicio, qtd_dias):
             contados += 1
     return atual
 
-def encontrar_horarios_proximos(slots, hora_preferida, qtd=2):
-    """Retorna os qtd slots mais próximos — prioriza data mais próxima,
-    desempata por proximidade de horário preferido."""
-    if not slots: return []
-    try:
-        h_pref = datetime.strptime(hora_preferida, "%H:%M")
-    except:
-        return sorted(slots, key=lambda x: (x["data"], x["hora"]))[:qtd]
-    def sort_key(slot):
-        try:
-            h_slot = datetime.strptime(slot["hora"], "%H:%M")
-            diff_hora = abs((h_slot - h_pref).total_seconds())
-        except:
-            diff_hora = 999999
-        return (slot["data"], diff_hora)
-    return sorted(slots, key=sort_key)[:qtd]
-
-def confirmar_presenca_feegow(agendamento_id):
-    """Confirma presença no Feegow — StatusID=4 (Aguardando)."""
+# Cache de horários: equipamentos do _LOCAL_ID_MAP pré-carregados de hoje até 14 dias úteis
+_PROC_ID_PADRAO_SERVICO = {"Fisioterapia": 42, "Acupuntura": 21}
+
+def _janela_prefetch_slots():
+    # Mesma janela do reagendando_preferencia sem data pedida: amanhã + 14 dias úteis
+    hoje = datetime.now()
+    return hoje.strftime('%Y-%m-%d'), dias_uteis_a_partir(hoje + timedelta(days=1), 14).strftime('%Y-%m-%d')
+
+_cache_slots = CacheSlots(
+    _consultar_disponibilidade_api,
+    chaves_semente=[(lid, _PROC_ID_PADRAO_SERVICO[info["servico"]], _LOCAL_ID_UNIDADE.get(lid, 0))
+                    for lid, info in _LOCAL_ID_MAP.items()],
+    janela_prefetch=_janela_prefetch_slots,
+)
+if FEEGOW_TOKEN:
+    _cache_slots.iniciar_prefetch()
+
+def confirmar_presenca_feegow(agendamento_id, paciente_id=None):
+    """Confirma presença no Feegow — StatusID=4 (Aguardando). paciente_id: ver cancelar_agendamento_feegow."""
     import sys
     if not FEEGOW_TOKEN or not agendamento_id: return False
-    url = "https://api.feegow.com/v1/api/appoints/statusUpdate"
-    payload = {"AgendamentoID": int(agendamento_id), "StatusID": "4", "Obs": "Presença confirmada pelo paciente via robô."}
     try:
-        res = requests.post(url, json=payload, headers=get_feegow_headers(), timeout=10)
-        print(f"[FEEGOW-CONFIRM] HTTP {res.status_code} | {res.text[:200]}", file=sys.stderr)
-        return res.status_code == 200 and res.json().get("success") != False
+        res = feegow.atualizar_status(agendamento_id, 4, "Presença confirmada pelo paciente via robô.")
+        print(f"[FEEGOW-CONFIRM] HTTP {res.status} | {str(res.dados)[:200]} | cf-ray={res.cf_ray or 'N/A'}", file=sys.stderr)
+        return res.ok
     except Exception as e:
         print(f"[FEEGOW-CONFIRM] Exceção: {e}", file=sys.stderr)
         return False
+    finally:
+        invalidar_agenda_feegow(paciente_id, agendamento_id)
 
 def integrar_feegow(phone, info):
     import sys
@@ -1065,10 +1279,9 @@ def integrar_feegow(phone, info):
         busca = buscar_feegow_por_cpf(cpf)
         if busca: feegow_id = busca['id']
 
-    base_url = "https://api.feegow.com/v1/api"
-    celular = re.sub(r'\D', '', phone)
-    if celular.startswith("55") and len(celular) > 11: celular = celular[2:]
-    
+    base_url = feegow.base_url
+    celular = _celular_feegow(phone)
+
     convenio_id = mapear_convenio(info.get("convenio", ""))
     matricula = info.get("numCarteirinha", "")
 
@@ -1080,25 +1293,26 @@ def integrar_feegow(phone, info):
         }
         if convenio_id > 0: payload_create.update({"convenio_id": convenio_id, "plano_id": 0, "matricula": matricula})
         try:
-            res_create = requests.post(f"{base_url}/patient/create", json=payload_create, headers=get_feegow_headers(), timeout=10)
-            if res_create.status_code == 200 and res_create.json().get("success") != False:
-                feegow_id = res_create.json().get("content", {}).get("paciente_id") or res_create.json().get("paciente_id")
+            feegow_id = feegow.criar_paciente(payload_create)
+            if feegow_id:
+                # Recém-criado: telefone e CPF deixam de ser "não encontrado" no índice
+                indice_pacientes.registrar(feegow_id, info.get("title", ""), tel=celular, cpf=cpf)
         except: pass
 
     elif feegow_id:
         try:
-            res_pac = requests.get(f"{base_url}/patient/search?paciente_id={feegow_id}&photo=false", headers=get_feegow_headers(), timeout=10)
             pac_nome = info.get("title", "Paciente")
             pac_nasc = formatar_data_feegow(info.get("birthDate", ""))
             pac_email = info.get("email", "")
-            
-            if res_pac.status_code == 200 and res_pac.json().get("success") != False:
-                conteudo = res_pac.json().get("content", [])
-                if conteudo:
-                    pac_data = conteudo[0] if isinstance(conteudo, list) else conteudo
-                    pac_nome = pac_data.get("nome_completo", pac_data.get("nome", pac_nome))
-                    if pac_data.get("data_nascimento"): pac_nasc = pac_data.get("data_nascimento")
-                    if pac_data.get("email1"): pac_email = pac_data.get("email1")
+
+            try:
+                pac_data = feegow.buscar_paciente(paciente_id=feegow_id)
+            except ErroFeegow:
+                pac_data = None  # segue com os dados do cadastro do robô
+            if pac_data:
+                pac_nome = pac_data.nome or pac_nome
+                if pac_data.nascimento: pac_nasc = pac_data.nascimento
+                if pac_data.bruto.get("email1"): pac_email = pac_data.bruto["email1"]
             
             payload_edit = {
                 "paciente_id": int(feegow_id),
@@ -1115,8 +1329,11 @@ def integrar_feegow(phone, info):
                     "matricula": matricula
                 })
             
-            res_edit = requests.post(f"{base_url}/patient/edit", json=payload_edit, headers=get_feegow_headers(), timeout=10)
-            print(f"[FEEGOW] Atualização de veterano (ID {feegow_id}): status={res_edit.status_code} resp={res_edit.text[:200]}", file=sys.stderr)
+            res_edit = feegow.editar_paciente(payload_edit)
+            print(f"[FEEGOW] Atualização de veterano (ID {feegow_id}): status={res_edit.status} resp={str(res_edit.dados)[:200]} cf-ray={res_edit.cf_ray or 'N/A'}", file=sys.stderr)
+            if res_edit.http_ok:
+                # celular1 agora aponta para este paciente no Feegow
+                indice_pacientes.registrar(feegow_id, pac_nome, tel=celular, cpf=cpf)
         except Exception as e:
             print(f"[FEEGOW] Erro ao atualizar veterano: {e}", file=sys.stderr)
 
@@ -1140,7 +1357,7 @@ def integrar_feegow(phone, info):
 
             if storage_url:
                 try:
-                    res_stor = requests.get(storage_url, timeout=20)
+                    res_stor = http_get(storage_url, timeout=20)
                     if res_stor.status_code == 200:
                         conteudo_bytes = res_stor.content
                         mime_type = res_stor.headers.get("Content-Type", "image/jpeg").split(";")[0].strip()
@@ -1175,11 +1392,7 @@ def integrar_feegow(phone, info):
             b64_puro = base64.b64encode(conteudo_bytes).decode("utf-8")
             data_uri = f"data:{mime_type};base64,{b64_puro}"
 
-            headers_json = {
-                "Content-Type": "application/json",
-                "x-access-token": FEEGOW_TOKEN,
-                "User-Agent": "Conectifisio-Integration/1.0"
-            }
+            headers_json = get_feegow_headers()
 
             try:
                 payload_json = {
@@ -1187,7 +1400,7 @@ def integrar_feegow(phone, info):
                     "arquivo_descricao": descricao,
                     "base64_file": data_uri
                 }
-                res = requests.post(
+                res = http_post(
                     f"{base_url}/patient/upload-base64",
                     json=payload_json,
                     headers=headers_json,
@@ -1206,7 +1419,7 @@ def integrar_feegow(phone, info):
             try:
                 ext = "jpg" if "jpeg" in mime_type else ("pdf" if "pdf" in mime_type else "jpg")
                 nome_arquivo = f"{descricao.replace(' ', '_').replace('(', '').replace(')', '')}.{ext}"
-                res_mp = requests.post(
+                res_mp = http_post(
                     f"{base_url}/patient/upload-base64",
                     files={"arquivo": (nome_arquivo, conteudo_bytes, mime_type)},
                     data={"paciente_id": str(feegow_id_int), "arquivo_descricao": descricao},
@@ -1249,12 +1462,14 @@ def integrar_feegow(phone, info):
 # ==========================================
 # INTEGRAÇÃO PORTO SEGURO — Elegibilidade via Playwright
 # ==========================================
-_porto_cache = {"token": None, "ts": 0}
 _PORTO_TOKEN_TTL = 3000  # 50 minutos
+_PORTO_LOGIN_MAX_S = 120  # browser + goto (30s) + redirecionamento (15s) + folga
+# Token compartilhado entre workers/instâncias (backend do cache) — um login Playwright por vez
+_porto_cache = Cache("porto", _PORTO_TOKEN_TTL, espera_single_flight=_PORTO_LOGIN_MAX_S)
 
 def verificar_elegibilidade_porto_seguro(cpf_paciente, tuss=None):
     """Verifica elegibilidade Porto Seguro/Itaú Saúde via portal do prestador."""
-    import sys, time, asyncio
+    import sys, asyncio
     
     if tuss is None:
         tuss = PORTO_SEGURO_TUSS_FISIO
@@ -1265,17 +1480,7 @@ def verificar_elegibilidade_porto_seguro(cpf_paciente, tuss=None):
     
     cpf_limpo = re.sub(r'\D', '', str(cpf_paciente))
     
-    async def _executar():
-        import requests as _req
-        
-        now = time.time()
-        token = _porto_cache.get("token")
-        if not token or (now - _porto_cache.get("ts", 0)) > _PORTO_TOKEN_TTL:
-            token = await _fazer_login_porto()
-            if token:
-                _porto_cache["token"] = token
-                _porto_cache["ts"] = now
-        
+    async def _executar(token):
         if not token:
             return {"erro": "Falha no login Porto Seguro"}
         
@@ -1291,12 +1496,12 @@ def verificar_elegibilidade_porto_seguro(cpf_paciente, tuss=None):
         BASE = "https://wwws.portoseguro.com.br/go-saud-jdig-prestador-api/v1"
         
         try:
-            r1 = _req.post(f"{BASE}/authorization/health-card",
+            r1 = http_post(f"{BASE}/authorization/health-card",
                 json={"cpf": cpf_limpo, "carteirinha": ""},
                 headers=headers, timeout=15)
             
             if r1.status_code in [401, 403]:
-                _porto_cache["token"] = None
+                _porto_cache.invalidar("token")
                 return {"erro": "Token expirado — tente novamente"}
             
             if r1.status_code != 200:
@@ -1312,7 +1517,7 @@ def verificar_elegibilidade_porto_seguro(cpf_paciente, tuss=None):
             plano = card.get("nomePlano", "")
             validade = card.get("validadeCartao", "")
             
-            r2 = _req.post(
+            r2 = http_post(
                 f"{BASE}/authorization/{PORTO_SEGURO_CODIGO_PRESTADOR}/elegibility-check",
                 json={"uuid": uuid, "procedimento": tuss, "regime": "2"},
                 headers=headers, timeout=15)
@@ -1383,10 +1588,19 @@ def verificar_elegibilidade_porto_seguro(cpf_paciente, tuss=None):
             print(f"[PORTO] Erro login: {e}", file=sys.stderr)
             return None
     
+    def _login_sincrono():
+        loop_login = asyncio.new_event_loop()
+        try:
+            return loop_login.run_until_complete(_fazer_login_porto())
+        finally:
+            loop_login.close()
+    
     try:
+        # Single-flight: com o token vencido só um chamador faz o login; os demais aguardam
+        token = _porto_cache.obter("token", _login_sincrono)
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
-        resultado = loop.run_until_complete(_executar())
+        resultado = loop.run_until_complete(_executar(token))
         loop.close()
         return resultado
     except Exception as e:
@@ -1490,6 +1704,8 @@ def iniciar_verificacao_porto_background(phone, cpf, numero_id):
     3. Resultado vai apenas para o Kanban — paciente não é notificado
     """
     import threading
+    # A thread lê e grava o card direto no Firestore — o estado do lote precisa estar gravado
+    _confirmar_escritas()
     t = threading.Thread(
         target=_thread_verificar_porto,
         args=(phone, cpf, numero_id),
@@ -1502,6 +1718,23 @@ def iniciar_verificacao_porto_background(phone, cpf, numero_id):
 # ==========================================
 # MENSAGERIA E IA
 # ==========================================
+_PROMPT_ACOLHIMENTO = (
+    "Você é o assistente virtual da ConectiFisio, clínica de fisioterapia em São Paulo. "
+    "O paciente acabou de descrever sua queixa ou motivo de contato. "
+    "Responda com UMA frase curta de acolhimento empático (máximo 2 linhas), "
+    "reconhecendo a situação do paciente de forma calorosa e humana. "
+    "NÃO ofereça informações sobre convênios, valores ou procedimentos. "
+    "NÃO faça perguntas. Apenas acolha."
+)
+
+def _mensagens_acolhimento(query):
+    return [{"role": "system", "content": _PROMPT_ACOLHIMENTO}, {"role": "user", "content": query[:300]}]
+
+def chamar_ia_custom_async(query):
+    """Dispara o acolhimento em paralelo (Future). Usado pelo webhook antes do despacho
+    dos estados com acolhimento=True; chamar_ia_custom(query) depois pega o resultado."""
+    return llm.completar_async("acolhimento", _mensagens_acolhimento(query), max_tokens=80, temperature=0.3, timeout=15)
+
 def chamar_ia_custom(query):
     """
     Chama o modelo BASE gpt-4o-mini para acolhimento empático de queixas.
@@ -1509,76 +1742,93 @@ def chamar_ia_custom(query):
     ele foi treinado para FAQ e gera respostas inadequadas para acolhimento.
     Gemini removido — se OpenAI falhar, retorna None (fallback estático no código).
     """
-    if not OPENAI_API_KEY:
-        return None
-
-    system_prompt = (
-        "Você é o assistente virtual da ConectiFisio, clínica de fisioterapia em São Paulo. "
-        "O paciente acabou de descrever sua queixa ou motivo de contato. "
-        "Responda com UMA frase curta de acolhimento empático (máximo 2 linhas), "
-        "reconhecendo a situação do paciente de forma calorosa e humana. "
-        "NÃO ofereça informações sobre convênios, valores ou procedimentos. "
-        "NÃO faça perguntas. Apenas acolha."
-    )
-    url = "https://api.openai.com/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {OPENAI_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "model": "gpt-4o-mini",
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": query[:300]}
-        ],
-        "max_tokens": 80,
-        "temperature": 0.3
-    }
-    try:
-        res = requests.post(url, json=payload, headers=headers, timeout=15)
-        if res.status_code == 200:
-            resposta = res.json().get('choices', [{}])[0].get('message', {}).get('content', '').strip()
-            import sys
-            print(f"[ACOLHIMENTO] '{resposta[:80]}'", file=sys.stderr)
-            return resposta
-    except Exception as e:
-        import sys
-        print(f"[ACOLHIMENTO] Erro OpenAI: {e}", file=sys.stderr)
-    return None
+    import sys
+    antecipado = getattr(_thread_local, "acolhimento", None)
+    _thread_local.acolhimento = None
+    # Queixa reconhecida pelas palavras-chave → frase curada, sem ir à OpenAI
+    if ACOLHIMENTO_LOCAL:
+        local = acolhimento_local(query)
+        if local:
+            print(f"[ACOLHIMENTO] Local ({classificar_queixa(query)}): '{local[:80]}'", file=sys.stderr)
+            return local
+    if antecipado and antecipado[0] == query:
+        try:
+            resta = orcamento_restante()
+            resposta = antecipado[1].result(timeout=max(resta, 0) if resta is not None else None)
+        except Exception as e:
+            print(f"[ACOLHIMENTO] Chamada antecipada não concluiu: {e}", file=sys.stderr)
+            return None
+    else:
+        resposta = llm.completar("acolhimento", _mensagens_acolhimento(query), max_tokens=80, temperature=0.3, timeout=15)
+    if resposta:
+        print(f"[ACOLHIMENTO] '{resposta[:80]}'", file=sys.stderr)
+    return resposta
 
 def enviar_whatsapp(to, payload_msg, numero_id=None):
     """Envia mensagem pelo número correto."""
     pid = numero_id or getattr(_thread_local, "numero_id", None) or PHONE_NUMBER_ID
+    return _post_graph(pid, to, payload_msg)
+
+def _post_graph(pid, to, payload_msg):
     url = f"https://graph.facebook.com/v19.0/{pid}/messages"
     headers = {"Authorization": f"Bearer {WHATSAPP_TOKEN}", "Content-Type": "application/json"}
     payload = {"messaging_product": "whatsapp", "to": to, **payload_msg}
-    try: return requests.post(url, json=payload, headers=headers, timeout=10)
+    try: return http_post(url, json=payload, headers=headers, timeout=10)
     except: return None
 
-def responder_texto(to, texto, remetente="robo", numero_id=None):
-    registrar_historico(to, remetente, "texto", texto)
-    return enviar_whatsapp(to, {"type": "text", "text": {"body": texto}}, numero_id=numero_id)
+def _gravar_historico_lote(itens):
+    """Grava [(phone, msg)] da fila de envio num único batch: as mensagens na
+    subcoleção + um lastInteraction por card tocado."""
+    if not db: return
+    batch = db.batch()
+    for phone, nova_msg in itens:
+        batch.set(historico_mensagens.referencia_nova_mensagem(db, phone), nova_msg)
+    telefones = list(dict.fromkeys(phone for phone, _ in itens))
+    for phone in telefones:
+        batch.set(db.collection("PatientsKanban").document(phone), {"lastInteraction": firestore.SERVER_TIMESTAMP}, merge=True)
+    batch.commit()
+    for phone, nova_msg in itens:
+        _eventos_dashboard.publicar("mensagem", {"phone": phone, "mensagem": nova_msg})
+    for phone in telefones:
+        _publicar_card(phone, {"lastInteraction": firestore.SERVER_TIMESTAMP})
+
+# Fila de saída (ver fila_envio.py) — só com ENVIO_ASSINCRONO=1
+_fila_envio = FilaEnvio(_post_graph, _gravar_historico_lote) if ENVIO_ASSINCRONO else None
+
+def _enviar_mensagem(to, payload_msg, remetente, texto_historico, numero_id=None, atraso=0):
+    """Caminho comum das funções de envio do robô: registra no histórico e envia.
+    `atraso` = segundos de pausa desde a mensagem anterior ao mesmo paciente."""
+    if _fila_envio:
+        pid = numero_id or getattr(_thread_local, "numero_id", None) or PHONE_NUMBER_ID
+        nova_msg = historico_mensagens.nova_mensagem(remetente, "texto", texto_historico)
+        _fila_envio.enfileirar(pid, to, payload_msg, historico=(to, nova_msg), atraso=atraso)
+        return None
+    if atraso:
+        time.sleep(atraso)
+    registrar_historico(to, remetente, "texto", texto_historico)
+    return enviar_whatsapp(to, payload_msg, numero_id=numero_id)
+
+def responder_texto(to, texto, remetente="robo", numero_id=None, atraso=0):
+    return _enviar_mensagem(to, {"type": "text", "text": {"body": texto}}, remetente, texto,
+                            numero_id=numero_id, atraso=atraso)
 
-def enviar_botoes(to, texto, botoes, numero_id=None):
-    registrar_historico(to, "robo", "texto", texto)
-    return enviar_whatsapp(to, {
+def enviar_botoes(to, texto, botoes, numero_id=None, atraso=0):
+    return _enviar_mensagem(to, {
         "type": "interactive",
         "interactive": {"type": "button", "body": {"text": texto}, "action": {"buttons": [{"type": "reply", "reply": {"id": b["id"], "title": b["title"][:20]}} for b in botoes]}}
-    }, numero_id=numero_id)
+    }, "robo", texto, numero_id=numero_id, atraso=atraso)
 
-def enviar_lista(to, texto, titulo_botao, secoes, numero_id=None):
-    registrar_historico(to, "robo", "texto", texto)
-    return enviar_whatsapp(to, {
+def enviar_lista(to, texto, titulo_botao, secoes, numero_id=None, atraso=0):
+    return _enviar_mensagem(to, {
         "type": "interactive",
         "interactive": {"type": "list", "body": {"text": texto}, "action": {"button": titulo_botao[:20], "sections": secoes}}
-    }, numero_id=numero_id)
+    }, "robo", texto, numero_id=numero_id, atraso=atraso)
 
-def enviar_localizacao(to, unidade, numero_id=None):
+def enviar_localizacao(to, unidade, numero_id=None, atraso=0):
     """Envia mini mapa nativo do WhatsApp com a localização da unidade.
     🛡️ Ver mapa_fluxos.md → Mensagem de confirmação pós-agendamento."""
     info = UNIDADES.get(unidade, UNIDADES["Ipiranga"])
-    registrar_historico(to, "robo", "texto", f"📍 Localização: {info['nome_oficial']}")
-    return enviar_whatsapp(to, {
+    return _enviar_mensagem(to, {
         "type": "location",
         "location": {
             "latitude": str(info["lat"]),
@@ -1586,7 +1836,7 @@ def enviar_localizacao(to, unidade, numero_id=None):
             "name": info["nome_oficial"],
             "address": info["endereco"]
         }
-    }, numero_id=numero_id)
+    }, "robo", f"📍 Localização: {info['nome_oficial']}", numero_id=numero_id, atraso=atraso)
 
 # ==========================================
 # PROXY DE MÍDIA — Visualização de imagens do WhatsApp no Dashboard
@@ -1601,12 +1851,12 @@ def media_proxy():
     try:
         url_info = f"https://graph.facebook.com/v19.0/{media_id}"
         headers_wa = {"Authorization": f"Bearer {WHATSAPP_TOKEN}"}
-        res_info = requests.get(url_info, headers=headers_wa, timeout=10)
+        res_info = http_get(url_info, headers=headers_wa, timeout=10)
         if res_info.status_code != 200:
             return jsonify({"error": "Mídia não encontrada"}), 404
         media_url = res_info.json().get("url")
         mime_type = res_info.json().get("mime_type", "image/jpeg")
-        res_download = requests.get(media_url, headers=headers_wa, timeout=15)
+        res_download = http_get(media_url, headers=headers_wa, timeout=15)
         if res_download.status_code != 200:
             return jsonify({"error": "Falha ao baixar mídia"}), 502
         from flask import Response
@@ -1621,6 +1871,8 @@ def media_proxy():
 # ==========================================
 # WEBHOOK PRINCIPAL
 # ==========================================
+_interruptor_robo = InterruptorRobo(Cache("config", ROBO_FLAG_TTL))
+
 @app.route("/api/robo/status", methods=["GET", "POST", "OPTIONS"])
 def robo_status():
     if request.method == "OPTIONS":
@@ -1637,6 +1889,7 @@ def robo_status():
             data = request.get_json()
             robo_on = data.get("robo_ligado", True)
             config_ref.set({"robo_ligado": robo_on}, merge=True)
+            _interruptor_robo.definir(robo_on)
             import sys
             print(f"[EMERGENCIA] Robô {'LIGADO' if robo_on else 'DESLIGADO'} globalmente", file=sys.stderr)
             return jsonify({"robo_ligado": robo_on, "ok": True}), 200
@@ -1644,6 +1897,32 @@ def robo_status():
         return jsonify({"error": str(e)}), 500
 
 
+def _serializar_card(doc_id, data):
+    data["id"] = doc_id
+    if "lastInteraction" in data and data["lastInteraction"]:
+        try:
+            ts = data["lastInteraction"]
+            iso = ts.isoformat()
+            if '+' not in iso and 'Z' not in iso:
+                iso = iso.split('.')[0] + '+00:00'
+            data["lastInteraction"] = iso
+        except: data["lastInteraction"] = str(data["lastInteraction"])
+    return data
+
+def listar_cards_kanban(status_filtro=(), limite=0):
+    """Cards do Kanban só com os campos de CAMPOS_CARD_KANBAN (projeção no servidor).
+    status + limite juntos exigem índice composto (status, lastInteraction desc)."""
+    query = db.collection("PatientsKanban").select(CAMPOS_CARD_KANBAN)
+    if status_filtro:
+        query = query.where("status", "in", list(status_filtro))
+    if limite:
+        query = query.order_by("lastInteraction", direction=firestore.Query.DESCENDING).limit(limite)
+    return [_serializar_card(doc.id, doc.to_dict()) for doc in query.stream()]
+
+_estado_kanban = EstadoKanban(
+    lambda doc_id, data: _serializar_card(doc_id, {k: data[k] for k in CAMPOS_CARD_KANBAN if k in data})
+)
+
 @app.route("/api/whatsapp", methods=["GET", "POST", "OPTIONS"])
 def webhook():
     if request.method == "OPTIONS":
@@ -1653,40 +1932,34 @@ def webhook():
         if request.args.get("hub.verify_token") == VERIFY_TOKEN: return request.args.get("hub.challenge"), 200
             
         if request.args.get("action") == "get_patients":
+            # Filtros opcionais: ?status=triagem,pausado (até 30) e ?limite=N (mais recentes primeiro)
             try:
-                import time
                 if not db: return jsonify({"error": "Erro DB"}), 500
-                now = time.time()
-                if _patients_cache["data"] is not None and (now - _patients_cache["ts"]) < _CACHE_TTL:
-                    return jsonify({"items": _patients_cache["data"], "cached": True}), 200
+                status_filtro = tuple(s_ for s_ in request.args.get("status", "").split(",") if s_)[:30]
+                limite = int(request.args.get("limite", 0) or 0)
+                # Sincronização incremental (?since=<cursor>, "" = primeira carga): servida do
+                # estado mantido pelo listener on_snapshot — zero leituras por poll
+                since = request.args.get("since")
+                if since is not None and limite:
+                    # "os N mais recentes" não tem delta: um card sai da janela sem ter mudado
+                    return jsonify({"error": "limite não é suportado junto com since"}), 400
+                if since is not None and _estado_kanban.iniciar(db):
+                    resposta = _estado_kanban.delta(since, status_filtro) or _estado_kanban.completo(status_filtro)
+                    return jsonify(resposta), 200
+                chave_cache = f"{','.join(status_filtro)}|{limite}"
                 try:
-                    docs = db.collection("PatientsKanban").stream()
-                    patients = []
-                    for doc in docs:
-                        data = doc.to_dict()
-                        data["id"] = doc.id
-                        # Remove historico do payload do kanban — reduz resposta de MB para KB
-                        # O historico completo só é carregado quando a recepção abre um card específico
-                        data.pop("historico", None)
-                        data.pop("carteirinha_b64", None)
-                        data.pop("pedido_b64", None)
-                        if "lastInteraction" in data and data["lastInteraction"]:
-                            try:
-                                ts = data["lastInteraction"]
-                                iso = ts.isoformat()
-                                if '+' not in iso and 'Z' not in iso:
-                                    iso = iso.split('.')[0] + '+00:00'
-                                data["lastInteraction"] = iso
-                            except: data["lastInteraction"] = str(data["lastInteraction"])
-                        patients.append(data)
-                    _patients_cache["data"] = patients
-                    _patients_cache["ts"] = now
-                    return jsonify({"items": patients}), 200
+                    patients, origem = _patients_cache.obter_com_origem(
+                        chave_cache,
+                        lambda: listar_cards_kanban(status_filtro, limite),
+                        fallback_em=lambda e: any(t in str(e) for t in ("429", "Quota", "RESOURCE_EXHAUSTED"))
+                    )
                 except Exception as e_firestore:
-                    err_str = str(e_firestore)
-                    if ("429" in err_str or "Quota" in err_str or "RESOURCE_EXHAUSTED" in err_str) and _patients_cache["data"] is not None:
-                        return jsonify({"items": _patients_cache["data"], "cached": True, "quota_warning": True}), 200
-                    return jsonify({"error": err_str}), 500
+                    return jsonify({"error": str(e_firestore)}), 500
+                if origem == "fallback":
+                    return jsonify({"items": patients, "cached": True, "quota_warning": True}), 200
+                if origem in ("cache", "obsoleto"):
+                    return jsonify({"items": patients, "cached": True}), 200
+                return jsonify({"items": patients}), 200
             except Exception as e: return jsonify({"error": str(e)}), 500
 
         if request.args.get("action") == "get_historico":
@@ -1694,12 +1967,13 @@ def webhook():
                 phone = request.args.get("phone")
                 if not phone or not db:
                     return jsonify({"error": "phone obrigatório"}), 400
-                doc = db.collection("PatientsKanban").document(phone).get()
-                if not doc.exists:
-                    return jsonify({"historico": [], "found": False}), 200
-                data = doc.to_dict()
-                historico = data.get("historico", [])
-                return jsonify({"historico": historico, "found": True}), 200
+                # Paginação por cursor: ?limite=200&antes=<cursor da página anterior>
+                historico, cursor = historico_mensagens.listar_mensagens(
+                    db, phone,
+                    limite=request.args.get("limite", historico_mensagens.LIMITE_PADRAO),
+                    antes=request.args.get("antes") or None
+                )
+                return jsonify({"historico": historico, "found": bool(historico), "cursor": cursor}), 200
             except Exception as e:
                 return jsonify({"error": str(e)}), 500
 
@@ -1710,13 +1984,13 @@ def webhook():
                 resolvido_por = request.args.get("resolvido_por", "Recepção")
                 if not phone:
                     return jsonify({"success": False}), 400
-                db.collection("PatientsKanban").document(phone).set({
+                _gravar_paciente(phone, {  # grava e avisa os dashboards (SSE)
                     "precisa_recepcao": False,
                     "bot_pausado_recepcao": False,
                     "motivo_recepcao": "",
                     "resolvido_recepcao_por": resolvido_por,
                     "resolvido_recepcao_em": datetime.utcnow().strftime('%d/%m/%Y %H:%M')
-                }, merge=True)
+                })
                 return jsonify({"success": True}), 200
             except Exception as e:
                 return jsonify({"error": str(e)}), 500
@@ -1752,7 +2026,7 @@ def webhook():
                         update_fields["historico_atendentes"] = firestore.ArrayUnion([entrada_ap])
                     except: pass
                 if update_fields:
-                    db.collection("PatientsKanban").document(phone).set(update_fields, merge=True)
+                    _gravar_paciente(phone, update_fields)  # grava e avisa os dashboards (SSE)
                     return jsonify({"success": True}), 200
                 return jsonify({"success": False}), 400
             except Exception as e: return jsonify({"error": str(e)}), 500
@@ -1770,12 +2044,20 @@ def webhook():
                 dias = int(request.args.get("dias", 7))
                 desde = agora - timedelta(days=dias)
                 
-                docs = db.collection("PatientsKanban").stream()
+                # Só os campos do resumo + array legado (cards ainda não migrados);
+                # as mensagens novas vêm da subcoleção de quem teve atividade no período
+                docs = db.collection("PatientsKanban").select(
+                    ["title", "status", "servico", "modalidade", "convenio", "lastInteraction", "historico"]
+                ).stream()
                 conversas = []
+                desde_iso = desde.strftime('%Y-%m-%dT%H:%M:%S+00:00')
                 
                 for doc in docs:
                     p = doc.to_dict()
                     historico = p.get("historico", [])
+                    ultima = p.get("lastInteraction")
+                    if hasattr(ultima, "timestamp") and ultima.timestamp() >= desde.timestamp():
+                        historico = historico + historico_mensagens.mensagens_desde(db, doc.id, desde_iso)
                     if not historico:
                         continue
                     
@@ -2207,15 +2489,12 @@ def webhook():
                     )
 
                 responder_texto(phone_p, msg_recomendacao)
-                import time as _t2
-                _t2.sleep(1)
-                # 🛡️ Dica específica da unidade + mini mapa nativo
+                # 🛡️ Dica específica da unidade + mini mapa nativo, 1s entre mensagens
                 # (ver mapa_fluxos.md → Mensagem de confirmação pós-agendamento)
                 dica = info_unidade.get("dica_chegada", "")
                 if dica:
-                    responder_texto(phone_p, dica)
-                    _t2.sleep(1)
-                enviar_localizacao(phone_p, unidade_p)
+                    responder_texto(phone_p, dica, atraso=1)
+                enviar_localizacao(phone_p, unidade_p, atraso=1)
 
                 return jsonify({"ok": True, "enviado": True}), 200
             except Exception as e:
@@ -2226,21 +2505,136 @@ def webhook():
     # --- POST: RECEBER MENSAGENS WHATSAPP ---
     data = request.get_json()
     if not data or "entry" not in data: return jsonify({"status": "ok"}), 200
-    
-    if db:
-        try:
-            config_doc = db.collection("Config").document("global").get()
-            if config_doc.exists and config_doc.to_dict().get("robo_ligado") == False:
-                import sys
-                print("[EMERGENCIA] Robô desligado globalmente — mensagem ignorada", file=sys.stderr)
-                return jsonify({"status": "robo_desligado"}), 200
-        except: pass
 
-    try:
-        val = data["entry"][0]["changes"][0]["value"]
-        if "messages" not in val: return jsonify({"status": "not_a_message"}), 200
+    # Modo assíncrono: enfileira e responde 200 na hora — a Meta não reenvia por timeout
+    # (ver fila_webhook.py). Se o shard estiver cheio, cai no processamento inline.
+    if WEBHOOK_ASSINCRONO:
+        # Uma parte por telefone: cada paciente vai para o seu shard, na ordem de chegada
+        for phone, parte in dividir_por_telefone(data):
+            if not _pool_webhook.enfileirar(phone, parte):
+                processar_webhook_whatsapp(parte)
+        return jsonify({"status": "enfileirado"}), 200
+
+    return processar_webhook_whatsapp(data)
+
+
+def _processar_item_fila(data):
+    """Executado no thread do worker da fila — jsonify precisa de app context."""
+    with app.app_context():
+        processar_webhook_whatsapp(data)
+
+def _desistir_item_fila(data):
+    """Item esgotou as tentativas na fila: os wamids deixam de contar como processados."""
+    mensagens_por_telefone, _ = extrair_eventos_webhook(data)
+    for itens in mensagens_por_telefone.values():
+        for message, _ in itens:
+            _dedupe_mensagens.liberar(message.get("id"))
+
+_pool_webhook = PoolWebhook(_processar_item_fila, ao_desistir=_desistir_item_fila)
+
+
+def processar_webhook_whatsapp(data):
+    """Processa um payload do webhook (inline no request ou a partir da fila)."""
+    mensagens_por_telefone, statuses = extrair_eventos_webhook(data)
+    # Reentregas da Meta (mesmo wamid) saem aqui — antes do Config/global e do get_paciente
+    for phone in list(mensagens_por_telefone):
+        novas = [item for item in mensagens_por_telefone[phone]
+                 if not _dedupe_mensagens.ja_processada(item[0].get("id"))]
+        if len(novas) < len(mensagens_por_telefone[phone]):
+            import sys
+            print(f"[DEDUPE] {len(mensagens_por_telefone[phone]) - len(novas)} reentrega(s) ignorada(s) de {phone}", file=sys.stderr)
+        if novas:
+            mensagens_por_telefone[phone] = novas
+        else:
+            del mensagens_por_telefone[phone]
+    if not mensagens_por_telefone and not statuses:
+        return jsonify({"status": "duplicada"}), 200
+
+    # Interruptor global em memória (listener no Config/global — ver interruptor_robo.py)
+    if not _interruptor_robo.ligado(db):
+        import sys
+        print("[EMERGENCIA] Robô desligado globalmente — mensagem ignorada", file=sys.stderr)
+        return jsonify({"status": "robo_desligado"}), 200
 
-        message = val["messages"][0]
+    for st in statuses:
+        try:
+            processar_status_whatsapp(st)
+        except Exception:
+            print(f"❌ Erro status de entrega: {traceback.format_exc()}")
+
+    if not mensagens_por_telefone:
+        return jsonify({"status": "not_a_message"}), 200
+
+    # Lote por paciente: o documento é lido uma vez, as mensagens seguintes do mesmo
+    # telefone reaproveitam o estado em memória (atualizado a cada gravação) e todas as
+    # escritas do lote saem num único commit (ver unidade_trabalho.py)
+    # Exceção no meio do payload: só os wamids que nem começaram são liberados no dedupe
+    # (os já processados podem ter respondido o paciente) e a exceção sobe — inline vira
+    # HTTP 500 e a Meta reentrega; na fila, o worker repete o item
+    resposta = None
+    nao_iniciadas = [message.get("id") for itens in mensagens_por_telefone.values() for message, _ in itens]
+    try:
+        for phone, itens in mensagens_por_telefone.items():
+            _thread_local.lote_pacientes = {}
+            _thread_local.unidade_trabalho = UnidadeTrabalho(db) if db else None
+            try:
+                for message, val in itens:
+                    iniciar_orcamento()  # prazo total das chamadas ao LLM desta mensagem
+                    _thread_local.acolhimento = None
+                    nao_iniciadas.remove(message.get("id"))
+                    resposta = processar_mensagem_whatsapp(message, val)
+            finally:
+                encerrar_orcamento()
+                _thread_local.acolhimento = None
+                try:
+                    _confirmar_escritas()
+                except Exception:
+                    print(f"❌ Erro gravando lote de {phone}: {traceback.format_exc()}")
+                _thread_local.unidade_trabalho = None
+                _thread_local.lote_pacientes = None
+    except Exception:
+        for msg_id in nao_iniciadas:
+            _dedupe_mensagens.liberar(msg_id)
+        raise
+    return resposta
+
+
+def extrair_eventos_webhook(data):
+    """Percorre TODAS as entries/changes do payload (a Meta agrupa entregas sob carga).
+    Retorna ({telefone: [(message, value), ...]}, [statuses]) preservando a ordem de chegada."""
+    por_telefone = {}
+    statuses = []
+    for entry in data.get("entry", []) or []:
+        for change in entry.get("changes", []) or []:
+            val = change.get("value", {}) or {}
+            for message in val.get("messages", []) or []:
+                if message.get("from"):
+                    por_telefone.setdefault(message["from"], []).append((message, val))
+            statuses.extend(val.get("statuses", []) or [])
+    for phone in por_telefone:
+        por_telefone[phone].sort(key=lambda item: int(item[0].get("timestamp") or 0))
+    return por_telefone, statuses
+
+
+def processar_status_whatsapp(st):
+    """Callback de entrega (sent/delivered/read/failed). Só falhas vão para o card —
+    gravar cada 'delivered'/'read' triplicaria as escritas por mensagem enviada."""
+    import sys
+    phone = st.get("recipient_id")
+    if st.get("status") != "failed" or not phone:
+        return
+    erro = (st.get("errors") or [{}])[0]
+    print(f"[STATUS-ENVIO] Falha na entrega {st.get('id')} para {phone}: {erro.get('code')} {erro.get('title', '')}", file=sys.stderr)
+    _gravar_paciente(phone, {"falha_envio": {
+        "codigo": erro.get("code"),
+        "motivo": erro.get("title", ""),
+        "data": datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S+00:00')
+    }})
+
+
+def processar_mensagem_whatsapp(message, val):
+    """Fluxo completo de UMA mensagem recebida (val = value da change de origem)."""
+    try:
         phone = message["from"]
         msg_type = message.get("type")
         numero_id = val.get("metadata", {}).get("phone_number_id") or PHONE_NUMBER_ID
@@ -2272,6 +2666,13 @@ def webhook():
             tem_anexo = True
             media_id = message.get(msg_type, {}).get("id")
 
+        # Estados que respondem com acolhimento do LLM: a chamada sai já, em paralelo com
+        # histórico, card e verificações globais — o handler recebe o resultado em chamar_ia_custom.
+        # Queixas que o acolhimento local reconhece não precisam da chamada.
+        if msg_type == "text" and registro_estados.pede_acolhimento(status_atual) and \
+                not (ACOLHIMENTO_LOCAL and classificar_queixa(msg_recebida)):
+            _thread_local.acolhimento = (msg_recebida, chamar_ia_custom_async(msg_recebida))
+
         if tem_anexo and media_id:
             registrar_historico(phone, "paciente", "anexo", msg_recebida, media_id=media_id)
         else:
@@ -2280,29 +2681,25 @@ def webhook():
         agora_iso = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S+00:00')
         # Reset contador de FAQ loops quando o paciente clica botão (interagiu com o fluxo)
         reset_faq = {"faq_calls_seguidas": 0} if msg_type == "interactive" else {}
-        db.collection("PatientsKanban").document(phone).set(
+        _gravar_paciente(phone,
             {"lastPatientInteraction": agora_iso,
              "numero_id": numero_id,
              **reset_faq,
-             **(({"followup_toque": 0, "followup_retomado_em": agora_iso}) if info.get("followup_toque", 0) > 0 else {})},
-            merge=True)
+             **(({"followup_toque": 0, "followup_retomado_em": agora_iso}) if info.get("followup_toque", 0) > 0 else {})})
 
         msg_limpa = msg_recebida.lower()
+        intencoes = analisar_intencoes(msg_recebida)
 
-        _cortesias_early = ["obrigad", "obg", "ok", "valeu", "certo", "tá bom", "perfeito", "beleza", "show", "combinado", "agradeço", "ótimo", "otimo", "maravilh", "excelente", "muito bom", "legal", "entendi", "entendido", "claro"]
-        _emojis_early = ["👍", "🙏", "❤️", "👏", "😊", "🥰", "💙", "💚", "🤝", "✅"]
         is_cortesia = len(msg_limpa) <= 35 and (
-            any(msg_limpa.startswith(w) for w in _cortesias_early) or
-            any(char in msg_limpa for char in _emojis_early)
+            intencoes.inicia("cortesia") or intencoes.contem("cortesia_emoji")
         )
 
         # Definição antecipada — usado pelo FAQ e pelo fluxo principal
         is_veteran = True if info.get("feegow_id") else False
 
-        palavras_insta = ["interesse", "informações", "informacoes", "pilates"]
         eh_lead_instagram = (
             msg_type == "text" and
-            sum(1 for p in palavras_insta if p in msg_limpa) >= 2 and
+            intencoes.distintos("instagram") >= 2 and
             not info.get("origem")
         )
         if eh_lead_instagram:
@@ -2322,8 +2719,7 @@ def webhook():
             responder_texto(phone, msg_boas_vindas)
             return jsonify({"status": "instagram_lead_capturado"}), 200
 
-        palavras_socorro = ["ajuda", "humano", "atendente", "recepção", "recepcao", "falar com alguém", "pessoa"]
-        if any(palavra in msg_limpa for palavra in palavras_socorro):
+        if intencoes.contem("socorro"):
             update_paciente(phone, {"status": "pausado", "ultima_mensagem_paciente": f"[PEDIDO DE AJUDA] {msg_recebida}"})
             responder_texto(phone, "Entendido! Pausei o meu sistema automático e já avisei a nossa equipa. 🚨 Em instantes um atendente humano vai assumir esta conversa para te ajudar!")
             return jsonify({"status": "pedido_ajuda"}), 200
@@ -2403,7 +2799,7 @@ def webhook():
         # NÃO vai para Intervenção — mantém card na coluna comercial
         # ============================================================
         if msg_type == "text" and not is_cortesia:
-            kw_recepcao = detectar_pedido_recepcao(msg_recebida)
+            kw_recepcao = detectar_pedido_recepcao(msg_recebida, intencoes)
             if kw_recepcao:
                 import sys
                 print(f"[RECEPCAO] Detectado '{kw_recepcao}' em: {msg_recebida[:60]}", file=sys.stderr)
@@ -2415,10 +2811,7 @@ def webhook():
         # SAUDAÇÃO PURA EM TRIAGEM → vai direto pedir o nome
         # Evita que "Olá" caia no FAQ e sequestre o fluxo do novo paciente
         # ============================================================
-        _saudacoes_puras = ["oi", "olá", "ola", "bom dia", "boa tarde", "boa noite",
-                           "oi!", "olá!", "ola!", "bom dia!", "boa tarde!", "boa noite!",
-                           "oii", "oiii", "ei", "alô", "alo", "hey", "hi", "hello"]
-        eh_saudacao_pura = msg_limpa.strip().rstrip(".!?,") in _saudacoes_puras
+        eh_saudacao_pura = intencoes.exato("saudacao")
         if eh_saudacao_pura and status_atual == "triagem" and not is_veteran:
             import sys
             print(f"[SAUDACAO→NOME] Novo paciente saudação → pede nome direto", file=sys.stderr)
@@ -2446,7 +2839,7 @@ def webhook():
         )
 
         if msg_type == "text" and len(msg_limpa) > 3 and not is_cortesia and not msg_so_numeros_simbolos and (status_atual in STATUSES_FAQ_PERMITIDOS or status_atual in STATUSES_FAQ_COM_RETOMADA):
-            resposta_faq, motivo_filtro = consultar_faq(msg_recebida)
+            resposta_faq, motivo_filtro = consultar_faq(msg_recebida, intencoes)
 
             # CASO ESPECIAL 1: paciente pediu massagem → redireciona para Liberação Miofascial
             if motivo_filtro == "massagem":
@@ -2650,8 +3043,7 @@ def webhook():
             enviar_botoes(phone, "Olá! ✨ Que bom ter você de volta.\n\nPara iniciarmos, em qual unidade você deseja ser atendido?", [{"id": "u1", "title": "São Caetano"}, {"id": "u2", "title": "Ipiranga"}])
             return jsonify({"status": "reativacao_arquivado"}), 200
         
-        estados_anexo = ["foto_carteirinha", "foto_pedido_medico", "pilates_caixa_foto_cart", "pilates_caixa_foto_pedido"]
-        if tem_anexo and status not in estados_anexo:
+        if tem_anexo and not registro_estados.aceita_anexo(status):
             responder_texto(phone, "❌ Por favor, responda com *texto* ou clique nos botões. Ainda não é o momento de enviar arquivos.")
             return jsonify({"status": "anexo_bloqueado"}), 200
 
@@ -2698,1793 +3090,70 @@ def webhook():
              return jsonify({"status": "retomada_confirmada"}), 200
 
         # ==========================================
-        # LÓGICA DE ESTADOS
+        # LÓGICA DE ESTADOS (handlers em estados/, ver maquina_estados.py)
         # ==========================================
-        if status == "instagram_pilates_q1":
-            update_paciente(phone, {
-                "status": "instagram_pilates_q2",
-                "instagram_resp_q1": msg_recebida,
-                "followup_toque": 0
-            })
-            responder_texto(phone, "Que ótimo! E qual o seu principal objetivo com o Pilates?")
-            return jsonify({"status": "instagram_q1_respondida"}), 200
-
-        elif status == "instagram_pilates_q2":
-            nome_lead = info.get("title", "").split()[0] if info.get("title") else ""
-            saudacao = f"Perfeito{', ' + nome_lead if nome_lead else ''}! 💙 " if nome_lead else "Perfeito! 💙 "
-            update_paciente(phone, {
-                "status": "atendimento_humano",
-                "instagram_resp_q2": msg_recebida,
-                "followup_toque": 0
-            })
-            responder_texto(phone, (
-                f"{saudacao}Registrei suas informações. "
-                f"Nossa equipe especializada vai entrar em contato em breve "
-                f"para te apresentar as melhores opções de Pilates Estúdio. 😊"
-            ))
-            return jsonify({"status": "instagram_lead_qualificado"}), 200
-
-        if status == "triagem":
-            if info.get("faq_encaminhou"):
-                # Veterano volta direto ao menu, sem pedir unidade
-                if is_veteran:
-                    nome_salvo = info.get("title", "Paciente").split()[0]
-                    update_paciente(phone, {"status": "menu_veterano", "faq_encaminhou": False})
-                    secoes = [{"title": "Como posso ajudar?", "rows": [{"id": "v1", "title": "🗓️ Meus Agendamentos"}, {"id": "v2", "title": "🔄 Nova Guia/Tratamento"}, {"id": "v3", "title": "➕ Novo Serviço"}, {"id": "v5", "title": "🔑 Enviar Token"}, {"id": "v4", "title": "📁 Secretaria"}]}]
-                    enviar_lista(phone, f"Olá, {nome_salvo}! 😊 Como posso te ajudar?", "Ver Opções", secoes)
-                    return jsonify({"status": "veterano_faq_para_menu"}), 200
-                # Novo paciente: pede NOME (não pede unidade ainda)
-                update_paciente(phone, {"status": "cadastrando_nome", "faq_encaminhou": False})
-                responder_texto(phone,
-                    "Olá! ✨ Seja muito bem-vindo(a) à Conectifisio.\n\n"
-                    "Para iniciarmos seu atendimento, como você gostaria de ser chamado(a)? 😊"
-                )
-                return jsonify({"status": "faq_para_fluxo_nome"}), 200
-
-            # Veterano: pula direto pro menu
-            if is_veteran:
-                import sys as _sys_vet
-                nome_salvo = info.get("title", "Paciente").split()[0]
-                unidade_salva = info.get("unit", "")
-                try:
-                    res_ag_vet = consultar_agenda_feegow(info.get("feegow_id"), retornar_raw=True)
-                    if res_ag_vet and res_ag_vet.get("agendamentos"):
-                        unidade_real_vet = res_ag_vet["agendamentos"][0].get("unidade", "")
-                        if unidade_real_vet and unidade_real_vet != unidade_salva:
-                            unidade_salva = unidade_real_vet
-                            print(f"[VETERAN-UNIT] Unidade atualizada para {unidade_salva}", file=_sys_vet.stderr)
-                except Exception as e_vet:
-                    print(f"[VETERAN-UNIT] Erro: {e_vet}", file=_sys_vet.stderr)
-                update_paciente(phone, {"status": "menu_veterano", "unit": unidade_salva})
-                secoes = [{"title": "Como posso ajudar?", "rows": [{"id": "v1", "title": "🗓️ Meus Agendamentos"}, {"id": "v2", "title": "🔄 Nova Guia/Tratamento"}, {"id": "v3", "title": "➕ Novo Serviço"}, {"id": "v5", "title": "🔑 Enviar Token"}, {"id": "v4", "title": "📁 Secretaria"}]}]
-                unid_txt = f" (unidade {unidade_salva})" if unidade_salva else ""
-                enviar_lista(phone, f"Olá, {nome_salvo}! ✨ Que bom ter você de volta{unid_txt}. Como posso te ajudar hoje?", "Ver Opções", secoes)
-                return jsonify({"status": "veterano_menu_direto"}), 200
-
-            # NOVO PACIENTE: pede o NOME ANTES de qualquer outra coisa
-            update_paciente(phone, {"status": "cadastrando_nome"})
-            if info.get("is_historico"):
-                responder_texto(phone,
-                    "Olá! ✨ Que bom ter você de volta à Conectifisio.\n\n"
-                    "Para iniciarmos seu atendimento, como você gostaria de ser chamado(a)? 😊"
-                )
-            else:
-                responder_texto(phone,
-                    "Olá! ✨ Seja muito bem-vindo(a) à Conectifisio.\n\n"
-                    "Para iniciarmos seu atendimento, como você gostaria de ser chamado(a)? 😊"
-                )
-
-        elif status == "escolhendo_unidade":
-            # Mantido para retrocompatibilidade quando volta ao Menu pelo retomar_fluxo
-            if msg_recebida not in ["São Caetano", "Ipiranga"]:
-                 enviar_botoes(phone, "Por favor, utilize os botões abaixo para escolher a unidade:", [{"id": "u1", "title": "São Caetano"}, {"id": "u2", "title": "Ipiranga"}])
-            else:
-                unidade_info = UNIDADES.get(msg_recebida, {})
-                update_paciente(phone, {
-                    "unit": msg_recebida,
-                    "address": unidade_info.get("endereco"),
-                    "maps_link": unidade_info.get("maps"),
-                    "recommendation": unidade_info.get("recomendacao")
-                })
-                if is_veteran:
-                    nome_salvo = info.get("title", "Paciente").split()[0]
-                    update_paciente(phone, {"status": "menu_veterano"})
-                    secoes = [{"title": "Como posso ajudar?", "rows": [{"id": "v1", "title": "🗓️ Meus Agendamentos"}, {"id": "v2", "title": "🔄 Nova Guia/Tratamento"}, {"id": "v3", "title": "➕ Novo Serviço"}, {"id": "v5", "title": "🔑 Enviar Token"}, {"id": "v4", "title": "📁 Secretaria"}]}]
-                    enviar_lista(phone, f"Unidade {msg_recebida} selecionada! ✅\n\nOlá, {nome_salvo}! ✨ Que bom ter você de volta. Como posso te ajudar hoje?", "Ver Opções", secoes)
-                else:
-                    # Caso novo paciente caia aqui (retomada): vai pra serviço
-                    if info.get("title") and not info.get("title", "").startswith("Paciente"):
-                        update_paciente(phone, {"status": "escolhendo_especialidade"})
-                        secoes = [{"title": "Nossos Serviços", "rows": [{"id": "e1", "title": "Fisio Ortopédica"}, {"id": "e2", "title": "Fisio Neurológica"}, {"id": "e3", "title": "Fisio Pélvica"}, {"id": "e4", "title": "Acupuntura"}, {"id": "e5", "title": "Pilates Studio"}, {"id": "e6", "title": "Recovery"}, {"id": "e7", "title": "Liberação Miofascial"}, {"id": "e9", "title": "🔍 Não encontrei"}]}]
-                        enviar_lista(phone, f"Unidade {msg_recebida} confirmada! ✅\n\nQual serviço você procura hoje?", "Ver Serviços", secoes)
-                    else:
-                        update_paciente(phone, {"status": "cadastrando_nome"})
-                        responder_texto(phone, f"Unidade {msg_recebida} selecionada! ✅\n\nPara garantirmos um atendimento personalizado, como você gostaria de ser chamado(a)?")
-
-        elif status == "cadastrando_nome":
-            # VALIDAÇÃO RIGOROSA: rejeita qualquer coisa que não seja nome
-            # (anexo, pergunta, URL, número, saudação, frase com verbos de pergunta)
-
-            # 1. Rejeita anexos
-            if tem_anexo:
-                responder_texto(phone,
-                    "Antes de seguir, preciso saber como você gostaria de ser chamado(a). 😊\n\n"
-                    "Pode me dizer seu nome?"
-                )
-                return jsonify({"status": "nome_anexo_rejeitado"}), 200
-
-            msg_stripped = msg_recebida.strip()
-            msg_lower_strip = msg_stripped.lower()
-
-            # 2. Rejeita perguntas (tem "?", "!")
-            tem_pontuacao_pergunta = "?" in msg_stripped or msg_stripped.endswith("!")
-
-            # 3. Rejeita URLs
-            tem_url = "http" in msg_lower_strip or "www." in msg_lower_strip
-
-            # 4. Rejeita só números
-            so_numeros = msg_stripped.replace(" ", "").replace("-", "").replace(".", "").isdigit()
-
-            # 5. Rejeita saudação isolada
-            saudacoes_puras = ["oi", "olá", "ola", "bom dia", "boa tarde", "boa noite",
-                               "oi!", "olá!", "ola!", "bom dia!", "boa tarde!", "boa noite!",
-                               "oii", "oiii", "ei", "alô", "alo"]
-            eh_saudacao = msg_lower_strip in saudacoes_puras
-
-            # 6. Rejeita início com verbos/pronomes de pergunta (formas variadas de "você")
-            verbos_pergunta = ["vocês", "voces", "voce", "vc", "vcs", "vces",
-                              "qual", "quanto", "como", "onde",
-                              "quando", "atendem", "atende", "atender", "fazem", "faz", "tem ",
-                              "preciso", "queria", "gostaria de saber", "gostaria saber",
-                              "podem", "pode me", "pode", "vou", "estou com dor", "estou querendo",
-                              "aceita", "aceitam", "realizam", "cobre", "cobrem"]
-            comeca_com_pergunta = any(msg_lower_strip.startswith(v) for v in verbos_pergunta)
-
-            # 6b. Rejeita palavras de pergunta/agendamento em QUALQUER posição (frases com 3+ palavras)
-            palavras_msg = msg_lower_strip.split()
-            palavras_pergunta_meio = [
-                "atende", "atendem", "atendimento", "atender",
-                "fazem", "faz", "realizam", "realiza",
-                "aceita", "aceitam", "cobrem", "cobre", "cobertura",
-                "convênio", "convenio", "plano", "seguro saúde",
-                "marcar", "agendar", "agendamento", "agenda",
-                "preço", "preco", "valor", "valores", "custa", "custo",
-                "disponível", "disponivel", "horário", "horario", "horarios",
-                "vaga", "vagas", "atendimento",
-                "particular", "consulta", "sessão", "sessao"
-            ]
-            tem_palavra_pergunta_no_meio = (
-                len(palavras_msg) >= 3 and
-                any(p in msg_lower_strip for p in palavras_pergunta_meio)
-            )
-
-            # 6c. Rejeita se mencionar nome de convênio (claramente não é nome de pessoa)
-            convenios_mencionados = [
-                "amil", "bradesco", "porto seguro", "porto", "prevent",
-                "saúde caixa", "saude caixa", "saúde petrobras", "saude petrobras",
-                "mediservice", "cassi", "geap", "unimed", "sulamerica", "sulamérica",
-                "hapvida", "notredame", "notre dame", "wellhub", "totalpass", "gympass"
-            ]
-            tem_convenio = any(c in msg_lower_strip for c in convenios_mencionados)
-
-            # 7. Rejeita mensagem muito longa (> 80 chars sugere frase, não nome)
-            muito_longo = len(msg_stripped) > 80
-
-            # 8. Rejeita texto sem letras
-            tem_letra = any(c.isalpha() for c in msg_stripped)
-
-            # 9. Tamanho mínimo
-            muito_curto = len(msg_stripped) < 2
-
-            nome_invalido = (tem_pontuacao_pergunta or tem_url or so_numeros or eh_saudacao
-                            or comeca_com_pergunta or tem_palavra_pergunta_no_meio
-                            or tem_convenio or muito_longo or not tem_letra or muito_curto)
-
-            if nome_invalido:
-                import sys
-                motivo = []
-                if tem_pontuacao_pergunta: motivo.append("pontuacao_pergunta")
-                if comeca_com_pergunta: motivo.append("inicio_pergunta")
-                if tem_palavra_pergunta_no_meio: motivo.append("palavra_pergunta_meio")
-                if tem_convenio: motivo.append("convenio_mencionado")
-                if eh_saudacao: motivo.append("saudacao")
-                if muito_longo: motivo.append("muito_longo")
-                if so_numeros: motivo.append("so_numeros")
-                if tem_url: motivo.append("url")
-                print(f"[NOME-BLOQUEIO] '{msg_recebida[:60]}' motivos={motivo}", file=sys.stderr)
-                responder_texto(phone,
-                    "Para prosseguirmos com seu atendimento, preciso primeiro saber como você gostaria de ser chamado(a). 😊\n\n"
-                    "Pode me dizer seu nome?"
-                )
-                return jsonify({"status": "nome_invalido"}), 200
-
-            # Detecta frase de terceiro ("estou agendando para minha mãe", etc)
-            frases_terceiro = [
-                "estou agendando para", "estou marcando para", "estou ligando para",
-                "sou a mãe de", "sou o pai de", "sou a esposa de", "sou o marido de",
-                "sou a filha de", "sou o filho de", "agendando para meu", "agendando para minha",
-                "marcando para meu", "marcando para minha", "para o meu marido", "para a minha esposa",
-                "para o meu pai", "para a minha mãe", "para meu filho", "para minha filha",
-                "para meu irmão", "para minha irmã", "mas estou vendo atendimento para"
-            ]
-            eh_terceiro = any(frase in msg_lower_strip for frase in frases_terceiro)
-
-            if eh_terceiro:
-                update_paciente(phone, {"title": msg_recebida, "agendado_por_terceiro": True, "status": "confirmando_paciente_real"})
-                responder_texto(phone, f"Entendido! 😊 Fico feliz em ajudar.\n\nPara garantirmos que o cadastro fique correto no sistema, por favor me informe o *NOME COMPLETO do paciente* que será atendido (conforme documento):")
-            else:
-                primeiro_nome = msg_stripped.split()[0].capitalize()
-                # Salva o nome e pergunta para quem é o atendimento
-                update_paciente(phone, {
-                    "title": msg_recebida,
-                    "primeiro_nome": primeiro_nome,
-                    "status": "perguntando_para_quem"
-                })
-                enviar_botoes(phone,
-                    f"Prazer em conhecer você, {primeiro_nome}! 😊\n\n"
-                    f"Para te oferecermos a melhor experiência, vou te conduzir por algumas perguntas rápidas.\n\n"
-                    f"O atendimento é para você ou para outra pessoa?",
-                    [{"id": "pq_eu", "title": "Para mim"}, {"id": "pq_outro", "title": "Para outra pessoa"}]
-                )
-
-        elif status == "perguntando_para_quem":
-            if "outra pessoa" in msg_limpa or msg_recebida == "Para outra pessoa":
-                update_paciente(phone, {"agendado_por_terceiro": True, "status": "confirmando_paciente_real"})
-                responder_texto(phone,
-                    "Entendido! 😊\n\n"
-                    "Por favor, me informe o *NOME COMPLETO* do paciente que será atendido (conforme documento):"
-                )
-            elif "mim" in msg_limpa or "para mim" in msg_limpa or msg_recebida == "Para mim":
-                # Pula para escolha de serviço
-                primeiro_nome = info.get("primeiro_nome") or info.get("title", "Paciente").split()[0]
-                update_paciente(phone, {"status": "escolhendo_especialidade"})
-                secoes = [{"title": "Nossos Serviços", "rows": [
-                    {"id": "e1", "title": "Fisio Ortopédica"},
-                    {"id": "e2", "title": "Fisio Neurológica"},
-                    {"id": "e3", "title": "Fisio Pélvica"},
-                    {"id": "e4", "title": "Acupuntura"},
-                    {"id": "e5", "title": "Pilates Studio"},
-                    {"id": "e6", "title": "Recovery"},
-                    {"id": "e7", "title": "Liberação Miofascial"},
-                    {"id": "e9", "title": "🔍 Não encontrei"}
-                ]}]
-                enviar_lista(phone,
-                    f"Perfeito, {primeiro_nome}! 😊\n\nQual serviço você procura hoje?",
-                    "Ver Serviços",
-                    secoes
-                )
-            else:
-                enviar_botoes(phone,
-                    "Por favor, escolha uma das opções abaixo:",
-                    [{"id": "pq_eu", "title": "Para mim"}, {"id": "pq_outro", "title": "Para outra pessoa"}]
-                )
-
-        elif status == "confirmando_paciente_real":
-            if len(msg_limpa) < 2 or msg_recebida.isdigit():
-                responder_texto(phone, "❌ Por favor, digite o nome completo do paciente.")
-            else:
-                nome_responsavel = info.get("title", "")
-                update_paciente(phone, {"title": msg_recebida, "nome_responsavel": nome_responsavel, "status": "escolhendo_especialidade"})
-                secoes = [{"title": "Nossos Serviços", "rows": [
-                    {"id": "e1", "title": "Fisio Ortopédica"},
-                    {"id": "e2", "title": "Fisio Neurológica"},
-                    {"id": "e3", "title": "Fisio Pélvica"},
-                    {"id": "e4", "title": "Acupuntura"},
-                    {"id": "e5", "title": "Pilates Studio"},
-                    {"id": "e6", "title": "Recovery"},
-                    {"id": "e7", "title": "Liberação Miofascial"},
-                    {"id": "e9", "title": "🔍 Não encontrei"}
-                ]}]
-                enviar_lista(phone, f"Perfeito! Cadastro em nome de *{msg_recebida}*. ✅\n\nQual serviço o paciente procura hoje?", "Ver Serviços", secoes)
-
-        elif status == "menu_veterano":
-            if "Novo Serviço" in msg_recebida:
-                # Limpa dados antigos — paciente pode escolher modalidade/convênio diferente
-                update_paciente(phone, {
-                    "status": "escolhendo_especialidade",
-                    "queixa": "", "queixa_ia": "",
-                    "modalidade": "", "convenio": "",
-                    "numCarteirinha": "", "carteirinha_media_id": "",
-                    "pedido_media_id": ""
-                })
-                secoes = [{"title": "Nossos Serviços", "rows": [{"id": "e1", "title": "Fisio Ortopédica"}, {"id": "e2", "title": "Fisio Neurológica"}, {"id": "e3", "title": "Fisio Pélvica"}, {"id": "e4", "title": "Acupuntura"}, {"id": "e5", "title": "Pilates Studio"}, {"id": "e6", "title": "Recovery"}, {"id": "e7", "title": "Liberação Miofascial"}, {"id": "e8", "title": "⬅️ Voltar ao Menu"}]}]
-                enviar_lista(phone, "Perfeito! Qual novo serviço você deseja agendar?", "Ver Serviços", secoes)
-
-            elif "Nova Guia" in msg_recebida or "Tratamento" in msg_recebida:
-                # Limpa dados antigos — paciente pode mudar modalidade/convênio
-                update_paciente(phone, {
-                    "queixa": "", "queixa_ia": "",
-                    "modalidade": "",
-                    "numCarteirinha": "", "carteirinha_media_id": "",
-                    "pedido_media_id": ""
-                })
-                feegow_id = info.get("feegow_id")
-                servico_atual = _buscar_servico_atual_feegow(feegow_id) if feegow_id else None
-                if servico_atual and servico_atual.get("servico"):
-                    sv = servico_atual["servico"]
-                    un = servico_atual.get("unidade", "")
-                    un_txt = f" — unidade *{un}*" if un else ""
-                    update_paciente(phone, {
-                        "status": "confirmando_servico_nova_guia",
-                        "nova_guia_servico": sv,
-                        "nova_guia_unidade": un,
-                        "nova_guia_local_id": servico_atual.get("local_id"),
-                        "nova_guia_proc_id": servico_atual.get("procedimento_id")
-                    })
-                    enviar_botoes(phone,
-                        f"Vou te ajudar a renovar a autorização do seu tratamento. ✅\n\n"
-                        f"Vi que você realiza *{sv}*{un_txt}.\n\n"
-                        f"Vamos organizar a nova guia para esse tratamento?",
-                        [{"id": "ng_sim", "title": f"✅ Sim, {sv}"}, {"id": "ng_outro", "title": "↔️ Outro serviço"}, {"id": "ng_voltar", "title": "⬅️ Voltar"}])
-                else:
-                    update_paciente(phone, {"status": "escolhendo_especialidade", "nova_guia": True})
-                    secoes_ng = [{"title": "Nossos Serviços", "rows": [{"id": "e1", "title": "Fisio Ortopédica"}, {"id": "e2", "title": "Fisio Neurológica"}, {"id": "e3", "title": "Fisio Pélvica"}, {"id": "e4", "title": "Acupuntura"}, {"id": "e5", "title": "Pilates Studio"}, {"id": "e6", "title": "Recovery"}, {"id": "e7", "title": "Liberação Miofascial"}, {"id": "e8", "title": "⬅️ Voltar ao Menu"}]}]
-                    enviar_lista(phone, "Não identifiquei seu tratamento automaticamente. Qual serviço deseja renovar a guia?", "Ver Serviços", secoes_ng)
-
-            elif "Reagendar" in msg_recebida or "Meus Agendamentos" in msg_recebida or msg_recebida == "v1":
-                resultado_raw = consultar_agenda_feegow(info.get("feegow_id"), retornar_raw=True) if info.get("feegow_id") else None
-                sessoes_labels = resultado_raw["sessoes"] if resultado_raw else []
-                agendamentos_raw = resultado_raw["agendamentos"] if resultado_raw else []
-                # Salva dados do primeiro agendamento para uso no reagendamento
-                local_id_ag = agendamentos_raw[0]["local_id"] if agendamentos_raw else None
-                proc_id_ag = agendamentos_raw[0]["procedimento_id"] if agendamentos_raw else None
-                # Atualiza unidade com base no agendamento real (não na seleção do menu)
-                unidade_real = agendamentos_raw[0].get("unidade", "") if agendamentos_raw else ""
-                update_fields = {"status": "gestao_agenda", "agenda_local_id": local_id_ag, "agenda_procedimento_id": proc_id_ag, "agenda_agendamentos": agendamentos_raw[:10]}
-                if unidade_real:
-                    update_fields["unit"] = unidade_real
-                update_paciente(phone, update_fields)
-                if sessoes_labels:
-                    secoes_gestao = [{"title": "O que deseja fazer?", "rows": [
-                        {"id": "ga_consultar", "title": "📋 Ver minha agenda"},
-                        {"id": "ga_confirmar", "title": "✅ Confirmar presença"},
-                        {"id": "ga_reagendar", "title": "🔄 Reagendar sessão"},
-                        {"id": "ga_cancelar",  "title": "❌ Cancelar sessão"}
-                    ]}]
-                    enviar_lista(phone, f"Localizei suas próximas sessões:\n\n{chr(10).join(sessoes_labels[:5])}\n\nO que deseja fazer?", "Ver Opções", secoes_gestao)
-                else:
-                    enviar_botoes(phone, "Não encontrei sessões futuras agendadas. 😊\n\nDeseja falar com nossa equipe?", [{"id": "ga_secretaria", "title": "📁 Falar com equipe"}, {"id": "menu_ini", "title": "⬅️ Voltar ao Menu"}])
-            
-            elif "Token" in msg_recebida or msg_recebida == "v5":
-                update_paciente(phone, {"status": "aguardando_token_convenio"})
-                responder_texto(phone, "Claro! 😊 Por favor, informe o código de autorização que você recebeu do seu convênio (Amil, Prevent, Bradesco...).\n\n_Normalmente é um número com 6 dígitos enviado por SMS ou pelo app do plano._")
-
-            elif "Secretaria" in msg_recebida or "📁" in msg_recebida:
-                update_paciente(phone, {"status": "menu_secretaria"})
-                secoes = [{"title": "Serviços de Secretaria", "rows": [{"id": "s1", "title": "Declaração de Horas"}, {"id": "s2", "title": "Relatório Fisio"}, {"id": "s3", "title": "Atualização Cadastral"}, {"id": "s5", "title": "📁 Enviar Exames/Resultados"}, {"id": "s6", "title": "❌ Cancelar Tratamento"}, {"id": "s4", "title": "⬅️ Voltar ao Menu"}]}]
-                enviar_lista(phone, "Acesso à Secretaria. O que você precisa solicitar?", "Ver Serviços", secoes)
-
-            else:
-                # Catch-all: mensagem não reconhecida → reapresenta o menu
-                nome_mv = info.get("title", "Paciente").split()[0]
-                secoes_mv = [{"title": "Como posso ajudar?", "rows": [{"id": "v1", "title": "🗓️ Meus Agendamentos"}, {"id": "v2", "title": "🔄 Nova Guia/Tratamento"}, {"id": "v3", "title": "➕ Novo Serviço"}, {"id": "v5", "title": "🔑 Enviar Token"}, {"id": "v4", "title": "📁 Secretaria"}]}]
-                enviar_lista(phone, f"Como posso te ajudar, {nome_mv}? 😊", "Ver Opções", secoes_mv)
-
-        elif status == "gestao_agenda":
-            import sys
-            _secoes_ga = [{"title": "O que deseja fazer?", "rows": [{"id": "ga_consultar", "title": "📋 Ver minha agenda"}, {"id": "ga_confirmar", "title": "✅ Confirmar presença"}, {"id": "ga_reagendar", "title": "🔄 Reagendar sessão"}, {"id": "ga_cancelar", "title": "❌ Cancelar sessão"}, {"id": "ga_voltar", "title": "⬅️ Voltar ao Menu"}]}]
-
-            if msg_recebida in ["ga_consultar", "📋 Ver minha agenda", "Ver minha agenda"]:
-                res_raw = consultar_agenda_feegow(info.get("feegow_id"), retornar_raw=True)
-                sessoes_v = res_raw["sessoes"] if res_raw else []
-                if sessoes_v:
-                    responder_texto(phone, f"📋 Sua agenda:\n\n{chr(10).join(sessoes_v[:10])}")
-                else:
-                    responder_texto(phone, "Não encontrei sessões futuras agendadas no momento.")
-                # Reapresenta menu veterano em vez de apenas "qualquer dúvida é só chamar"
-                update_paciente(phone, {"status": "menu_veterano"})
-                nome_va = info.get("title", "Paciente").split()[0]
-                secoes_va = [{"title": "Como posso ajudar?", "rows": [
-                    {"id": "v1", "title": "🗓️ Meus Agendamentos"},
-                    {"id": "v2", "title": "🔄 Nova Guia/Tratamento"},
-                    {"id": "v3", "title": "➕ Novo Serviço"},
-                    {"id": "v5", "title": "🔑 Enviar Token"},
-                    {"id": "v4", "title": "📁 Secretaria"}
-                ]}]
-                enviar_lista(phone, f"Posso te ajudar com mais alguma coisa, {nome_va}? 😊", "Ver Opções", secoes_va)
-                return jsonify({"status": "agenda_consultada"}), 200
-
-            elif msg_recebida in ["ga_confirmar", "✅ Confirmar presença", "Confirmar presença"]:
-                agendamentos_raw = info.get("agenda_agendamentos", [])
-                agendamento_id = agendamentos_raw[0]["agendamento_id"] if agendamentos_raw else None
-                data_proxima = agendamentos_raw[0]["data_br"] if agendamentos_raw else "--"
-                hora_proxima = agendamentos_raw[0]["hora"] if agendamentos_raw else "--"
-                if agendamento_id:
-                    ok = confirmar_presenca_feegow(agendamento_id)
-                    if ok:
-                        update_paciente(phone, {"status": "menu_veterano", "confirmou_presenca": True})
-                        responder_texto(phone, f"✅ Presença confirmada para *{data_proxima} às {hora_proxima}*!\n\nTe esperamos! Lembre-se de chegar 10 minutinhos antes. 😊")
-                    else:
-                        update_paciente(phone, {"status": "atendimento_humano", "unread": True, "queixa": f"[CONFIRMAÇÃO]: Paciente tentou confirmar presença em {data_proxima} às {hora_proxima}"})
-                        responder_texto(phone, "Não consegui confirmar automaticamente. Nossa equipe já foi notificada e confirma em instantes! 😊")
-                else:
-                    responder_texto(phone, "Não encontrei agendamento para confirmar. Nossa equipe pode te ajudar! 😊")
-                    update_paciente(phone, {"status": "menu_veterano"})
-                return jsonify({"status": "confirmacao_processada"}), 200
-
-            elif msg_recebida in ["ga_reagendar", "🔄 Reagendar sessão", "Reagendar sessão"]:
-                agendamentos_raw = info.get("agenda_agendamentos", [])
-                if not agendamentos_raw:
-                    responder_texto(phone, "Não encontrei sessões próximas para reagendar. Nossa equipe pode te ajudar! 😊")
-                    update_paciente(phone, {"status": "menu_veterano"})
-                    return jsonify({"status": "reagendar_sem_sessoes"}), 200
-
-                # Agrupa por local_id — pega as 2 mais próximas de cada agenda
-                local_id_visto = {}
-                sessoes_exibir = []
-                for ag in agendamentos_raw:
-                    lid = ag.get("local_id")
-                    if lid not in local_id_visto:
-                        local_id_visto[lid] = 0
-                    if local_id_visto[lid] < 2:
-                        sessoes_exibir.append(ag)
-                        local_id_visto[lid] += 1
-
-                tem_mais = len(agendamentos_raw) > len(sessoes_exibir)
-
-                if len(sessoes_exibir) == 1:
-                    # Só uma sessão — vai direto para tipo
-                    ag = sessoes_exibir[0]
-                    update_paciente(phone, {"status": "reagendando_tipo", "agenda_sessao_selecionada": ag, "agenda_local_id": ag["local_id"], "agenda_procedimento_id": ag["procedimento_id"]})
-                    enviar_botoes(phone,
-                        f"Vamos reagendar sua sessão de *{ag['servico']}* em *{ag['data_br']} às {ag['hora']}*.\n\nO que você precisa?",
-                        [{"id": "rt_horario", "title": "🕐 Mudar horário"}, {"id": "rt_dia", "title": "📅 Mudar o dia"}, {"id": "rt_voltar", "title": "⬅️ Voltar"}])
-                else:
-                    # Múltiplas sessões — deixa paciente escolher
-                    rows = [{"id": f"rag_{i}", "title": f"{ag['servico']} {ag['data_br']} {ag['hora']}"[:24]} for i, ag in enumerate(sessoes_exibir)]
-                    if tem_mais:
-                        rows.append({"id": "rag_mais", "title": "📅 Ver mais sessões"})
-                    rows.append({"id": "rag_voltar", "title": "⬅️ Voltar"})
-                    update_paciente(phone, {"status": "escolhendo_sessao_reagendamento", "agenda_agendamentos": agendamentos_raw})
-                    lista_txt = "\n".join([f"• 🗓️ *{ag['data_br']} às {ag['hora']}* - {ag['servico']}" for ag in sessoes_exibir])
-                    enviar_lista(phone, f"Qual sessão deseja reagendar?\n\n{lista_txt}", "Selecionar", [{"title": "Sessões", "rows": rows}])
-                return jsonify({"status": "reagendar_iniciado"}), 200
-
-            elif msg_recebida in ["ga_cancelar", "❌ Cancelar sessão", "Cancelar sessão"]:
-                agendamentos_raw = info.get("agenda_agendamentos", [])
-                ag_cancel = agendamentos_raw[0] if agendamentos_raw else None
-                ag_mesmo_dia_c = []
-                if ag_cancel:
-                    data_c = ag_cancel.get("data", "")
-                    ag_mesmo_dia_c = [a for a in agendamentos_raw if a.get("data") == data_c]
-                if len(ag_mesmo_dia_c) > 1:
-                    opcoes_c = [{"id": f"ac_{i}", "title": f"{ag['servico']} {ag['hora']}"[:24]} for i, ag in enumerate(ag_mesmo_dia_c[:2])]
-                    opcoes_c.append({"id": "ac_ambos", "title": "Cancelar ambos"})
-                    opcoes_c.append({"id": "ac_voltar", "title": "⬅️ Voltar"})
-                    update_paciente(phone, {"status": "escolhendo_sessao_cancelamento"})
-                    enviar_lista(phone, f"Você tem dois atendimentos em *{ag_cancel.get('data_br','')}*. Qual deseja cancelar?", "Ver Sessões", [{"title": "Selecione", "rows": opcoes_c}])
-                elif ag_cancel:
-                    update_paciente(phone, {"status": "cancelando_sessao", "agenda_sessao_selecionada": ag_cancel})
-                    data_br_c = ag_cancel.get("data_br", "")
-                    hora_c = ag_cancel.get("hora", "")
-                    servico_c = ag_cancel.get("servico", "Sessão")
-                    enviar_botoes(phone,
-                        f"Atenção: vou cancelar sua sessão de *{servico_c}* em *{data_br_c} às {hora_c}*.\n\nDeseja informar o motivo?",
-                        [{"id": "cs_motivo", "title": "Sim, informar motivo"}, {"id": "cs_direto", "title": "Não, só cancelar"}, {"id": "cs_voltar", "title": "⬅️ Voltar"}])
-                else:
-                    responder_texto(phone, "Não encontrei sessões próximas para cancelar.")
-                    update_paciente(phone, {"status": "menu_veterano"})
-                return jsonify({"status": "cancelamento_iniciado"}), 200
-
-            elif msg_recebida in ["ga_voltar", "⬅️ Voltar ao Menu", "Voltar ao Menu"]:
-                nome_s = info.get("title", "Paciente").split()[0]
-                update_paciente(phone, {"status": "menu_veterano"})
-                secoes_vet_v = [{"title": "Como posso ajudar?", "rows": [{"id": "v1", "title": "🗓️ Meus Agendamentos"}, {"id": "v2", "title": "🔄 Nova Guia/Tratamento"}, {"id": "v3", "title": "➕ Novo Serviço"}, {"id": "v5", "title": "🔑 Enviar Token"}, {"id": "v4", "title": "📁 Secretaria"}]}]
-                enviar_lista(phone, f"Voltando ao menu principal. Como posso te ajudar, {nome_s}?", "Ver Opções", secoes_vet_v)
-
-            else:
-                enviar_lista(phone, "Por favor, escolha uma das opções:", "Ver Opções", _secoes_ga)
-
-        elif status == "escolhendo_sessao_reagendamento":
-            agendamentos_raw = info.get("agenda_agendamentos", [])
-            if msg_recebida in ["rag_voltar", "ag_voltar", "⬅️ Voltar"]:
-                update_paciente(phone, {"status": "gestao_agenda"})
-                _secoes_ga2 = [{"title": "O que deseja fazer?", "rows": [{"id": "ga_consultar", "title": "📋 Ver minha agenda"}, {"id": "ga_confirmar", "title": "✅ Confirmar presença"}, {"id": "ga_reagendar", "title": "🔄 Reagendar sessão"}, {"id": "ga_cancelar", "title": "❌ Cancelar sessão"}]}]
-                enviar_lista(phone, "Voltando ao menu de gestão:", "Ver Opções", _secoes_ga2)
-            elif msg_recebida == "rag_mais":
-                nome_rm = info.get("title", "Paciente").split()[0]
-                update_paciente(phone, {"status": "atendimento_humano", "unread": True, "queixa": "[REAGENDAMENTO]: paciente quer reagendar sessões além das próximas."})
-                responder_texto(phone, f"Claro, {nome_rm}! Vou conectar você com nossa recepção para organizar as demais sessões. 💙")
-            else:
-                # Tenta casar por ID (rag_N ou ag_N) ou por título
-                ag_sel = None
-                for prefix in ["rag_", "ag_"]:
-                    if msg_recebida.startswith(prefix) and msg_recebida.replace(prefix, "").isdigit():
-                        idx = int(msg_recebida.replace(prefix, ""))
-                        if idx < len(agendamentos_raw):
-                            ag_sel = agendamentos_raw[idx]
-                        break
-                if not ag_sel:
-                    # Casa por título — inclui serviço para evitar ambiguidade
-                    msg_lower = msg_limpa
-                    for ag in agendamentos_raw:
-                        servico_ag = ag.get('servico','').lower()
-                        data_ag = ag.get('data_br','')
-                        hora_ag = ag.get('hora','')
-                        # Verifica se o serviço e a data batem
-                        servico_ok = servico_ag and servico_ag in msg_lower
-                        data_ok = data_ag and data_ag.replace("/","") in msg_lower.replace("/","").replace("-","")
-                        hora_ok = hora_ag and hora_ag[:5] in msg_lower
-                        if servico_ok and (data_ok or hora_ok):
-                            ag_sel = ag
-                            break
-                    # Fallback: casa só por data+hora se serviço não identificado
-                    if not ag_sel:
-                        for ag in agendamentos_raw:
-                            data_ag = ag.get('data_br','')
-                            hora_ag = ag.get('hora','')
-                            if data_ag in msg_recebida and hora_ag[:5] in msg_recebida:
-                                ag_sel = ag
-                                break
-                if ag_sel:
-                    update_paciente(phone, {"status": "reagendando_tipo", "agenda_sessao_selecionada": ag_sel, "agenda_local_id": ag_sel["local_id"], "agenda_procedimento_id": ag_sel["procedimento_id"]})
-                    enviar_botoes(phone,
-                        f"Vamos reagendar sua sessão de *{ag_sel['servico']}* em *{ag_sel['data_br']} às {ag_sel['hora']}*.\n\nO que você precisa?",
-                        [{"id": "rt_horario", "title": "🕐 Mudar horário"}, {"id": "rt_dia", "title": "📅 Mudar o dia"}, {"id": "rt_voltar", "title": "⬅️ Voltar"}])
-                else:
-                    enviar_lista(phone, "Qual sessão deseja reagendar?", "Selecionar", [{"title": "Sessões", "rows": [{"id": f"rag_{i}", "title": f"{ag['servico']} {ag['data_br']}"[:24]} for i, ag in enumerate(agendamentos_raw[:4])]}])
-
-        elif status == "escolhendo_sessao_cancelamento":
-            agendamentos_raw = info.get("agenda_agendamentos", [])
-            if msg_recebida in ["ac_voltar", "⬅️ Voltar", "Voltar"]:
-                update_paciente(phone, {"status": "gestao_agenda"})
-                _secoes_ga3 = [{"title": "O que deseja fazer?", "rows": [{"id": "ga_consultar", "title": "📋 Ver minha agenda"}, {"id": "ga_confirmar", "title": "✅ Confirmar presença"}, {"id": "ga_reagendar", "title": "🔄 Reagendar sessão"}, {"id": "ga_cancelar", "title": "❌ Cancelar sessão"}]}]
-                enviar_lista(phone, "Voltando ao menu de gestão:", "Ver Opções", _secoes_ga3)
-            else:
-                # Tenta achar a sessão: primeiro por ID (ac_N), depois por título
-                ag_sel = None
-                if msg_recebida.startswith("ac_") and msg_recebida.replace("ac_", "").isdigit():
-                    idx = int(msg_recebida.replace("ac_", ""))
-                    if idx < len(agendamentos_raw):
-                        ag_sel = agendamentos_raw[idx]
-                else:
-                    # Busca por título — ex: "Fisioterapia 11:00"
-                    for ag in agendamentos_raw:
-                        titulo_ag = f"{ag.get('servico','')} {ag.get('hora','')}".strip()
-                        if msg_limpa in titulo_ag.lower() or titulo_ag.lower() in msg_limpa:
-                            ag_sel = ag
-                            break
-                if ag_sel:
-                    update_paciente(phone, {"status": "cancelando_sessao", "agenda_sessao_selecionada": ag_sel})
-                    data_br_c = ag_sel.get("data_br", "")
-                    hora_c = ag_sel.get("hora", "")
-                    servico_c = ag_sel.get("servico", "Sessão")
-                    enviar_botoes(phone,
-                        f"Atenção: vou cancelar sua sessão de *{servico_c}* em *{data_br_c} às {hora_c}*.\n\nDeseja informar o motivo?",
-                        [{"id": "cs_motivo", "title": "Sim, informar motivo"}, {"id": "cs_direto", "title": "Não, só cancelar"}, {"id": "cs_voltar", "title": "⬅️ Voltar"}])
-                else:
-                    # Sessão não identificada — mostra a lista novamente
-                    ag_mesmo_dia = agendamentos_raw[:2]
-                    opcoes_c = [{"id": f"ac_{i}", "title": f"{ag['servico']} {ag['hora']}"[:24]} for i, ag in enumerate(ag_mesmo_dia)]
-                    opcoes_c.append({"id": "ac_voltar", "title": "⬅️ Voltar"})
-                    enviar_lista(phone, "Qual sessão deseja cancelar?", "Selecionar", [{"title": "Sessões", "rows": opcoes_c}])
-
-        elif status == "reagendando_preferencia":
-            import sys
-            if msg_recebida in ["rp_voltar", "⬅️ Voltar", "Voltar"]:
-                update_paciente(phone, {"status": "gestao_agenda"})
-                _secoes_gav = [{"title": "O que deseja fazer?", "rows": [{"id": "ga_consultar", "title": "📋 Ver minha agenda"}, {"id": "ga_confirmar", "title": "✅ Confirmar presença"}, {"id": "ga_reagendar", "title": "🔄 Reagendar sessão"}, {"id": "ga_cancelar", "title": "❌ Cancelar sessão"}, {"id": "ga_voltar", "title": "⬅️ Voltar ao Menu"}]}]
-                enviar_lista(phone, "Voltando às opções:", "Ver Opções", _secoes_gav)
-                return jsonify({"status": "reagendamento_cancelado"}), 200
-            # Usa IA para extrair preferência de data do texto livre
-            pref = extrair_preferencia_data(msg_recebida)
-            print(f"[REAGEND-PREF] Extraído: {pref}", file=sys.stderr)
-            local_id = info.get("agenda_local_id") or 2
-            proc_id = info.get("agenda_procedimento_id") or 9
-            hoje = datetime.now()
-            agendamentos_serie = info.get("agenda_agendamentos", [])
-
-            # Determina horário preferido
-            hora_preferida = pref.get("hora") or ("14:00" if pref.get("periodo") == "tarde" else "08:00")
-
-            # Data alvo — já em YYYY-MM-DD, sem parsing frágil
-            data_ini = hoje + timedelta(days=1)  # mínimo amanhã
-            if pref.get("data"):
-                try:
-                    data_cand = datetime.strptime(pref["data"], "%Y-%m-%d")
-                    if data_cand.date() >= hoje.date():
-                        data_ini = data_cand
-                except Exception as e_dp:
-                    print(f"[REAGEND-DATA] Erro parse '{pref.get('data')}': {e_dp}", file=sys.stderr)
-            elif pref.get("periodo") and not pref.get("data"):
-                pass  # sem data específica → usa amanhã
-            print(f"[REAGEND-DATA] data_ini={data_ini.strftime('%d/%m/%Y')} hora_pref={hora_preferida}", file=sys.stderr)
-
-            data_fim = dias_uteis_a_partir(data_ini, 14)  # janela de 14 dias úteis
-
-            # Monta mapa de conflitos: data → lista de horários já agendados
-            def _tem_conflito(slot_data, slot_hora, agendamentos):
-                """Retorna True se o slot conflita com agendamentos existentes.
-                Regras: mesmo dia mesmo serviço OU mesmo dia horário com diff < 30min."""
-                try:
-                    sh = datetime.strptime(slot_hora, "%H:%M")
-                except: return False
-                for ag in agendamentos:
-                    if ag.get("data") != slot_data: continue
-                    try:
-                        ah = datetime.strptime(ag.get("hora",""), "%H:%M")
-                        diff_min = abs((sh - ah).total_seconds()) / 60
-                        if diff_min < 30:
-                            return True
-                    except: continue
-                return False
-
-            update_paciente(phone, {"status": "escolhendo_horario_reagendamento", "reagendamento_hora_preferida": hora_preferida})
-            responder_texto(phone, "Buscando horários disponíveis... ⏳")
-            slots_all = consultar_disponibilidade_feegow(local_id, proc_id, data_ini.strftime('%Y-%m-%d'), data_fim.strftime('%Y-%m-%d'))
-
-            # Filtra por data >= solicitada (Feegow ignora data_start)
-            data_ini_str = data_ini.strftime('%Y-%m-%d')
-            slots_all = [s for s in slots_all if s.get("data","") >= data_ini_str]
-
-            # Filtro por unidade_id já feito na consulta — não precisa filtrar aqui
-            print(f"[REAGEND-SLOTS] {len(slots_all)} slots unidade_id={_LOCAL_ID_UNIDADE.get(local_id, 0)}", file=sys.stderr)
-
-            # Filtra conflitos com agenda existente
-            slots_ok = [s for s in slots_all if not _tem_conflito(s.get("data",""), s.get("hora",""), agendamentos_serie)]
-            proximos = encontrar_horarios_proximos(slots_ok, hora_preferida, qtd=2)
-            if proximos:
-                opcoes_txt = "\n".join([f"• {s['label']}" for s in proximos])
-                update_paciente(phone, {
-                    "reagendamento_opcoes": [{"data": s["data"], "hora": s["hora"], "label": s["label"]} for s in proximos],
-                    "reagendamento_slots_cache": slots_ok,
-                    "reagendamento_slots_vistos": [s["label"] for s in proximos]
-                })
-                rows_sl = [{"id": f"slot_{i}", "title": f"{s['data_br']} às {s['hora']}"} for i, s in enumerate(proximos[:8])]
-                rows_sl.append({"id": "slot_outro", "title": "🔄 Ver outros horários"})
-                rows_sl.append({"id": "eh_voltar", "title": "⬅️ Voltar"})
-                opcoes_txt = "\n".join([f"• {s['label']}" for s in proximos])
-                enviar_lista(phone, f"Horários disponíveis mais próximos:\n\n{opcoes_txt}\n\nQual prefere?", "Ver Horários", [{"title": "Selecione", "rows": rows_sl}])
-            else:
-                ag_sel = info.get("agenda_sessao_selecionada", {})
-                nome_rp = info.get("title", "Paciente").split()[0]
-                # Verifica se o problema é conflito (tem slots mas todos filtrados)
-                tem_slots_brutos = len(slots_all) > 0
-                if tem_slots_brutos:
-                    # Conflito detectado — tem slots mas todos conflitam com agenda
-                    conflitos = []
-                    for ag in agendamentos_serie:
-                        conflitos.append(f"{ag.get('data_br','')} às {ag.get('hora','')} ({ag.get('servico','')})")
-                    conflitos_txt = "\n".join([f"• {c}" for c in conflitos[:3]])
-                    queixa_conf = f"[REAGENDAMENTO CONFLITO]: {nome_rp} solicitou horário que conflita com agenda existente. Sessão original: {ag_sel.get('data_br','')} às {ag_sel.get('hora','')}. Preferência: {msg_recebida}."
-                    update_paciente(phone, {"status": "atendimento_humano", "unread": True, "queixa": queixa_conf})
-                    responder_texto(phone,
-                        f"Atenção, {nome_rp}! ⚠️ O horário solicitado conflita com sessões já agendadas:\n\n{conflitos_txt}\n\n"
-                        f"Vou encaminhar para nossa recepção encontrar o melhor horário sem conflito. 💙"
-                    )
-                else:
-                    queixa_rp = f"[REAGENDAMENTO]: sem disponibilidade. Preferência: {msg_recebida}. Sessão original: {ag_sel.get('data_br','')}"
-                    update_paciente(phone, {"status": "atendimento_humano", "unread": True, "queixa": queixa_rp})
-                    responder_texto(phone, f"Não encontrei horários disponíveis no período solicitado, {nome_rp}. Nossa equipe vai entrar em contato para encontrar o melhor horário! 💙")
-
-        elif status == "escolhendo_horario_reagendamento":
-            opcoes = info.get("reagendamento_opcoes", [])
-            if msg_recebida in ["slot_outro", "Outros horários", "Ver outros horários", "Outro horário", "🔄 Ver outros horários"]:
-                hora_pref = info.get("reagendamento_hora_preferida", "08:00")
-                ag_sel_r = info.get("agenda_sessao_selecionada", {})
-                # Usa slots já em cache — não refaz chamada à API
-                slots_cache = info.get("reagendamento_slots_cache", [])
-                slots_ja_vistos = info.get("reagendamento_slots_vistos", [])
-                # Filtra os que ainda não foram mostrados
-                proximos_outros = [s for s in slots_cache if s.get("label") not in slots_ja_vistos]
-                proximos_outros = encontrar_horarios_proximos(proximos_outros, hora_pref, qtd=5)
-                if proximos_outros:
-                    vistos_novos = slots_ja_vistos + [s["label"] for s in proximos_outros]
-                    update_paciente(phone, {
-                        "reagendamento_opcoes": proximos_outros,
-                        "reagendamento_slots_vistos": vistos_novos
-                    })
-                    opcoes_txt2 = "\n".join([f"• {s['label']}" for s in proximos_outros])
-                    rows_sl2 = [{"id": f"slot_{i}", "title": f"{s['data_br']} às {s['hora']}"} for i, s in enumerate(proximos_outros[:8])]
-                    rows_sl2.append({"id": "slot_recepcao", "title": "👩 Falar com recepção"})
-                    rows_sl2.append({"id": "eh_voltar", "title": "⬅️ Voltar"})
-                    enviar_lista(phone, f"Outras opções disponíveis:\n\n{opcoes_txt2}\n\nQual prefere?", "Ver Horários", [{"title": "Selecione", "rows": rows_sl2}])
-                else:
-                    # Sem mais slots — transfere para recepção
-                    nome_r = info.get("title", "Paciente").split()[0]
-                    queixa_sem = f"[REAGENDAMENTO]: {nome_r} não aceitou nenhuma sugestão. Sessão original: {ag_sel_r.get('data_br','')} às {ag_sel_r.get('hora','')}. Preferência: {hora_pref}."
-                    update_paciente(phone, {"status": "atendimento_humano", "unread": True, "queixa": queixa_sem})
-                    responder_texto(phone, f"Entendido, {nome_r}! Vou passar para nossa equipe encontrar o melhor horário para você. Em breve entraremos em contato! 💙")
-
-            elif msg_recebida in ["slot_recepcao", "👩 Falar com recepção"]:
-                nome_r2 = info.get("title", "Paciente").split()[0]
-                ag_sel_r2 = info.get("agenda_sessao_selecionada", {})
-                queixa_r2 = f"[REAGENDAMENTO]: {nome_r2} pediu para falar com a recepção. Sessão original: {ag_sel_r2.get('data_br','')} às {ag_sel_r2.get('hora','')}."
-                update_paciente(phone, {"status": "atendimento_humano", "unread": True, "queixa": queixa_r2})
-                responder_texto(phone, f"Claro, {nome_r2}! Nossa equipe vai entrar em contato para encontrar o melhor horário. 💙")
-            elif msg_recebida in ["eh_voltar", "⬅️ Voltar", "Voltar"]:
-                update_paciente(phone, {"status": "gestao_agenda"})
-                _secoes_ehv = [{"title": "O que deseja fazer?", "rows": [{"id": "ga_consultar", "title": "📋 Ver minha agenda"}, {"id": "ga_confirmar", "title": "✅ Confirmar presença"}, {"id": "ga_reagendar", "title": "🔄 Reagendar sessão"}, {"id": "ga_cancelar", "title": "❌ Cancelar sessão"}, {"id": "ga_voltar", "title": "⬅️ Voltar ao Menu"}]}]
-                enviar_lista(phone, "Voltando às opções:", "Ver Opções", _secoes_ehv)
-            else:
-                # Tenta casar por ID (slot_N) ou por título ("15/05/2026 às 08:00")
-                slot = None
-                if msg_recebida.startswith("slot_") and msg_recebida.replace("slot_", "").isdigit():
-                    idx = int(msg_recebida.replace("slot_", ""))
-                    slot = opcoes[idx] if idx < len(opcoes) else None
-                else:
-                    # Lista retorna título — casa por data/hora
-                    for o in opcoes:
-                        titulo = f"{o.get('data_br','')} às {o.get('hora','')}"
-                        if msg_recebida == titulo or o.get("hora","") in msg_recebida and o.get("data_br","") in msg_recebida:
-                            slot = o
-                            break
-
-                if slot:
-                    ag_orig = info.get("agenda_sessao_selecionada", {})
-                    nome_pac = info.get("title", "Paciente").split()[0]
-                    queixa_r = (
-                        f"[REAGENDAMENTO]: {nome_pac} escolheu *{slot['label']}*. "
-                        f"Sessão original: {ag_orig.get('data_br','')} às {ag_orig.get('hora','')} "
-                        f"({ag_orig.get('servico','')}) — aguarda confirmação da recepção."
-                    )
-                    update_paciente(phone, {
-                        "status": "atendimento_humano",
-                        "unread": True,
-                        "queixa": queixa_r,
-                        "reagendamento_solicitado": slot
-                    })
-                    responder_texto(phone,
-                        f"Ótimo, {nome_pac}! ✅\n\n"
-                        f"Sua preferência de horário *{slot['label']}* foi registrada.\n\n"
-                        f"Vou informar nossa recepção agora e em breve você receberá a confirmação do reagendamento. 😊"
-                    )
-                elif opcoes:
-                    rows_back = [{"id": f"slot_{i}", "title": f"{o['data_br']} às {o['hora']}"} for i, o in enumerate(opcoes[:8])]
-                    rows_back.append({"id": "slot_outro", "title": "🔄 Ver outros horários"})
-                    rows_back.append({"id": "eh_voltar", "title": "⬅️ Voltar"})
-                    enviar_lista(phone, "Por favor, escolha uma das opções:", "Ver Horários", [{"title": "Selecione", "rows": rows_back}])
-
-        elif status == "cancelando_sessao":
-            ag_sel = info.get("agenda_sessao_selecionada", {})
-            ag_id_cs = ag_sel.get("agendamento_id")
-            ref_sessao = f" *{ag_sel.get('data_br','')} às {ag_sel.get('hora','')}*" if ag_sel else ""
-            if msg_recebida in ["cs_voltar", "⬅️ Voltar", "Voltar"]:
-                update_paciente(phone, {"status": "gestao_agenda"})
-                _secoes_csv = [{"title": "O que deseja fazer?", "rows": [{"id": "ga_consultar", "title": "📋 Ver minha agenda"}, {"id": "ga_confirmar", "title": "✅ Confirmar presença"}, {"id": "ga_reagendar", "title": "🔄 Reagendar sessão"}, {"id": "ga_cancelar", "title": "❌ Cancelar sessão"}, {"id": "ga_voltar", "title": "⬅️ Voltar ao Menu"}]}]
-                enviar_lista(phone, "Voltando às opções:", "Ver Opções", _secoes_csv)
-            elif msg_recebida in ["cs_motivo", "Sim, informar motivo"]:
-                update_paciente(phone, {"status": "informando_motivo_cancelamento_sessao"})
-                responder_texto(phone, f"Entendido. Por favor, me informe o motivo do cancelamento da sessão de{ref_sessao}:")
-            elif msg_recebida in ["cs_direto", "Não, só cancelar"] or "apenas" in msg_recebida.lower():
-                obs_cs = f"Desmarcado pelo paciente via robô. Sessão:{ref_sessao}"
-                ok_cs = cancelar_agendamento_feegow(ag_id_cs, obs=obs_cs) if ag_id_cs else False
-                import sys; print(f"[CANCEL-SESSAO] id={ag_id_cs} ok={ok_cs}", file=sys.stderr)
-                tag_cs = "[CANCELAMENTO]" if ok_cs else "[CANCELAMENTO — confirmar no Feegow]"
-                update_paciente(phone, {"status": "menu_veterano", "unread": True, "queixa": f"{tag_cs}: sessão{ref_sessao} cancelada."})
-                enviar_botoes(phone, f"Cancelamento registrado! ✅\n\nGostaria de reagendar para outro horário?",
-                    [{"id": "cs_rea", "title": "Sim, reagendar"}, {"id": "cs_nao", "title": "Não, obrigado"}])
-                update_paciente(phone, {"status": "pos_cancelamento_sessao"})
-            elif msg_recebida in ["cs_rea", "Sim, reagendar"] or "cancel_reagendar" in msg_recebida or "reagendar" in msg_recebida.lower():
-                update_paciente(phone, {"status": "reagendando_preferencia"})
-                responder_texto(phone, "Vamos encontrar um novo horário! 😊\n\nQual dia e período você prefere?\n\n_Exemplo: quinta de manhã, semana que vem_")
-            elif msg_recebida in ["cs_nao", "Não, obrigado"]:
-                nome_cs = info.get("title", "Paciente").split()[0]
-                update_paciente(phone, {"status": "menu_veterano"})
-                responder_texto(phone, f"Tudo certo, {nome_cs}! ✅ Sua solicitação foi enviada para nossa recepção. Se precisar de algo mais, é só chamar. 😊")
-            else:
-                enviar_botoes(phone, f"Como deseja prosseguir com a sessão de{ref_sessao}?",
-                    [{"id": "cs_motivo", "title": "Informar motivo"}, {"id": "cs_direto", "title": "Cancelar direto"}, {"id": "cs_rea", "title": "Cancelar e reagendar"}, {"id": "cs_voltar", "title": "⬅️ Voltar"}])
-
-        elif status == "informando_motivo_cancelamento_sessao":
-            motivo_cs = msg_recebida
-            ag_sel_cs = info.get("agenda_sessao_selecionada", {})
-            ag_id_mcs = ag_sel_cs.get("agendamento_id")
-            ref_cs = f" *{ag_sel_cs.get('data_br','')} às {ag_sel_cs.get('hora','')}*" if ag_sel_cs else ""
-            obs_mcs = f"Desmarcado pelo paciente. Motivo: {motivo_cs}"
-            ok_mcs = cancelar_agendamento_feegow(ag_id_mcs, obs=obs_mcs) if ag_id_mcs else False
-            import sys; print(f"[CANCEL-MOTIVO] id={ag_id_mcs} ok={ok_mcs}", file=sys.stderr)
-            tag_mcs = "[CANCELAMENTO]" if ok_mcs else "[CANCELAMENTO — confirmar no Feegow]"
-            update_paciente(phone, {"status": "pos_cancelamento_sessao", "unread": True, "queixa": f"{tag_mcs}: sessão{ref_cs}. Motivo: {motivo_cs}"})
-            enviar_botoes(phone, f"Cancelamento registrado! ✅\n\nGostaria de reagendar para outro horário?",
-                [{"id": "cs_rea", "title": "Sim, reagendar"}, {"id": "cs_nao", "title": "Não, obrigado"}])
-
-        elif status == "pos_cancelamento_sessao":
-            nome_pcs = info.get("title", "Paciente").split()[0]
-            if msg_recebida in ["cs_rea", "Sim, reagendar"] or "reagendar" in msg_recebida.lower():
-                update_paciente(phone, {"status": "reagendando_preferencia"})
-                responder_texto(phone, f"Vamos encontrar um novo horário para você, {nome_pcs}! 😊\n\nQual dia e período você prefere?\n\n_Exemplo: quinta de manhã, semana que vem_")
-            elif msg_recebida in ["cs_nao", "Não, obrigado"] or "obrigad" in msg_recebida.lower() or "nao" in msg_recebida.lower() or "não" in msg_recebida.lower():
-                update_paciente(phone, {"status": "menu_veterano"})
-                responder_texto(phone, f"Tudo certo, {nome_pcs}! ✅ Sua solicitação foi enviada para nossa recepção. Qualquer dúvida, é só chamar. 😊")
-
-        elif status == "aguardando_token_convenio":
-            import re as _re_tk
-            nums = _re_tk.findall(r'[0-9]{4,10}', msg_recebida)
-            palavras_saida = ["ok", "obrigado", "obrigada", "valeu", "voltar", "menu", "cancelar", "tchau", "nao", "não"]
-            eh_saida = any(w in msg_limpa for w in palavras_saida) and not nums
-            if nums:
-                token_val = nums[0]
-                from firebase_admin import firestore as _fs_tk
-                conv_tk = info.get("convenio", "")
-                update_paciente(phone, {
-                    "historico_tokens": _fs_tk.ArrayUnion([{"token": token_val, "convenio": conv_tk, "ts": agora_iso}]),
-                    "token_convenio": token_val,
-                    "status": "menu_veterano",
-                    "unread": True
-                })
-                nome_tk = info.get("title", "Paciente").split()[0]
-                responder_texto(phone, f"Token *{token_val}* registrado! ✅\nNossa recepção já recebeu a autorização. 😊")
-                import time as _t_tk; _t_tk.sleep(1)
-                secoes_tk = [{"title": "Como posso ajudar?", "rows": [{"id": "v1", "title": "🗓️ Meus Agendamentos"}, {"id": "v2", "title": "🔄 Nova Guia/Tratamento"}, {"id": "v3", "title": "➕ Novo Serviço"}, {"id": "v5", "title": "🔑 Enviar Token"}, {"id": "v4", "title": "📁 Secretaria"}]}]
-                enviar_lista(phone, f"Mais alguma coisa, {nome_tk}?", "Ver Opções", secoes_tk)
-            elif eh_saida:
-                nome_tk2 = info.get("title", "Paciente").split()[0]
-                update_paciente(phone, {"status": "menu_veterano"})
-                secoes_tk2 = [{"title": "Como posso ajudar?", "rows": [{"id": "v1", "title": "🗓️ Meus Agendamentos"}, {"id": "v2", "title": "🔄 Nova Guia/Tratamento"}, {"id": "v3", "title": "➕ Novo Serviço"}, {"id": "v5", "title": "🔑 Enviar Token"}, {"id": "v4", "title": "📁 Secretaria"}]}]
-                enviar_lista(phone, f"Como posso te ajudar, {nome_tk2}? 😊", "Ver Opções", secoes_tk2)
-            else:
-                responder_texto(phone, "❌ Não reconheci esse código. O token de autorização tem entre 4 e 10 dígitos numéricos.\n\nPode tentar novamente?")
-
-        elif status == "confirmando_servico_nova_guia":
-            if msg_recebida in ["ng_sim"] or "Sim" in msg_recebida:
-                sv_ng = info.get("nova_guia_servico", "")
-                update_paciente(phone, {"status": "cadastrando_queixa_veterano", "servico": sv_ng})
-                responder_texto(phone, f"Ótimo! ✅ Vamos renovar a guia para *{sv_ng}*.\n\nPara registrarmos corretamente, me conte brevemente sua situação atual — como está se sentindo e o que motivou a renovação?")
-            elif msg_recebida in ["ng_outro"] or "Outro" in msg_recebida:
-                update_paciente(phone, {"status": "escolhendo_especialidade", "nova_guia": True})
-                secoes_ng2 = [{"title": "Nossos Serviços", "rows": [{"id": "e1", "title": "Fisio Ortopédica"}, {"id": "e2", "title": "Fisio Neurológica"}, {"id": "e3", "title": "Fisio Pélvica"}, {"id": "e4", "title": "Acupuntura"}, {"id": "e5", "title": "Pilates Studio"}, {"id": "e6", "title": "Recovery"}, {"id": "e7", "title": "Liberação Miofascial"}, {"id": "e8", "title": "⬅️ Voltar ao Menu"}]}]
-                enviar_lista(phone, "Qual serviço você deseja renovar a guia?", "Ver Serviços", secoes_ng2)
-            elif msg_recebida in ["ng_voltar"] or "Voltar" in msg_recebida:
-                update_paciente(phone, {"status": "menu_veterano"})
-                nome_ng = info.get("title", "Paciente").split()[0]
-                secoes_ng_v = [{"title": "Como posso ajudar?", "rows": [{"id": "v1", "title": "🗓️ Meus Agendamentos"}, {"id": "v2", "title": "🔄 Nova Guia/Tratamento"}, {"id": "v3", "title": "➕ Novo Serviço"}, {"id": "v5", "title": "🔑 Enviar Token"}, {"id": "v4", "title": "📁 Secretaria"}]}]
-                enviar_lista(phone, f"Voltando ao menu. Como posso ajudar, {nome_ng}?", "Ver Opções", secoes_ng_v)
-            else:
-                sv_ng = info.get("nova_guia_servico", "")
-                un_ng = info.get("nova_guia_unidade", "")
-                un_ng_txt = f" — unidade *{un_ng}*" if un_ng else ""
-                enviar_botoes(phone, f"Você realiza *{sv_ng}*{un_ng_txt}. Vamos renovar a guia para esse tratamento?",
-                    [{"id": "ng_sim", "title": f"✅ Sim, {sv_ng}"}, {"id": "ng_outro", "title": "↔️ Outro serviço"}, {"id": "ng_voltar", "title": "⬅️ Voltar"}])
-
-        elif status == "reagendando_tipo":
-            ag_orig = info.get("agenda_sessao_selecionada", info.get("agenda_agendamentos", [{}])[0] if info.get("agenda_agendamentos") else {})
-            if msg_recebida in ["rt_horario"] or "horário" in msg_recebida.lower() or "horario" in msg_recebida.lower():
-                data_orig = ag_orig.get("data", "")
-                local_id_rt = info.get("agenda_local_id") or 2
-                proc_id_rt = info.get("agenda_procedimento_id") or 9
-                hora_orig = ag_orig.get("hora", "08:00")
-                update_paciente(phone, {"status": "escolhendo_horario_reagendamento", "reagendamento_mesmo_dia": True, "reagendamento_hora_preferida": hora_orig})
-                responder_texto(phone, "Buscando horários disponíveis no mesmo dia... ⏳")
-                if data_orig:
-                    slots_dia = consultar_disponibilidade_feegow(local_id_rt, proc_id_rt, data_orig, data_orig)
-                    proximos_dia = encontrar_horarios_proximos(slots_dia, hora_orig, qtd=3)
-                    if proximos_dia:
-                        update_paciente(phone, {"reagendamento_opcoes": [{"data": s["data"], "hora": s["hora"], "label": s["label"]} for s in proximos_dia]})
-                        botoes_dia = [{"id": f"slot_{i}", "title": f"{s['hora']}"[:20]} for i, s in enumerate(proximos_dia)]
-                        botoes_dia.append({"id": "slot_outro", "title": "Outro horário"})
-                        botoes_dia.append({"id": "eh_voltar", "title": "⬅️ Voltar"})
-                        data_br_orig = ag_orig.get("data_br", "")
-                        enviar_botoes(phone, f"Horários disponíveis em *{data_br_orig}* mais próximos das {hora_orig}:", botoes_dia)
-                    else:
-                        responder_texto(phone, "Não há outros horários disponíveis nesse dia. Quer tentar outro dia?")
-                        update_paciente(phone, {"status": "reagendando_preferencia"})
-                        responder_texto(phone, "Qual dia e período você prefere?\n\n_Exemplo: quinta de manhã, semana que vem_")
-                else:
-                    update_paciente(phone, {"status": "reagendando_preferencia"})
-                    responder_texto(phone, "Qual dia e período você prefere?\n\n_Exemplo: quinta de manhã_")
-            elif msg_recebida in ["rt_dia"] or "dia" in msg_recebida.lower():
-                update_paciente(phone, {"status": "reagendando_preferencia", "reagendamento_mesmo_dia": False})
-                responder_texto(phone, "Qual dia e período você prefere?\n\n_Exemplo: quinta de manhã, semana que vem, dia 20..._")
-            elif msg_recebida in ["rt_voltar"] or "Voltar" in msg_recebida:
-                update_paciente(phone, {"status": "gestao_agenda"})
-                _secoes_rtv = [{"title": "O que deseja fazer?", "rows": [{"id": "ga_consultar", "title": "📋 Ver minha agenda"}, {"id": "ga_confirmar", "title": "✅ Confirmar presença"}, {"id": "ga_reagendar", "title": "🔄 Reagendar sessão"}, {"id": "ga_cancelar", "title": "❌ Cancelar sessão"}, {"id": "ga_voltar", "title": "⬅️ Voltar ao Menu"}]}]
-                enviar_lista(phone, "Voltando às opções:", "Ver Opções", _secoes_rtv)
-            else:
-                data_br_rt = ag_orig.get("data_br", "")
-                hora_rt = ag_orig.get("hora", "")
-                enviar_botoes(phone, f"O que deseja fazer com a sessão de *{data_br_rt} às {hora_rt}*?",
-                    [{"id": "rt_horario", "title": "🕐 Mudar horário (mesmo dia)"}, {"id": "rt_dia", "title": "📅 Mudar o dia"}, {"id": "rt_voltar", "title": "⬅️ Voltar"}])
-
-        elif status == "cancelando_tratamento":
-            if msg_recebida in ["ct_motivo", "Sim, informar motivo"] or "motivo" in msg_recebida.lower():
-                update_paciente(phone, {"status": "informando_motivo_cancelamento_trat"})
-                responder_texto(phone, "Entendido. Por favor, me conte o motivo do cancelamento do tratamento:")
-            elif msg_recebida in ["ct_direto", "Não, só cancelar"] or "não" in msg_recebida.lower() or "nao" in msg_recebida.lower():
-                ag_prox = (info.get("agenda_agendamentos") or [{}])[0]
-                ag_id_ct = ag_prox.get("agendamento_id")
-                if ag_id_ct:
-                    cancelar_agendamento_feegow(ag_id_ct, obs="Cancelamento de tratamento solicitado pelo paciente via robô.")
-                update_paciente(phone, {"status": "atendimento_humano", "unread": True, "queixa": "[CANCELAR TRATAMENTO]: Paciente solicitou encerramento do tratamento."})
-                responder_texto(phone, "Cancelamento registrado. 💙\n\nNossa equipe responsável entrará em contato para entender melhor sua situação e garantir o melhor cuidado para você.")
-            else:
-                enviar_botoes(phone, "Deseja informar o motivo do cancelamento?",
-                    [{"id": "ct_motivo", "title": "Sim, informar motivo"}, {"id": "ct_direto", "title": "Não, só cancelar"}])
-
-        elif status == "informando_motivo_cancelamento_trat":
-            motivo_ct = msg_recebida
-            ag_prox_ct = (info.get("agenda_agendamentos") or [{}])[0]
-            ag_id_ct2 = ag_prox_ct.get("agendamento_id")
-            if ag_id_ct2:
-                cancelar_agendamento_feegow(ag_id_ct2, obs=f"Cancelamento de tratamento — motivo: {motivo_ct}")
-            update_paciente(phone, {"status": "atendimento_humano", "unread": True, "queixa": f"[CANCELAR TRATAMENTO]: {motivo_ct}"})
-            responder_texto(phone, "Obrigado por nos explicar. 💙\n\nNossa equipe responsável entrará em contato para entender melhor sua situação e garantir o melhor cuidado para você.")
-
-        elif status == "cadastrando_queixa_veterano":
-            acolhimento = chamar_ia_custom(msg_recebida) or "Compreendo perfeitamente, e saiba que estamos aqui para cuidar de você da melhor forma."
-            conv_salvo = info.get("convenio", "")
-            update_paciente(phone, {"queixa": msg_recebida, "queixa_ia": acolhimento})
-            
-            if conv_salvo and conv_salvo.lower() != "particular":
-                update_paciente(phone, {"status": "confirmando_convenio_salvo"})
-                enviar_botoes(phone, f"{acolhimento}\n\nVi aqui que você utilizou o convênio *{conv_salvo}* anteriormente. Vamos seguir com ele?", [{"id": "c_manter", "title": "Sim, manter plano"}, {"id": "c_trocar", "title": "Troquei de plano"}, {"id": "c_part", "title": "Mudar p/ Particular"}])
-            else:
-                update_paciente(phone, {"status": "modalidade"})
-                enviar_botoes(phone, f"{acolhimento}\n\nAs novas sessões serão pelo seu CONVÊNIO ou de forma PARTICULAR?", [{"id": "m1", "title": "Convênio"}, {"id": "m2", "title": "Particular"}])
-
-        elif status == "menu_secretaria":
-            if "Voltar" in msg_recebida:
-                update_paciente(phone, {"status": "menu_veterano"})
-                nome_s_sec = info.get("title", "Paciente").split()[0]
-                secoes = [{"title": "Como posso ajudar?", "rows": [{"id": "v1", "title": "🗓️ Meus Agendamentos"}, {"id": "v2", "title": "🔄 Nova Guia/Tratamento"}, {"id": "v3", "title": "➕ Novo Serviço"}, {"id": "v5", "title": "🔑 Enviar Token"}, {"id": "v4", "title": "📁 Secretaria"}]}]
-                enviar_lista(phone, f"Voltando ao menu principal. Como posso ajudar, {nome_s_sec}?", "Ver Opções", secoes)
-            elif "Exames" in msg_recebida:
-                update_paciente(phone, {"status": "enviando_exames"})
-                responder_texto(phone, "Perfeito! ✅ Pode enviar os arquivos (PDF ou Foto) agora mesmo. Eu vou anexá-los diretamente ao seu prontuário para o fisioterapeuta analisar.")
-            elif "Cancelar Tratamento" in msg_recebida or msg_recebida == "s6":
-                update_paciente(phone, {"status": "cancelando_tratamento"})
-                enviar_botoes(phone,
-                    "Entendo. Cancelar um tratamento é uma decisão importante e nossa equipe quer garantir o melhor para você. 💙\n\n"
-                    "Deseja informar o motivo do cancelamento?",
-                    [{"id": "ct_motivo", "title": "Sim, informar motivo"}, {"id": "ct_direto", "title": "Não, só cancelar"}])
-            else:
-                update_paciente(phone, {"status": "atendimento_humano", "queixa": f"[SECRETARIA]: {msg_recebida}"})
-                responder_texto(phone, f"A sua solicitação para '{msg_recebida}' foi registada com sucesso. A nossa equipe de secretaria vai assumir o atendimento para providenciar os detalhes. Aguarde um instante! 👩‍💻")
-
-        elif status == "enviando_exames":
-            if tem_anexo:
-                media_data = salvar_midia_imediata(phone, "exame", media_id) if media_id else {}
-                update_fields = {
-                    "status": "atendimento_humano",
-                    "queixa": "[EXAME ENVIADO]: Paciente enviou exames via robô.",
-                    "tem_exame": True,
-                }
-                update_fields.update(media_data)
-                update_paciente(phone, update_fields)
-                if info.get("feegow_id") and media_data.get("exame_storage_url"):
-                    import sys
-                    try:
-                        feegow_id_int = int(info["feegow_id"])
-                        conteudo_bytes, mime_type = baixar_midia_whatsapp_raw(media_id) if media_id else (None, None)
-                        if not conteudo_bytes:
-                            res_stor = requests.get(media_data["exame_storage_url"], timeout=20)
-                            conteudo_bytes = res_stor.content if res_stor.status_code == 200 else None
-                            mime_type = res_stor.headers.get("Content-Type", "image/jpeg") if conteudo_bytes else None
-                        if conteudo_bytes:
-                            b64_puro = base64.b64encode(conteudo_bytes).decode("utf-8")
-                            data_uri = f"data:{mime_type};base64,{b64_puro}"
-                            headers_up = {"x-access-token": FEEGOW_TOKEN, "Content-Type": "application/json", "User-Agent": "Conectifisio-Integration/1.0"}
-                            for ep in ["/patient/upload-prontuario", "/patient/upload-base64"]:
-                                res_up = requests.post(f"https://api.feegow.com/v1/api{ep}",
-                                    json={"paciente_id": feegow_id_int, "arquivo_descricao": "Exame (Robô)", "base64_file": data_uri},
-                                    headers=headers_up, timeout=30)
-                                print(f"[FEEGOW-EXAME] {ep}: HTTP {res_up.status_code} | {res_up.text[:300]}", file=sys.stderr)
-                                if res_up.status_code == 200:
-                                    break
-                    except Exception as e_ex:
-                        import sys
-                        print(f"[FEEGOW-EXAME] Erro: {e_ex}", file=sys.stderr)
-                responder_texto(phone, "Recebido com sucesso! 📁 O arquivo foi salvo e nossa equipe vai analisar em breve.")
-            else:
-                responder_texto(phone, "❌ Não recebi o arquivo. Por favor, envie o seu exame ou resultado (Foto ou PDF).")
-
-        elif status == "confirmando_convenio_salvo":
-            if "manter" in msg_recebida.lower():
-                conv_salvo = info.get("convenio", "")
-                if not verificar_cobertura(conv_salvo, servico or "Fisio Ortopédica"):
-                    update_paciente(phone, {"status": "cobertura_recusada"})
-                    enviar_botoes(phone, f"⚠️ O seu plano *{conv_salvo}* não possui cobertura para *{servico}*.\n\nVocê pode realizar o atendimento Particular para reembolso. Deseja seguir no particular?", [{"id": "part", "title": "Seguir Particular"}, {"id": "out", "title": "Escolher outro"}])
-                else:
-                    update_paciente(phone, {"modalidade": "Convênio", "status": "foto_pedido_medico"})
-                    responder_texto(phone, "Perfeito! ✅ Como você manteve o plano, precisamos apenas do novo pedido médico.\n\nPor favor, envie a FOTO ou PDF DO SEU PEDIDO MÉDICO atualizado.")
-            elif "Particular" in msg_recebida:
-                update_paciente(phone, {"modalidade": "Particular", "status": "agendando"})
-                enviar_botoes(phone, "Perfeito! Mudamos para Particular. Qual o melhor período para você? ☀️ ⛅", [{"id": "t1", "title": "Manhã"}, {"id": "t2", "title": "Tarde"}])
-            else:
-                update_paciente(phone, {"status": "nome_convenio"})
-                secoes = [{"title": "Convênios Aceitos", "rows": [{"id": "c1", "title": "Saúde Petrobras"}, {"id": "c2", "title": "Mediservice"}, {"id": "c3", "title": "Cassi"}, {"id": "c4", "title": "Geap Saúde"}, {"id": "c5", "title": "Amil"}, {"id": "c6", "title": "Bradesco Saúde"}, {"id": "c7", "title": "Porto Seguro Saúde"}, {"id": "c8", "title": "Prevent Senior"}, {"id": "c9", "title": "Saúde Caixa"}]}]
-                enviar_lista(phone, "Entendido! Selecione o seu NOVO plano de saúde:", "Ver Convênios", secoes)
-
-        elif status == "escolhendo_especialidade":
-            if "Voltar" in msg_recebida:
-                update_paciente(phone, {"status": "menu_veterano"})
-                secoes = [{"title": "Como posso ajudar?", "rows": [{"id": "v1", "title": "🗓️ Meus Agendamentos"}, {"id": "v2", "title": "🔄 Nova Guia/Tratamento"}, {"id": "v3", "title": "➕ Novo Serviço"}, {"id": "v5", "title": "🔑 Enviar Token"}, {"id": "v4", "title": "📁 Secretaria"}]}]
-                enviar_lista(phone, "Voltando ao menu principal. Como posso ajudar?", "Ver Opções", secoes)
-
-            # OPÇÃO "Não encontrei" — paciente descreve em texto livre
-            elif "Não encontrei" in msg_recebida or "Nao encontrei" in msg_recebida or msg_recebida == "🔍 Não encontrei":
-                update_paciente(phone, {"status": "interpretando_servico_livre"})
-                responder_texto(phone,
-                    "Sem problemas! 😊\n\n"
-                    "Me conte com suas palavras: qual tratamento você está procurando?\n\n"
-                    "_Pode descrever o que está sentindo ou o nome do procedimento que você conhece._"
-                )
-
-            elif msg_recebida in ["Recovery", "Liberação Miofascial"]:
-                # Exceção 2: sempre Particular — vai direto pra queixa (sem perguntar modalidade)
-                update_paciente(phone, {"servico": msg_recebida, "modalidade": "Particular", "status": "cadastrando_queixa"})
-                responder_texto(phone, f"Ótima escolha! {msg_recebida} é um serviço particular. ✨\n\nPara prepararmos o atendimento, me conte brevemente: o que te trouxe aqui hoje?")
-
-            elif msg_recebida == "Fisio Neurológica":
-                # Etapa extra de mobilidade ANTES da queixa
-                update_paciente(phone, {"servico": msg_recebida, "status": "triagem_neuro"})
-                texto_neuro = "Queremos garantir que sua experiência na Conectifisio seja a mais confortável e segura possível. 😊\n\nPoderia nos contar em qual dessas opções de suporte você se enquadra hoje?\n\n1️⃣ Preciso de auxílio integral (ajuda de outra pessoa para me movimentar).\n2️⃣ Preciso de auxílio parcial (utilizo bengala, andador).\n3️⃣ Tenho autonomia total."
-                enviar_botoes(phone, texto_neuro, [{"id": "n1", "title": "1️⃣ Auxílio integral"}, {"id": "n2", "title": "2️⃣ Auxílio parcial"}, {"id": "n3", "title": "3️⃣ Autonomia total"}])
-
-            elif msg_recebida == "Pilates Studio":
-                # Exceção 1: Pilates só em São Caetano — fluxo próprio
-                if info.get("unit") == "Ipiranga":
-                    update_paciente(phone, {"servico": msg_recebida, "status": "transferencia_pilates"})
-                    enviar_botoes(phone, "O Pilates Studio é uma modalidade exclusiva da nossa unidade de *São Caetano*. 🧘‍♀️\n\nDeseja transferir o seu atendimento para lá para realizar o Pilates?", [{"id": "tp_sim", "title": "Sim, mudar p/ São Caetano"}, {"id": "tp_nao", "title": "Não, escolher outro"}])
-                else:
-                    update_paciente(phone, {"servico": msg_recebida, "unit": "São Caetano", "status": "pilates_modalidade"})
-                    secoes = [{"title": "Modalidade Pilates", "rows": [{"id": "p_part", "title": "💎 Plano Particular"}, {"id": "p_caixa", "title": "🏦 Saúde Caixa"}, {"id": "p_app", "title": "💪 Wellhub/Totalpass"}, {"id": "p_vol", "title": "⬅️ Voltar"}]}]
-                    enviar_lista(phone, "Excelente escolha! 🧘‍♀️ O Pilates é fundamental para a correção postural e fortalecimento.\n\n📍 Atendemos Pilates exclusivamente em *São Caetano*.\n\nComo você pretende realizar as aulas?", "Ver Opções", secoes)
-
-            else:
-                # Fisio Ortopédica, Pélvica, Acupuntura → vai DIRETO pra queixa (unidade vem depois da modalidade)
-                update_paciente(phone, {"servico": msg_recebida, "status": "cadastrando_queixa"})
-                responder_texto(phone, f"Entendido! {msg_recebida} selecionada. ✅\n\nPara garantirmos o conforto e segurança no seu atendimento, me conte brevemente: o que te trouxe à clínica hoje?")
-
-        elif status == "escolhendo_unidade_apos_servico":
-            if msg_recebida not in ["São Caetano", "Ipiranga"]:
-                enviar_botoes(phone,
-                    "Por favor, escolha uma das unidades abaixo:",
-                    [{"id": "u1", "title": "São Caetano"}, {"id": "u2", "title": "Ipiranga"}]
-                )
-                return jsonify({"status": "unidade_invalida"}), 200
-            unidade_info = UNIDADES.get(msg_recebida, {})
-            update_paciente(phone, {
-                "unit": msg_recebida,
-                "address": unidade_info.get("endereco"),
-                "maps_link": unidade_info.get("maps"),
-                "recommendation": unidade_info.get("recomendacao")
-            })
-            # Unidade escolhida DEPOIS da modalidade → agora vai pro cadastro
-            # (veterano pula cadastro e vai pro fluxo de convênio/agendamento conforme modalidade)
-            modalidade_atual = info.get("modalidade", "")
-            convenio_atual = info.get("convenio", "")
-            primeiro_nome = info.get("primeiro_nome", "")
-
-            if is_veteran:
-                # Veterano: já tem cadastro — vai direto conforme modalidade
-                if convenio_atual and convenio_atual.lower() != "particular":
-                    update_paciente(phone, {"status": "num_carteirinha"})
-                    responder_texto(phone, f"Unidade {msg_recebida} confirmada! ✅\n\nComo você já é nosso paciente, qual o NÚMERO DA SUA CARTEIRINHA? (Apenas números)")
-                else:
-                    update_paciente(phone, {"status": "agendando"})
-                    enviar_botoes(phone, f"Unidade {msg_recebida} confirmada! ✅\n\nQual o melhor período para você? ☀️⛅", [{"id": "t1", "title": "Manhã"}, {"id": "t2", "title": "Tarde"}])
-                return jsonify({"status": "unidade_veterano"}), 200
-
-            # Novo paciente: vai pro cadastro de nome completo
-            update_paciente(phone, {"status": "cadastrando_nome_completo"})
-            if primeiro_nome:
-                msg_nome = f"Unidade {msg_recebida} confirmada! ✅\n\nAgora, {primeiro_nome}, para o seu prontuário preciso do seu *nome completo conforme documento* (exigência do registro clínico):"
-            else:
-                msg_nome = f"Unidade {msg_recebida} confirmada! ✅\n\nPara o seu prontuário, preciso do seu *nome completo conforme documento*:"
-            responder_texto(phone, msg_nome)
-
-        elif status == "interpretando_servico_livre":
-            # Paciente descreveu em texto livre — usa o modelo v8 para interpretar
-            import sys
-            print(f"[SERVICO-LIVRE] Texto recebido: {msg_recebida[:80]}", file=sys.stderr)
-
-            # Primeiro: filtros locais antes da IA
-            msg_lower_serv = msg_recebida.lower()
-
-            # Detecta massagem → Liberação Miofascial
-            if any(w in msg_lower_serv for w in ["massagem", "massoterapia", "massotera"]):
-                if "miofascial" not in msg_lower_serv and "liberação" not in msg_lower_serv:
-                    update_paciente(phone, {"status": "confirmando_servico_livre", "servico_sugerido": "Liberação Miofascial"})
-                    enviar_botoes(phone,
-                        "Não realizamos massagem terapêutica tradicional, mas oferecemos a *Liberação Miofascial*! 💆\n\n"
-                        "É uma técnica manual eficaz para tensão muscular e dores, realizada por fisioterapeutas especializados.\n\n"
-                        "É um serviço *particular*. É isso que você está procurando?",
-                        [{"id": "sl_sim", "title": "✅ Sim, é isso"}, {"id": "sl_nao", "title": "❌ Não é isso"}]
-                    )
-                    return jsonify({"status": "sugerido_liberacao"}), 200
-
-            # Detecta serviços não atendidos
-            SERVICOS_NAO_ATENDIDOS_KEYWORDS = {
-                "ATM / disfunção temporomandibular": ["atm", "articulação temporomandibular", "temporomandibular", "disfunção tm"],
-                "fisioterapia facial / estética facial": ["fisioterapia facial", "fisio facial", "estética facial", "estetica facial"],
-                "fisioterapia pediátrica": ["pediátrica", "pediatrica", "infantil"],
-                "fisioterapia neuropediátrica": ["neuropediátrica", "neuropediatrica"],
-                "drenagem linfática": ["drenagem linfática", "drenagem linfatica", "drenagem"],
-                "RPG": [" rpg", "reeducação postural global"],
-                "quiropraxia": ["quiropraxia", "quiroprática"],
-                "fisioterapia respiratória": ["respiratória", "respiratoria"]
-            }
-            msg_pad_serv = " " + msg_lower_serv + " "
-            servico_nao_atendido = None
-            for nome_s, kws in SERVICOS_NAO_ATENDIDOS_KEYWORDS.items():
-                if any(kw in msg_pad_serv for kw in kws):
-                    servico_nao_atendido = nome_s
-                    break
-
-            if servico_nao_atendido:
-                responder_texto(phone,
-                    f"Infelizmente ainda não atendemos *{servico_nao_atendido}*. 💙\n\n"
-                    "Outros serviços que oferecemos:\n"
-                    "• Fisioterapia Ortopédica\n"
-                    "• Fisioterapia Neurológica\n"
-                    "• Fisioterapia Pélvica\n"
-                    "• Acupuntura\n"
-                    "• Pilates Studio\n"
-                    "• Recovery\n"
-                    "• Liberação Miofascial\n\n"
-                    "Nossa recepção vai te orientar sobre as melhores opções para o seu caso. 😊"
-                )
-                marcar_precisa_recepcao(phone, f"Solicitou serviço não atendido: {servico_nao_atendido}. Msg: {msg_recebida[:80]}")
-                return jsonify({"status": "servico_livre_nao_atendido"}), 200
-
-            # Tenta interpretar com o modelo
-            prompt_interpretacao = (
-                f"Paciente descreveu: \"{msg_recebida[:200]}\"\n\n"
-                "Qual dos serviços abaixo melhor corresponde ao que ele procura?\n"
-                "- Fisio Ortopédica\n"
-                "- Fisio Neurológica\n"
-                "- Fisio Pélvica\n"
-                "- Acupuntura\n"
-                "- Pilates Studio\n"
-                "- Recovery\n"
-                "- Liberação Miofascial\n\n"
-                "Responda APENAS com o nome exato do serviço da lista (sem explicações). "
-                "Se nenhum bater, responda NENHUM."
-            )
-            try:
-                url_oai = "https://api.openai.com/v1/chat/completions"
-                headers_oai = {"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"}
-                payload_oai = {
-                    "model": "gpt-4o-mini",
-                    "messages": [{"role": "user", "content": prompt_interpretacao}],
-                    "max_tokens": 30,
-                    "temperature": 0.0
-                }
-                res_oai = requests.post(url_oai, json=payload_oai, headers=headers_oai, timeout=10)
-                resp_interp = res_oai.json().get("choices", [{}])[0].get("message", {}).get("content", "").strip()
-                print(f"[SERVICO-LIVRE] Modelo sugeriu: {resp_interp}", file=sys.stderr)
-
-                SERVICOS_VALIDOS = ["Fisio Ortopédica", "Fisio Neurológica", "Fisio Pélvica", "Acupuntura", "Pilates Studio", "Recovery", "Liberação Miofascial"]
-                servico_match = None
-                for sv in SERVICOS_VALIDOS:
-                    if sv.lower() in resp_interp.lower() or resp_interp.lower() in sv.lower():
-                        servico_match = sv
-                        break
-
-                if servico_match:
-                    update_paciente(phone, {"status": "confirmando_servico_livre", "servico_sugerido": servico_match})
-                    enviar_botoes(phone,
-                        f"Pelo que você descreveu, *{servico_match}* parece a melhor opção. 😊\n\nÉ isso que você procura?",
-                        [{"id": "sl_sim", "title": "✅ Sim, é isso"}, {"id": "sl_nao", "title": "❌ Não é isso"}]
-                    )
-                else:
-                    # Modelo não conseguiu identificar → recepção
-                    marcar_precisa_recepcao(phone, f"Serviço não identificado. Descrição livre: {msg_recebida[:120]}")
-                    responder_texto(phone,
-                        "Obrigado por compartilhar! 💙\n\n"
-                        "Para te oferecermos a melhor orientação, vou conectar você com nossa recepção. "
-                        "Em instantes alguém da equipe vai te atender pessoalmente. 😊"
-                    )
-            except Exception as e_int:
-                print(f"[SERVICO-LIVRE] Erro IA: {e_int}", file=sys.stderr)
-                marcar_precisa_recepcao(phone, f"Erro ao interpretar serviço. Descrição: {msg_recebida[:120]}")
-                responder_texto(phone,
-                    "Obrigado por compartilhar! 💙\n\n"
-                    "Vou conectar você com nossa recepção para te orientar melhor. 😊"
-                )
-
-        elif status == "confirmando_servico_livre":
-            servico_sug = info.get("servico_sugerido", "")
-            if msg_recebida in ["✅ Sim, é isso", "sl_sim"] or "sim" in msg_limpa[:5]:
-                # Confirmado: entra no fluxo normal do serviço (queixa primeiro, igual escolhendo_especialidade)
-                update_paciente(phone, {"servico": servico_sug, "servico_sugerido": ""})
-                if servico_sug in ["Recovery", "Liberação Miofascial"]:
-                    # Exceção 2: sempre particular → queixa direto
-                    update_paciente(phone, {"modalidade": "Particular", "status": "cadastrando_queixa"})
-                    responder_texto(phone, f"Perfeito! {servico_sug} é um serviço particular. ✨\n\nPara prepararmos o atendimento, me conte brevemente: o que te trouxe aqui hoje?")
-                elif servico_sug == "Pilates Studio":
-                    # Exceção 1: Pilates fluxo próprio
-                    update_paciente(phone, {"unit": "São Caetano", "status": "pilates_modalidade"})
-                    secoes = [{"title": "Modalidade Pilates", "rows": [{"id": "p_part", "title": "💎 Plano Particular"}, {"id": "p_caixa", "title": "🏦 Saúde Caixa"}, {"id": "p_app", "title": "💪 Wellhub/Totalpass"}, {"id": "p_vol", "title": "⬅️ Voltar"}]}]
-                    enviar_lista(phone, "Excelente! 🧘‍♀️\n\n📍 Atendemos Pilates exclusivamente em *São Caetano*.\n\nComo você pretende realizar as aulas?", "Ver Opções", secoes)
-                elif servico_sug == "Fisio Neurológica":
-                    # Etapa extra de mobilidade
-                    update_paciente(phone, {"status": "triagem_neuro"})
-                    texto_neuro = "Queremos garantir que sua experiência seja a mais confortável e segura possível. 😊\n\nPoderia nos contar em qual dessas opções de suporte você se enquadra hoje?\n\n1️⃣ Preciso de auxílio integral (ajuda de outra pessoa para me movimentar).\n2️⃣ Preciso de auxílio parcial (utilizo bengala, andador).\n3️⃣ Tenho autonomia total."
-                    enviar_botoes(phone, texto_neuro, [{"id": "n1", "title": "1️⃣ Auxílio integral"}, {"id": "n2", "title": "2️⃣ Auxílio parcial"}, {"id": "n3", "title": "3️⃣ Autonomia total"}])
-                else:
-                    # Ortopédica, Pélvica, Acupuntura → queixa direto
-                    update_paciente(phone, {"status": "cadastrando_queixa"})
-                    responder_texto(phone, f"Perfeito! {servico_sug} confirmado. ✅\n\nPara prepararmos o atendimento, me conte brevemente: o que te trouxe à clínica hoje?")
-            elif msg_recebida in ["❌ Não é isso", "sl_nao"] or "não" in msg_limpa[:5] or "nao" in msg_limpa[:5]:
-                # Não é o serviço sugerido → marca recepção
-                marcar_precisa_recepcao(phone, f"Não confirmou serviço sugerido ({servico_sug}). Recepção avalia.")
-                responder_texto(phone,
-                    "Entendido! Vou conectar você com nossa recepção para te orientar melhor sobre as opções disponíveis. 💙"
-                )
-            else:
-                enviar_botoes(phone,
-                    f"O serviço *{servico_sug}* é o que você procura?",
-                    [{"id": "sl_sim", "title": "✅ Sim, é isso"}, {"id": "sl_nao", "title": "❌ Não é isso"}]
-                )
-
-        elif status == "transferencia_pilates":
-            if "Sim" in msg_recebida or "mudar" in msg_recebida.lower():
-                update_paciente(phone, {"unit": "São Caetano", "status": "pilates_modalidade"})
-                secoes = [{"title": "Modalidade Pilates", "rows": [{"id": "p_part", "title": "💎 Plano Particular"}, {"id": "p_caixa", "title": "🏦 Saúde Caixa"}, {"id": "p_app", "title": "💪 Wellhub/Totalpass"}, {"id": "p_vol", "title": "⬅️ Voltar"}]}]
-                enviar_lista(phone, "Perfeito! A sua unidade foi alterada para **São Caetano** com sucesso. ✅\n\nAgora, como você pretende realizar as aulas de Pilates?", "Ver Opções", secoes)
-            else:
-                update_paciente(phone, {"servico": "", "status": "escolhendo_especialidade"})
-                secoes = [{"title": "Nossos Serviços", "rows": [{"id": "e1", "title": "Fisio Ortopédica"}, {"id": "e2", "title": "Fisio Neurológica"}, {"id": "e3", "title": "Fisio Pélvica"}, {"id": "e4", "title": "Acupuntura"}, {"id": "e6", "title": "Recovery"}, {"id": "e7", "title": "Liberação Miofascial"}]}]
-                enviar_lista(phone, "Sem problemas! Mantemos o seu atendimento na unidade **Ipiranga**. Qual outro serviço você procura hoje?", "Ver Serviços", secoes)
-
-        elif status.startswith("pilates_"):
-            if status == "pilates_modalidade":
-                if "Voltar" in msg_recebida:
-                    update_paciente(phone, {"status": "escolhendo_especialidade"})
-                    secoes = [{"title": "Nossos Serviços", "rows": [{"id": "e1", "title": "Fisio Ortopédica"}, {"id": "e2", "title": "Fisio Neurológica"}, {"id": "e3", "title": "Fisio Pélvica"}, {"id": "e4", "title": "Acupuntura"}, {"id": "e5", "title": "Pilates Studio"}, {"id": "e6", "title": "Recovery"}, {"id": "e7", "title": "Liberação Miofascial"}]}]
-                    enviar_lista(phone, "Voltando ao menu de especialidades. Qual serviço você procura hoje?", "Ver Serviços", secoes)
-                elif "Wellhub" in msg_recebida or "Totalpass" in msg_recebida:
-                    # 🛡️ Wellhub/TotalPass: informar planos aceitos antes da escolha
-                    # Ver mapa_fluxos.md → Fluxo Wellhub / TotalPass
-                    update_paciente(phone, {"modalidade": "Parceria App", "status": "pilates_app"})
-                    enviar_botoes(phone, "Atendemos *Wellhub (Golden)* e *TotalPass (TP5)*. Qual o seu?", [{"id": "w1", "title": "Wellhub"}, {"id": "t1", "title": "Totalpass"}])
-                elif "Saúde Caixa" in msg_recebida:
-                    # 🛡️ Saúde Caixa Pilates: comporta-se como convênio Fisio padrão
-                    # Ver mapa_fluxos.md → Fluxo Pilates Saúde Caixa
-                    update_paciente(phone, {"modalidade": "Convênio", "convenio": "Saúde Caixa", "status": "pilates_caixa_queixa"})
-                    responder_texto(phone, "Entendido! 🏦 Para o plano Saúde Caixa, me conte brevemente: o que te trouxe à clínica hoje?")
-                elif "Particular" in msg_recebida:
-                    # 🛡️ Pilates Particular: pergunta experiência ANTES da aula experimental
-                    # Ver mapa_fluxos.md → Experiência com Pilates
-                    update_paciente(phone, {"modalidade": "Particular", "status": "pilates_part_experiencia"})
-                    enviar_botoes(phone, "Para personalizarmos sua experiência, você já praticou Pilates? 🧘",
-                        [{"id": "exp_atual", "title": "☑️ Já pratico"}, {"id": "exp_pass", "title": "🌱 Já pratiquei"}, {"id": "exp_nao", "title": "❌ Nunca pratiquei"}])
-
-            elif status == "pilates_part_experiencia":
-                # 🛡️ Captura nível de experiência do lead Pilates Particular
-                # Ver mapa_fluxos.md → Experiência com Pilates
-                update_paciente(phone, {"experiencia_pilates": msg_recebida, "status": "pilates_part_exp"})
-                enviar_botoes(phone, "Ótima escolha! ✨ O Pilates vai ajudar a fortalecer o corpo. Gostaria de agendar uma aula experimental gratuita para conhecer o nosso estúdio?", [{"id": "pe_sim", "title": "Sim, gostaria"}, {"id": "pe_nao", "title": "Não, já quero começar"}])
-
-            elif status == "pilates_part_exp":
-                update_paciente(phone, {"interesse_experimental": msg_recebida, "status": "pilates_part_periodo"})
-                enviar_botoes(phone, "Agradecemos a escolha! Para o agendamento, qual o melhor período para você?", [{"id": "pe_m", "title": "☀️ Manhã"}, {"id": "pe_t", "title": "⛅ Tarde"}, {"id": "pe_n", "title": "🌙 Noite"}])
-
-            elif status == "pilates_part_periodo":
-                update_paciente(phone, {"periodo": msg_recebida})
-                if is_veteran:
-                    update_paciente(phone, {"status": "atendimento_humano"})
-                    responder_texto(phone, "Tudo pronto! Nossa equipe vai assumir o atendimento agora mesmo para alinhar seu horário. Aguarde um instante! 👩‍⚕️")
-                else:
-                    update_paciente(phone, {"status": "pilates_part_nome"})
-                    responder_texto(phone, "Para agilizarmos seu atendimento de Pilates, por favor, digite seu NOME E SOBRENOME:")
-            
-            elif status == "pilates_part_nome":
-                update_paciente(phone, {"title": msg_recebida, "status": "pilates_part_cpf"})
-                responder_texto(phone, "Nome registrado! ✅ Agora, para validarmos o seu registro com segurança, digite o seu CPF (apenas os 11 números):")
-
-            elif status == "pilates_part_cpf":
-                cpf_limpo = re.sub(r'\D', '', msg_recebida)
-                if not validar_cpf(cpf_limpo): responder_texto(phone, "❌ CPF inválido. Por favor, verifique os números e digite novamente:")
-                else:
-                    update_paciente(phone, {"cpf": cpf_limpo, "status": "pilates_part_nasc"})
-                    responder_texto(phone, "Recebido! ✅ Qual sua data de nascimento? (Ex: 15/05/1980)")
-
-            elif status == "pilates_part_nasc":
-                validacao = validar_data_nascimento(msg_recebida)
-                if not validacao["valida"]: responder_texto(phone, "❌ Data inválida. Digite uma data real no formato DD/MM/AAAA (ex: 15/05/1980).")
-                else:
-                    # Salva data NORMALIZADA (4 dígitos) — ver mapa_fluxos.md bug Cleusa
-                    update_paciente(phone, {"birthDate": validacao["data"], "status": "pilates_part_email"})
-                    responder_texto(phone, "Para completarmos, qual seu melhor E-MAIL?")
-
-            elif status == "pilates_part_email":
-                if "@" not in msg_recebida or "." not in msg_recebida: responder_texto(phone, "❌ E-mail inválido. Por favor, digite um e-mail válido.")
-                else:
-                    # 🛡️ Pilates: cadastra aluno no Feegow + marca precisa_recepcao
-                    # Card permanece na coluna Lead Pilates (ver index.html filtros)
-                    # Ver mapa_fluxos.md → Fluxo Pilates
-                    update_paciente(phone, {"email": msg_recebida})
-                    info_atualizado = get_paciente(phone)
-                    resultado_feegow = integrar_feegow(phone, info_atualizado)
-                    update_data = {"status": "pilates_pendente_recepcao"}
-                    if resultado_feegow:
-                        update_data.update(resultado_feegow)
-                    update_paciente(phone, update_data)
-                    marcar_precisa_recepcao(phone, "Atenção lead Pilates")
-                    responder_texto(phone, "Tudo pronto! Nossa equipe vai assumir o atendimento agora mesmo para confirmar o seu horário. Aguarde um instante! 👩‍⚕️")
-
-            elif status == "pilates_app":
-                # 🛡️ Wellhub/TotalPass: após escolher app, confirma se tem plano elegível
-                # Ver mapa_fluxos.md → Fluxo Wellhub / TotalPass
-                plano = "Golden" if msg_recebida == "Wellhub" else "TP5"
-                update_paciente(phone, {"convenio": msg_recebida, "status": "pilates_app_confirma_plano"})
-                enviar_botoes(phone, f"⚠️ Atendemos apenas o plano *{plano}* do {msg_recebida}. Você está com este plano?",
-                    [{"id": "pl_sim", "title": f"✅ Tenho {plano}"}, {"id": "pl_nsei", "title": "❓ Não sei"}, {"id": "pl_outro", "title": "❌ Tenho outro"}])
-
-            elif status == "pilates_app_confirma_plano":
-                # 🛡️ Roteia para A (segue Golden/TP5), B (cross-sell), C (orientar verificação)
-                info_app = info.get("convenio", "Wellhub")
-                if "✅" in msg_recebida or "Tenho Golden" in msg_recebida or "Tenho TP5" in msg_recebida:
-                    # CAMINHO A — segue fluxo Wellhub/TotalPass normal
-                    if info_app == "Wellhub":
-                        update_paciente(phone, {"status": "pilates_wellhub_id"})
-                        responder_texto(phone, "Perfeito! Por favor, informe o seu Wellhub ID.")
-                    else:
-                        update_paciente(phone, {"status": "pilates_app_periodo"})
-                        enviar_botoes(phone, "Perfeito! ✅ Para agilizarmos o agendamento, qual o melhor período para você?",
-                            [{"id": "pe_m", "title": "☀️ Manhã"}, {"id": "pe_t", "title": "⛅ Tarde"}, {"id": "pe_n", "title": "🌙 Noite"}])
-                elif "❌" in msg_recebida or "outro" in msg_recebida.lower():
-                    # CAMINHO B — cross-sell
-                    update_paciente(phone, {"status": "pilates_app_cross_sell"})
-                    enviar_botoes(phone,
-                        f"Que pena! Atualmente atendemos apenas o plano de cobertura completa pelo {info_app}.\n\n"
-                        "Mas temos o nosso *Plano Particular* que pode te interessar. Gostaria de conhecer?",
-                        [{"id": "cs_sim", "title": "Sim, quero conhecer"}, {"id": "cs_nao", "title": "Agora não"}])
-                elif "❓" in msg_recebida or "não sei" in msg_recebida.lower() or "nao sei" in msg_recebida.lower():
-                    # CAMINHO C — orientar verificação
-                    update_paciente(phone, {"status": "pilates_app_orientar"})
-                    enviar_botoes(phone,
-                        f"Sem problemas! 😊\n\nPara verificar, abra o app do {info_app} em *'Minha conta'* — o plano aparece logo abaixo do seu nome.\n\n"
-                        "Enquanto verifica, posso te orientar sobre nosso *Plano Particular*, caso seu plano não cubra. Deseja conhecer?",
-                        [{"id": "or_sim", "title": "Sim, quero conhecer"}, {"id": "or_nao", "title": "Vou verificar e volto"}])
-                else:
-                    enviar_botoes(phone, "Por favor, escolha uma das opções:",
-                        [{"id": "pl_sim", "title": "✅ Tenho o plano"}, {"id": "pl_nsei", "title": "❓ Não sei"}, {"id": "pl_outro", "title": "❌ Tenho outro"}])
-
-            elif status == "pilates_app_cross_sell":
-                # 🛡️ Caminho B: paciente tinha plano fora de cobertura
-                info_app = info.get("convenio", "Wellhub")
-                if "Sim" in msg_recebida:
-                    # Migra para fluxo Particular
-                    update_paciente(phone, {"modalidade": "Particular", "convenio": "", "status": "pilates_part_experiencia"})
-                    enviar_botoes(phone, "Ótima decisão! ✨\n\nPara personalizarmos sua experiência, você já praticou Pilates? 🧘",
-                        [{"id": "exp_atual", "title": "☑️ Já pratico"}, {"id": "exp_pass", "title": "🌱 Já pratiquei"}, {"id": "exp_nao", "title": "❌ Nunca pratiquei"}])
-                else:
-                    # Lead morno
-                    update_paciente(phone, {"status": "pilates_lead_morno",
-                                            "motivo_lead_morno": f"Plano {info_app} fora da cobertura"})
-                    marcar_precisa_recepcao(phone, "Recuperar lead")
-                    responder_texto(phone, "Tudo certo! Volte quando quiser, será um prazer atender. 😊")
-
-            elif status == "pilates_app_orientar":
-                # 🛡️ Caminho C: paciente não sabia o plano
-                info_app = info.get("convenio", "Wellhub")
-                if "Sim" in msg_recebida:
-                    update_paciente(phone, {"modalidade": "Particular", "convenio": "", "status": "pilates_part_experiencia"})
-                    enviar_botoes(phone, "Ótima decisão! ✨\n\nPara personalizarmos sua experiência, você já praticou Pilates? 🧘",
-                        [{"id": "exp_atual", "title": "☑️ Já pratico"}, {"id": "exp_pass", "title": "🌱 Já pratiquei"}, {"id": "exp_nao", "title": "❌ Nunca pratiquei"}])
-                else:
-                    update_paciente(phone, {"status": "pilates_lead_morno",
-                                            "motivo_lead_morno": f"Não sabia o plano {info_app}"})
-                    marcar_precisa_recepcao(phone, "Recuperar lead")
-                    responder_texto(phone, "Tudo certo! Volte quando quiser, será um prazer atender. 😊")
-
-            elif status == "pilates_wellhub_id":
-                update_paciente(phone, {"numCarteirinha": msg_recebida, "status": "pilates_app_periodo"})
-                enviar_botoes(phone, "ID recebido com sucesso! ✅ Para agilizarmos, qual o melhor período para você?", [{"id": "pe_m", "title": "☀️ Manhã"}, {"id": "pe_t", "title": "⛅ Tarde"}, {"id": "pe_n", "title": "🌙 Noite"}])
-                
-            elif status == "pilates_app_periodo":
-                periodo_limpo = msg_recebida.replace("☀️ ", "").replace("⛅ ", "").replace("🌙 ", "")
-                update_paciente(phone, {"periodo": msg_recebida})
-                if is_veteran:
-                    update_paciente(phone, {"status": "atendimento_humano"})
-                    responder_texto(phone, f"Tudo pronto! Nossa equipe vai confirmar o horário para a {periodo_limpo} em instantes. 👩‍⚕️")
-                else:
-                    update_paciente(phone, {"status": "pilates_app_nome_completo"})
-                    responder_texto(phone, "Para finalizarmos, digite o seu NOME E SOBRENOME:")
-
-            elif status == "pilates_app_nome_completo":
-                update_paciente(phone, {"title": msg_recebida, "status": "pilates_app_cpf"})
-                responder_texto(phone, "Nome registrado! ✅ Agora, digite o seu CPF (apenas os 11 números):")
-
-            elif status == "pilates_app_cpf":
-                cpf_limpo = re.sub(r'\D', '', msg_recebida)
-                if not validar_cpf(cpf_limpo): responder_texto(phone, "❌ CPF inválido. Por favor, verifique os números e digite novamente:")
-                else:
-                    update_paciente(phone, {"cpf": cpf_limpo, "status": "pilates_app_nasc"})
-                    responder_texto(phone, "Recebido! ✅ Qual sua data de nascimento? (Ex: 15/05/1980)")
-
-            elif status == "pilates_app_nasc":
-                validacao = validar_data_nascimento(msg_recebida)
-                if not validacao["valida"]: responder_texto(phone, "❌ Data inválida. Digite uma data real no formato DD/MM/AAAA (ex: 15/05/1980).")
-                else:
-                    # Salva data NORMALIZADA (4 dígitos) — ver mapa_fluxos.md bug Cleusa
-                    update_paciente(phone, {"birthDate": validacao["data"], "status": "pilates_app_email"})
-                    responder_texto(phone, "Para completarmos o registro, qual seu melhor E-MAIL?")
-
-            elif status == "pilates_app_email":
-                if "@" not in msg_recebida or "." not in msg_recebida: responder_texto(phone, "❌ E-mail inválido. Por favor, digite um e-mail válido.")
-                else:
-                    # 🛡️ Wellhub/TotalPass (Golden/TP5): cadastra no Feegow + recepção transfere pro NextFit
-                    # Ver mapa_fluxos.md → Fluxo Wellhub / TotalPass
-                    update_paciente(phone, {"email": msg_recebida})
-                    info_atualizado = get_paciente(phone)
-                    resultado_feegow = integrar_feegow(phone, info_atualizado)
-                    update_data = {"status": "pilates_pendente_recepcao"}
-                    if resultado_feegow:
-                        update_data.update(resultado_feegow)
-                    update_paciente(phone, update_data)
-                    marcar_precisa_recepcao(phone, "Transferir NextFit")
-
-                    nome_app = info_atualizado.get("convenio", "do seu aplicativo")
-                    responder_texto(phone,
-                        "Cadastro concluído! 🎉\n\n"
-                        f"📲 *O agendamento das aulas é feito direto pelo app do {nome_app}*. "
-                        "Nossa unidade aparece como *Conectifisio São Caetano* — "
-                        "escolha o horário disponível direto por lá.\n\n"
-                        "Qualquer dúvida, nossa equipe está à disposição. 😊"
-                    )
-
-            elif status == "pilates_caixa_queixa":
-                # 🛡️ Saúde Caixa Pilates: captura queixa (igual convênio Fisio)
-                update_paciente(phone, {"queixa": msg_recebida, "status": "pilates_caixa_num_carteirinha"})
-                responder_texto(phone, "Anotado! ✅ Pode me informar o *número da sua carteirinha* do Saúde Caixa?")
-
-            elif status == "pilates_caixa_num_carteirinha":
-                num_limpo = re.sub(r'\D', '', msg_recebida)
-                _espera = ["momento", "aguarda", "agora não", "depois", "vou pegar", "não tenho", "nao tenho", "vou ver", "preciso ver"]
-                if any(e in msg_limpa for e in _espera) and len(num_limpo) < 4:
-                    update_paciente(phone, {"status": "pausado", "unread": True, "ultima_mensagem_paciente": msg_recebida})
-                    responder_texto(phone, "Sem problema! 😊 Quando tiver o número da carteirinha em mãos, é só me enviar aqui que continuamos.")
-                elif len(num_limpo) < 4:
-                    responder_texto(phone, "❌ Número de carteirinha inválido. Por favor, digite apenas os números da sua carteirinha (mínimo 4 dígitos):")
-                else:
-                    update_paciente(phone, {"numCarteirinha": num_limpo, "status": "pilates_caixa_foto_cart"})
-                    responder_texto(phone, "Anotado! ✅ Agora a parte documental:\n\nEnvie uma *FOTO NÍTIDA da sua carteirinha* do Saúde Caixa (use o ícone de clipe ou câmera do WhatsApp).")
-
-            elif status == "pilates_caixa_foto_cart":
-                if not tem_anexo: responder_texto(phone, "❌ Não recebi a imagem. Por favor, envie a foto da sua carteirinha.")
-                else:
-                    media_data = salvar_midia_imediata(phone, "carteirinha", media_id) if media_id else {}
-                    update_fields = {
-                        "status": "pilates_caixa_foto_pedido",
-                        "tem_foto_carteirinha": True,
-                    }
-                    update_fields.update(media_data)
-                    update_paciente(phone, update_fields)
-                    responder_texto(phone, "Foto recebida! ✅\n\nAgora, envie a *FOTO ou PDF do seu PEDIDO MÉDICO* atualizado.")
-
-            elif status == "pilates_caixa_foto_pedido":
-                if not tem_anexo: responder_texto(phone, "❌ Por favor, envie o Pedido Médico.")
-                else:
-                    media_data = salvar_midia_imediata(phone, "pedido", media_id) if media_id else {}
-                    update_fields = {
-                        "status": "pilates_caixa_periodo",
-                        "tem_foto_pedido": True,
-                    }
-                    update_fields.update(media_data)
-                    update_paciente(phone, update_fields)
-                    enviar_botoes(phone, "Documentação completa! 🎉 ✅ Para agilizarmos o agendamento, qual o melhor período para você?", [{"id": "pe_m", "title": "☀️ Manhã"}, {"id": "pe_t", "title": "⛅ Tarde"}, {"id": "pe_n", "title": "🌙 Noite"}])
-            
-            elif status == "pilates_caixa_periodo":
-                update_paciente(phone, {"periodo": msg_recebida})
-                if is_veteran:
-                    update_paciente(phone, {"status": "atendimento_humano"})
-                    responder_texto(phone, "Tudo pronto! Nossa equipe vai assumir o atendimento agora mesmo para alinhar seu horário. 👩‍⚕️")
-                else:
-                    update_paciente(phone, {"status": "pilates_caixa_nome"})
-                    responder_texto(phone, "Para finalizarmos, por favor digite o seu NOME E SOBRENOME:")
-
-            elif status == "pilates_caixa_nome":
-                update_paciente(phone, {"title": msg_recebida, "status": "pilates_caixa_cpf"})
-                responder_texto(phone, "Nome registrado! ✅ Agora, digite seu CPF (apenas os 11 números):")
-
-            elif status == "pilates_caixa_cpf":
-                cpf_limpo = re.sub(r'\D', '', msg_recebida)
-                if not validar_cpf(cpf_limpo): responder_texto(phone, "❌ CPF inválido. Digite apenas os 11 números.")
-                else:
-                    update_paciente(phone, {"cpf": cpf_limpo, "status": "pilates_caixa_nasc"})
-                    responder_texto(phone, "Recebido! ✅ Qual sua data de nascimento? (Ex: 15/05/1980)")
-
-            elif status == "pilates_caixa_nasc":
-                validacao = validar_data_nascimento(msg_recebida)
-                if not validacao["valida"]: responder_texto(phone, "❌ Data inválida. Digite no formato DD/MM/AAAA (ex: 15/05/1980).")
-                else:
-                    # Salva data NORMALIZADA (4 dígitos) — ver mapa_fluxos.md bug Cleusa
-                    update_paciente(phone, {"birthDate": validacao["data"], "status": "pilates_caixa_email"})
-                    responder_texto(phone, "Ótimo! Qual seu melhor E-MAIL?")
-
-            elif status == "pilates_caixa_email":
-                if "@" not in msg_recebida or "." not in msg_recebida: responder_texto(phone, "❌ E-mail inválido. Por favor, digite um e-mail válido.")
-                else:
-                    # 🛡️ Pilates: cadastra aluno no Feegow + marca precisa_recepcao
-                    # Ver mapa_fluxos.md → Fluxo Pilates
-                    update_paciente(phone, {"email": msg_recebida})
-                    info_atualizado = get_paciente(phone)
-                    resultado_feegow = integrar_feegow(phone, info_atualizado)
-                    update_data = {"status": "pilates_pendente_recepcao"}
-                    if resultado_feegow:
-                        update_data.update(resultado_feegow)
-                    update_paciente(phone, update_data)
-                    marcar_precisa_recepcao(phone, "Atenção lead Pilates")
-                    responder_texto(phone, "Recebido! ✅ Tudo pronto! Nossa equipe vai confirmar o seu horário e logo retorna. 👩‍⚕️")
-
-        elif status == "triagem_neuro":
-            if "integral" in msg_limpa or "1" in msg_limpa:
-                update_paciente(phone, {"mobilidade": "Necessidade de auxílio integral", "status": "triagem_neuro_queixa"})
-                responder_texto(phone, "Agradeço por compartilhar. ❤️ Para prepararmos o consultório com a estrutura correta para você, me conte brevemente: o que te trouxe à clínica hoje?")
-            else:
-                mobilidade = "Preciso de auxílio parcial" if "parcial" in msg_limpa or "2" in msg_limpa else "Autonomia total"
-                update_paciente(phone, {"mobilidade": mobilidade, "status": "triagem_neuro_queixa"})
-                responder_texto(phone, "Anotado! ✅\n\nPara prepararmos o consultório com a estrutura correta para você, me conte brevemente: o que te trouxe à clínica hoje?")
-
-        elif status == "triagem_neuro_queixa":
-            acolhimento = chamar_ia_custom(msg_recebida) or "Compreendo perfeitamente, e saiba que estamos aqui para cuidar de você da melhor forma."
-            conv_salvo = info.get("convenio", "")
-            update_paciente(phone, {"queixa": msg_recebida, "queixa_ia": acolhimento, "lastPatientInteraction": datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S+00:00'), "status": "modalidade"})
-            if is_veteran and conv_salvo and conv_salvo.lower() != "particular":
-                update_paciente(phone, {"status": "confirmando_convenio_salvo"})
-                enviar_botoes(phone, f"{acolhimento}\n\nVi aqui que você já utilizou o convênio *{conv_salvo}*. Vamos seguir com ele para este serviço?", [{"id": "c_manter", "title": "Sim, manter plano"}, {"id": "c_trocar", "title": "Troquei de plano"}, {"id": "c_part", "title": "Mudar p/ Particular"}])
-            else:
-                enviar_botoes(phone, f"{acolhimento}\n\nDeseja atendimento pelo seu CONVÊNIO ou de forma PARTICULAR?", [{"id": "m1", "title": "Convênio"}, {"id": "m2", "title": "Particular"}])
-
-        elif status == "cadastrando_queixa":
-            # VALIDAÇÃO: rejeita respostas que não são queixa (paciente clicou achando que era avanço)
-            msg_strip_queixa = msg_recebida.strip().lower()
-            palavras_avanco = ["próximo", "proximo", "next", "avançar", "avancar", "ok",
-                              "sim", "tá", "ta", "blz", "beleza", "continuar", "vai",
-                              "manda", "pode mandar", "?", "."]
-            eh_resposta_curta_invalida = (
-                len(msg_strip_queixa) <= 12 and
-                (msg_strip_queixa in palavras_avanco or msg_strip_queixa.replace("!", "").replace(".", "").replace("?", "") in palavras_avanco)
-            )
-            if eh_resposta_curta_invalida:
-                responder_texto(phone,
-                    "Por favor, me conte um pouquinho mais sobre o que está sentindo ou o motivo da consulta. 😊\n\n"
-                    "_Pode descrever em poucas palavras: dor, lesão, recuperação, etc._"
-                )
-                return jsonify({"status": "queixa_invalida"}), 200
-
-            acolhimento = chamar_ia_custom(msg_recebida) or "Compreendo perfeitamente, e saiba que estamos aqui para cuidar de você da melhor forma."
-            if servico in ["Recovery", "Liberação Miofascial"]:
-                # Exceção 2: sempre particular, sem perguntar modalidade → vai pra unidade
-                if is_veteran:
-                    update_paciente(phone, {"queixa": msg_recebida, "queixa_ia": acolhimento, "status": "agendando"})
-                    enviar_botoes(phone, f"{acolhimento}\n\nComo você já é nosso paciente, vamos direto para a agenda. Qual o melhor período para você? ☀️⛅", [{"id": "t1", "title": "Manhã"}, {"id": "t2", "title": "Tarde"}])
-                else:
-                    update_paciente(phone, {"queixa": msg_recebida, "queixa_ia": acolhimento, "status": "escolhendo_unidade_apos_servico"})
-                    enviar_botoes(phone,
-                        f"{acolhimento}\n\nEm qual unidade você prefere ser atendido?",
-                        [{"id": "u1", "title": "São Caetano"}, {"id": "u2", "title": "Ipiranga"}]
-                    )
-            else:
-                update_paciente(phone, {"queixa": msg_recebida, "queixa_ia": acolhimento, "status": "modalidade"})
-                conv_salvo = info.get("convenio", "")
-                if is_veteran and conv_salvo and conv_salvo.lower() != "particular":
-                    update_paciente(phone, {"status": "confirmando_convenio_salvo"})
-                    enviar_botoes(phone, f"{acolhimento}\n\nVi aqui que você já utilizou o convênio *{conv_salvo}*. Vamos seguir com ele para este serviço?", [{"id": "c_manter", "title": "Sim, manter plano"}, {"id": "c_trocar", "title": "Troquei de plano"}, {"id": "c_part", "title": "Mudar p/ Particular"}])
-                else:
-                    enviar_botoes(phone, f"{acolhimento}\n\nDeseja atendimento pelo seu CONVÊNIO ou de forma PARTICULAR?", [{"id": "m1", "title": "Convênio"}, {"id": "m2", "title": "Particular"}])
-
-        elif status == "modalidade":
-            if "Convênio" in msg_recebida:
-                update_paciente(phone, {"modalidade": "Convênio", "status": "nome_convenio"})
-                secoes = [{"title": "Convênios Aceitos", "rows": [{"id": "c1", "title": "Saúde Petrobras"}, {"id": "c2", "title": "Mediservice"}, {"id": "c3", "title": "Cassi"}, {"id": "c4", "title": "Geap Saúde"}, {"id": "c5", "title": "Amil"}, {"id": "c6", "title": "Bradesco Saúde"}, {"id": "c7", "title": "Porto Seguro Saúde"}, {"id": "c8", "title": "Prevent Senior"}, {"id": "c9", "title": "Saúde Caixa"}]}]
-                enviar_lista(phone, "Selecione o seu plano de saúde para validarmos a cobertura:", "Ver Convênios", secoes)
-            else:
-                if is_veteran:
-                    update_paciente(phone, {"modalidade": "Particular", "status": "agendando"})
-                    enviar_botoes(phone, "Perfeito! Como você já é nosso paciente, vamos direto para a agenda. Qual o melhor período para você? ☀️⛅", [{"id": "t1", "title": "Manhã"}, {"id": "t2", "title": "Tarde"}])
-                else:
-                    # Novo + Particular: pergunta UNIDADE antes do cadastro
-                    update_paciente(phone, {"modalidade": "Particular", "status": "escolhendo_unidade_apos_servico"})
-                    enviar_botoes(phone,
-                        "Perfeito, atendimento Particular! ✨\n\nEm qual unidade você prefere ser atendido?",
-                        [{"id": "u1", "title": "São Caetano"}, {"id": "u2", "title": "Ipiranga"}]
-                    )
-
-        elif status == "nome_convenio":
-            convenio_selecionado = msg_recebida
-            CONVENIOS_VALIDOS = ["Saúde Petrobras", "Mediservice", "Cassi", "Geap Saúde", "Amil",
-                                  "Bradesco Saúde", "Porto Seguro Saúde", "Prevent Senior", "Saúde Caixa"]
-            CONVENIOS_NAO_ATENDIDOS = ["Unimed", "Sulamerica", "SulAmérica", "Hapvida", "NotreDame", "Notre Dame", "Golden Cross", "Apivida"]
-            if any(c.lower() in convenio_selecionado.lower() for c in CONVENIOS_NAO_ATENDIDOS):
-                responder_texto(phone, f"Infelizmente não atendemos o convênio {convenio_selecionado}. 😊 Os convênios que aceitamos são: Amil, Bradesco Saúde, Porto Seguro, Prevent Senior, Saúde Caixa, Saúde Petrobras, Mediservice, Cassi e Geap Saúde. Gostaria de verificar outra opção ou realizar o atendimento particular?")
-            elif convenio_selecionado not in CONVENIOS_VALIDOS:
-                secoes = [{"title": "Convênios Aceitos", "rows": [{"id": "c1", "title": "Saúde Petrobras"}, {"id": "c2", "title": "Mediservice"}, {"id": "c3", "title": "Cassi"}, {"id": "c4", "title": "Geap Saúde"}, {"id": "c5", "title": "Amil"}, {"id": "c6", "title": "Bradesco Saúde"}, {"id": "c7", "title": "Porto Seguro Saúde"}, {"id": "c8", "title": "Prevent Senior"}, {"id": "c9", "title": "Saúde Caixa"}]}]
-                enviar_lista(phone, "❌ Por favor, selecione um dos convênios disponíveis na lista abaixo:", "Ver Convênios", secoes)
-            elif not verificar_cobertura(convenio_selecionado, servico):
-                update_paciente(phone, {"convenio": convenio_selecionado, "status": "cobertura_recusada"})
-                enviar_botoes(phone, f"⚠️ O seu plano *{convenio_selecionado}* não possui cobertura direta para *{servico}* na nossa clínica.\n\nNo entanto, você pode realizar o atendimento Particular para solicitar reembolso. Deseja seguir no particular?", [{"id": "part", "title": "Seguir Particular"}, {"id": "out", "title": "Escolher outro"}])
-            else:
-                if is_veteran:
-                    update_paciente(phone, {"convenio": convenio_selecionado, "status": "num_carteirinha"})
-                    responder_texto(phone, f"Anotado: {convenio_selecionado}! ✅\n\nComo você já é nosso paciente, pulei o preenchimento de CPF e E-mail! Para atualizarmos o seu cadastro, qual o NÚMERO DA SUA NOVA CARTEIRINHA? (Apenas números)")
-                else:
-                    # Novo + Convênio: pergunta UNIDADE antes do cadastro
-                    update_paciente(phone, {"convenio": convenio_selecionado, "status": "escolhendo_unidade_apos_servico"})
-                    enviar_botoes(phone,
-                        f"Anotado: {convenio_selecionado}! ✅\n\nEm qual unidade você prefere ser atendido?",
-                        [{"id": "u1", "title": "São Caetano"}, {"id": "u2", "title": "Ipiranga"}]
-                    )
-
-        elif status == "cobertura_recusada":
-            if "Particular" in msg_recebida:
-                if is_veteran:
-                    update_paciente(phone, {"modalidade": "Particular", "status": "agendando"})
-                    enviar_botoes(phone, "Perfeito! Mudamos para Particular. Qual o melhor período para você? ☀️ ⛅", [{"id": "t1", "title": "Manhã"}, {"id": "t2", "title": "Tarde"}])
-                else:
-                    # Novo: ainda não escolheu unidade (recusa veio antes) → pergunta unidade
-                    update_paciente(phone, {"modalidade": "Particular", "convenio": "", "status": "escolhendo_unidade_apos_servico"})
-                    enviar_botoes(phone,
-                        "Perfeito! Mudamos para Particular. ✨\n\nEm qual unidade você prefere ser atendido?",
-                        [{"id": "u1", "title": "São Caetano"}, {"id": "u2", "title": "Ipiranga"}]
-                    )
-            else:
-                update_paciente(phone, {"status": "escolhendo_especialidade"})
-                secoes = [{"title": "Nossos Serviços", "rows": [{"id": "e1", "title": "Fisio Ortopédica"}, {"id": "e2", "title": "Fisio Neurológica"}, {"id": "e3", "title": "Fisio Pélvica"}, {"id": "e4", "title": "Acupuntura"}]}]
-                enviar_lista(phone, "Sem problemas! Qual outro serviço você gostaria de buscar?", "Ver Serviços", secoes)
-
-        elif status == "cadastrando_nome_completo":
-            partes_nc = [p for p in msg_limpa.split() if len(p) >= 2]
-            if len(partes_nc) < 2 or msg_recebida.isdigit(): responder_texto(phone, "❌ Por favor, digite seu NOME E SOBRENOME completos:")
-            else:
-                update_paciente(phone, {"title": msg_recebida, "status": "cpf"})
-                responder_texto(phone, "Nome registrado! ✅ Agora, para validarmos o seu registro com segurança junto ao sistema, digite o seu CPF (apenas os 11 números):")
-
-        elif status == "cpf":
-            cpf_limpo = re.sub(r'\D', '', msg_recebida)
-            if not validar_cpf(cpf_limpo):
-                responder_texto(phone, "❌ CPF inválido. Por favor, verifique os números e digite novamente:")
-            else:
-                conv_atual = info.get("convenio", "")
-
-                # ==========================================
-                # PORTO SEGURO — ELEGIBILIDADE SILENCIOSA
-                #
-                # MUDANÇA ARQUITETURAL (30/04/2026):
-                # 1. Salva o CPF e avança IMEDIATAMENTE para data de nascimento
-                # 2. Thread de elegibilidade roda em paralelo (silenciosa)
-                # 3. Resultado vai APENAS para o card no Kanban (badge verde/vermelho/amarelo)
-                # 4. Paciente nunca sabe se conseguimos ou não verificar a elegibilidade
-                # ==========================================
-                if any(x in conv_atual for x in ["Porto Seguro", "Itaú"]) and PORTO_SEGURO_SENHA:
-                    # Salva CPF e avança o estado ANTES de disparar a thread
-                    update_paciente(phone, {
-                        "cpf": cpf_limpo,
-                        "status": "data_nascimento",
-                        "porto_elegibilidade_badge": "amarelo",  # Badge inicial: aguardando verificação
-                        "porto_verificando": True
-                    })
-                    # Resposta natural — sem mencionar elegibilidade
-                    responder_texto(phone, "CPF recebido! ✅ Para completarmos sua ficha clínica, qual sua data de nascimento? (Ex: 15/05/1980)")
-                    # Thread dispara em background — não bloqueia o fluxo
-                    iniciar_verificacao_porto_background(phone, cpf_limpo, numero_id)
-                    return jsonify({"status": "cpf_recebido_porto_verificando"}), 200
-
-                # Outros convênios / Particular — fluxo padrão
-                busca = buscar_feegow_por_cpf(cpf_limpo)
-                if busca:
-                    if modalidade == "Particular":
-                        update_paciente(phone, {"cpf": cpf_limpo, "title": busca['nome'], "feegow_id": busca['id'], "status": "agendando"})
-                        enviar_botoes(phone, f"Reconheci seu cadastro, {busca['nome']}! ✨\n\nPulei as etapas de e-mail e nascimento. Qual o melhor período para você?", [{"id": "t1", "title": "Manhã"}, {"id": "t2", "title": "Tarde"}])
-                    else:
-                        update_paciente(phone, {"cpf": cpf_limpo, "title": busca['nome'], "feegow_id": busca['id'], "status": "num_carteirinha"})
-                        responder_texto(phone, f"Reconheci seu cadastro, {busca['nome']}! ✨\n\nPulei as etapas de e-mail e nascimento. Para atualizarmos o seu cadastro, qual o NÚMERO DA SUA CARTEIRINHA? (Apenas números)")
-                else:
-                    update_paciente(phone, {"cpf": cpf_limpo, "status": "data_nascimento"})
-                    responder_texto(phone, "Recebido! ✅ Para completarmos sua ficha clínica, qual sua data de nascimento? (Ex: 15/05/1980)")
-
-        elif status == "data_nascimento":
-            validacao = validar_data_nascimento(msg_recebida)
-            if not validacao["valida"]:
-                responder_texto(phone, "❌ Data de nascimento inválida. Digite uma data real no formato DD/MM/AAAA (ex: 15/05/1980).")
-            elif validacao["menor_12"]:
-                # Permite ao paciente confirmar se foi engano antes de bloquear
-                # Salva a data NORMALIZADA (4 dígitos) — ver mapa_fluxos.md bug Cleusa
-                update_paciente(phone, {"birthDate": validacao["data"], "status": "confirmando_menor_12"})
-                enviar_botoes(phone,
-                    f"⚠️ A data *{validacao['data']}* indica que o paciente tem menos de 12 anos.\n\n"
-                    "Foi um engano de digitação?",
-                    [{"id": "menor_engano", "title": "Sim, foi engano"}, {"id": "menor_correto", "title": "Não, é correta"}]
-                )
-            else:
-                # Salva a data NORMALIZADA (4 dígitos) — ver mapa_fluxos.md bug Cleusa
-                update_paciente(phone, {"birthDate": validacao["data"], "status": "coletando_email"})
-                responder_texto(phone, "Ótimo! Para finalizar seu cadastro, qual seu melhor E-MAIL?")
-
-        elif status == "confirmando_menor_12":
-            if "engano" in msg_limpa or msg_recebida == "Sim, foi engano":
-                update_paciente(phone, {"status": "data_nascimento", "birthDate": ""})
-                responder_texto(phone, "Sem problemas! 😊 Pode me informar a data de nascimento correta? (Ex: 15/05/1980)")
-            elif "correta" in msg_limpa or msg_recebida == "Não, é correta":
-                update_paciente(phone, {"status": "finalizado", "robo_ligado": False})
-                responder_texto(phone,
-                    "⚠️ Infelizmente não possuímos especialidade pediátrica em nossas unidades. "
-                    "Não poderemos realizar este agendamento.\n\n"
-                    "Recomendamos a busca por profissionais especializados na área infantil. "
-                    "Obrigado pela compreensão! 🙏"
-                )
-            else:
-                enviar_botoes(phone,
-                    "Por favor, confirme:",
-                    [{"id": "menor_engano", "title": "Sim, foi engano"}, {"id": "menor_correto", "title": "Não, é correta"}]
-                )
-
-        elif status == "coletando_email":
-            if "@" not in msg_recebida or "." not in msg_recebida: responder_texto(phone, "❌ E-mail inválido. Por favor, digite um e-mail válido.")
-            else:
-                if modalidade == "Particular":
-                    update_paciente(phone, {"email": msg_recebida, "status": "agendando"})
-                    enviar_botoes(phone, "Cadastro concluído! 🎉\n\nQual o melhor período para verificarmos a agenda particular?", [{"id": "t1", "title": "Manhã"}, {"id": "t2", "title": "Tarde"}])
-                else:
-                    update_paciente(phone, {"email": msg_recebida, "status": "num_carteirinha"})
-                    responder_texto(phone, "Certo! E qual o NÚMERO DA CARTEIRINHA do seu plano? (apenas números)")
-
-        elif status == "num_carteirinha":
-            num_limpo = re.sub(r'\D', '', msg_recebida)
-            _espera = ["momento", "aguarda", "agora não", "depois", "vou pegar", "não tenho", "nao tenho", "vou ver", "preciso ver"]
-            if any(e in msg_limpa for e in _espera) and len(num_limpo) < 4:
-                update_paciente(phone, {"status": "pausado", "unread": True, "ultima_mensagem_paciente": msg_recebida})
-                responder_texto(phone, "Sem problema! 😊 Quando tiver o número da carteirinha em mãos, é só me enviar aqui que continuamos.")
-            elif len(num_limpo) < 4:
-                responder_texto(phone, "❌ Número de carteirinha inválido. Por favor, digite apenas os números da sua carteirinha (mínimo 4 dígitos):")
-            else:
-                update_paciente(phone, {"numCarteirinha": num_limpo, "status": "foto_carteirinha"})
-                responder_texto(phone, "Anotado! ✅ Agora a parte documental:\n\nEnvie uma FOTO NÍTIDA da sua carteirinha (use o ícone de clipe ou câmera do WhatsApp).")
-
-        elif status == "foto_carteirinha":
-            if not tem_anexo: responder_texto(phone, "❌ Não recebi a imagem. Por favor, envie a foto da sua carteirinha.")
-            else:
-                media_data = salvar_midia_imediata(phone, "carteirinha", media_id) if media_id else {}
-                update_fields = {
-                    "status": "foto_pedido_medico",
-                    "tem_foto_carteirinha": True,
-                }
-                update_fields.update(media_data)
-                update_paciente(phone, update_fields)
-                responder_texto(phone, "Foto recebida! ✅\n\nAgora, envie a FOTO DO SEU PEDIDO MÉDICO.")
-
-        elif status == "foto_pedido_medico":
-            _links_pedido = ["memed.com.br", "drconnect", "bula.fiocruz", "receita", "http", "https"]
-            _tem_link_pedido = any(lp in msg_limpa for lp in _links_pedido) and not tem_anexo
-            if _tem_link_pedido:
-                update_paciente(phone, {"status": "agendando", "tem_foto_pedido": True, "pedido_link": msg_recebida})
-                enviar_botoes(phone, "Pedido médico digital recebido! 🎉\n\nQual o melhor período para verificarmos a sua vaga?", [{"id": "t1", "title": "Manhã"}, {"id": "t2", "title": "Tarde"}])
-            elif not tem_anexo: responder_texto(phone, "❌ Por favor, envie a foto do seu Pedido Médico.")
-            else:
-                media_data = salvar_midia_imediata(phone, "pedido", media_id) if media_id else {}
-                update_fields = {
-                    "status": "agendando",
-                    "tem_foto_pedido": True,
-                }
-                update_fields.update(media_data)
-                update_paciente(phone, update_fields)
-                enviar_botoes(phone, "Documentação completa! 🎉\n\nQual o melhor período para verificarmos a sua vaga?", [{"id": "t1", "title": "Manhã"}, {"id": "t2", "title": "Tarde"}])
-
-        elif status == "agendando":
-            if msg_recebida in ["Manhã", "Tarde", "Noite"]:
-                info["periodo"] = msg_recebida
-                if not modalidade and (info.get("convenio") or info.get("carteirinha_media_id")):
-                    modalidade = "Convênio"
-                novo_status = "pendente_feegow" if modalidade == "Convênio" else "finalizado"
-                update_data = {"periodo": msg_recebida, "status": novo_status, "modalidade": modalidade}
-                
-                if servico and "Pilates" not in servico:
-                    resultado_feegow = integrar_feegow(phone, info)
-                    if resultado_feegow: update_data.update(resultado_feegow)
-                
-                update_paciente(phone, update_data)
-                
-                if modalidade == "Convênio":
-                    texto_final = (f"Período selecionado com sucesso! ✅ Nossa recepção já recebeu as suas fotos e está realizando a validação de cobertura junto ao seu plano de saúde.\n\n"
-                                   f"Assim que a elegibilidade for confirmada, enviaremos as opções de horários disponíveis. Fique de olho por aqui! 😊")
-                else:
-                    texto_final = (f"Período selecionado com sucesso! ✅ Tudo pronto! A nossa equipe já está verificando a disponibilidade dos nossos especialistas para o período da {msg_recebida}.\n\n"
-                                   f"Em instantes voltaremos com as opções exatas para confirmarmos o seu horário. Fique de olho por aqui! ✨")
-                
-                responder_texto(phone, texto_final)
-            else:
-                enviar_botoes(phone, "Por favor, escolha o período:", [{"id": "t1", "title": "Manhã"}, {"id": "t2", "title": "Tarde"}])
+        ctx = Contexto(phone=phone, info=info, status=status, msg_recebida=msg_recebida, msg_limpa=msg_limpa,
+                       msg_type=msg_type, tem_anexo=tem_anexo, media_id=media_id, servico=servico,
+                       modalidade=modalidade, convenio=convenio, is_veteran=is_veteran,
+                       is_cortesia=is_cortesia, numero_id=numero_id, agora_iso=agora_iso)
+        resposta = registro_estados.despachar(ctx)
+        if resposta is not None:
+            return resposta
 
         return jsonify({"status": "success"}), 200
     except Exception as e:
         print(f"❌ Erro Crítico POST: {traceback.format_exc()}")
         return jsonify({"status": "error", "message": str(e)}), 200
 
+# ==========================================
+# ROTA: EVENTOS EM TEMPO REAL PARA O DASHBOARD (SSE / LONG-POLL)
+# ==========================================
+@app.route("/api/eventos", methods=["GET"])
+def eventos_dashboard():
+    """SSE (EventSource): eventos "mensagem", "card" e "resync".
+    Fallback sem EventSource: GET /api/eventos?modo=poll&desde=<cursor> (espera até 25s)."""
+    import time
+    desde = request.headers.get("Last-Event-ID") or request.args.get("desde")
+    try:
+        desde = int(desde) if desde not in (None, "") else _eventos_dashboard.ultimo_seq()
+    except ValueError:
+        desde = _eventos_dashboard.ultimo_seq() + 1  # cursor inválido → resync
+
+    # Conexões bloqueantes ocupam threads do gunicorn: acima do limite, o cliente volta ao polling
+    if not _eventos_dashboard.reservar_conexao():
+        if request.args.get("modo") == "poll":
+            return jsonify({"eventos": [], "cursor": desde, "ocupado": True}), 200
+        return jsonify({"error": "limite de conexões em tempo real atingido"}), 503, {"Retry-After": "60"}
+
+    if request.args.get("modo") == "poll":
+        try:
+            eventos = _eventos_dashboard.aguardar(desde, 25)
+        finally:
+            _eventos_dashboard.liberar_conexao()
+        return jsonify({
+            "eventos": [{"seq": seq, "tipo": tipo, "dados": dados} for seq, tipo, dados in eventos],
+            "cursor": eventos[-1][0] if eventos else desde
+        }), 200
+
+    def gerar():
+        ultimo = desde
+        yield "retry: 3000\n\n"
+        fim = time.time() + SSE_DURACAO_MAX
+        while time.time() < fim:
+            eventos = _eventos_dashboard.aguardar(ultimo, 15)
+            if not eventos:
+                yield ": ping\n\n"  # mantém a conexão viva através de proxies
+                continue
+            for seq, tipo, dados in eventos:
+                yield formatar_sse(seq, tipo, dados)
+                ultimo = seq
+
+    resposta = Response(gerar(), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    # Libera a vaga quando o servidor fecha a resposta — mesmo se o gerador nunca rodou
+    resposta.call_on_close(_eventos_dashboard.liberar_conexao)
+    return resposta
+
 # ==========================================
 # ROTA: CHAT MANUAL E UPLOAD DE FOTOS/PDF DO DASHBOARD
 # ==========================================
@@ -4514,19 +3183,12 @@ def chat_manual():
         url = f"https://graph.facebook.com/v19.0/{pid}/messages"
         headers = {"Authorization": f"Bearer {WHATSAPP_TOKEN}", "Content-Type": "application/json"}
 
-        from requests.adapters import HTTPAdapter
-        from urllib3.util.retry import Retry
-        
-        session = requests.Session()
-        retries = Retry(total=3, backoff_factor=0.5, status_forcelist=[ 500, 502, 503, 504 ])
-        session.mount('https://', HTTPAdapter(max_retries=retries))
-
         if file_b64:
             b64_data = file_b64.split(",")[1] if "," in file_b64 else file_b64
             file_bytes = base64.b64decode(b64_data)
             url_media = f"https://graph.facebook.com/v19.0/{pid}/media"
             
-            res_m = session.post(url_media, headers={"Authorization": f"Bearer {WHATSAPP_TOKEN}"}, files={'file': (file_name, file_bytes, mime_type)}, data={'messaging_product': 'whatsapp'}, timeout=15)
+            res_m = http_post(url_media, headers={"Authorization": f"Bearer {WHATSAPP_TOKEN}"}, files={'file': (file_name, file_bytes, mime_type)}, data={'messaging_product': 'whatsapp'}, timeout=15)
             m_id = res_m.json().get("id")
             
             if not m_id:
@@ -4536,11 +3198,11 @@ def chat_manual():
             payload = {"messaging_product": "whatsapp", "to": phone, "type": msg_type, msg_type: {"id": m_id}}
             if message_text: payload[msg_type]["caption"] = message_text
             
-            res = session.post(url, json=payload, headers=headers, timeout=15)
+            res = http_post(url, json=payload, headers=headers, timeout=15)
             
         else:
             payload = {"messaging_product": "whatsapp", "to": phone, "type": "text", "text": {"body": message_text}}
-            res = session.post(url, json=payload, headers=headers, timeout=15)
+            res = http_post(url, json=payload, headers=headers, timeout=15)
 
         if res.status_code == 200:
             registrar_historico(phone, "clinica", "texto" if not file_b64 else "anexo", message_text or "[Arquivo]")
@@ -4556,6 +3218,34 @@ def chat_manual():
         print(traceback.format_exc(), file=sys.stderr)
         return jsonify({"success": False, "error": f"Erro de conexão/servidor: {str(e)}"}), 500
 
+@app.route("/api/diagnostico/metricas", methods=["GET"])
+def diagnostico_metricas():
+    """Contadores internos (fila do webhook, deduplicação).
+    GET /api/diagnostico/metricas?token=conectifisio_followup_2025"""
+    if request.args.get("token", "") != os.environ.get("FOLLOWUP_SECRET", "conectifisio_followup_2025"):
+        return jsonify({"error": "Unauthorized"}), 401
+    return jsonify({
+        "fila_webhook": _pool_webhook.status(),
+        "dedupe_mensagens": _dedupe_mensagens.status(),
+        "kanban_sync": _estado_kanban.status(),
+        "eventos_dashboard": {"seq": _eventos_dashboard.ultimo_seq(), "conexoes": _eventos_dashboard.conexoes,
+                              "max_conexoes": _eventos_dashboard.max_conexoes, "recusadas": _eventos_dashboard.recusadas},
+        "caches": metricas_caches(),
+        "http": metricas_http(),
+        "fila_envio": _fila_envio.status() if _fila_envio else {"ativo": False},
+        "estados": registro_estados.metricas(),
+        "unidade_trabalho": metricas_unidade_trabalho(),
+        "interruptor_robo": _interruptor_robo.status(),
+        "faq": _faq_indice.status(),
+        "faq_semantico": _faq_semantico.status() if _faq_semantico else None,
+        "preferencia_data": dict(METRICAS_PREFERENCIA_DATA),
+        "llm": llm.status(),
+        "acolhimento": metricas_acolhimento(),
+        "slots": _cache_slots.status(),
+        "indice_pacientes": indice_pacientes.status(),
+        "feegow": metricas_feegow(),
+    }), 200
+
 @app.route("/api/diagnostico/slots", methods=["GET"])
 def diagnostico_slots():
     """Endpoint de diagnóstico: consulta disponibilidade para cada local_id
@@ -4565,6 +3255,7 @@ def diagnostico_slots():
     GET /api/diagnostico/slots?token=conectifisio_followup_2025
     GET /api/diagnostico/slots?token=...&local_id=5  (testa só um)
     GET /api/diagnostico/slots?token=...&proc_id=42  (procedimento específico)
+    GET /api/diagnostico/slots?token=...&ao_vivo=1   (ignora o cache de horários)
     """
     import sys
     token = request.args.get("token", "")
@@ -4575,6 +3266,7 @@ def diagnostico_slots():
     proc_id_param = int(request.args.get("proc_id", 42))
 
     local_ids_testar = [int(local_id_param)] if local_id_param else [2, 3, 4, 5, 6, 7, 8]
+    ao_vivo = request.args.get("ao_vivo") == "1"
 
     hoje = datetime.now()
     data_ini = hoje.strftime('%Y-%m-%d')
@@ -4582,7 +3274,7 @@ def diagnostico_slots():
 
     resultado = []
     for lid in local_ids_testar:
-        slots = consultar_disponibilidade_feegow(lid, proc_id_param, data_ini, data_fim)
+        slots = consultar_disponibilidade_feegow(lid, proc_id_param, data_ini, data_fim, usar_cache=not ao_vivo)
         # Agrupa por local_id dos slots retornados
         slot_local_ids = {}
         for s in slots:
@@ -4618,5 +3310,9 @@ def diagnostico_slots():
 
 
 if __name__ == "__main__":
+    # Os módulos de estados fazem "from whatsapp import ..." — reaproveita este módulo
+    # em vez de carregar uma segunda cópia
+    import sys
+    sys.modules.setdefault("whatsapp", sys.modules[__name__])
     port = int(os.environ.get("PORT", 5000))
     app.run(host="0.0.0.0", port=port)
@@ -0,0 +1,90 @@
+"""
+Mede, sobre queixas reais, quanto do acolhimento sai local (api/acolhimento.py)
+e quanto ainda iria para o LLM.
+
+Uso:
+    python scripts/bench_acolhimento.py                        # queixas do PatientsKanban (FIREBASE_CREDENTIALS)
+    python scripts/bench_acolhimento.py --arquivo queixas.txt  # uma queixa por linha (ou lista JSON)
+    python scripts/bench_acolhimento.py --exemplos 30          # mostra mais queixas sem categoria
+
+Queixas geradas pelo sistema ("[REAGENDAMENTO]: ...", "[CONFIRMAÇÃO]: ...") são ignoradas.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+
+from acolhimento import classificar_queixa, acolhimento_local  # noqa: E402
+
+
+def _ler_arquivo(caminho):
+    with open(caminho, encoding="utf-8") as f:
+        conteudo = f.read()
+    if caminho.endswith(".json"):
+        return [str(q) for q in json.loads(conteudo)]
+    return [linha.strip() for linha in conteudo.splitlines()]
+
+
+def _ler_firestore():
+    from whatsapp import db  # inicializa o Firebase a partir do ambiente
+    if not db:
+        print("FIREBASE_CREDENTIALS não configurado.", file=sys.stderr)
+        return None
+    return [(d.to_dict() or {}).get("queixa") or "" for d in db.collection("PatientsKanban").select(["queixa"]).stream()]
+
+
+def _percentil(ordenadas, p):
+    return ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cobertura e latência do acolhimento local")
+    parser.add_argument("--arquivo", help="queixas em .txt (uma por linha) ou .json (lista)")
+    parser.add_argument("--exemplos", type=int, default=10, help="queixas sem categoria a listar")
+    args = parser.parse_args()
+
+    queixas = _ler_arquivo(args.arquivo) if args.arquivo else _ler_firestore()
+    if queixas is None:
+        return 1
+    queixas = [q for q in queixas if q and q.strip() and not q.strip().startswith("[")]
+    if not queixas:
+        print("Nenhuma queixa encontrada.")
+        return 0
+
+    categorias = Counter()
+    sem_categoria = []
+    latencias = []
+    for q in queixas:
+        inicio = time.perf_counter()
+        categoria = classificar_queixa(q)
+        acolhimento_local(q)
+        latencias.append(time.perf_counter() - inicio)
+        if categoria:
+            categorias[categoria] += 1
+        else:
+            sem_categoria.append(q)
+
+    total = len(queixas)
+    locais = total - len(sem_categoria)
+    latencias.sort()
+    print(f"Queixas: {total}")
+    print(f"Acolhimento local: {locais} ({100 * locais / total:.1f}%) | LLM: {len(sem_categoria)} "
+          f"({100 * len(sem_categoria) / total:.1f}%)")
+    print(f"Latência local: p50 {1e6 * _percentil(latencias, 0.5):.0f}µs | "
+          f"p99 {1e6 * _percentil(latencias, 0.99):.0f}µs | máx {1e6 * latencias[-1]:.0f}µs")
+    print("\nPor categoria:")
+    for categoria, n in categorias.most_common():
+        print(f"  {categoria:<15} {n:>6}  ({100 * n / total:.1f}%)")
+    if sem_categoria and args.exemplos:
+        print(f"\nSem categoria (primeiras {min(args.exemplos, len(sem_categoria))}):")
+        for q in sem_categoria[:args.exemplos]:
+            print(f"  - {q[:100]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
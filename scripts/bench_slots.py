@@ -0,0 +1,144 @@
+"""
+Micro-benchmark da busca de horários do reagendamento: implementação anterior
+(sort com strptime na chave + _tem_conflito slot × agendamento) contra
+indice_slots (minutos por dia + bisect).
+
+Agendas sintéticas realistas: 14 dias úteis, vários profissionais por agenda
+(grade de 30 em 30 min das 7h às 21h, com ocupação aleatória), slots repetidos
+entre profissionais — como o available-schedule devolve — e a série de
+agendamentos do paciente para o filtro de conflito.
+
+Uso:
+    python scripts/bench_slots.py
+    python scripts/bench_slots.py --profissionais 6 --dias 14 --agendamentos 10 --repeticoes 2000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+
+from indice_slots import IndiceSlots, encontrar_horarios_proximos, filtrar_conflitos  # noqa: E402
+
+
+# ==========================================
+# IMPLEMENTAÇÃO ANTERIOR (referência)
+# ==========================================
+def _proximos_anterior(slots, hora_preferida, qtd=2):
+    if not slots: return []
+    try:
+        h_pref = datetime.strptime(hora_preferida, "%H:%M")
+    except:
+        return sorted(slots, key=lambda x: (x["data"], x["hora"]))[:qtd]
+    def sort_key(slot):
+        try:
+            h_slot = datetime.strptime(slot["hora"], "%H:%M")
+            diff_hora = abs((h_slot - h_pref).total_seconds())
+        except:
+            diff_hora = 999999
+        return (slot["data"], diff_hora)
+    return sorted(slots, key=sort_key)[:qtd]
+
+
+def _tem_conflito_anterior(slot_data, slot_hora, agendamentos):
+    try:
+        sh = datetime.strptime(slot_hora, "%H:%M")
+    except: return False
+    for ag in agendamentos:
+        if ag.get("data") != slot_data: continue
+        try:
+            ah = datetime.strptime(ag.get("hora",""), "%H:%M")
+            if abs((sh - ah).total_seconds()) / 60 < 30:
+                return True
+        except: continue
+    return False
+
+
+# ==========================================
+# AGENDAS SINTÉTICAS
+# ==========================================
+def gerar_agenda(rng, dias, profissionais, ocupacao):
+    """Slots de dias úteis (sem domingo) a partir de amanhã, em ordem de (data, hora)."""
+    grade = [f"{h:02d}:{m:02d}" for h in range(7, 21) for m in (0, 30)]
+    atual = datetime(2026, 5, 18)
+    slots = []
+    contados = 0
+    while contados < dias:
+        atual += timedelta(days=1)
+        if atual.weekday() == 6:
+            continue
+        contados += 1
+        data_iso = atual.strftime("%Y-%m-%d")
+        data_br = atual.strftime("%d/%m/%Y")
+        for _ in range(profissionais):
+            for hora in grade:
+                if rng.random() >= ocupacao:
+                    slots.append({"data": data_iso, "data_br": data_br, "hora": hora,
+                                  "label": f"🗓️ *{data_br} às {hora}*"})
+    slots.sort(key=lambda x: (x["data"], x["hora"]))
+    return slots
+
+
+def gerar_agendamentos(rng, slots, qtd):
+    return [{"data": s["data"], "hora": s["hora"]} for s in rng.sample(slots, min(qtd, len(slots)))]
+
+
+def _medir(funcao, repeticoes):
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        resultado = funcao()
+    return (time.perf_counter() - inicio) / repeticoes * 1e6, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark da busca de horários")
+    parser.add_argument("--dias", type=int, default=14, help="dias úteis na janela")
+    parser.add_argument("--profissionais", type=int, default=4, help="profissionais por agenda")
+    parser.add_argument("--ocupacao", type=float, default=0.6, help="fração da grade já ocupada")
+    parser.add_argument("--agendamentos", type=int, default=8, help="agendamentos da série do paciente")
+    parser.add_argument("--repeticoes", type=int, default=500)
+    parser.add_argument("--semente", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.semente)
+    slots = gerar_agenda(rng, args.dias, args.profissionais, args.ocupacao)
+    agendamentos = gerar_agendamentos(rng, slots, args.agendamentos)
+    preferencias = ["08:00", "14:00", "18:00", "10:45"]
+    print(f"Agenda: {len(slots)} slots em {args.dias} dias úteis, {args.profissionais} profissional(is), "
+          f"{len(agendamentos)} agendamento(s) na série | {args.repeticoes} repetições")
+
+    # Conferência: mesma resposta nas duas implementações
+    livres_ant = [s for s in slots if not _tem_conflito_anterior(s["data"], s["hora"], agendamentos)]
+    assert filtrar_conflitos(slots, agendamentos) == livres_ant, "filtro de conflito divergiu"
+    for pref in preferencias:
+        for qtd in (2, 5):
+            assert encontrar_horarios_proximos(livres_ant, pref, qtd) == _proximos_anterior(livres_ant, pref, qtd), \
+                f"ranking divergiu ({pref}, qtd={qtd})"
+
+    casos = [
+        ("conflitos", lambda: [s for s in slots if not _tem_conflito_anterior(s["data"], s["hora"], agendamentos)],
+         lambda: filtrar_conflitos(slots, agendamentos)),
+    ]
+    for pref, qtd in (("08:00", 2), ("14:00", 5)):
+        casos.append((f"próximos {pref} qtd={qtd}", lambda p=pref, q=qtd: _proximos_anterior(livres_ant, p, q),
+                      lambda p=pref, q=qtd: encontrar_horarios_proximos(livres_ant, p, q)))
+    casos.append(("fluxo completo (filtro + 2 próximos)",
+                  lambda: _proximos_anterior([s for s in slots if not _tem_conflito_anterior(s["data"], s["hora"], agendamentos)], "14:00", 2),
+                  lambda: encontrar_horarios_proximos(filtrar_conflitos(slots, agendamentos), "14:00", 2)))
+    indice = IndiceSlots(livres_ant)
+    casos.append(("índice pronto: 3 consultas", lambda: [_proximos_anterior(livres_ant, p, 3) for p in preferencias[:3]],
+                  lambda: [indice.proximos(p, 3) for p in preferencias[:3]]))
+
+    print(f"\n{'operação':<38} {'anterior µs':>12} {'índice µs':>10} {'ganho':>7}")
+    for nome, anterior, novo in casos:
+        t_ant, _ = _medir(anterior, args.repeticoes)
+        t_novo, _ = _medir(novo, args.repeticoes)
+        print(f"{nome:<38} {t_ant:>12.1f} {t_novo:>10.1f} {t_ant / t_novo:>6.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
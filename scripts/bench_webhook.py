@@ -0,0 +1,263 @@
+"""
+Benchmark offline do webhook: reproduz payloads da Meta pelo app Flask com
+Firestore em memória e Graph/OpenAI/Feegow falsos (ver scripts/simuladores.py).
+Nada sai da máquina.
+
+Uso:
+    python scripts/bench_webhook.py                                # corpus sintético, 1 e 4 workers
+    python scripts/bench_webhook.py --corpus payloads.jsonl        # um payload do webhook por linha
+    python scripts/bench_webhook.py --workers 1 4 8 --latencia api.openai.com=0.8 --latencia api.feegow.com=0.3
+    python scripts/bench_webhook.py --gerar-corpus corpus.jsonl --conversas 200   # só grava o corpus sintético
+
+Relatório por rodada (uma por valor de --workers). Cada rodada roda num processo
+novo — Firestore, caches (agenda, horários, pacientes, preferências), índice do
+FAQ, embeddings em disco e estatísticas do LLM começam frios, então as rodadas
+são comparáveis:
+  - mensagens/s com N workers (as mensagens de um telefone ficam no mesmo worker, em ordem);
+  - p50/p95/p99 por status do card ANTES da mensagem;
+  - leituras/escritas no Firestore por mensagem (no thread do request) e chamadas HTTP por host.
+
+Telefones e wamids do corpus são trocados por valores sintéticos estáveis — pode
+usar payloads gravados de produção sem levar números reais para o relatório.
+"""
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import tempfile
+import subprocess
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(_DIR, "..", "api"))
+sys.path.insert(0, _DIR)
+
+_TMP = tempfile.mkdtemp(prefix="bench_webhook_")
+os.environ.pop("FIREBASE_CREDENTIALS", None)  # nunca o Firestore real
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("FEEGOW_TOKEN", "bench")
+os.environ["WEBHOOK_ASSINCRONO"] = "0"  # processamento inline: a latência do POST é a da mensagem
+os.environ["DEDUPE_SQLITE"] = os.path.join(_TMP, "dedupe.db")
+os.environ["FAQ_EMBEDDINGS_PATH"] = os.path.join(_TMP, "embeddings.db")
+os.environ["FAQ_AQUECIMENTO_S"] = "0"
+
+from simuladores import FirestoreMemoria, TransporteFalso, instalar_transporte  # noqa: E402
+
+LATENCIAS_PADRAO = {"graph.facebook.com": 0.05, "api.openai.com": 0.6, "api.feegow.com": 0.25}
+
+DADOS_INICIAIS = {
+    "Config/global": {"robo_ligado": True},
+    "FAQ/localizacao": {"perguntas_frequentes": [
+        {"pergunta": "qual o endereço", "variacoes": ["onde fica a clínica", "endereço"],
+         "resposta_ideal": "Estamos na Rua Exemplo, 100. 📍"}]},
+    "FAQ/horarios": {"perguntas_frequentes": [
+        {"pergunta": "qual o horário de funcionamento", "variacoes": ["que horas abre", "horário"],
+         "resposta_ideal": "Atendemos de segunda a sexta, das 7h às 21h."}]},
+}
+
+# Corpus sintético: roteiro típico do funil com variações de texto
+_NOMES = ["Maria Souza", "João Lima", "Ana Paula", "Carlos Eduardo", "Fernanda Alves", "Roberto Dias"]
+_QUEIXAS = ["dor no joelho há 2 meses", "operei o ombro mês passado", "hérnia de disco na lombar",
+            "tenho fibromialgia", "torci o tornozelo jogando bola", "queria melhorar a postura",
+            "minha mãe teve AVC", "sinto um formigamento estranho no braço"]
+_DUVIDAS = ["qual o endereço?", "vocês abrem sábado?", "aceita Amil?", "quanto custa a sessão?", "obrigado!"]
+
+
+def _roteiro(rng):
+    return [("text", rng.choice(["Oi", "Olá, bom dia!", "Boa tarde"])),
+            ("text", rng.choice(_NOMES)),
+            ("button", "Para mim"),
+            ("button", "Fisioterapia Ortopédica"),
+            ("text", rng.choice(_QUEIXAS)),
+            ("button", rng.choice(["Particular", "Convênio"])),
+            ("button", rng.choice(["Manhã", "Tarde"])),
+            ("text", rng.choice(["amanhã de manhã", "sexta às 14h", "dia 20", "semana que vem"])),
+            ("text", rng.choice(_DUVIDAS))]
+
+
+def _mensagem(phone, wamid, ts, tipo, corpo):
+    m = {"from": phone, "id": wamid, "timestamp": str(ts), "type": "text" if tipo == "text" else "interactive"}
+    if tipo == "text":
+        m["text"] = {"body": corpo}
+    else:
+        m["interactive"] = {"type": "button_reply", "button_reply": {"id": corpo, "title": corpo}}
+    return m
+
+
+def _payload(*mensagens):
+    return {"object": "whatsapp_business_account", "entry": [{"id": "bench", "changes": [{"field": "messages", "value": {
+        "messaging_product": "whatsapp", "metadata": {"phone_number_id": "bench"},
+        "contacts": [{"wa_id": m["from"], "profile": {"name": "Paciente"}} for m in mensagens],
+        "messages": list(mensagens)}}]}]}
+
+
+def gerar_corpus(conversas, semente=42):
+    rng = random.Random(semente)
+    corpus = []
+    ts = 1760000000
+    for c in range(conversas):
+        phone = f"5511{900000000 + c}"
+        for i, (tipo, corpo) in enumerate(_roteiro(rng)):
+            ts += 1
+            corpus.append(_payload(_mensagem(phone, f"wamid.sint.{c}.{i}", ts, tipo, corpo)))
+    return corpus
+
+
+def ler_corpus(caminho):
+    with open(caminho, encoding="utf-8") as f:
+        return [json.loads(linha) for linha in f if linha.strip()]
+
+
+def _telefones(payload):
+    return [m.get("from") for e in payload.get("entry", []) for c in e.get("changes", [])
+            for m in (c.get("value", {}) or {}).get("messages", []) or [] if m.get("from")]
+
+
+def _anonimizar(payload, rodada):
+    """Troca telefones e wamids por sintéticos estáveis (e únicos por rodada, para a deduplicação)."""
+    texto = json.dumps(payload)
+    for phone in set(_telefones(payload)):
+        falso = "5500" + str(int(hashlib.sha1(f"{phone}.{rodada}".encode()).hexdigest(), 16) % 10 ** 9).zfill(9)
+        texto = texto.replace(f'"{phone}"', f'"{falso}"')
+    novo = json.loads(texto)
+    for e in novo.get("entry", []):
+        for c in e.get("changes", []):
+            for m in (c.get("value", {}) or {}).get("messages", []) or []:
+                m["id"] = f"{m.get('id')}.r{rodada}"
+    return novo
+
+
+def _percentil(ordenadas, p):
+    return ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * p))]
+
+
+def rodar(whatsapp, corpus, workers, rodada):
+    import dedupe_mensagens
+    db = FirestoreMemoria(DADOS_INICIAIS)
+    if isinstance(whatsapp.db, FirestoreMemoria):
+        whatsapp.db.encerrar()
+    whatsapp.db = db
+    whatsapp._dedupe_mensagens = dedupe_mensagens.DedupeMensagens(dedupe_mensagens.PersistenciaFirestore(lambda: db))
+    transporte = TransporteFalso(_LATENCIAS)
+    instalar_transporte(transporte)
+
+    # Conversas inteiras por worker: a ordem das mensagens de cada telefone é mantida
+    por_telefone = defaultdict(list)
+    for payload in corpus:
+        anon = _anonimizar(payload, rodada)
+        por_telefone[(_telefones(anon) or ["-"])[0]].append(anon)
+
+    amostras = defaultdict(list)  # status → [(segundos, leituras, escritas)]
+    erros = [0]
+
+    def processar_conversa(payloads):
+        cliente = whatsapp.app.test_client()
+        for payload in payloads:
+            phone = (_telefones(payload) or ["-"])[0]
+            status = (db.status(f"PatientsKanban/{phone}") or {}).get("status", "(novo)")
+            ops = db.contadores.medir_thread()
+            inicio = time.perf_counter()
+            resposta = cliente.post("/api/whatsapp", json=payload)
+            segundos = time.perf_counter() - inicio
+            if resposta.status_code >= 500:
+                erros[0] += 1
+            amostras[status].append((segundos, ops.get("leituras", 0), ops.get("escritas", 0)))
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(processar_conversa, por_telefone.values()))
+    duracao = time.perf_counter() - inicio
+    return amostras, duracao, db.contadores.total, dict(transporte.chamadas), erros[0]
+
+
+def relatorio(workers, amostras, duracao, totais, chamadas, erros):
+    todas = [a for lista in amostras.values() for a in lista]
+    n = len(todas)
+    print(f"\n=== {workers} worker(s): {n} mensagens em {duracao:.1f}s → {n / duracao:.1f} msg/s"
+          f"{f' | {erros} erro(s) 5xx' if erros else ''}")
+    print(f"Firestore (total): {totais['leituras'] / n:.1f} leituras e {totais['escritas'] / n:.1f} escritas por mensagem"
+          f" | listeners: {totais['leituras_listener']} leituras")
+    print("HTTP por mensagem: " + ", ".join(f"{h} {c / n:.2f}" for h, c in sorted(chamadas.items())))
+    print(f"{'status antes da mensagem':<34} {'n':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'leit/msg':>9} {'escr/msg':>9}")
+    for status, lista in sorted(amostras.items(), key=lambda t: -len(t[1])):
+        tempos = sorted(a[0] for a in lista)
+        print(f"{status[:34]:<34} {len(lista):>5} {1000 * _percentil(tempos, 0.5):>8.1f} "
+              f"{1000 * _percentil(tempos, 0.95):>8.1f} {1000 * _percentil(tempos, 0.99):>8.1f} "
+              f"{sum(a[1] for a in lista) / len(lista):>9.1f} {sum(a[2] for a in lista) / len(lista):>9.1f}")
+    tempos = sorted(a[0] for a in todas)
+    print(f"{'(todas)':<34} {n:>5} {1000 * _percentil(tempos, 0.5):>8.1f} "
+          f"{1000 * _percentil(tempos, 0.95):>8.1f} {1000 * _percentil(tempos, 0.99):>8.1f}")
+
+
+_LATENCIAS = dict(LATENCIAS_PADRAO)
+_MARCA_RESULTADO = "@@resultado "
+
+
+def _rodar_em_processo_novo(caminho_corpus, workers, rodada, args):
+    """Uma rodada num processo Python novo (nenhum estado em memória ou em disco da anterior)."""
+    cmd = [sys.executable, os.path.abspath(__file__), "--corpus", caminho_corpus,
+           "--workers", str(workers), "--rodada", str(rodada)]
+    for item in args.latencia:
+        cmd += ["--latencia", item]
+    if args.verbose:
+        cmd.append("--verbose")
+    saida = subprocess.run(cmd, stdout=subprocess.PIPE, text=True, check=True).stdout
+    linha = next(l for l in reversed(saida.splitlines()) if l.startswith(_MARCA_RESULTADO))
+    return tuple(json.loads(linha[len(_MARCA_RESULTADO):]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline do webhook WhatsApp")
+    parser.add_argument("--corpus", help="payloads do webhook, um JSON por linha (padrão: corpus sintético)")
+    parser.add_argument("--conversas", type=int, default=100, help="conversas do corpus sintético")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4], help="rodadas com N workers")
+    parser.add_argument("--latencia", action="append", default=[], metavar="HOST=SEGUNDOS",
+                        help=f"latência simulada por host (padrão: {LATENCIAS_PADRAO})")
+    parser.add_argument("--gerar-corpus", metavar="ARQUIVO", help="grava o corpus sintético e sai")
+    parser.add_argument("--verbose", action="store_true", help="mantém os logs do webhook no stderr")
+    parser.add_argument("--rodada", type=int, help=argparse.SUPPRESS)  # uso interno: processo de uma rodada
+    args = parser.parse_args()
+
+    for item in args.latencia:
+        host, _, segundos = item.partition("=")
+        _LATENCIAS[host] = float(segundos)
+
+    corpus = ler_corpus(args.corpus) if args.corpus else gerar_corpus(args.conversas)
+    if args.gerar_corpus:
+        with open(args.gerar_corpus, "w", encoding="utf-8") as f:
+            for payload in corpus:
+                f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+        print(f"{len(corpus)} payloads gravados em {args.gerar_corpus}")
+        return 0
+
+    if args.rodada is not None:
+        stderr = sys.stderr
+        if not args.verbose:
+            sys.stderr = open(os.devnull, "w")
+        try:
+            import whatsapp
+            resultado = rodar(whatsapp, corpus, args.workers[0], args.rodada)
+        finally:
+            sys.stderr = stderr
+        print(_MARCA_RESULTADO + json.dumps(resultado))
+        return 0
+
+    caminho_corpus = args.corpus
+    if not caminho_corpus:
+        caminho_corpus = os.path.join(_TMP, "corpus.jsonl")
+        with open(caminho_corpus, "w", encoding="utf-8") as f:
+            for payload in corpus:
+                f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+    resultados = [(w, _rodar_em_processo_novo(caminho_corpus, w, i, args)) for i, w in enumerate(args.workers)]
+    print(f"Corpus: {len(corpus)} payloads | latências simuladas: {_LATENCIAS}")
+    for workers, resultado in resultados:
+        relatorio(workers, *resultado)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,55 @@
+"""
+Migra o array "historico" de cada card do PatientsKanban para a subcoleção
+PatientsKanban/{phone}/mensagens (ver api/historico_mensagens.py).
+
+Uso (com FIREBASE_CREDENTIALS no ambiente):
+    python scripts/migrar_historico.py --dry-run          # só conta
+    python scripts/migrar_historico.py                    # migra todos
+    python scripts/migrar_historico.py --phone 5511999999999
+
+Idempotente — pode ser interrompido e executado de novo.
+"""
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+
+from whatsapp import db  # noqa: E402 — inicializa o Firebase a partir do ambiente
+import historico_mensagens  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migra historico → subcoleção mensagens")
+    parser.add_argument("--phone", help="migra apenas este card")
+    parser.add_argument("--dry-run", action="store_true", help="não grava nada, só conta")
+    args = parser.parse_args()
+
+    if not db:
+        print("FIREBASE_CREDENTIALS não configurado.", file=sys.stderr)
+        return 1
+
+    if args.phone:
+        telefones = [args.phone]
+    else:
+        # Projeção vazia: só os ids, sem baixar os históricos
+        telefones = [d.id for d in db.collection("PatientsKanban").select([]).stream()]
+
+    total_cards = total_msgs = 0
+    for phone in telefones:
+        try:
+            qtd = historico_mensagens.migrar_documento(db, phone, dry_run=args.dry_run)
+        except Exception as e:
+            print(f"[MIGRACAO-HIST] {phone}: ERRO {e}", file=sys.stderr)
+            continue
+        if qtd:
+            total_cards += 1
+            total_msgs += qtd
+
+    acao = "a migrar" if args.dry_run else "migradas"
+    print(f"{total_msgs} mensagens {acao} em {total_cards} cards (de {len(telefones)} verificados)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
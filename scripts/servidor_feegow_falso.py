@@ -0,0 +1,300 @@
+"""
+Servidor HTTP falso da API do Feegow, para exercitar o feegow_cliente.py sem
+tocar na clínica: pacientes, agendamentos e horários em memória, injeção de
+falhas (429 com Retry-After, 503, latência) e cabeçalho cf-ray em toda resposta.
+
+Endpoints (prefixo /v1/api): patient/list, patient/search, patient/create,
+patient/edit, patient/upload-base64, appoints/search,
+appoints/available-schedule, appoints/statusUpdate.
+
+Uso:
+    python scripts/servidor_feegow_falso.py --porta 8765
+    FEEGOW_BASE_URL=http://127.0.0.1:8765/v1/api FEEGOW_TOKEN=x python api/whatsapp.py
+
+    # Autoteste do cliente contra o servidor (repetições, cf-ray, normalização)
+    python scripts/servidor_feegow_falso.py --autoteste
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import threading
+from datetime import datetime, timedelta
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+
+PREFIXO = "/v1/api/"
+
+
+def _data(valor):
+    """O Feegow aceita DD-MM-YYYY (robô) e YYYY-MM-DD (totem)."""
+    for formato in ("%d-%m-%Y", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(valor, formato)
+        except ValueError:
+            pass
+    raise ValueError(f"data inválida: {valor}")
+
+
+# ==========================================
+# ESTADO EM MEMÓRIA
+# ==========================================
+class FeegowFalso:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.pacientes = {}      # paciente_id → dict (formato do Feegow)
+        self.agendamentos = {}   # agendamento_id → dict
+        self.horarios = {}       # data DD-MM-YYYY → ["08:00", ...]
+        self.falhas = {}         # endpoint → [429 | 503 | ...] (consumidas em ordem)
+        self.latencia_s = 0.0
+        self.chamadas = []       # (método, endpoint)
+        self._proximo_id = 1000
+
+    def _novo_id(self):
+        self._proximo_id += 1
+        return self._proximo_id
+
+    def adicionar_paciente(self, nome, cpf="", celular="", nascimento="", email=""):
+        with self._lock:
+            pid = self._novo_id()
+            self.pacientes[pid] = {"patient_id": pid, "nome_completo": nome, "cpf": cpf, "celular1": celular,
+                                   "data_nascimento": nascimento, "email1": email}
+            return pid
+
+    def adicionar_agendamento(self, paciente_id, data_iso, hora, status_id=1, local_id=2, procedimento_id=42):
+        with self._lock:
+            aid = self._novo_id()
+            d = datetime.strptime(data_iso, "%Y-%m-%d")
+            self.agendamentos[aid] = {"agendamento_id": aid, "paciente_id": paciente_id,
+                                      "data": d.strftime("%d-%m-%Y"), "horario": f"{hora}:00",
+                                      "status_id": status_id, "local_id": local_id,
+                                      "procedimento_id": procedimento_id, "profissional_id": 7,
+                                      "convenio": "Particular"}
+            return aid
+
+    def injetar(self, endpoint, *status):
+        """Próximas respostas de endpoint: status HTTP dados (ex.: 429, 503), depois o normal."""
+        with self._lock:
+            self.falhas.setdefault(endpoint, []).extend(status)
+
+    def _falha(self, endpoint):
+        with self._lock:
+            fila = self.falhas.get(endpoint)
+            return fila.pop(0) if fila else None
+
+    # ------------------------------------------
+    # Endpoints → (status, corpo)
+    # ------------------------------------------
+    def tratar(self, metodo, endpoint, params, corpo):
+        self.chamadas.append((metodo, endpoint))
+        if self.latencia_s:
+            time.sleep(self.latencia_s)
+        falha = self._falha(endpoint)
+        if falha:
+            return falha, {"success": False, "content": f"falha injetada {falha}"}
+        rota = getattr(self, "_" + endpoint.replace("/", "_").replace("-", "_"), None)
+        if not rota:
+            return 404, {"success": False, "content": "endpoint desconhecido"}
+        with self._lock:
+            return rota(params, corpo)
+
+    def _patient_list(self, params, corpo):
+        tel, cpf = params.get("telefone"), params.get("cpf")
+        achados = [p for p in self.pacientes.values()
+                   if (tel and p["celular1"] == tel) or (cpf and p["cpf"] == cpf)]
+        return 200, {"success": True, "content": achados}
+
+    def _patient_search(self, params, corpo):
+        pid, cpf = params.get("paciente_id"), params.get("paciente_cpf")
+        for p in self.pacientes.values():
+            if (pid and str(p["patient_id"]) == pid) or (cpf and p["cpf"] == cpf):
+                # patient/search devolve paciente_id/nome (patient/list: patient_id/nome_completo)
+                return 200, {"success": True, "content": {"paciente_id": p["patient_id"], "nome": p["nome_completo"],
+                                                          "cpf": p["cpf"], "data_nascimento": p["data_nascimento"],
+                                                          "email1": p["email1"], "celular1": p["celular1"]}}
+        return 200, {"success": False, "content": "Paciente não encontrado"}
+
+    def _patient_create(self, params, corpo):
+        pid = self._novo_id()
+        self.pacientes[pid] = {"patient_id": pid, "nome_completo": corpo.get("nome_completo", ""),
+                               "cpf": corpo.get("cpf", ""), "celular1": corpo.get("celular1", ""),
+                               "data_nascimento": corpo.get("data_nascimento", ""), "email1": corpo.get("email1", "")}
+        return 200, {"success": True, "content": {"paciente_id": pid}}
+
+    def _patient_edit(self, params, corpo):
+        p = self.pacientes.get(int(corpo.get("paciente_id") or 0))
+        if not p:
+            return 200, {"success": False, "content": "Paciente não encontrado"}
+        p.update({k: v for k, v in corpo.items() if k in p})
+        return 200, {"success": True, "content": "Paciente atualizado"}
+
+    def _patient_upload_base64(self, params, corpo):
+        return 200, {"success": True, "content": "Arquivo enviado"}
+
+    def _appoints_search(self, params, corpo):
+        ini, fim = _data(params["data_start"]), _data(params["data_end"])
+        achados = [a for a in self.agendamentos.values()
+                   if str(a["paciente_id"]) == params.get("paciente_id")
+                   and ini <= datetime.strptime(a["data"], "%d-%m-%Y") <= fim]
+        return 200, {"success": True, "content": achados}
+
+    def _appoints_available_schedule(self, params, corpo):
+        ini, fim = _data(params["data_start"]), _data(params["data_end"])
+        horarios = {}
+        dia = ini
+        while dia <= fim:
+            chave = dia.strftime("%d-%m-%Y")
+            if self.horarios.get(chave):
+                horarios[dia.strftime("%Y-%m-%d")] = [f"{h}:00" for h in self.horarios[chave]]
+            dia += timedelta(days=1)
+        # Formato real: profissional → local_id da agenda → data → horários HH:MM:SS
+        local_agenda = "6" if params.get("unidade_id") == "1" else "4"
+        return 200, {"success": True, "content": {"profissional_id": {"7": {"local_id": {local_agenda: horarios}}}}}
+
+    def _appoints_statusUpdate(self, params, corpo):
+        a = self.agendamentos.get(int(corpo.get("AgendamentoID") or 0))
+        if not a:
+            return 200, {"success": False, "content": "Agendamento não encontrado"}
+        a["status_id"] = int(corpo.get("StatusID"))
+        return 200, {"success": True, "content": "Status alterado"}
+
+
+# ==========================================
+# HTTP
+# ==========================================
+def _handler(feegow):
+    class Handler(BaseHTTPRequestHandler):
+        def _responder(self, metodo):
+            url = urlparse(self.path)
+            if not url.path.startswith(PREFIXO):
+                status, corpo = 404, {"success": False}
+            elif not (self.headers.get("x-access-token") or self.headers.get("token")):
+                status, corpo = 403, {"success": False, "content": "token ausente"}
+            else:
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                tamanho = int(self.headers.get("Content-Length") or 0)
+                bruto = self.rfile.read(tamanho) if tamanho else b""
+                try:
+                    corpo_req = json.loads(bruto) if bruto else {}
+                except ValueError:
+                    corpo_req = {}  # multipart do upload
+                status, corpo = feegow.tratar(metodo, url.path[len(PREFIXO):], params, corpo_req)
+            dados = json.dumps(corpo).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(dados)))
+            self.send_header("cf-ray", f"{uuid.uuid4().hex[:16]}-GRU")
+            if status == 429:
+                self.send_header("Retry-After", "0")
+            self.end_headers()
+            self.wfile.write(dados)
+
+        def do_GET(self):
+            self._responder("GET")
+
+        def do_POST(self):
+            self._responder("POST")
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def servir(porta=0, feegow=None):
+    """Sobe o servidor numa thread; retorna (servidor, feegow, base_url)."""
+    feegow = feegow or FeegowFalso()
+    servidor = ThreadingHTTPServer(("127.0.0.1", porta), _handler(feegow))
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, feegow, f"http://127.0.0.1:{servidor.server_address[1]}{PREFIXO.rstrip('/')}"
+
+
+# ==========================================
+# AUTOTESTE
+# ==========================================
+def autoteste():
+    from feegow_cliente import ClienteFeegow, ErroFeegow, metricas_feegow
+
+    servidor, falso, base_url = servir()
+    cliente = ClienteFeegow(lambda: "token-falso", base_url=base_url, dormir=lambda s: None)
+    hoje = datetime.now().strftime("%Y-%m-%d")
+    pid = falso.adicionar_paciente("Maria da Silva", cpf="12345678900", celular="11999998888")
+    aid = falso.adicionar_agendamento(pid, hoje, "14:30")
+    falhas = []
+
+    def conferir(nome, condicao):
+        print(f"  {'ok  ' if condicao else 'FALHA'} {nome}")
+        if not condicao:
+            falhas.append(nome)
+
+    print(f"Servidor falso em {base_url}")
+    p = cliente.listar_pacientes(telefone="11999998888")
+    conferir("patient/list normaliza patient_id/nome_completo", p and p[0].id == pid and p[0].nome == "Maria da Silva")
+    p = cliente.buscar_paciente(cpf="12345678900")
+    conferir("patient/search normaliza paciente_id/nome", p and p.id == pid and p.nome == "Maria da Silva")
+    conferir("patient/search success=false → None", cliente.buscar_paciente(cpf="000") is None)
+
+    falso.injetar("patient/list", 429, 429)
+    p = cliente.listar_pacientes(cpf="12345678900")
+    conferir("429 repetido até dar certo", p and p[0].id == pid)
+
+    falso.injetar("appoints/search", 503)
+    ags = cliente.agendamentos(pid, hoje, hoje)
+    conferir("503 em GET repetido; data DD-MM-YYYY → ISO e hora HH:MM",
+             ags and ags[0].id == aid and ags[0].data == hoje and ags[0].hora == "14:30")
+
+    falso.injetar("patient/create", 503)
+    conferir("503 em patient/create não é repetido", cliente.criar_paciente({"nome_completo": "X"}) is None
+             and falso.chamadas.count(("POST", "patient/create")) == 1)
+
+    falso.injetar("appoints/statusUpdate", 503)
+    r = cliente.atualizar_status(aid, 4, "autoteste")
+    conferir("statusUpdate repetido em 503", r.ok and r.tentativas == 2 and falso.agendamentos[aid]["status_id"] == 4)
+
+    falso.injetar("patient/list", 503, 503, 503)
+    try:
+        cliente.listar_pacientes(telefone="1")
+        conferir("falha persistente levanta ErroFeegow", False)
+    except ErroFeegow as e:
+        conferir("falha persistente levanta ErroFeegow com cf-ray", e.status == 503 and bool(e.cf_ray))
+
+    m = metricas_feegow()
+    conferir("métricas por endpoint e cf-rays recentes", m["patient/list"]["repeticoes"] >= 4
+             and len(m["_cf_rays_recentes"]) >= 5)
+    servidor.shutdown()
+    print("OK" if not falhas else f"{len(falhas)} falha(s)")
+    return 1 if falhas else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor falso da API do Feegow")
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("--autoteste", action="store_true", help="roda o feegow_cliente contra o servidor e sai")
+    parser.add_argument("--latencia", type=float, default=0.0, help="segundos de atraso por resposta")
+    args = parser.parse_args()
+
+    if args.autoteste:
+        return autoteste()
+
+    falso = FeegowFalso()
+    falso.latencia_s = args.latencia
+    pid = falso.adicionar_paciente("Paciente Exemplo", cpf="12345678900", celular="11999998888")
+    amanha = datetime.now() + timedelta(days=1)
+    falso.adicionar_agendamento(pid, amanha.strftime("%Y-%m-%d"), "09:00")
+    falso.horarios[amanha.strftime("%d-%m-%Y")] = ["08:00", "10:00", "14:00", "18:00"]
+    servidor, _, base_url = servir(args.porta, falso)
+    print(f"Feegow falso em {base_url} — FEEGOW_BASE_URL={base_url} (Ctrl+C para sair)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        servidor.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,438 @@
+"""
+Substitutos locais dos serviços externos, para benchmarks e replays offline
+(ver scripts/bench_webhook.py).
+
+  - FirestoreMemoria: coleções/documentos em dicionários, com set/update/create/
+    delete, batch, where/order_by/limit/select/start_after, subcoleções,
+    transforms (SERVER_TIMESTAMP, ArrayUnion/ArrayRemove, Increment, DELETE_FIELD)
+    e on_snapshot (callbacks num thread próprio, como no SDK). Conta leituras e
+    escritas por thread e no total — mesma regra de cobrança do Firestore
+    (cada documento devolvido é uma leitura).
+  - TransporteFalso: adaptador do requests montado nas sessões do http_cliente —
+    Graph API, OpenAI e Feegow respondem em memória, com latência configurável
+    por host. Nada sai da máquina.
+"""
+import copy
+import json
+import time
+import queue
+import hashlib
+import itertools
+import threading
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import requests
+from requests.adapters import BaseAdapter
+from google.api_core.exceptions import AlreadyExists, NotFound
+from firebase_admin import firestore
+
+
+# ==========================================
+# FIRESTORE EM MEMÓRIA
+# ==========================================
+class _Contadores:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.total = {"leituras": 0, "escritas": 0, "leituras_listener": 0}
+
+    def somar(self, tipo, n=1):
+        with self._lock:
+            self.total[tipo] += n
+        atual = getattr(self._local, "ops", None)
+        if atual is not None:
+            atual[tipo] = atual.get(tipo, 0) + n
+
+    def medir_thread(self):
+        """Zera e devolve o contador do thread atual (dict atualizado em seguida)."""
+        self._local.ops = {}
+        return self._local.ops
+
+
+def _aplicar(destino, dados, merge, caminhos=False):
+    if not merge:
+        destino.clear()
+    for chave, valor in dados.items():
+        alvo, campo = destino, chave
+        if caminhos and "." in chave:
+            *pais, campo = chave.split(".")
+            for p in pais:
+                alvo = alvo.setdefault(p, {})
+        if valor is firestore.SERVER_TIMESTAMP:
+            alvo[campo] = datetime.now(timezone.utc)
+        elif valor is firestore.DELETE_FIELD:
+            alvo.pop(campo, None)
+        elif isinstance(valor, firestore.ArrayUnion):
+            atual = list(alvo.get(campo) or [])
+            atual.extend(copy.deepcopy(v) for v in valor.values if v not in atual)
+            alvo[campo] = atual
+        elif isinstance(valor, firestore.ArrayRemove):
+            alvo[campo] = [v for v in (alvo.get(campo) or []) if v not in valor.values]
+        elif isinstance(valor, firestore.Increment):
+            alvo[campo] = (alvo.get(campo) or 0) + valor.value
+        elif merge and isinstance(valor, dict) and isinstance(alvo.get(campo), dict):
+            _aplicar(alvo[campo], valor, True)
+        else:
+            alvo[campo] = copy.deepcopy(valor)
+
+
+class SnapshotMemoria:
+    def __init__(self, referencia, dados):
+        self.reference = referencia
+        self.id = referencia.id
+        self._dados = dados
+
+    @property
+    def exists(self):
+        return self._dados is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._dados) if self._dados is not None else None
+
+    def get(self, campo):
+        return (self._dados or {}).get(campo)
+
+
+class _Watch:
+    def __init__(self, banco, caminho, consulta):
+        self._banco, self.caminho, self.consulta = banco, caminho, consulta
+        self.is_active = True
+
+    def unsubscribe(self):
+        self.is_active = False
+        self._banco._remover_watch(self)
+
+
+class DocumentoMemoria:
+    def __init__(self, banco, colecao, doc_id):
+        self._banco, self._colecao, self.id = banco, colecao, doc_id
+        self.path = f"{colecao}/{doc_id}"
+
+    def collection(self, nome):
+        return ColecaoMemoria(self._banco, f"{self.path}/{nome}")
+
+    def get(self, field_paths=None, **kwargs):
+        self._banco.contadores.somar("leituras")
+        with self._banco.lock:
+            dados = copy.deepcopy(self._banco.docs.get(self.path))
+        if dados is not None and field_paths:
+            dados = {k: v for k, v in dados.items() if k in field_paths}
+        return SnapshotMemoria(self, dados)
+
+    def set(self, dados, merge=False):
+        self._banco._escrever(self, lambda atual: _aplicar(atual, dados, merge), criar=True)
+
+    def update(self, dados):
+        self._banco._escrever(self, lambda atual: _aplicar(atual, dados, True, caminhos=True), criar=False)
+
+    def create(self, dados):
+        self._banco._escrever(self, lambda atual: _aplicar(atual, dados, True), criar=True, exclusivo=True)
+
+    def delete(self):
+        self._banco._escrever(self, None)
+
+    def on_snapshot(self, callback):
+        return self._banco._observar(self.path, None, callback)
+
+
+class ConsultaMemoria:
+    def __init__(self, banco, caminho, filtros=(), ordem=None, limite=None, campos=None, apos=None):
+        self._banco, self._caminho = banco, caminho
+        self._filtros, self._ordem, self._limite, self._campos, self._apos = list(filtros), ordem, limite, campos, apos
+
+    def _copiar(self, **mudancas):
+        atual = {"filtros": self._filtros, "ordem": self._ordem, "limite": self._limite,
+                 "campos": self._campos, "apos": self._apos}
+        atual.update(mudancas)
+        return ConsultaMemoria(self._banco, self._caminho, **atual)
+
+    def where(self, campo=None, op=None, valor=None, filter=None):
+        if filter is not None:
+            campo, op, valor = filter.field_path, filter.op_string, filter.value
+        return self._copiar(filtros=self._filtros + [(campo, op, valor)])
+
+    def order_by(self, campo, direction="ASCENDING"):
+        return self._copiar(ordem=(campo, direction))
+
+    def limit(self, n):
+        return self._copiar(limite=n)
+
+    def select(self, campos):
+        return self._copiar(campos=list(campos))
+
+    def start_after(self, valor):
+        return self._copiar(apos=valor)
+
+    @staticmethod
+    def _passa(dados, campo, op, valor):
+        x = dados.get(campo)
+        try:
+            return {"==": lambda: x == valor, "!=": lambda: x != valor, "in": lambda: x in valor,
+                    "not-in": lambda: x not in valor, "array_contains": lambda: valor in (x or []),
+                    "<": lambda: x < valor, "<=": lambda: x <= valor,
+                    ">": lambda: x > valor, ">=": lambda: x >= valor}[op]()
+        except TypeError:
+            return False
+
+    def _resultado(self, docs):
+        prefixo = self._caminho + "/"
+        itens = [(k[len(prefixo):], d) for k, d in docs.items()
+                 if k.startswith(prefixo) and "/" not in k[len(prefixo):]
+                 and all(self._passa(d, *f) for f in self._filtros)]
+        itens.sort(key=lambda t: t[0])
+        if self._ordem:
+            campo, direcao = self._ordem
+            decrescente = direcao in ("DESCENDING", firestore.Query.DESCENDING)
+            itens = [t for t in itens if t[1].get(campo) is not None]
+            itens.sort(key=lambda t: t[1][campo], reverse=decrescente)
+            if self._apos is not None:
+                ref = self._apos.get(campo) if isinstance(self._apos, (dict, SnapshotMemoria)) else self._apos
+                itens = [t for t in itens if (t[1][campo] < ref if decrescente else t[1][campo] > ref)]
+        if self._limite:
+            itens = itens[:self._limite]
+        return [(i, copy.deepcopy({k: v for k, v in d.items() if k in self._campos} if self._campos is not None else d))
+                for i, d in itens]
+
+    def stream(self):
+        with self._banco.lock:
+            itens = self._resultado(self._banco.docs)
+        self._banco.contadores.somar("leituras", max(len(itens), 1))  # consulta vazia cobra 1 leitura
+        return iter([SnapshotMemoria(DocumentoMemoria(self._banco, self._caminho, i), d) for i, d in itens])
+
+    def get(self):
+        return list(self.stream())
+
+    def on_snapshot(self, callback):
+        return self._banco._observar(self._caminho, self, callback)
+
+
+class ColecaoMemoria(ConsultaMemoria):
+    _ids = itertools.count(1)
+
+    def __init__(self, banco, caminho):
+        super().__init__(banco, caminho)
+        self.id = caminho.rsplit("/", 1)[-1]
+
+    def document(self, doc_id=None):
+        return DocumentoMemoria(self._banco, self._caminho, doc_id or f"auto{next(self._ids):012d}")
+
+    def add(self, dados):
+        ref = self.document()
+        ref.set(dados)
+        return datetime.now(timezone.utc), ref
+
+
+class BatchMemoria:
+    def __init__(self, banco):
+        self._banco = banco
+        self._ops = []
+
+    def set(self, ref, dados, merge=False):
+        self._ops.append(lambda: ref.set(dados, merge=merge))
+
+    def update(self, ref, dados):
+        self._ops.append(lambda: ref.update(dados))
+
+    def create(self, ref, dados):
+        self._ops.append(lambda: ref.create(dados))
+
+    def delete(self, ref):
+        self._ops.append(ref.delete)
+
+    def commit(self):
+        ops, self._ops = self._ops, []
+        for op in ops:
+            op()
+
+
+class FirestoreMemoria:
+    def __init__(self, dados_iniciais=None):
+        self.lock = threading.RLock()
+        self.docs = copy.deepcopy(dados_iniciais or {})  # "Colecao/doc[/sub/doc]" → dict
+        self.contadores = _Contadores()
+        self._watches = []
+        self._eventos = queue.Queue()
+        threading.Thread(target=self._despachar, daemon=True, name="firestore-memoria-watch").start()
+
+    def collection(self, nome):
+        return ColecaoMemoria(self, nome)
+
+    def batch(self):
+        return BatchMemoria(self)
+
+    def encerrar(self):
+        """Derruba os listeners (quem observa vê is_active=False e reconecta no banco novo)."""
+        with self.lock:
+            watches, self._watches = self._watches, []
+        for watch in watches:
+            watch.is_active = False
+
+    def status(self, caminho):
+        """Leitura direta, sem contar operação (para o harness)."""
+        with self.lock:
+            return copy.deepcopy(self.docs.get(caminho))
+
+    # ------------------------------------------
+    # Escrita
+    # ------------------------------------------
+    def _escrever(self, ref, alterar, criar=True, exclusivo=False):
+        self.contadores.somar("escritas")
+        with self.lock:
+            existia = ref.path in self.docs
+            if alterar is None:
+                self.docs.pop(ref.path, None)
+            else:
+                if exclusivo and existia:
+                    raise AlreadyExists(f"Documento já existe: {ref.path}")
+                if not criar and not existia:
+                    raise NotFound(f"Documento não encontrado: {ref.path}")
+                alterar(self.docs.setdefault(ref.path, {}))
+            if self._watches:
+                tipo = "REMOVED" if alterar is None else ("MODIFIED" if existia else "ADDED")
+                self._eventos.put((ref, tipo))
+
+    # ------------------------------------------
+    # Listeners
+    # ------------------------------------------
+    def _observar(self, caminho, consulta, callback):
+        watch = _Watch(self, caminho, consulta)
+        watch.callback = callback
+        with self.lock:
+            self._watches.append(watch)
+        self._eventos.put((watch, "INICIAL"))
+        return watch
+
+    def _remover_watch(self, watch):
+        with self.lock:
+            if watch in self._watches:
+                self._watches.remove(watch)
+
+    def _snapshots(self, watch):
+        with self.lock:
+            if watch.consulta is None:
+                colecao, doc_id = watch.caminho.rsplit("/", 1)
+                ref = DocumentoMemoria(self, colecao, doc_id)
+                return [SnapshotMemoria(ref, copy.deepcopy(self.docs.get(watch.caminho)))]
+            return [SnapshotMemoria(DocumentoMemoria(self, watch.caminho, i), d)
+                    for i, d in watch.consulta._resultado(self.docs)]
+
+    def _despachar(self):
+        while True:
+            origem, tipo = self._eventos.get()
+            try:
+                if tipo == "INICIAL":
+                    docs = self._snapshots(origem)
+                    self.contadores.somar("leituras_listener", len(docs))
+                    origem.callback(docs, [], datetime.now(timezone.utc))
+                    continue
+                with self.lock:
+                    watches = list(self._watches)
+                for watch in watches:
+                    if watch.consulta is None and watch.caminho == origem.path:
+                        docs = self._snapshots(watch)
+                        self.contadores.somar("leituras_listener", 1)
+                        watch.callback(docs, [SimpleNamespace(type=SimpleNamespace(name=tipo), document=docs[0])],
+                                       datetime.now(timezone.utc))
+                    elif watch.consulta is not None and origem.path.rsplit("/", 1)[0] == watch.caminho:
+                        with self.lock:
+                            dados = copy.deepcopy(self.docs.get(origem.path))
+                        doc = SnapshotMemoria(origem, dados)
+                        self.contadores.somar("leituras_listener", 1)
+                        watch.callback(self._snapshots(watch),
+                                       [SimpleNamespace(type=SimpleNamespace(name=tipo), document=doc)],
+                                       datetime.now(timezone.utc))
+            except Exception as e:
+                print(f"[FIRESTORE-MEMORIA] Callback de listener falhou: {e}")
+
+
+# ==========================================
+# TRANSPORTE HTTP FALSO
+# ==========================================
+def _embedding_falso(texto, dimensao=64):
+    """Vetor determinístico por texto (mesmo texto → mesmo vetor)."""
+    semente = hashlib.sha256(texto.encode("utf-8")).digest()
+    return [(semente[i % len(semente)] - 127.5) / 127.5 for i in range(dimensao)]
+
+
+def resposta_openai(caminho, corpo):
+    if caminho.endswith("/embeddings"):
+        entradas = corpo.get("input") or []
+        entradas = [entradas] if isinstance(entradas, str) else entradas
+        return {"data": [{"index": i, "embedding": _embedding_falso(t)} for i, t in enumerate(entradas)],
+                "usage": {"prompt_tokens": 8 * len(entradas)}}
+    sistema = " ".join(m.get("content", "") for m in corpo.get("messages", []) if m.get("role") == "system")
+    if "JSON" in sistema:
+        conteudo = json.dumps({"data": None, "hora": None, "periodo": None})
+    else:
+        conteudo = "Entendo! Estamos aqui para te ajudar."
+    return {"choices": [{"message": {"role": "assistant", "content": conteudo}}],
+            "usage": {"prompt_tokens": 120, "completion_tokens": 20}}
+
+
+def resposta_graph(caminho, corpo):
+    if caminho.endswith("/messages"):
+        return {"messaging_product": "whatsapp", "messages": [{"id": f"wamid.bench.{time.monotonic_ns()}"}]}
+    return {"id": caminho.rsplit("/", 1)[-1], "url": "https://lookaside.invalid/midia", "mime_type": "image/jpeg"}
+
+
+def resposta_feegow(caminho, corpo):
+    # Sem pacientes nem horários: os fluxos seguem pelos ramos "não encontrado"/"sem vaga"
+    return {"success": True, "content": []}
+
+
+class TransporteFalso(BaseAdapter):
+    """Adaptador do requests: responde pelo host, depois de `latencias[host]` segundos."""
+
+    RESPOSTAS = {
+        "graph.facebook.com": resposta_graph,
+        "api.openai.com": resposta_openai,
+        "api.feegow.com": resposta_feegow,
+    }
+
+    def __init__(self, latencias=None):
+        super().__init__()
+        self.latencias = dict(latencias or {})
+        self._lock = threading.Lock()
+        self.chamadas = {}
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        url = requests.utils.urlparse(request.url)
+        host = url.hostname or ""
+        with self._lock:
+            self.chamadas[host] = self.chamadas.get(host, 0) + 1
+        atraso = self.latencias.get(host, 0)
+        if atraso:
+            time.sleep(atraso)
+        try:
+            corpo = json.loads(request.body or b"{}")
+        except (TypeError, ValueError):
+            corpo = {}
+        gerar = self.RESPOSTAS.get(host)
+        dados = gerar(url.path, corpo) if gerar else {}
+        resposta = requests.Response()
+        resposta.status_code = 200
+        resposta._content = json.dumps(dados).encode("utf-8")
+        resposta.headers["Content-Type"] = "application/json"
+        resposta.url = request.url
+        resposta.request = request
+        resposta.encoding = "utf-8"
+        return resposta
+
+    def close(self):
+        pass
+
+
+def instalar_transporte(transporte):
+    """Faz o http_cliente criar todas as sessões com o transporte falso."""
+    import http_cliente
+
+    def criar_sessao(host):
+        sessao = requests.Session()
+        sessao.mount("https://", transporte)
+        sessao.mount("http://", transporte)
+        return sessao
+
+    with http_cliente._lock:
+        http_cliente._sessoes.clear()
+    http_cliente._criar_sessao = criar_sessao